@@ -0,0 +1,4 @@
+from asgi_app import create_app
+
+# ASGI entry point: uvicorn asgi:application --workers N
+application = create_app()
@@ -0,0 +1,731 @@
+from contextlib import asynccontextmanager
+from functools import wraps
+from tempfile import SpooledTemporaryFile
+import hashlib
+import logging
+import os
+import sys
+import time
+import traceback
+
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import FileResponse, Response, StreamingResponse
+from starlette.routing import Route
+from werkzeug.exceptions import BadRequest, UnsupportedMediaType
+from werkzeug.http import http_date, parse_etags
+
+from database import setup_database
+from database.async_database import adb
+from services import (async_todo_service as todo_service, async_user_service as user_service, auth_cache,
+                      events, metrics, password_hasher, serializer, validator_service)
+
+# The API of todo_app served from an event loop: same routes, same bodies and
+# status codes, with database and bcrypt waits awaited instead of holding a
+# thread. Run with: uvicorn asgi:application
+
+logger = logging.getLogger(__name__)
+
+JWT_SECRET = os.getenv("JWT_SECRET_KEY")
+JWT_ALGORITHM = "HS256"
+
+# Uploads larger than this are spooled to disk while they are read.
+IMPORT_SPOOL_BYTES = 1024 * 1024
+
+
+def create_app() -> Starlette:
+
+    # Like todo_app.create_app(): the engine connects lazily, migrations are
+    # not run here, and several apps can be built in one process.
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
+        handlers=[
+            logging.StreamHandler(sys.stdout)
+        ]
+    )
+
+    if not setup_database.DATABASE_URL:
+        raise ValueError("DATABASE_URL environment variable is not set!")
+    adb.init(setup_database.DATABASE_URL)
+
+    middleware = [Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"]),
+                  Middleware(DatabaseSessionMiddleware)]
+    if metrics.METRICS_ENABLED:
+        metrics.install_query_hooks()
+        middleware.insert(0, Middleware(MetricsMiddleware))
+
+    return Starlette(routes=ROUTES, middleware=middleware, lifespan=_lifespan)
+
+
+@asynccontextmanager
+async def _lifespan(app):
+
+    yield
+    await adb.dispose()
+
+
+class DatabaseSessionMiddleware:
+    """Binds one AsyncSession per HTTP request, closed once the response is sent.
+
+    A plain ASGI middleware rather than BaseHTTPMiddleware, so streamed
+    responses run inside the scope and see the session.
+    """
+
+    def __init__(self, app):
+
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        async with adb.scope():
+            await self.app(scope, receive, send)
+
+
+class MetricsMiddleware:
+    """Request metrics, with the same boundaries as the Flask app's.
+
+    A request is timed until its response starts, so a streamed body is not
+    included; its route is the matched route's path template.
+    """
+
+    def __init__(self, app):
+
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        metrics.start_request(scope["method"])
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                metrics.finish_request(_route_template(scope), message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # A no-op unless the app failed before starting a response.
+            metrics.finish_request(_route_template(scope), 500)
+
+
+def token_required(f):
+
+    @wraps(f)
+    async def decorated(request, *args, **kwargs):
+
+        import jwt
+
+        auth_header = request.headers.get("Authorization")
+        if not auth_header:
+            logger.error("Error with authorization header!")
+            return _json({"message:": "Authorization header is missing!"}, 401)
+
+        parts = auth_header.split()
+        if parts[0].lower() != "bearer" or len(parts) != 2:
+            logger.error("Error with token format. Expected Bearer <token>.")
+            return _json({"message": "Invalid token format. Expected Bearer <token>."}, 401)
+
+        token = parts[1]
+
+        try:
+            data = auth_cache.get_token_payload(token)
+            if data is None:
+                data = jwt.decode(token, JWT_SECRET, algorithms=JWT_ALGORITHM)
+                auth_cache.put_token_payload(token, data)
+
+            current_user_id = data["user_id"]
+            user_result = auth_cache.get_user(current_user_id)
+
+            if user_result is None:
+                user_result, error = await user_service.get_user(current_user_id)
+
+                if error or not user_result:
+                    logger.error("Invalid token: user not found.")
+                    return _json({"message": "Invalid token: user not found!"}, 401)
+
+                auth_cache.put_user(current_user_id, user_result)
+
+        except jwt.ExpiredSignatureError:
+            logger.error(f"Token has expired: {jwt.ExpiredSignatureError}")
+            return _json({"message": "Token has expired!"}, 401)
+        except jwt.InvalidTokenError:
+            logger.error(f"Token is invalid {jwt.InvalidTokenError}")
+            return _json({"message": "Token is invalid!"}, 401)
+        except Exception as e:
+            logger.error(f"Token validation error: {str(e)}")
+            return _json({"message": "Token validation failed!"}, 401)
+
+        return await f(request, user_result, *args, **kwargs)
+
+    return decorated
+
+
+async def index(request):
+    return FileResponse(os.path.join(os.path.dirname(os.path.abspath(__file__)), "index.html"))
+
+
+async def health(request):
+
+    try:
+        healthy = await adb.check_connection()
+        status = {"success": healthy,
+                  "database": "ok" if healthy else "unavailable",
+                  "pool": adb.pool_status(),
+                  "event_streams": events.streams_supported(asynchronous=True)}
+
+        return _json(status, 200 if healthy else 503)
+    except Exception as e:
+        return _handle_exception(e, "health")
+
+
+async def metrics_endpoint(request):
+
+    if not metrics.METRICS_ENABLED:
+        return _error_response("Metrics are disabled.", 404)
+
+    return Response(metrics.render(), headers={"Content-Type": metrics.CONTENT_TYPE})
+
+
+@token_required
+async def get_items(request, current_user):
+
+    try:
+        user_id = current_user["id"]
+
+        async def build_response():
+
+            if _arg(request, "stream", "").lower() in ("1", "true"):
+                return _stream_items(request, user_id)
+
+            page, error = await todo_service.get_todos(
+                status=_arg(request, "status"),
+                user_id=user_id,
+                sort_by=_arg(request, "sort_by"),
+                sort_order=_arg(request, "sort_order", "asc"),
+                limit=_arg(request, "limit"),
+                cursor=_arg(request, "cursor"),
+                fields=_arg(request, "fields"),
+                q=_arg(request, "q"),
+                filters=_arg(request, "filter")
+            )
+
+            return _success_response(page) if not error else _error_response(error)
+
+        return await _conditional_response(request, user_id, build_response)
+    except Exception as e:
+        return _handle_exception(e, "get_items")
+
+
+@token_required
+async def get_item_stats(request, current_user):
+
+    try:
+        user_id = current_user["id"]
+
+        stats, error = await todo_service.get_stats(user_id)
+
+        return _success_response({"stats": stats}) if not error else _error_response(error)
+    except Exception as e:
+        return _handle_exception(e, "get_item_stats")
+
+
+@token_required
+async def get_item_changes(request, current_user):
+
+    try:
+        user_id = current_user["id"]
+
+        async def build_response():
+
+            changes, error = await todo_service.get_changes(user_id, _arg(request, "since"))
+            if error == todo_service.SYNC_EXPIRED_ERROR:
+                return _error_response(error, 410)
+
+            return _success_response(changes) if not error else _error_response(error)
+
+        return await _conditional_response(request, user_id, build_response)
+    except Exception as e:
+        return _handle_exception(e, "get_item_changes")
+
+
+@token_required
+async def item_events(request, current_user):
+
+    try:
+        if not events.streams_supported(asynchronous=True):
+            return _error_response(events.STREAMS_UNAVAILABLE_ERROR, 501)
+
+        try:
+            subscription = events.subscribe(current_user["id"])
+        except events.TooManySubscribersError as e:
+            response = _error_response(str(e), 503)
+            response.headers["Retry-After"] = str(int(events.EVENTS_RETRY_MS / 1000) or 1)
+            return response
+
+        # The token check is the last query; give its connection back before
+        # the stream starts idling.
+        await adb.session.close()
+
+        response = StreamingResponse(_event_stream(subscription), media_type="text/event-stream")
+        response.headers["Cache-Control"] = "no-cache"
+        response.headers["X-Accel-Buffering"] = "no"
+        return response
+    except Exception as e:
+        return _handle_exception(e, "item_events")
+
+
+@token_required
+async def export_items(request, current_user):
+
+    try:
+        user_id = current_user["id"]
+
+        export_format = _arg(request, "format", "ndjson").lower()
+        if export_format not in serializer.EXPORT_MIMETYPES:
+            return _error_response(
+                f"Format must be one of: {', '.join(serializer.EXPORT_MIMETYPES)}")
+
+        rows, error = todo_service.stream_todos(
+            status=_arg(request, "status"),
+            user_id=user_id,
+            sort_by=_arg(request, "sort_by"),
+            sort_order=_arg(request, "sort_order", "asc"),
+            fields=_arg(request, "fields"),
+            q=_arg(request, "q"),
+            filters=_arg(request, "filter")
+        )
+        if error:
+            return _error_response(error)
+
+        body = (serializer.astream_csv(rows) if export_format == "csv"
+                else serializer.astream_ndjson(rows))
+
+        response = StreamingResponse(body, media_type=serializer.EXPORT_MIMETYPES[export_format])
+        response.headers["Content-Disposition"] = f"attachment; filename=items.{export_format}"
+        return response
+    except Exception as e:
+        return _handle_exception(e, "export_items")
+
+
+@token_required
+async def import_items(request, current_user):
+
+    try:
+        user_id = current_user["id"]
+
+        default_format = "csv" if _mimetype(request) == "text/csv" else "ndjson"
+        import_format = _arg(request, "format", default_format).lower()
+        if import_format not in serializer.EXPORT_MIMETYPES:
+            return _error_response(
+                f"Format must be one of: {', '.join(serializer.EXPORT_MIMETYPES)}")
+
+        # The parsers are blocking, so the body is spooled first (to disk past
+        # IMPORT_SPOOL_BYTES) and then parsed a batch at a time off the loop.
+        with SpooledTemporaryFile(max_size=IMPORT_SPOOL_BYTES) as upload:
+            async for chunk in request.stream():
+                await run_in_threadpool(upload.write, chunk)
+            upload.seek(0)
+
+            records = (serializer.parse_csv(upload) if import_format == "csv"
+                       else serializer.parse_ndjson(upload))
+
+            report, error = await todo_service.import_todos(records, user_id,
+                                                            _arg(request, "batch_size"))
+
+        return (_success_response(report) if not error
+                else _error_response(error))
+    except Exception as e:
+        return _handle_exception(e, "import_items")
+
+
+@token_required
+async def get_item(request, current_user):
+
+    try:
+        user_id = current_user["id"]
+        item_id = request.path_params["item_id"]
+
+        item, error = await todo_service.get_todo(item_id, user_id)
+        if error:
+            return _error_response(error, 404)
+
+        return _item_response(request, item)
+    except Exception as e:
+        return _handle_exception(e, "get_item")
+
+
+@token_required
+async def create_item(request, current_user):
+
+    try:
+        user_id = current_user["id"]
+
+        data = await _get_json(request)
+        if not data:
+            return _error_response("No data provided.")
+
+        validation_error = validator_service.validate_todo_item_data(data)
+        if validation_error:
+            logger.error(f"Wrong validation: {validation_error}")
+            return _error_response(validation_error)
+
+        created_item, error = await todo_service.create_todo(
+            title=data.get("title"),
+            description=data.get("description"),
+            status=data.get("status"),
+            user_id=user_id
+        )
+
+        return (_success_response({"item": created_item}, 201) if not error
+                else _error_response(error))
+    except Exception as e:
+        return _handle_exception(e, "create_item")
+
+
+@token_required
+async def delete_item(request, current_user):
+
+    try:
+        user_id = current_user["id"]
+        item_id = request.path_params["item_id"]
+
+        expected_version, error = _parse_if_match(request.headers.get("If-Match"))
+        if error:
+            return _error_response(error)
+
+        item, error = await todo_service.delete_todo(item_id, user_id, expected_version)
+
+        if error == todo_service.VERSION_CONFLICT_ERROR:
+            return _error_response(error, 412)
+
+        return (_success_response({"message": "Item deleted", "item": item}) if not error
+                else _error_response(error, 404))
+    except Exception as e:
+        return _handle_exception(e, "delete_item")
+
+
+@token_required
+async def update_item(request, current_user):
+
+    try:
+        user_id = current_user["id"]
+        item_id = request.path_params["item_id"]
+
+        data = await _get_json(request)
+        if not data:
+            return _error_response("No data provided.")
+
+        validation_error = validator_service.validate_todo_item_data(data, is_update=True)
+        if validation_error:
+            logger.error(f"Wrong validation: {validation_error}")
+            return _error_response(validation_error)
+
+        expected_version, error = _parse_if_match(request.headers.get("If-Match"))
+        if error:
+            return _error_response(error)
+
+        updated_item, error = await todo_service.update_todo(
+            item_id=item_id,
+            title=data.get("title"),
+            description=data.get("description"),
+            status=data.get("status"),
+            user_id=user_id,
+            expected_version=expected_version
+        )
+
+        if error == todo_service.VERSION_CONFLICT_ERROR:
+            return _error_response(error, 412)
+
+        if error:
+            return _error_response(error, 404)
+
+        response = _success_response({"message": "Item updated", "item": updated_item})
+        response.headers["ETag"] = f'"{_item_etag(updated_item)}"'
+        return response
+    except Exception as e:
+        return _handle_exception(e, "update_item")
+
+
+@token_required
+async def batch_items(request, current_user):
+
+    try:
+        user_id = current_user["id"]
+
+        data = await _get_json(request)
+        if not data:
+            return _error_response("No data provided.")
+
+        validation_error = validator_service.validate_fields(data, {"operations"})
+        if validation_error:
+            return _error_response(validation_error)
+
+        results, error = await todo_service.apply_batch(data.get("operations"), user_id)
+
+        return (_success_response({"results": results}) if not error
+                else _error_response(error))
+    except Exception as e:
+        return _handle_exception(e, "batch_items")
+
+
+async def register(request):
+
+    try:
+        data = await _get_json(request)
+        if not data:
+            return _error_response("No data provided.")
+
+        validation_error = validator_service.validate_user_registration_data(data)
+        if validation_error:
+            return _error_response(validation_error)
+
+        created_user, error = await user_service.register_user(
+            email=data.get("email"),
+            password=data.get("password")
+        )
+
+        if error == user_service.BUSY_ERROR:
+            return _busy_response(error)
+
+        return (_success_response({"user": created_user}, 201) if not error
+                else _error_response(error))
+    except Exception as e:
+        return _handle_exception(e, "register")
+
+
+async def login(request):
+
+    try:
+        data = await _get_json(request)
+        if not data:
+            return _error_response("No data provided.")
+
+        validation_error = validator_service.validate_user_login_data(data)
+        if validation_error:
+            return _error_response(validation_error, 402)
+
+        user, error = await user_service.authenticate_user(
+            email=data.get("email"),
+            password=data.get("password")
+        )
+
+        if error == user_service.BUSY_ERROR:
+            return _busy_response(error)
+
+        return (_success_response({"user": user}) if not error
+                else _error_response(error, 401))
+    except Exception as e:
+        return _handle_exception(e, "login")
+
+
+@token_required
+async def get_user(request, current_user):
+
+    try:
+        current_user, error = await user_service.get_user(request.path_params["user_id"])
+
+        return (_success_response({"user": current_user}) if not error
+                else _error_response(error, 404))
+
+    except Exception as e:
+        return _handle_exception(e, "get_user")
+
+
+# Fixed paths come before /user/items/{item_id}, which would match them too.
+ROUTES = [
+    Route("/", index),
+    Route("/health", health, methods=["GET"]),
+    Route("/metrics", metrics_endpoint, methods=["GET"]),
+    Route("/user/items", get_items, methods=["GET"]),
+    Route("/user/items", create_item, methods=["POST"]),
+    Route("/user/items/stats", get_item_stats, methods=["GET"]),
+    Route("/user/items/changes", get_item_changes, methods=["GET"]),
+    Route("/user/items/events", item_events, methods=["GET"]),
+    Route("/user/items/export", export_items, methods=["GET"]),
+    Route("/user/items/import", import_items, methods=["POST"]),
+    Route("/user/items/batch", batch_items, methods=["POST"]),
+    Route("/user/items/{item_id}", get_item, methods=["GET"]),
+    Route("/user/items/{item_id}", delete_item, methods=["DELETE"]),
+    Route("/user/items/{item_id}", update_item, methods=["PUT"]),
+    Route("/register", register, methods=["POST"]),
+    Route("/login", login, methods=["POST"]),
+    Route("/user/{user_id}", get_user, methods=["GET"]),
+]
+
+
+def _stream_items(request, user_id):
+
+    rows, error = todo_service.stream_todos(
+        status=_arg(request, "status"),
+        user_id=user_id,
+        sort_by=_arg(request, "sort_by"),
+        sort_order=_arg(request, "sort_order", "asc"),
+        fields=_arg(request, "fields"),
+        q=_arg(request, "q"),
+        filters=_arg(request, "filter")
+    )
+    if error:
+        return _error_response(error)
+
+    return StreamingResponse(serializer.astream_json_list("items", rows), media_type="application/json")
+
+
+async def _event_stream(subscription):
+
+    deadline = time.monotonic() + events.EVENTS_STREAM_SECONDS
+    try:
+        yield serializer.sse_message(retry_ms=events.EVENTS_RETRY_MS)
+
+        while not subscription.closed:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+
+            event = await subscription.get_async(min(events.EVENTS_HEARTBEAT_SECONDS, remaining))
+            if event is None:
+                if subscription.closed:
+                    return
+                yield serializer.sse_comment("keep-alive")
+            else:
+                yield serializer.sse_message(event, event=event["type"])
+    finally:
+        subscription.close()
+
+
+async def _conditional_response(request, user_id, build_response):
+
+    # See todo_app._conditional_response.
+    change, error = await todo_service.get_change_version(user_id)
+    if error:
+        return await build_response()
+
+    etag = _representation_etag(request, change["version"])
+
+    if parse_etags(request.headers.get("If-None-Match")).contains(etag):
+        response = Response(status_code=304)
+    else:
+        response = await build_response()
+        if response.status_code != 200:
+            return response
+
+    response.headers["ETag"] = f'"{etag}"'
+    # Werkzeug drops Last-Modified from a 304 as an entity header; so do we.
+    if change["changed_at"] and response.status_code != 304:
+        response.headers["Last-Modified"] = http_date(change["changed_at"])
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
+def _representation_etag(request, version):
+
+    query = "&".join(f"{key}={value}" for key, value in sorted(request.query_params.multi_items()))
+    digest = hashlib.sha1(f"{request.url.path}?{query}".encode("utf-8")).hexdigest()[:16]
+    return f"v{version}-{digest}"
+
+
+def _item_response(request, item):
+
+    # See todo_app._item_response.
+    etag = _item_etag(item)
+
+    if parse_etags(request.headers.get("If-None-Match")).contains(etag):
+        response = Response(status_code=304)
+    else:
+        response = _success_response({"item": item})
+
+    response.headers["ETag"] = f'"{etag}"'
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
+def _item_etag(item):
+
+    return str(item["version"])
+
+
+def _parse_if_match(header):
+
+    if not header or header.strip() == "*":
+        return None, None
+
+    value = header.strip()
+    if value.startswith("W/"):
+        value = value[2:]
+
+    try:
+        return int(value.strip('"')), None
+    except ValueError:
+        return None, "Invalid If-Match header."
+
+
+def _route_template(scope):
+
+    route = scope.get("route")
+    return getattr(route, "path", None)
+
+
+def _arg(request: Request, name, default=None):
+
+    # First value wins, as with Flask's request.args.get().
+    values = request.query_params.getlist(name)
+    return values[0] if values else default
+
+
+def _mimetype(request: Request) -> str:
+
+    return request.headers.get("Content-Type", "").split(";")[0].strip().lower()
+
+
+async def _get_json(request: Request):
+
+    # Behaves like Flask's request.get_json(): a non-JSON content type or an
+    # unparsable body raises, and the route reports it as a server error.
+    mimetype = _mimetype(request)
+    if not (mimetype == "application/json"
+            or (mimetype.startswith("application/") and mimetype.endswith("+json"))):
+        raise UnsupportedMediaType("Did not attempt to load JSON data because the request "
+                                   "Content-Type was not 'application/json'.")
+
+    try:
+        return serializer.loads(await request.body())
+    except ValueError:
+        raise BadRequest()
+
+
+def _json(payload, status_code=200):
+
+    return Response(serializer.dumps(payload), status_code=status_code, media_type="application/json")
+
+
+def _success_response(data, status_code=200):
+
+    return _json({"success": True, **data}, status_code)
+
+
+def _error_response(error_message, status_code=400):
+
+    return _json({"success": False, "error": error_message}, status_code)
+
+
+def _busy_response(error_message):
+
+    response = _error_response(error_message, 503)
+    response.headers["Retry-After"] = str(password_hasher.BCRYPT_RETRY_AFTER_SECONDS)
+    return response
+
+
+def _handle_exception(exception, route_name):
+
+    logger.error(f"Error in {route_name} route: {str(exception)}")
+    logger.error(traceback.format_exc())
+    return _error_response(f"Server error: {str(exception)}", 500)
@@ -0,0 +1 @@
+"""Benchmarks for the API; run with python -m benchmarks (see README)."""
@@ -0,0 +1,250 @@
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+from typing import List, Optional
+
+logger = logging.getLogger("benchmarks")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+
+    parser = argparse.ArgumentParser(prog="python -m benchmarks",
+                                     description="Benchmark and load-test the API, and compare runs.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="Seed a database, drive every route and report JSON.")
+    _add_setup_arguments(run, users=20, items=2000, bcrypt_rounds=4)
+    run.add_argument("--target", choices=["client", "server"], default="client",
+                     help="Flask's test client in process, or gunicorn over HTTP.")
+    run.add_argument("--requests", type=int, default=200, help="Timed requests per scenario.")
+    run.add_argument("--warmup", type=int, default=20, help="Untimed requests per scenario first.")
+    run.add_argument("--concurrency", type=int, default=1, help="Client threads sending requests.")
+    run.add_argument("--scenario", action="append", dest="scenarios",
+                     help="Only run this scenario (repeatable).")
+    run.add_argument("--baseline", help="Compare with this earlier report; exit 1 on regressions.")
+    run.add_argument("--threshold", type=float, default=0.10,
+                     help="Allowed slowdown as a fraction (default 0.10, i.e. 10%%).")
+
+    load = commands.add_parser("load", help="Ramp a mixed workload against gunicorn and find where it saturates.")
+    _add_setup_arguments(load, users=50, items=5000, bcrypt_rounds=12)
+    load.add_argument("--worker-class", help="gunicorn worker class (default: GUNICORN_WORKER_CLASS or gthread).")
+    load.add_argument("--stages", type=_stages, default="1,2,4,8,16,32,64",
+                      help="Concurrent clients per ramp stage, increasing.")
+    load.add_argument("--stage-seconds", type=float, default=15.0)
+    load.add_argument("--mix", help="Clients per persona, e.g. reader=70,writer=25,login=5 (the default).")
+    load.add_argument("--think-seconds", type=float, default=0.05,
+                      help="Mean pause between a client's requests (exponential); 0 for none.")
+    load.add_argument("--token-ttl", type=float,
+                      help="Lifetime of login tokens in seconds, so clients hit expiry and log in again "
+                           "(started server only).")
+    load.add_argument("--latency-slo-ms", type=float, default=500.0,
+                      help="A stage whose p95 is above this counts as saturated.")
+    load.add_argument("--max-error-rate", type=float, default=0.01,
+                      help="A stage with more failed requests than this fraction counts as saturated.")
+    load.add_argument("--min-gain", type=float, default=0.10,
+                      help="A stage adding less throughput than this fraction counts as saturated.")
+    load.add_argument("--full-ramp", action="store_true", help="Run every stage, even past saturation.")
+
+    compare = commands.add_parser("compare", help="Compare two JSON reports; exit 1 on regressions.")
+    compare.add_argument("baseline")
+    compare.add_argument("current")
+    compare.add_argument("--threshold", type=float, default=0.10)
+
+    args = parser.parse_args(argv)
+    if args.command == "compare":
+        return _compare(args)
+
+    workdir = None
+    if not args.database_url:
+        workdir = tempfile.mkdtemp(prefix="bench-")
+        args.database_url = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+
+    # Settings are read when the app's modules are imported, so they are set
+    # before anything below imports them.
+    os.environ["DATABASE_URL"] = args.database_url
+    os.environ["BCRYPT_ROUNDS"] = str(args.bcrypt_rounds)
+    os.environ["METRICS_ENABLED"] = "true"
+    os.environ.setdefault("JWT_SECRET_KEY", "benchmark-secret")
+    if getattr(args, "token_ttl", None):
+        os.environ["JWT_EXPIRATION_HOURS"] = str(args.token_ttl / 3600)
+    if getattr(args, "worker_class", None):
+        os.environ["GUNICORN_WORKER_CLASS"] = args.worker_class
+
+    from benchmarks import harness
+    from database import setup_database
+    from todo_app import create_app
+
+    app = create_app()
+    _quiet_logging()
+    try:
+        users = harness.seed(app, args.users, args.items, args.distribution, args.seed)
+        return _run(args, app, users) if args.command == "run" else _load(args, users)
+    finally:
+        setup_database.dispose_engines(app)
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _add_setup_arguments(parser: argparse.ArgumentParser, users: int, items: int, bcrypt_rounds: int) -> None:
+
+    parser.add_argument("--database-url", help="An empty database to seed (default: a fresh SQLite file).")
+    parser.add_argument("--users", type=int, default=users)
+    parser.add_argument("--items", type=int, default=items, help="Items in total, spread over the users.")
+    parser.add_argument("--distribution", choices=["uniform", "zipf"], default="zipf",
+                        help="How items are spread over users (zipf: a few users hold most of them).")
+    parser.add_argument("--server-url", help="Use this running server instead of starting gunicorn; it "
+                                             "must use the same DATABASE_URL and JWT_SECRET_KEY.")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers.")
+    parser.add_argument("--threads", type=int, default=4, help="Threads per gunicorn worker.")
+    parser.add_argument("--bcrypt-rounds", type=int, default=bcrypt_rounds,
+                        help="Cost of seeded passwords; login and register are bcrypt-bound.")
+    parser.add_argument("--seed", type=int, default=1, help="Seed for the data and the request mix.")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout.")
+
+
+def _run(args: argparse.Namespace, app, users) -> int:
+
+    from sqlalchemy.engine import make_url
+    from benchmarks import harness
+
+    settings = {"requests": args.requests, "concurrency": args.concurrency,
+                "warmup": args.warmup, "seed_value": args.seed, "only": args.scenarios}
+
+    if args.target == "client":
+        scenarios = harness.run(harness.ClientDriver(app), users, **settings)
+    elif args.server_url:
+        scenarios = harness.run(harness.HttpDriver(args.server_url), users, **settings)
+    else:
+        with harness.gunicorn_server(args.workers, args.threads) as url:
+            scenarios = harness.run(harness.HttpDriver(url, settle_seconds=0.3), users, **settings)
+
+    server = {"workers": args.workers, "threads": args.threads} if args.target == "server" else {}
+    report = {"meta": harness.metadata(target=args.target,
+                                       server_url=args.server_url,
+                                       **server,
+                                       database=make_url(args.database_url).get_backend_name(),
+                                       users=args.users,
+                                       items=args.items,
+                                       distribution=args.distribution,
+                                       requests=args.requests,
+                                       warmup=args.warmup,
+                                       concurrency=args.concurrency,
+                                       bcrypt_rounds=args.bcrypt_rounds,
+                                       seed=args.seed),
+              "scenarios": scenarios}
+
+    _write_report(report, args.output)
+    print(harness.summary(scenarios), file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            return _report_regressions(harness.compare(json.load(f), report, args.threshold))
+    return 0
+
+
+def _load(args: argparse.Namespace, users) -> int:
+
+    from sqlalchemy.engine import make_url
+    from benchmarks import harness, load
+
+    try:
+        mix = load.parse_mix(args.mix)
+    except ValueError as e:
+        raise SystemExit(f"--mix: {e}")
+
+    settings = {"stages": args.stages, "stage_seconds": args.stage_seconds, "mix": mix,
+                "think_seconds": args.think_seconds, "seed_value": args.seed,
+                "latency_slo_ms": args.latency_slo_ms, "max_error_rate": args.max_error_rate,
+                "min_gain": args.min_gain, "stop_at_saturation": not args.full_ramp}
+
+    if args.server_url:
+        result = load.ramp(harness.HttpDriver(args.server_url), users, **settings)
+    else:
+        with harness.gunicorn_server(args.workers, args.threads) as url:
+            result = load.ramp(harness.HttpDriver(url), users, **settings)
+
+    report = {"meta": harness.metadata(server_url=args.server_url,
+                                       workers=None if args.server_url else args.workers,
+                                       threads=None if args.server_url else args.threads,
+                                       worker_class=os.getenv("GUNICORN_WORKER_CLASS") or "gthread",
+                                       database=make_url(args.database_url).get_backend_name(),
+                                       users=args.users,
+                                       items=args.items,
+                                       distribution=args.distribution,
+                                       mix=settings["mix"],
+                                       think_seconds=args.think_seconds,
+                                       stage_seconds=args.stage_seconds,
+                                       token_ttl_seconds=args.token_ttl,
+                                       bcrypt_rounds=args.bcrypt_rounds,
+                                       seed=args.seed),
+              **result}
+
+    _write_report(report, args.output)
+    print(load.summary(report), file=sys.stderr)
+    return 0
+
+
+def _stages(text: str) -> List[int]:
+
+    try:
+        stages = [int(stage) for stage in text.split(",")]
+    except ValueError:
+        stages = []
+    if not stages or stages != sorted(set(stages)) or stages[0] < 1:
+        raise argparse.ArgumentTypeError("expected increasing positive numbers, e.g. 1,2,4,8")
+    return stages
+
+
+def _write_report(report, output: Optional[str]) -> None:
+
+    text = json.dumps(report, indent=2)
+    if output:
+        with open(output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+def _compare(args: argparse.Namespace) -> int:
+
+    from benchmarks import harness
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+
+    for key in ("target", "database", "users", "items", "distribution", "concurrency", "workers", "threads"):
+        if baseline["meta"].get(key) != current["meta"].get(key):
+            print(f"warning: runs differ in {key}: {baseline['meta'].get(key)} vs {current['meta'].get(key)}",
+                  file=sys.stderr)
+    return _report_regressions(harness.compare(baseline, current, args.threshold))
+
+
+def _report_regressions(regressions: List[str]) -> int:
+
+    for regression in regressions:
+        print(f"REGRESSION {regression}", file=sys.stderr)
+    if not regressions:
+        print("No regressions.", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+def _quiet_logging() -> None:
+
+    # The app logs every request at INFO to stdout, which would both skew the
+    # timings and mix into the JSON report; progress goes to stderr instead.
+    logging.getLogger().setLevel(logging.WARNING)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+    logger.addHandler(handler)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
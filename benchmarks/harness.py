@@ -0,0 +1,545 @@
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, FrozenSet, Iterator, List, NamedTuple, Optional, Tuple
+from urllib.parse import urlsplit
+import http.client
+import json
+import logging
+import math
+import os
+import platform
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+from database import migrations
+from database.models import db
+from repositories import user_repository
+from services import password_hasher, todo_service
+
+logger = logging.getLogger(__name__)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PASSWORD = "benchmark-password"
+# Title prefix of the items create_item makes, so they can be found again.
+CREATED_PREFIX = "new"
+WORDS = ("alpha", "bravo", "charlie", "delta", "echo", "foxtrot", "golf", "hotel", "india", "juliet")
+STATUSES = ("ToDo", "InProgress", "Done")
+# Share of items held by each user under the "zipf" distribution: the
+# heaviest user has the most, the long tail a few each, as in production.
+ZIPF_EXPONENT = 1.1
+RESULT_FORMAT = 1
+
+
+class Request(NamedTuple):
+    method: str
+    path: str
+    body: Optional[bytes] = None
+    headers: Dict[str, str] = {}
+
+
+class Scenario(NamedTuple):
+    name: str
+    method: str
+    # Route template as reported by /metrics, used to read query counts.
+    route: str
+    build: Callable[["Context", random.Random], Request]
+    expect: FrozenSet[int] = frozenset([200])
+
+
+class BenchUser:
+    """A seeded user, their token and items the scenarios can address."""
+
+    def __init__(self, user_id: str, email: str):
+
+        self.user_id = user_id
+        self.email = email
+        self.token: Optional[str] = None
+        self.item_ids: List[str] = []
+        self.etag: Optional[Tuple[str, str]] = None
+        # Items made by create_item, updated and then deleted by later scenarios.
+        self.created: List[str] = []
+
+    def auth(self, **headers: str) -> Dict[str, str]:
+
+        return {"Authorization": f"Bearer {self.token}", **headers}
+
+
+class Context:
+    """What the scenarios share: the seeded users, and a counter for unique names."""
+
+    def __init__(self, users: List[BenchUser]):
+
+        self.users = users
+        self._counter = iter(range(sys.maxsize))
+        self._lock = threading.Lock()
+
+    def user(self, rng: random.Random) -> BenchUser:
+
+        return rng.choice(self.users)
+
+    def unique(self) -> int:
+
+        with self._lock:
+            return next(self._counter)
+
+
+def json_request(method: str, path: str, payload: Any, headers: Dict[str, str]) -> Request:
+
+    return Request(method, path, json.dumps(payload).encode("utf-8"),
+                   {**headers, "Content-Type": "application/json"})
+
+
+def _new_item(rng: random.Random, number: int, prefix: str = "") -> Dict[str, Any]:
+
+    return {"title": f"{prefix}{rng.choice(WORDS)} {rng.choice(WORDS)} {number}",
+            "description": f"Benchmark item {number} about {rng.choice(WORDS)}",
+            "status": rng.choice(STATUSES)}
+
+
+def _created_item(context: Context, rng: random.Random, pop: bool = False) -> Tuple[BenchUser, str]:
+
+    # An item made by create_item. Once delete_item has used them all up, a
+    # missing id: the request then counts as an error.
+    users = [user for user in context.users if user.created] or context.users
+    user = rng.choice(users)
+    try:
+        return user, (user.created.pop() if pop else rng.choice(user.created))
+    except IndexError:
+        return user, "missing"
+
+
+def _get_item(context: Context, rng: random.Random) -> Request:
+
+    user = rng.choice([user for user in context.users if user.item_ids] or context.users)
+    item_id = rng.choice(user.item_ids) if user.item_ids else "missing"
+    return Request("GET", f"/user/items/{item_id}", headers=user.auth())
+
+
+def _get_item_unchanged(context: Context, rng: random.Random) -> Request:
+
+    user = rng.choice([user for user in context.users if user.etag])
+    item_id, etag = user.etag
+    return Request("GET", f"/user/items/{item_id}", headers=user.auth(**{"If-None-Match": etag}))
+
+
+def _create_item(context: Context, rng: random.Random) -> Request:
+
+    user = context.user(rng)
+    return json_request("POST", "/user/items", _new_item(rng, context.unique(), f"{CREATED_PREFIX} "), user.auth())
+
+
+def _update_item(context: Context, rng: random.Random) -> Request:
+
+    user, item_id = _created_item(context, rng)
+    return json_request("PUT", f"/user/items/{item_id}", {"status": rng.choice(STATUSES)}, user.auth())
+
+
+def _delete_item(context: Context, rng: random.Random) -> Request:
+
+    user, item_id = _created_item(context, rng, pop=True)
+    return Request("DELETE", f"/user/items/{item_id}", headers=user.auth())
+
+
+def _batch(context: Context, rng: random.Random) -> Request:
+
+    user = context.user(rng)
+    operations = [{"op": "create", "data": _new_item(rng, context.unique())} for _ in range(5)]
+    operations += [{"op": "get", "id": item_id} for item_id in user.item_ids[:5]]
+    return json_request("POST", "/user/items/batch", {"operations": operations}, user.auth())
+
+
+def _import(context: Context, rng: random.Random) -> Request:
+
+    user = context.user(rng)
+    lines = [json.dumps(_new_item(rng, context.unique())) for _ in range(10)]
+    return Request("POST", "/user/items/import", "\n".join(lines).encode("utf-8"),
+                   user.auth(**{"Content-Type": "application/x-ndjson"}))
+
+
+def _login(context: Context, rng: random.Random) -> Request:
+
+    return json_request("POST", "/login", {"email": context.user(rng).email, "password": PASSWORD}, {})
+
+
+def _register(context: Context, rng: random.Random) -> Request:
+
+    email = f"bench-new-{context.unique()}-{uuid.UUID(int=rng.getrandbits(128)).hex[:8]}@example.com"
+    return json_request("POST", "/register", {"email": email, "password": PASSWORD}, {})
+
+
+def _get(path: Callable[[BenchUser, random.Random], str]) -> Callable[[Context, random.Random], Request]:
+
+    def build(context: Context, rng: random.Random) -> Request:
+        user = context.user(rng)
+        return Request("GET", path(user, rng), headers=user.auth())
+    return build
+
+
+# Every API route except /metrics (read by the harness itself), the
+# /admin/profiles endpoints and the /user/items/events stream, which stays
+# open by design. Writers run after readers so reads see the seeded data
+# only; update_item and delete_item work on what create_item made.
+SCENARIOS = (
+    Scenario("health", "GET", "/health", lambda context, rng: Request("GET", "/health")),
+    Scenario("index", "GET", "/", lambda context, rng: Request("GET", "/")),
+    Scenario("list_items", "GET", "/user/items", _get(lambda user, rng: "/user/items?limit=50")),
+    Scenario("list_filtered", "GET", "/user/items",
+             _get(lambda user, rng: "/user/items?filter=status=Done&sort_by=title&limit=50")),
+    Scenario("search", "GET", "/user/items", _get(lambda user, rng: f"/user/items?q={rng.choice(WORDS)}")),
+    Scenario("list_stream", "GET", "/user/items", _get(lambda user, rng: "/user/items?stream=1")),
+    Scenario("stats", "GET", "/user/items/stats", _get(lambda user, rng: "/user/items/stats")),
+    Scenario("changes", "GET", "/user/items/changes", _get(lambda user, rng: "/user/items/changes")),
+    Scenario("export", "GET", "/user/items/export", _get(lambda user, rng: "/user/items/export?format=csv")),
+    Scenario("get_item", "GET", "/user/items/<item_id>", _get_item),
+    Scenario("get_item_unchanged", "GET", "/user/items/<item_id>", _get_item_unchanged, frozenset([304])),
+    Scenario("get_user", "GET", "/user/<user_id>", _get(lambda user, rng: f"/user/{user.user_id}")),
+    Scenario("login", "POST", "/login", _login),
+    Scenario("create_item", "POST", "/user/items", _create_item, frozenset([201])),
+    Scenario("update_item", "PUT", "/user/items/<item_id>", _update_item),
+    Scenario("batch", "POST", "/user/items/batch", _batch),
+    Scenario("import", "POST", "/user/items/import", _import),
+    Scenario("delete_item", "DELETE", "/user/items/<item_id>", _delete_item),
+    Scenario("register", "POST", "/register", _register, frozenset([201])),
+)
+
+
+def item_counts(users: int, items: int, distribution: str) -> List[int]:
+
+    # Items per user, adding up to `items` exactly.
+    if distribution == "uniform":
+        weights = [1.0] * users
+    elif distribution == "zipf":
+        weights = [1 / (rank + 1) ** ZIPF_EXPONENT for rank in range(users)]
+    else:
+        raise ValueError(f"Unknown distribution: {distribution}")
+
+    total = sum(weights)
+    counts = [int(items * weight / total) for weight in weights]
+    for rank in range(items - sum(counts)):
+        counts[rank % users] += 1
+    return counts
+
+
+def seed(app, users: int, items: int, distribution: str, seed_value: int) -> List[BenchUser]:
+
+    # Migrates the database and fills it through the same code paths as the
+    # API (import_todos keeps counters, search index and shards right). The
+    # password is hashed once: bcrypt per user would dominate seeding.
+    rng = random.Random(seed_value)
+    seeded = []
+
+    with app.app_context():
+        migrations.upgrade(db.engine)
+        if user_repository.get_all_user_ids():
+            raise ValueError("The benchmark database already has users; use an empty one.")
+
+        password_hash = password_hasher.hash_password(PASSWORD)
+        for rank, count in enumerate(item_counts(users, items, distribution)):
+            user = BenchUser(str(uuid.UUID(int=rng.getrandbits(128), version=4)), f"bench-{rank}@example.com")
+            user_repository.create_user(user_id=user.user_id, email=user.email,
+                                        password_hash=password_hash, created_at=datetime.now(timezone.utc))
+
+            records = ((number, _new_item(rng, number), None) for number in range(count))
+            report, error = todo_service.import_todos(records, user.user_id)
+            if error or report["failed"]:
+                raise RuntimeError(f"Could not seed items for {user.email}: {error or report['errors']}")
+            seeded.append(user)
+
+    logger.info(f"Seeded {users} users and {items} items ({distribution}).")
+    return seeded
+
+
+class ClientDriver:
+    """Sends requests through Flask's test client, in process."""
+
+    def __init__(self, app):
+
+        self.app = app
+        self._local = threading.local()
+
+    def send(self, request: Request) -> Tuple[int, Any, bytes]:
+
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+
+        response = client.open(request.path, method=request.method, data=request.body, headers=request.headers)
+        body = response.get_data()
+        response.close()
+        return response.status_code, response.headers, body
+
+    def settle(self) -> None:
+
+        pass
+
+
+class HttpDriver:
+    """Sends requests to a running server, one keep-alive connection per thread."""
+
+    def __init__(self, base_url: str, settle_seconds: float = 0.0):
+
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.settle_seconds = settle_seconds
+        self._local = threading.local()
+
+    def send(self, request: Request) -> Tuple[int, Any, bytes]:
+
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+
+        try:
+            connection.request(request.method, request.path, body=request.body, headers=request.headers)
+            response = connection.getresponse()
+            return response.status, response.headers, response.read()
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            self._local.connection = None
+            raise
+
+    def settle(self) -> None:
+
+        # Lets every worker flush its metrics before they are scraped.
+        time.sleep(self.settle_seconds)
+
+
+def prepare(driver, users: List[BenchUser]) -> Context:
+
+    # Untimed: a token per user, some of their item ids and one ETag.
+    for user in users:
+        status, _, body = driver.send(json_request("POST", "/login", {"email": user.email, "password": PASSWORD}, {}))
+        if status != 200:
+            raise RuntimeError(f"Could not log in {user.email}: {status} {body[:200]!r}")
+        user.token = json.loads(body)["user"]["token"]
+
+        status, _, body = driver.send(Request("GET", "/user/items?limit=50&fields=id", headers=user.auth()))
+        user.item_ids = [item["id"] for item in json.loads(body)["items"]] if status == 200 else []
+
+        if user.item_ids:
+            status, headers, _ = driver.send(Request("GET", f"/user/items/{user.item_ids[0]}", headers=user.auth()))
+            if status == 200 and headers.get("ETag"):
+                user.etag = (user.item_ids[0], headers.get("ETag"))
+    return Context(users)
+
+
+def query_totals(driver) -> Dict[str, Tuple[float, float]]:
+
+    # Per route: (queries, requests) so far, from the app's own /metrics.
+    driver.settle()
+    status, _, body = driver.send(Request("GET", "/metrics"))
+    if status != 200:
+        return {}
+
+    totals: Dict[str, List[float]] = {}
+    for match in re.finditer(r'^db_queries_per_request_(sum|count)\{route="((?:[^"\\]|\\.)*)"\} (\S+)$',
+                             body.decode("utf-8"), re.MULTILINE):
+        kind, route, value = match.groups()
+        route = route.replace('\\"', '"').replace("\\\\", "\\")
+        totals.setdefault(route, [0.0, 0.0])[0 if kind == "sum" else 1] = float(value)
+    return {route: (queries, requests) for route, (queries, requests) in totals.items()}
+
+
+def percentile(values: List[float], fraction: float) -> float:
+
+    # Nearest rank on sorted values.
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+def run_scenario(driver, scenario: Scenario, context: Context, requests: int, concurrency: int,
+                 warmup: int, seed_value: int) -> Dict[str, Any]:
+
+    warmup_rng = random.Random(f"{seed_value}-{scenario.name}-warmup")
+    for _ in range(warmup):
+        driver.send(scenario.build(context, warmup_rng))
+
+    before = query_totals(driver)
+    latencies: List[float] = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def work(worker: int, count: int) -> None:
+        rng = random.Random(f"{seed_value}-{scenario.name}-{worker}")
+        timings, failed = [], 0
+        for _ in range(count):
+            request = scenario.build(context, rng)
+            started = time.perf_counter()
+            try:
+                status, _, _ = driver.send(request)
+            except (OSError, http.client.HTTPException):
+                status = None
+            timings.append(time.perf_counter() - started)
+            failed += status not in scenario.expect
+        with lock:
+            latencies.extend(timings)
+            errors[0] += failed
+
+    shares = [requests // concurrency + (worker < requests % concurrency) for worker in range(concurrency)]
+    threads = [threading.Thread(target=work, args=(worker, share)) for worker, share in enumerate(shares) if share]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    after = query_totals(driver)
+    queries, counted = (after.get(scenario.route, (0, 0))[i] - before.get(scenario.route, (0, 0))[i]
+                        for i in (0, 1))
+
+    latencies.sort()
+    return {"route": scenario.route,
+            "method": scenario.method,
+            "requests": len(latencies),
+            "errors": errors[0],
+            "throughput_rps": round(len(latencies) / elapsed, 2),
+            "latency_ms": {"mean": round(sum(latencies) / len(latencies) * 1000, 3),
+                           "p50": round(percentile(latencies, 0.50) * 1000, 3),
+                           "p95": round(percentile(latencies, 0.95) * 1000, 3),
+                           "p99": round(percentile(latencies, 0.99) * 1000, 3),
+                           "max": round(latencies[-1] * 1000, 3)},
+            "queries_per_request": round(queries / counted, 2) if counted else None}
+
+
+def run(driver, users: List[BenchUser], requests: int, concurrency: int, warmup: int, seed_value: int,
+        only: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+
+    context = prepare(driver, users)
+    results = {}
+    for scenario in SCENARIOS:
+        if only and scenario.name not in only:
+            continue
+        if scenario.name in ("update_item", "delete_item") and not any(user.created for user in users):
+            # Needs the items create_item makes.
+            continue
+
+        result = run_scenario(driver, scenario, context, requests, concurrency, warmup, seed_value)
+        results[scenario.name] = result
+        if scenario.name == "create_item":
+            _collect_created(driver, context)
+        logger.info(f"{scenario.name}: {result['throughput_rps']} req/s, p95 {result['latency_ms']['p95']} ms")
+    return results
+
+
+def _collect_created(driver, context: Context) -> None:
+
+    # Ids of the items create_item made, for update and delete.
+    for user in context.users:
+        status, _, body = driver.send(Request("GET", f"/user/items?filter=title^={CREATED_PREFIX}"
+                                                     "&limit=500&fields=id", headers=user.auth()))
+        if status == 200:
+            user.created = [item["id"] for item in json.loads(body)["items"]]
+
+
+def metadata(**settings: Any) -> Dict[str, Any]:
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+
+    return {"format": RESULT_FORMAT,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "commit": commit,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            **settings}
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float) -> List[str]:
+
+    # Regressions of `current` against `baseline`: a latency percentile up or
+    # throughput down by more than `threshold` (a fraction), more queries per
+    # request (by half a query or more), or new errors.
+    regressions = []
+    for name, now in current["scenarios"].items():
+        before = baseline["scenarios"].get(name)
+        if before is None:
+            continue
+
+        for key in ("p50", "p95", "p99"):
+            if now["latency_ms"][key] > before["latency_ms"][key] * (1 + threshold):
+                regressions.append(f"{name}: {key} {before['latency_ms'][key]} -> {now['latency_ms'][key]} ms")
+        if now["throughput_rps"] < before["throughput_rps"] * (1 - threshold):
+            regressions.append(f"{name}: throughput {before['throughput_rps']} -> {now['throughput_rps']} req/s")
+        if (now["queries_per_request"] is not None and before["queries_per_request"] is not None
+                and now["queries_per_request"] - before["queries_per_request"] >= 0.5):
+            regressions.append(f"{name}: queries per request {before['queries_per_request']} "
+                               f"-> {now['queries_per_request']}")
+        if now["errors"] > before["errors"]:
+            regressions.append(f"{name}: errors {before['errors']} -> {now['errors']}")
+    return regressions
+
+
+def summary(results: Dict[str, Dict[str, Any]]) -> str:
+
+    lines = [f"{'scenario':20} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'queries':>8} {'errors':>6}"]
+    for name, result in results.items():
+        latency = result["latency_ms"]
+        queries = result["queries_per_request"]
+        lines.append(f"{name:20} {result['throughput_rps']:9.1f} {latency['p50']:9.3f} {latency['p95']:9.3f} "
+                     f"{latency['p99']:9.3f} {'-' if queries is None else queries:>8} {result['errors']:6}")
+    return "\n".join(lines)
+
+
+def _free_port() -> int:
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def gunicorn_server(workers: int, threads: int, startup_timeout: float = 60.0) -> Iterator[str]:
+
+    # gunicorn with the repo's gunicorn.conf.py on a free local port, against
+    # the same DATABASE_URL and JWT secret as this process. Metrics go through
+    # a shared METRICS_DIR flushed often, so scrapes see every worker.
+    port = _free_port()
+    metrics_dir = tempfile.mkdtemp(prefix="bench-metrics-")
+    log = tempfile.NamedTemporaryFile(prefix="bench-gunicorn-", suffix=".log", delete=False)
+    env = {**os.environ,
+           "GUNICORN_BIND": f"127.0.0.1:{port}",
+           "WEB_CONCURRENCY": str(workers),
+           "GUNICORN_THREADS": str(threads),
+           "METRICS_ENABLED": "true",
+           "METRICS_DIR": metrics_dir,
+           "METRICS_FLUSH_SECONDS": "0.1"}
+    process = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "wsgi:application"],
+                               cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    url = f"http://127.0.0.1:{port}"
+
+    try:
+        deadline = time.monotonic() + startup_timeout
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f"gunicorn exited with {process.returncode}; see {log.name}")
+            try:
+                status, _, _ = HttpDriver(url).send(Request("GET", "/health"))
+                if status == 200:
+                    break
+            except (OSError, http.client.HTTPException):
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"gunicorn did not become healthy in {startup_timeout:.0f} s; see {log.name}")
+            time.sleep(0.2)
+
+        logger.info(f"gunicorn serving at {url} ({workers} workers x {threads} threads), log in {log.name}")
+        yield url
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        log.close()
@@ -0,0 +1,342 @@
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+import http.client
+import json
+import logging
+import random
+import threading
+import time
+
+from benchmarks.harness import PASSWORD, STATUSES, WORDS, BenchUser, Request, json_request, percentile
+
+logger = logging.getLogger(__name__)
+
+# Share of virtual users per persona: readers poll for changes the way the
+# web client does, writers create, update and delete their items, and login
+# users sign in over and over (a login storm, e.g. after a deploy).
+DEFAULT_MIX = {"reader": 70, "writer": 25, "login": 5}
+# A writer's actions and how often each is picked.
+WRITER_ACTIONS = (("create", 50), ("update", 35), ("delete", 15))
+# Readers fetch a page of items every this many polls, and re-check an item
+# they have seen (If-None-Match) every READER_REVALIDATE_EVERY polls.
+READER_LIST_EVERY = 10
+READER_REVALIDATE_EVERY = 3
+
+
+class Recorder:
+    """Every request's start time, operation, latency and outcome, plus token events."""
+
+    def __init__(self):
+
+        self.started = time.perf_counter()
+        self.samples: List[Tuple[float, str, float, bool]] = []
+        self.tokens = {"logins": 0, "expired": 0}
+        self._lock = threading.Lock()
+
+    def elapsed(self) -> float:
+
+        return time.perf_counter() - self.started
+
+    def record(self, operation: str, started: float, latency: float, ok: bool) -> None:
+
+        # list.append is atomic, so no lock on the hot path.
+        self.samples.append((started - self.started, operation, latency, ok))
+
+    def count(self, event: str) -> None:
+
+        with self._lock:
+            self.tokens[event] += 1
+
+
+class VirtualUser(threading.Thread):
+    """One simulated client: logs in once, reuses its token and logs in again when it expires."""
+
+    def __init__(self, number: int, persona: str, user: BenchUser, users: Sequence[BenchUser], driver,
+                 recorder: Recorder, stop: threading.Event, think_seconds: float, seed_value: int):
+
+        super().__init__(name=f"vu-{number}-{persona}", daemon=True)
+        self.persona = persona
+        self.user = user
+        self.users = users
+        self.driver = driver
+        self.recorder = recorder
+        self.stop = stop
+        self.think_seconds = think_seconds
+        self.rng = random.Random(f"{seed_value}-vu-{number}")
+        self.token: Optional[str] = None
+        self.iteration = 0
+        # Reader state: the delta-sync token and ETags of items seen.
+        self.since: Optional[str] = None
+        self.etags: Dict[str, str] = {}
+        # Writer state: (id, version) of the items this client made.
+        self.created: List[Tuple[str, int]] = []
+
+    def run(self) -> None:
+
+        step = getattr(self, f"_{self.persona}")
+        while not self.stop.is_set():
+            self.iteration += 1
+            step()
+            if self.think_seconds:
+                self.stop.wait(self.rng.expovariate(1 / self.think_seconds))
+
+    def send(self, operation: str, request: Request) -> Tuple[Optional[int], Any, bytes]:
+
+        started = time.perf_counter()
+        try:
+            status, headers, body = self.driver.send(request)
+        except (OSError, http.client.HTTPException):
+            status, headers, body = None, {}, b""
+        # Client errors are answers; no answer, 429 and 5xx are failures.
+        ok = status is not None and status < 500 and status != 429
+        self.recorder.record(operation, started, time.perf_counter() - started, ok)
+        return status, headers, body
+
+    def login(self, user: Optional[BenchUser] = None) -> Optional[str]:
+
+        user = user or self.user
+        credentials = {"email": user.email, "password": PASSWORD}
+        status, _, body = self.send("login", json_request("POST", "/login", credentials, {}))
+        self.recorder.count("logins")
+        return json.loads(body)["user"]["token"] if status == 200 else None
+
+    def call(self, operation: str, build: Callable[[Dict[str, str]], Request]) -> Tuple[Optional[int], Any, bytes]:
+
+        # Sends with the cached token; a 401 means it expired, so log in and
+        # retry once, as the web client does.
+        if self.token is None:
+            self.token = self.login()
+            if self.token is None:
+                return None, {}, b""
+
+        status, headers, body = self.send(operation, build({"Authorization": f"Bearer {self.token}"}))
+        if status == 401:
+            self.recorder.count("expired")
+            self.token = self.login()
+            if self.token is None:
+                return None, {}, b""
+            status, headers, body = self.send(operation, build({"Authorization": f"Bearer {self.token}"}))
+        return status, headers, body
+
+    def _reader(self) -> None:
+
+        if self.iteration % READER_LIST_EVERY == 1:
+            status, _, body = self.call("list", lambda auth: Request("GET", "/user/items?limit=50", headers=auth))
+            if status == 200:
+                for item in json.loads(body)["items"][:10]:
+                    self.etags.setdefault(item["id"], "")
+
+        path = f"/user/items/changes?since={self.since}" if self.since else "/user/items/changes"
+        status, _, body = self.call("poll", lambda auth: Request("GET", path, headers=auth))
+        if status == 200:
+            self.since = json.loads(body).get("next_since")
+        elif status == 410:
+            self.since = None
+
+        if self.etags and self.iteration % READER_REVALIDATE_EVERY == 0:
+            item_id = self.rng.choice(sorted(self.etags))
+            status, headers, _ = self.call("get_item", lambda auth: Request(
+                "GET", f"/user/items/{item_id}",
+                headers={**auth, **({"If-None-Match": self.etags[item_id]} if self.etags[item_id] else {})}))
+            if status == 200 and headers.get("ETag"):
+                self.etags[item_id] = headers.get("ETag")
+            elif status == 404:
+                del self.etags[item_id]
+
+    def _writer(self) -> None:
+
+        action = self.rng.choices([name for name, _ in WRITER_ACTIONS],
+                                  [weight for _, weight in WRITER_ACTIONS])[0]
+        if action != "create" and not self.created:
+            action = "create"
+
+        if action == "create":
+            item = {"title": f"{self.rng.choice(WORDS)} {self.rng.choice(WORDS)}",
+                    "description": f"Load test item about {self.rng.choice(WORDS)}",
+                    "status": self.rng.choice(STATUSES)}
+            status, _, body = self.call("create", lambda auth: json_request("POST", "/user/items", item, auth))
+            if status == 201:
+                created = json.loads(body)["item"]
+                self.created.append((created["id"], created.get("version", 1)))
+
+        elif action == "update":
+            index = self.rng.randrange(len(self.created))
+            item_id, version = self.created[index]
+            update = {"status": self.rng.choice(STATUSES)}
+            status, _, body = self.call("update", lambda auth: json_request(
+                "PUT", f"/user/items/{item_id}", update, {**auth, "If-Match": f'"{version}"'}))
+            if status == 200:
+                self.created[index] = (item_id, json.loads(body)["item"].get("version", version + 1))
+            elif status in (404, 412):
+                del self.created[index]
+
+        else:
+            item_id, _ = self.created.pop(self.rng.randrange(len(self.created)))
+            self.call("delete", lambda auth: Request("DELETE", f"/user/items/{item_id}", headers=auth))
+
+    def _login(self) -> None:
+
+        self.login(self.rng.choice(self.users))
+
+
+def parse_mix(text: Optional[str]) -> Dict[str, float]:
+
+    # "reader=70,writer=25,login=5"
+    if not text:
+        return dict(DEFAULT_MIX)
+
+    mix = {}
+    for part in text.split(","):
+        persona, _, weight = part.partition("=")
+        persona = persona.strip()
+        if persona not in DEFAULT_MIX:
+            raise ValueError(f"Unknown persona: {persona} (choose from {', '.join(DEFAULT_MIX)})")
+        mix[persona] = float(weight)
+    if sum(mix.values()) <= 0:
+        raise ValueError("The mix needs at least one persona with a positive weight.")
+    return mix
+
+
+def assign_personas(count: int, mix: Dict[str, float]) -> List[str]:
+
+    # Deterministic and proportional at every prefix, so each ramp stage has
+    # the configured mix, not just the last one.
+    total = sum(mix.values())
+    assigned = {persona: 0 for persona in mix}
+    personas = []
+    for number in range(1, count + 1):
+        persona = max(mix, key=lambda name: mix[name] / total * number - assigned[name])
+        assigned[persona] += 1
+        personas.append(persona)
+    return personas
+
+
+def summarize(samples: Sequence[Tuple[float, str, float, bool]], duration: float) -> Dict[str, Any]:
+
+    latencies = sorted(sample[2] for sample in samples)
+    errors = sum(1 for sample in samples if not sample[3])
+    if not latencies:
+        return {"requests": 0, "errors": 0, "error_rate": 0.0, "throughput_rps": 0.0,
+                "latency_ms": {"p50": None, "p95": None, "p99": None}}
+
+    return {"requests": len(latencies),
+            "errors": errors,
+            "error_rate": round(errors / len(latencies), 4),
+            "throughput_rps": round((len(latencies) - errors) / duration, 2),
+            "latency_ms": {key: round(percentile(latencies, fraction) * 1000, 3)
+                           for key, fraction in (("p50", 0.50), ("p95", 0.95), ("p99", 0.99))}}
+
+
+def find_saturation(stages: List[Dict[str, Any]], latency_slo_ms: float, max_error_rate: float,
+                    min_gain: float) -> Optional[Dict[str, Any]]:
+
+    # The first stage where more clients stopped buying more throughput (less
+    # than min_gain over the best stage so far), or where p95 latency or the
+    # error rate went past its limit.
+    best = None
+    for stage in stages:
+        reason = None
+        if stage["error_rate"] > max_error_rate:
+            reason = f"error rate {stage['error_rate']:.2%} over {max_error_rate:.2%}"
+        elif stage["latency_ms"]["p95"] is not None and stage["latency_ms"]["p95"] > latency_slo_ms:
+            reason = f"p95 {stage['latency_ms']['p95']} ms over {latency_slo_ms} ms"
+        elif best and stage["throughput_rps"] < best["throughput_rps"] * (1 + min_gain):
+            reason = (f"throughput {stage['throughput_rps']} req/s, under {min_gain:.0%} more than "
+                      f"{best['throughput_rps']} req/s at {best['concurrency']} clients")
+
+        if reason:
+            return {"concurrency": stage["concurrency"], "reason": reason}
+        if best is None or stage["throughput_rps"] > best["throughput_rps"]:
+            best = stage
+    return None
+
+
+def ramp(driver, users: Sequence[BenchUser], stages: Sequence[int], stage_seconds: float,
+         mix: Dict[str, float], think_seconds: float, seed_value: int, latency_slo_ms: float,
+         max_error_rate: float, min_gain: float, stop_at_saturation: bool = True) -> Dict[str, Any]:
+
+    # Closed-loop ramp: each stage adds virtual users up to its concurrency
+    # and runs for stage_seconds; the ones started earlier keep going. Each
+    # virtual user acts as one of the seeded users, several share one as
+    # with phones and laptops of the same person.
+    recorder = Recorder()
+    stop = threading.Event()
+    personas = assign_personas(max(stages), mix)
+    clients: List[VirtualUser] = []
+    results, windows, saturation = [], [], None
+
+    try:
+        for concurrency in stages:
+            while len(clients) < concurrency:
+                number = len(clients)
+                client = VirtualUser(number, personas[number], users[number % len(users)], users, driver,
+                                     recorder, stop, think_seconds, seed_value)
+                client.start()
+                clients.append(client)
+
+            started = recorder.elapsed()
+            time.sleep(stage_seconds)
+            ended = recorder.elapsed()
+            windows.append((started, ended, concurrency))
+
+            samples = [sample for sample in list(recorder.samples) if started <= sample[0] < ended]
+            stage = {"concurrency": concurrency,
+                     "started_at": round(started, 3),
+                     **summarize(samples, ended - started),
+                     "operations": {operation: summarize([s for s in samples if s[1] == operation], ended - started)
+                                    for operation in sorted({sample[1] for sample in samples})}}
+            results.append(stage)
+            logger.info(f"{concurrency} clients: {stage['throughput_rps']} req/s, "
+                        f"p95 {stage['latency_ms']['p95']} ms, {stage['errors']} errors")
+
+            saturation = find_saturation(results, latency_slo_ms, max_error_rate, min_gain)
+            if saturation and stop_at_saturation:
+                break
+    finally:
+        stop.set()
+        for client in clients:
+            client.join(timeout=70)
+
+    peak = max(results, key=lambda stage: stage["throughput_rps"]) if results else None
+    return {"stages": results,
+            "timeline": timeline(list(recorder.samples), windows),
+            "tokens": dict(recorder.tokens),
+            "peak": {"concurrency": peak["concurrency"], "throughput_rps": peak["throughput_rps"]} if peak else None,
+            "saturation": saturation}
+
+
+def timeline(samples: List[Tuple[float, str, float, bool]],
+             windows: List[Tuple[float, float, int]]) -> List[Dict[str, Any]]:
+
+    # One entry per second of the run, with the concurrency at that time.
+    if not windows:
+        return []
+
+    seconds: Dict[int, List[Tuple[float, str, float, bool]]] = {}
+    for sample in samples:
+        if sample[0] < windows[-1][1]:
+            seconds.setdefault(int(sample[0]), []).append(sample)
+
+    entries = []
+    for second in range(int(windows[-1][1]) + 1):
+        concurrency = next((level for started, ended, level in windows if started <= second < ended),
+                           windows[0][2])
+        entries.append({"t": second, "concurrency": concurrency, **summarize(seconds.get(second, []), 1.0)})
+    return entries
+
+
+def summary(report: Dict[str, Any]) -> str:
+
+    lines = [f"{'clients':>8} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}"]
+    for stage in report["stages"]:
+        latency = stage["latency_ms"]
+        lines.append(f"{stage['concurrency']:8} {stage['throughput_rps']:9.1f} {latency['p50'] or 0:9.3f} "
+                     f"{latency['p95'] or 0:9.3f} {latency['p99'] or 0:9.3f} {stage['errors']:7}")
+
+    tokens = report["tokens"]
+    lines.append(f"logins {tokens['logins']}, expired tokens {tokens['expired']}")
+    if report["peak"]:
+        lines.append(f"peak {report['peak']['throughput_rps']} req/s at {report['peak']['concurrency']} clients")
+    saturation = report["saturation"]
+    lines.append(f"saturated at {saturation['concurrency']} clients: {saturation['reason']}" if saturation
+                 else "not saturated; add higher stages")
+    return "\n".join(lines)
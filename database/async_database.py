@@ -0,0 +1,98 @@
+import logging
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Dict, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+
+from database import routing, setup_database, sharding
+
+logger = logging.getLogger(__name__)
+
+# The asyncio driver used when DATABASE_URL names none (or a blocking one).
+_ASYNC_DRIVER_FOR = {"postgresql": "asyncpg", "sqlite": "aiosqlite"}
+
+
+def async_url(database_url: str) -> str:
+
+    # postgresql://... and postgresql+psycopg2://... become postgresql+asyncpg://...,
+    # sqlite:///... becomes sqlite+aiosqlite:///...; async URLs pass through.
+    url = make_url(database_url)
+    backend, _, driver = url.drivername.partition("+")
+    if driver in setup_database.ASYNC_DRIVERS:
+        return database_url
+
+    if backend not in _ASYNC_DRIVER_FOR:
+        raise ValueError(f"No asyncio driver known for {backend} databases.")
+    return url.set(drivername=f"{backend}+{_ASYNC_DRIVER_FOR[backend]}").render_as_string(hide_password=False)
+
+
+class AsyncDatabase:
+    """Async engine plus one AsyncSession per request.
+
+    The ASGI counterpart of Flask-SQLAlchemy's db: repositories use
+    adb.session, which scope() binds for the duration of a request (or a
+    task), and commits stay explicit.
+    """
+
+    def __init__(self):
+
+        self.engine: Optional[AsyncEngine] = None
+        self._sessionmaker: Optional[async_sessionmaker] = None
+        self._session: ContextVar[Optional[AsyncSession]] = ContextVar("async_session", default=None)
+
+    def init(self, database_url: str) -> None:
+
+        # Like init_db(), builds the engine without connecting.
+        if sharding.enabled() or routing.DATABASE_REPLICA_URLS:
+            raise ValueError("The async app serves a single database; "
+                             "unset DATABASE_SHARD_URLS and DATABASE_REPLICA_URLS.")
+
+        url = async_url(database_url)
+        self.engine = create_async_engine(url, **setup_database.engine_options(url))
+        # Rows are turned into dicts before commit; nothing needs reloading.
+        self._sessionmaker = async_sessionmaker(self.engine, expire_on_commit=False, autoflush=False)
+        logger.info("Async database initialized successfully with SQLAlchemy!")
+
+    @property
+    def session(self) -> AsyncSession:
+
+        session = self._session.get()
+        if session is None:
+            raise RuntimeError("No async database session; run inside adb.scope().")
+        return session
+
+    @asynccontextmanager
+    async def scope(self) -> AsyncIterator[AsyncSession]:
+
+        session = self._sessionmaker()
+        token = self._session.set(session)
+        try:
+            yield session
+        finally:
+            self._session.reset(token)
+            await session.close()
+
+    async def check_connection(self) -> bool:
+
+        try:
+            async with self.engine.connect() as conn:
+                await conn.execute(text("SELECT 1"))
+            return True
+        except Exception as e:
+            logger.error(f"Database connection failed: {str(e)}")
+            return False
+
+    def pool_status(self) -> Dict[str, Any]:
+
+        return {"default": setup_database.pool_stats(self.engine.pool)}
+
+    async def dispose(self) -> None:
+
+        if self.engine is not None:
+            await self.engine.dispose()
+
+
+adb = AsyncDatabase()
@@ -0,0 +1,429 @@
+import argparse
+import logging
+import os
+import sys
+from datetime import datetime, timezone
+from typing import Callable, List, NamedTuple, Optional, Sequence, Set
+
+from sqlalchemy import (BigInteger, CheckConstraint, Column, DateTime, ForeignKey, Index, Integer, MetaData,
+                        String, Table, Text, create_engine, inspect, select, text)
+from sqlalchemy.engine import Connection, Engine
+
+logger = logging.getLogger(__name__)
+
+
+class Migration(NamedTuple):
+    version: str
+    description: str
+    upgrade: Callable[[Connection], None]
+    # Non-transactional migrations run on an autocommit connection, which
+    # Postgres requires for CREATE INDEX CONCURRENTLY.
+    transactional: bool = True
+
+
+_migrations_metadata = MetaData()
+
+schema_migrations = Table(
+    "schema_migrations", _migrations_metadata,
+    Column("version", String(64), primary_key=True),
+    Column("description", String(200), nullable=False),
+    Column("applied_at", DateTime, nullable=False)
+)
+
+
+def create_index(conn: Connection, name: str, table: str, columns: Sequence[str],
+                 using: Optional[str] = None) -> None:
+
+    # On Postgres the build is CONCURRENTLY, so writes continue meanwhile. A
+    # concurrent build that fails (deadlock, unique violation, cancelled
+    # deploy) leaves an INVALID index behind, which IF NOT EXISTS would then
+    # skip forever while queries ignore it. Such a leftover is dropped and
+    # rebuilt, and the index is checked afterwards, so the migration is only
+    # recorded once the index is usable.
+    method = f"USING {using} " if using else ""
+    definition = f"ON {table} {method}({', '.join(columns)})"
+
+    if conn.dialect.name != "postgresql":
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} {definition}"))
+        logger.info(f"Index {name} is present on {table}.")
+        return
+
+    if _index_valid(conn, name) is False:
+        logger.warning(f"Index {name} on {table} is INVALID from an earlier failed build; rebuilding it.")
+        conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+
+    conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} {definition}"))
+
+    if not _index_valid(conn, name):
+        raise RuntimeError(f"Index {name} on {table} is not valid after building it; "
+                           f"drop it and run the migration again.")
+    logger.info(f"Index {name} is present on {table}.")
+
+
+def _index_valid(conn: Connection, name: str) -> Optional[bool]:
+
+    # pg_index.indisvalid of the index visible on the search path, or None
+    # when there is no such index.
+    return conn.execute(text(
+        "SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+        "WHERE c.relname = :name AND pg_catalog.pg_table_is_visible(c.oid)"), {"name": name}).scalar()
+
+
+def _initial_schema(conn: Connection) -> None:
+
+    # Frozen copy of the schema as it was before versioned migrations, so later
+    # model changes never leak into this step.
+    metadata = MetaData()
+
+    Table("users", metadata,
+          Column("id", String(36), primary_key=True),
+          Column("email", String(120), unique=True, nullable=False),
+          Column("password_hash", String(60), nullable=False),
+          Column("created_at", DateTime, nullable=False))
+
+    Table("items", metadata,
+          Column("id", String(36), primary_key=True),
+          Column("title", String(200), nullable=False),
+          Column("description", Text),
+          Column("status", String(20), nullable=False),
+          Column("timestamp", DateTime, nullable=False),
+          Column("user_id", String(36), ForeignKey("users.id", ondelete="CASCADE"),
+                 nullable=False),
+          CheckConstraint("status IN ('ToDo', 'InProgress', 'Done')", name="valid_status_check"),
+          Index("ix_items_user_id", "user_id"))
+
+    inspector = inspect(conn)
+    if "items" in inspector.get_table_names():
+        columns = [col["name"] for col in inspector.get_columns("items")]
+        if "user_id" not in columns:
+            _add_items_user_id(conn)
+
+    metadata.create_all(conn, checkfirst=True)
+
+
+def _add_items_user_id(conn: Connection) -> None:
+
+    item_count = conn.execute(text("SELECT COUNT(*) FROM items")).scalar()
+    if item_count > 0:
+        logger.warning(f"Found {item_count} existing items without user_id, removing them.")
+        conn.execute(text("DELETE FROM items"))
+
+    conn.execute(text("ALTER TABLE items ADD COLUMN user_id VARCHAR(36)"))
+
+    if conn.dialect.name != "sqlite":
+        conn.execute(text("""
+            ALTER TABLE items
+            ADD CONSTRAINT items_user_id_fkey
+            FOREIGN KEY (user_id) REFERENCES users(id)
+            ON DELETE CASCADE
+            """))
+
+    logger.info("user_id column added to items.")
+
+
+# Composite indexes matching the list queries: always scoped by user_id,
+# optionally filtered by status, ordered by (sort column, id).
+ITEMS_ACCESS_INDEXES = [
+    ("ix_items_user_id_id", ("user_id", "id")),
+    ("ix_items_user_timestamp", ("user_id", "timestamp", "id")),
+    ("ix_items_user_title", ("user_id", "title", "id")),
+    ("ix_items_user_status", ("user_id", "status", "id")),
+    ("ix_items_user_status_timestamp", ("user_id", "status", "timestamp", "id")),
+    ("ix_items_user_status_title", ("user_id", "status", "title", "id")),
+]
+
+
+def _items_access_indexes(conn: Connection) -> None:
+
+    for name, columns in ITEMS_ACCESS_INDEXES:
+        create_index(conn, name, "items", columns)
+
+
+def _items_version_column(conn: Connection) -> None:
+
+    columns = [col["name"] for col in inspect(conn).get_columns("items")]
+    if "version" not in columns:
+        conn.execute(text("ALTER TABLE items ADD COLUMN version INTEGER NOT NULL DEFAULT 1"))
+
+
+def _item_status_counts(conn: Connection) -> None:
+
+    metadata = MetaData()
+    Table("users", metadata, Column("id", String(36), primary_key=True))
+    counts = Table("item_status_counts", metadata,
+                   Column("user_id", String(36), ForeignKey("users.id", ondelete="CASCADE"),
+                          primary_key=True),
+                   Column("status", String(20), primary_key=True),
+                   Column("count", Integer, nullable=False, server_default="0"))
+    counts.create(conn, checkfirst=True)
+
+    conn.execute(text("DELETE FROM item_status_counts"))
+    conn.execute(text("""
+        INSERT INTO item_status_counts (user_id, status, count)
+        SELECT user_id, status, COUNT(*) FROM items GROUP BY user_id, status
+        """))
+
+
+def _user_change_versions(conn: Connection) -> None:
+
+    metadata = MetaData()
+    Table("users", metadata, Column("id", String(36), primary_key=True))
+    versions = Table("user_change_versions", metadata,
+                     Column("user_id", String(36), ForeignKey("users.id", ondelete="CASCADE"),
+                            primary_key=True),
+                     Column("version", BigInteger, nullable=False, server_default="0"),
+                     Column("changed_at", DateTime, nullable=False))
+    versions.create(conn, checkfirst=True)
+
+
+def _delta_sync(conn: Connection) -> None:
+
+    inspector = inspect(conn)
+
+    item_columns = [col["name"] for col in inspector.get_columns("items")]
+    if "updated_at" not in item_columns:
+        conn.execute(text("ALTER TABLE items ADD COLUMN updated_at TIMESTAMP"))
+        conn.execute(text("UPDATE items SET updated_at = timestamp"))
+        if conn.dialect.name == "postgresql":
+            conn.execute(text("ALTER TABLE items ALTER COLUMN updated_at SET NOT NULL"))
+    if "change_version" not in item_columns:
+        conn.execute(text("ALTER TABLE items ADD COLUMN change_version BIGINT NOT NULL DEFAULT 0"))
+
+    version_columns = [col["name"] for col in inspector.get_columns("user_change_versions")]
+    if "min_sync_version" not in version_columns:
+        conn.execute(text("ALTER TABLE user_change_versions "
+                          "ADD COLUMN min_sync_version BIGINT NOT NULL DEFAULT 0"))
+
+    metadata = MetaData()
+    Table("users", metadata, Column("id", String(36), primary_key=True))
+    tombstones = Table("item_tombstones", metadata,
+                       Column("item_id", String(36), primary_key=True),
+                       Column("user_id", String(36), ForeignKey("users.id", ondelete="CASCADE"),
+                              nullable=False),
+                       Column("change_version", BigInteger, nullable=False),
+                       Column("deleted_at", DateTime, nullable=False),
+                       Index("ix_item_tombstones_user_change_version", "user_id", "change_version"))
+    tombstones.create(conn, checkfirst=True)
+
+
+def _delta_sync_indexes(conn: Connection) -> None:
+
+    create_index(conn, "ix_items_user_change_version", "items", ("user_id", "change_version"))
+
+
+# Text search configuration baked into items.search_vector on Postgres; the
+# queries in todo_repository must use the same one.
+SEARCH_CONFIG = "english"
+
+# Rows per UPDATE when filling search_vector for existing items on Postgres.
+SEARCH_BACKFILL_BATCH_SIZE = 5000
+
+
+def _search_vector(row: str = "") -> str:
+
+    return (f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce({row}title, '')), 'A') || "
+            f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce({row}description, '')), 'B')")
+
+
+def _items_search(conn: Connection) -> None:
+
+    if conn.dialect.name == "postgresql":
+        # A plain nullable column is a catalog change: unlike a STORED
+        # generated column it does not rewrite items under an ACCESS EXCLUSIVE
+        # lock. The trigger fills it on every write path, COPY included, from
+        # this commit on; migration 0009 backfills older rows.
+        conn.execute(text("ALTER TABLE items ADD COLUMN IF NOT EXISTS search_vector tsvector"))
+        conn.execute(text(f"""
+            CREATE OR REPLACE FUNCTION items_search_vector_update() RETURNS trigger AS $$
+            BEGIN
+                NEW.search_vector := {_search_vector("NEW.")};
+                RETURN NEW;
+            END
+            $$ LANGUAGE plpgsql
+            """))
+        conn.execute(text("DROP TRIGGER IF EXISTS items_search_vector_update ON items"))
+        conn.execute(text("""
+            CREATE TRIGGER items_search_vector_update
+            BEFORE INSERT OR UPDATE OF title, description ON items
+            FOR EACH ROW EXECUTE FUNCTION items_search_vector_update()
+            """))
+        return
+
+    if conn.dialect.name != "sqlite":
+        logger.warning(f"Full-text search is not available on {conn.dialect.name}.")
+        return
+
+    # External-content FTS5 table over items, keyed by the items rowid and
+    # kept current by triggers.
+    conn.execute(text("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS items_fts
+        USING fts5(title, description, content='items', content_rowid='rowid')
+        """))
+    conn.execute(text("""
+        CREATE TRIGGER IF NOT EXISTS items_fts_insert AFTER INSERT ON items BEGIN
+            INSERT INTO items_fts (rowid, title, description)
+            VALUES (new.rowid, new.title, new.description);
+        END
+        """))
+    conn.execute(text("""
+        CREATE TRIGGER IF NOT EXISTS items_fts_delete AFTER DELETE ON items BEGIN
+            INSERT INTO items_fts (items_fts, rowid, title, description)
+            VALUES ('delete', old.rowid, old.title, old.description);
+        END
+        """))
+    conn.execute(text("""
+        CREATE TRIGGER IF NOT EXISTS items_fts_update AFTER UPDATE OF title, description ON items BEGIN
+            INSERT INTO items_fts (items_fts, rowid, title, description)
+            VALUES ('delete', old.rowid, old.title, old.description);
+            INSERT INTO items_fts (rowid, title, description)
+            VALUES (new.rowid, new.title, new.description);
+        END
+        """))
+    conn.execute(text("INSERT INTO items_fts (items_fts) VALUES ('rebuild')"))
+
+
+def _items_search_index(conn: Connection) -> None:
+
+    if conn.dialect.name == "postgresql":
+        _backfill_search_vectors(conn)
+        create_index(conn, "ix_items_search_vector", "items", ("search_vector",), using="GIN")
+
+
+def _backfill_search_vectors(conn: Connection) -> None:
+
+    # Runs on the autocommit connection, so every batch commits on its own and
+    # only locks its own rows. Walks the primary key rather than looking for
+    # NULLs, which would rescan the filled part of the table for every batch.
+    last_id, filled = "", 0
+
+    while True:
+        ids = conn.execute(text("SELECT id FROM items WHERE id > :last_id ORDER BY id LIMIT :limit"),
+                           {"last_id": last_id, "limit": SEARCH_BACKFILL_BATCH_SIZE}).scalars().all()
+        if not ids:
+            break
+
+        filled += conn.execute(text(f"""
+            UPDATE items SET search_vector = {_search_vector()}
+            WHERE id >= :first_id AND id <= :last_id AND search_vector IS NULL
+            """), {"first_id": ids[0], "last_id": ids[-1]}).rowcount
+        last_id = ids[-1]
+
+    logger.info(f"Filled search_vector for {filled} existing items.")
+
+
+def _items_filter_indexes(conn: Connection) -> None:
+
+    # updated_at ranges from the filter language, and case-sensitive title
+    # prefixes: on Postgres only a pattern_ops index turns LIKE 'x%' into an
+    # index range (SQLite queries use a plain range on ix_items_user_title).
+    create_index(conn, "ix_items_user_updated_at", "items", ("user_id", "updated_at", "id"))
+    if conn.dialect.name == "postgresql":
+        create_index(conn, "ix_items_user_title_pattern", "items",
+                     ("user_id", "title text_pattern_ops"))
+
+
+def _user_shards(conn: Connection) -> None:
+
+    # Shard directory; only used when DATABASE_SHARD_URLS is set.
+    metadata = MetaData()
+    Table("users", metadata, Column("id", String(36), primary_key=True))
+    directory = Table("user_shards", metadata,
+                      Column("user_id", String(36), ForeignKey("users.id", ondelete="CASCADE"),
+                             primary_key=True),
+                      Column("shard", String(64), nullable=False),
+                      Column("updated_at", DateTime, nullable=False))
+    directory.create(conn, checkfirst=True)
+
+
+MIGRATIONS: List[Migration] = [
+    Migration("0001", "Initial users and items schema", _initial_schema),
+    Migration("0002", "Composite indexes for item list queries", _items_access_indexes,
+              transactional=False),
+    Migration("0003", "Item version column for optimistic concurrency", _items_version_column),
+    Migration("0004", "Per-user item status counters", _item_status_counts),
+    Migration("0005", "Per-user change versions for conditional requests", _user_change_versions),
+    Migration("0006", "updated_at, change versions and tombstones for delta sync", _delta_sync),
+    Migration("0007", "Index for delta sync reads", _delta_sync_indexes, transactional=False),
+    Migration("0008", "Full-text search over item titles and descriptions", _items_search),
+    Migration("0009", "Search vector backfill and GIN index for full-text search", _items_search_index,
+              transactional=False),
+    Migration("0010", "Indexes for updated_at ranges and title prefixes", _items_filter_indexes,
+              transactional=False),
+    Migration("0011", "Shard directory for user-keyed sharding", _user_shards),
+]
+
+
+def applied_versions(engine: Engine) -> Set[str]:
+
+    with engine.begin() as conn:
+        schema_migrations.create(conn, checkfirst=True)
+        return set(conn.execute(select(schema_migrations.c.version)).scalars())
+
+
+def pending_migrations(engine: Engine) -> List[Migration]:
+
+    applied = applied_versions(engine)
+    return [migration for migration in MIGRATIONS if migration.version not in applied]
+
+
+def upgrade(engine: Engine) -> List[str]:
+
+    applied = []
+
+    for migration in pending_migrations(engine):
+        logger.info(f"Applying migration {migration.version}: {migration.description}")
+
+        if migration.transactional:
+            with engine.begin() as conn:
+                migration.upgrade(conn)
+                _record(conn, migration)
+        else:
+            with engine.execution_options(isolation_level="AUTOCOMMIT").connect() as conn:
+                migration.upgrade(conn)
+            with engine.begin() as conn:
+                _record(conn, migration)
+
+        applied.append(migration.version)
+
+    logger.info(f"Database schema is up to date ({len(applied)} migration(s) applied).")
+    return applied
+
+
+def _record(conn: Connection, migration: Migration) -> None:
+
+    conn.execute(schema_migrations.insert().values(
+        version=migration.version,
+        description=migration.description,
+        applied_at=datetime.now(timezone.utc)
+    ))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+
+    parser = argparse.ArgumentParser(description="Manage the database schema.")
+    parser.add_argument("command", choices=["upgrade", "status"])
+    args = parser.parse_args(argv)
+
+    database_url = os.getenv("DATABASE_URL")
+    if not database_url:
+        logger.error("DATABASE_URL environment variable is not set!")
+        return 1
+
+    engine = create_engine(database_url)
+    try:
+        if args.command == "upgrade":
+            upgrade(engine)
+        else:
+            applied = applied_versions(engine)
+            for migration in MIGRATIONS:
+                state = "applied" if migration.version in applied else "pending"
+                print(f"{migration.version}  {state:8} {migration.description}")
+        return 0
+    finally:
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO,
+                        format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+    sys.exit(main())
@@ -3,8 +3,10 @@ from datetime import datetime, timezone
 from typing import Dict, Any
 import uuid
 
+from database.sharding import ShardedSession
+
 # This will be initialized in setup_database.py
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": ShardedSession})
 
 class User(db.Model):
 
@@ -41,10 +43,28 @@ class Item(db.Model):
     timestamp = db.Column(db.DateTime, nullable=False, default=datetime.now(timezone.utc))
     user_id = db.Column(db.String(36), db.ForeignKey("users.id", ondelete="CASCADE"), 
                     nullable=False, index=True)
+    # Bumped by every UPDATE, used for optimistic concurrency (If-Match).
+    version = db.Column(db.Integer, nullable=False, default=1, server_default="1")
+    updated_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+    # The owner's change version at the last write; delta sync reads items past a token.
+    change_version = db.Column(db.BigInteger, nullable=False, default=0, server_default="0")
     
+    # Composite indexes are created by migrations (database/migrations.py);
+    # they are declared here so the model matches the migrated schema. The
+    # full-text search structures (items.search_vector on Postgres, the
+    # items_fts table on SQLite) and the Postgres title pattern index exist
+    # only in migrations.
     __table_args__ = (
         db.CheckConstraint(status.in_(["ToDo", "InProgress", "Done"]),
                            name="valid_status_check"),
+        db.Index("ix_items_user_id_id", "user_id", "id"),
+        db.Index("ix_items_user_timestamp", "user_id", "timestamp", "id"),
+        db.Index("ix_items_user_title", "user_id", "title", "id"),
+        db.Index("ix_items_user_status", "user_id", "status", "id"),
+        db.Index("ix_items_user_status_timestamp", "user_id", "status", "timestamp", "id"),
+        db.Index("ix_items_user_status_title", "user_id", "status", "title", "id"),
+        db.Index("ix_items_user_change_version", "user_id", "change_version"),
+        db.Index("ix_items_user_updated_at", "user_id", "updated_at", "id"),
     )
 
     def to_dict(self):
@@ -55,8 +75,93 @@ class Item(db.Model):
             "description": self.description,
             "status": self.status,
             "timestamp": self.timestamp.isoformat() if self.timestamp else None,
-            "user_id": self.user_id
+            "user_id": self.user_id,
+            "version": self.version,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None
+        }
+
+    @staticmethod
+    def row_to_dict(row) -> Dict[str, Any]:
+
+        # Same shape as to_dict(), for Core rows (e.g. from RETURNING) that
+        # never become ORM objects.
+        return {
+            "id": row["id"],
+            "title": row["title"],
+            "description": row["description"],
+            "status": row["status"],
+            "timestamp": row["timestamp"].isoformat() if row["timestamp"] else None,
+            "user_id": row["user_id"],
+            "version": row["version"],
+            "updated_at": row["updated_at"].isoformat() if row["updated_at"] else None
         }
     
     def __repr__(self) -> str:
         return f"<Item {self.id}: {self.title}>"
+
+
+class ItemStatusCount(db.Model):
+
+    # Per-user item counts by status, kept in step with every item mutation
+    # so stats reads never scan items.
+    __tablename__ = "item_status_counts"
+
+    user_id = db.Column(db.String(36), db.ForeignKey("users.id", ondelete="CASCADE"),
+                        primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+
+    def __repr__(self) -> str:
+        return f"<ItemStatusCount {self.user_id} {self.status}={self.count}>"
+
+
+class UserChangeVersion(db.Model):
+
+    # Monotonic per-user counter bumped in the same transaction as every item
+    # write; conditional GETs compare it instead of re-running item queries.
+    __tablename__ = "user_change_versions"
+
+    user_id = db.Column(db.String(36), db.ForeignKey("users.id", ondelete="CASCADE"),
+                        primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0, server_default="0")
+    changed_at = db.Column(db.DateTime, nullable=False)
+    # Sync tokens below this version are too old: tombstones they would need were pruned.
+    min_sync_version = db.Column(db.BigInteger, nullable=False, default=0, server_default="0")
+
+    def __repr__(self) -> str:
+        return f"<UserChangeVersion {self.user_id} v{self.version}>"
+
+
+class ItemTombstone(db.Model):
+
+    # Remembers deleted items so delta sync can report them.
+    __tablename__ = "item_tombstones"
+
+    item_id = db.Column(db.String(36), primary_key=True)
+    user_id = db.Column(db.String(36), db.ForeignKey("users.id", ondelete="CASCADE"),
+                        nullable=False)
+    change_version = db.Column(db.BigInteger, nullable=False)
+    deleted_at = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.Index("ix_item_tombstones_user_change_version", "user_id", "change_version"),
+    )
+
+    def __repr__(self) -> str:
+        return f"<ItemTombstone {self.item_id}>"
+
+
+class UserShard(db.Model):
+
+    # Shard directory, kept on the primary: users placed on a shard other
+    # than the one the hash ring picks (see database/rebalance.py). Users
+    # without a row follow the ring.
+    __tablename__ = "user_shards"
+
+    user_id = db.Column(db.String(36), db.ForeignKey("users.id", ondelete="CASCADE"),
+                        primary_key=True)
+    shard = db.Column(db.String(64), nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self) -> str:
+        return f"<UserShard {self.user_id} on {self.shard}>"
@@ -0,0 +1,297 @@
+import argparse
+import logging
+import os
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import create_engine, delete, func, insert, inspect, select, text
+from sqlalchemy.engine import Engine
+
+from database import migrations, sharding
+from database.models import Item, ItemStatusCount, ItemTombstone, User, UserChangeVersion, UserShard
+
+logger = logging.getLogger(__name__)
+
+# After pinning a user, wait this long before copying: writes that picked the
+# shard from the ring before the pin existed hold no directory lock, so the
+# cutover can only rely on them having finished. Keep it above the longest
+# request (the gunicorn timeout).
+REBALANCE_GRACE_SECONDS = float(os.getenv("REBALANCE_GRACE_SECONDS", "30"))
+# Copy passes before the cutover; each only copies what changed during the last.
+REBALANCE_CATCHUP_PASSES = int(os.getenv("REBALANCE_CATCHUP_PASSES", "3"))
+REBALANCE_CHUNK_SIZE = 1000
+
+_directory = UserShard.__table__
+_items = Item.__table__
+_tombstones = ItemTombstone.__table__
+_counts = ItemStatusCount.__table__
+_versions = UserChangeVersion.__table__
+
+
+def pin(primary: Engine, user_id: str) -> str:
+
+    # Records the user's current shard in the directory, so the shard stops
+    # depending on the ring and the cutover has a row to lock. Returns it.
+    with primary.begin() as conn:
+        shard = conn.execute(select(_directory.c.shard).where(_directory.c.user_id == user_id)).scalar()
+        if shard is not None:
+            return shard
+
+        shard = sharding.ring().shard_for(user_id)
+        conn.execute(insert(_directory).values(user_id=user_id, shard=shard,
+                                               updated_at=datetime.now(timezone.utc)))
+        return shard
+
+
+def move_user(primary: Engine, shards: Dict[str, Engine], user_id: str, target: str) -> bool:
+
+    # Online move of one user's item data. Writes keep going to the source
+    # until the cutover, which waits for in-flight writes (they hold a share
+    # lock on the directory row) and blocks new ones until it commits.
+    # Returns False when the user already lives on target.
+    if target not in shards:
+        raise ValueError(f"Unknown shard {target!r}; known shards: {', '.join(shards)}")
+
+    with primary.connect() as conn:
+        pinned = conn.execute(select(_directory.c.shard).where(_directory.c.user_id == user_id)).scalar()
+    source = pinned or pin(primary, user_id)
+    if pinned is None:
+        time.sleep(REBALANCE_GRACE_SECONDS)
+
+    if source == target:
+        _unpin_if_on_ring(primary, user_id, target)
+        return False
+
+    logger.info(f"Moving user {user_id} from {source} to {target}")
+    source_engine, target_engine = shards[source], shards[target]
+
+    # Leftovers from an earlier, interrupted move would shadow nothing but
+    # would skew the counters; start from an empty target.
+    _delete_user_rows(target_engine, user_id)
+
+    version = -1
+    for _ in range(1 + REBALANCE_CATCHUP_PASSES):
+        version = _copy_changes(source_engine, target_engine, user_id, since=version)
+
+    with primary.begin() as conn:
+        locked = conn.execute(select(_directory.c.shard)
+                              .where(_directory.c.user_id == user_id)
+                              .with_for_update()).scalar()
+        if locked != source:
+            raise RuntimeError(f"User {user_id} moved to {locked} while copying; aborting.")
+
+        _copy_changes(source_engine, target_engine, user_id, since=version)
+        _copy_user_state(source_engine, target_engine, user_id)
+
+        if target == sharding.ring().shard_for(user_id):
+            conn.execute(delete(_directory).where(_directory.c.user_id == user_id))
+        else:
+            conn.execute(_directory.update()
+                         .where(_directory.c.user_id == user_id)
+                         .values(shard=target, updated_at=datetime.now(timezone.utc)))
+
+    # Workers may serve reads from a cached lookup until it expires; only
+    # then is the old copy unused.
+    time.sleep(sharding.SHARD_MAP_CACHE_SECONDS)
+    _delete_user_rows(source_engine, user_id)
+    logger.info(f"Moved user {user_id} to {target}")
+    return True
+
+
+def rebalance(primary: Engine, shards: Dict[str, Engine], limit: Optional[int] = None) -> int:
+
+    # Moves pinned users to the shard the ring assigns them, unpinning them
+    # as they arrive. Returns the number of users moved.
+    with primary.connect() as conn:
+        pinned = conn.execute(select(_directory.c.user_id, _directory.c.shard)
+                              .order_by(_directory.c.user_id)).all()
+
+    moved = 0
+    for user_id, shard in pinned:
+        if limit is not None and moved >= limit:
+            break
+        target = sharding.ring().shard_for(user_id)
+        if shard == target:
+            _unpin_if_on_ring(primary, user_id, target)
+        elif move_user(primary, shards, user_id, target):
+            moved += 1
+    return moved
+
+
+def pin_changed(primary: Engine, from_count: int) -> int:
+
+    # Run before adding shards to DATABASE_SHARD_URLS: pins every user whose
+    # shard differs between a ring of from_count shards and the current one,
+    # so they stay put until rebalance moves them.
+    if not 0 < from_count <= len(sharding.DATABASE_SHARD_URLS):
+        raise ValueError(f"--from-count must be between 1 and {len(sharding.DATABASE_SHARD_URLS)}")
+
+    old_ring = sharding.HashRing(sharding.shard_names(from_count))
+    new_ring = sharding.ring()
+    pinned = 0
+
+    with primary.connect() as conn:
+        user_ids = conn.execute(select(User.__table__.c.id)).scalars().all()
+
+    for user_id in user_ids:
+        old_shard = old_ring.shard_for(user_id)
+        if old_shard == new_ring.shard_for(user_id):
+            continue
+        with primary.begin() as conn:
+            exists = conn.execute(select(_directory.c.user_id).where(_directory.c.user_id == user_id)).first()
+            if exists is None:
+                conn.execute(insert(_directory).values(user_id=user_id, shard=old_shard,
+                                                       updated_at=datetime.now(timezone.utc)))
+                pinned += 1
+    return pinned
+
+
+def prepare(primary: Engine, shards: Dict[str, Engine]) -> None:
+
+    # Brings every shard's schema up to date. On shards other than the
+    # primary the users table stays empty, so the foreign keys pointing at it
+    # are dropped (SQLite doesn't enforce them unless asked to).
+    for name, engine in shards.items():
+        migrations.upgrade(engine)
+        if engine.url != primary.url and engine.dialect.name == "postgresql":
+            with engine.begin() as conn:
+                for table in sorted(sharding.SHARDED_TABLES):
+                    for foreign_key in inspect(conn).get_foreign_keys(table):
+                        if foreign_key["referred_table"] == "users" and foreign_key["name"]:
+                            conn.execute(text(f'ALTER TABLE {table} DROP CONSTRAINT "{foreign_key["name"]}"'))
+        logger.info(f"Shard {name} is ready.")
+
+
+def status(primary: Engine, shards: Dict[str, Engine]) -> List[Dict[str, object]]:
+
+    with primary.connect() as conn:
+        pinned = dict(conn.execute(select(_directory.c.shard, func.count())
+                                   .group_by(_directory.c.shard)).all())
+
+    report = []
+    for name, engine in shards.items():
+        with engine.connect() as conn:
+            users = conn.execute(select(func.count()).select_from(_versions)).scalar()
+            items = conn.execute(select(func.count()).select_from(_items)).scalar()
+        report.append({"shard": name, "users": users, "items": items, "pinned": pinned.get(name, 0)})
+    return report
+
+
+def _copy_changes(source: Engine, target: Engine, user_id: str, since: int) -> int:
+
+    # Copies the user's items and tombstones written after change version
+    # `since`, replacing older copies. Returns the version this pass covered:
+    # it is read first, so rows written meanwhile are picked up next time.
+    with source.connect() as conn:
+        version = conn.execute(select(_versions.c.version).where(_versions.c.user_id == user_id)).scalar()
+
+        for table in (_items, _tombstones):
+            rows = conn.execute(select(table)
+                                .where(table.c.user_id == user_id, table.c.change_version > since)
+                                .execution_options(yield_per=REBALANCE_CHUNK_SIZE)).mappings()
+            for chunk in rows.partitions():
+                chunk = [dict(row) for row in chunk]
+                with target.begin() as target_conn:
+                    if table is _items:
+                        ids = [row["id"] for row in chunk]
+                        target_conn.execute(delete(_items).where(_items.c.id.in_(ids)))
+                    else:
+                        ids = [row["item_id"] for row in chunk]
+                        target_conn.execute(delete(_items).where(_items.c.id.in_(ids)))
+                        target_conn.execute(delete(_tombstones).where(_tombstones.c.item_id.in_(ids)))
+                    target_conn.execute(insert(table), chunk)
+
+    return version if version is not None else since
+
+
+def _copy_user_state(source: Engine, target: Engine, user_id: str) -> None:
+
+    # Status counters and the change version (with min_sync_version, so old
+    # sync tokens stay valid or expired exactly as before).
+    with source.connect() as conn:
+        state = {table: [dict(row) for row in conn.execute(select(table).where(table.c.user_id == user_id))
+                         .mappings()]
+                 for table in (_counts, _versions)}
+
+    with target.begin() as conn:
+        for table, rows in state.items():
+            conn.execute(delete(table).where(table.c.user_id == user_id))
+            if rows:
+                conn.execute(insert(table), rows)
+
+
+def _delete_user_rows(engine: Engine, user_id: str) -> None:
+
+    with engine.begin() as conn:
+        for table in (_items, _tombstones, _counts, _versions):
+            conn.execute(delete(table).where(table.c.user_id == user_id))
+
+
+def _unpin_if_on_ring(primary: Engine, user_id: str, shard: str) -> None:
+
+    if shard == sharding.ring().shard_for(user_id):
+        with primary.begin() as conn:
+            conn.execute(delete(_directory).where(_directory.c.user_id == user_id,
+                                                  _directory.c.shard == shard))
+
+
+def _shard_engines() -> Dict[str, Engine]:
+
+    return {name: create_engine(url) for name, url in zip(sharding.shard_names(), sharding.DATABASE_SHARD_URLS)}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+
+    parser = argparse.ArgumentParser(description="Place users on shards and move them between shards.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("status", help="Users, items and pinned users per shard.")
+    commands.add_parser("prepare", help="Migrate every shard and drop its foreign keys to users.")
+    pin_parser = commands.add_parser("pin", help="Pin users whose shard changes when shards are added.")
+    pin_parser.add_argument("--from-count", type=int, required=True,
+                            help="Number of shards before the newly added ones.")
+    move_parser = commands.add_parser("move", help="Move one user to a shard.")
+    move_parser.add_argument("user_id")
+    move_parser.add_argument("shard")
+    rebalance_parser = commands.add_parser("rebalance", help="Move pinned users to their ring shard.")
+    rebalance_parser.add_argument("--limit", type=int, help="Stop after moving this many users.")
+    args = parser.parse_args(argv)
+
+    database_url = os.getenv("DATABASE_URL")
+    if not database_url:
+        logger.error("DATABASE_URL environment variable is not set!")
+        return 1
+    if not sharding.enabled():
+        logger.error("DATABASE_SHARD_URLS environment variable is not set!")
+        return 1
+
+    primary = create_engine(database_url)
+    shards = _shard_engines()
+    try:
+        if args.command == "status":
+            for row in status(primary, shards):
+                print(f"{row['shard']:12} {row['users']:>8} users {row['items']:>10} items "
+                      f"{row['pinned']:>6} pinned")
+        elif args.command == "prepare":
+            prepare(primary, shards)
+        elif args.command == "pin":
+            print(f"Pinned {pin_changed(primary, args.from_count)} user(s).")
+        elif args.command == "move":
+            move_user(primary, shards, args.user_id, args.shard)
+        else:
+            print(f"Moved {rebalance(primary, shards, args.limit)} user(s).")
+        return 0
+    except ValueError as e:
+        logger.error(str(e))
+        return 1
+    finally:
+        primary.dispose()
+        for engine in shards.values():
+            engine.dispose()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO,
+                        format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+    sys.exit(main())
@@ -0,0 +1,123 @@
+import hashlib
+import hmac
+import logging
+import math
+import os
+import random
+import time
+from typing import List, Optional
+from flask import g, has_app_context, has_request_context, request
+from sqlalchemy.orm import Session
+
+from database.models import db
+from services.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Comma-separated read replica URLs. Without any, every query uses the
+# primary (DATABASE_URL) exactly as before.
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",")
+                         if url.strip()]
+# After a user writes, that user's reads stay on the primary this long, so
+# they see their own changes even while replicas lag behind.
+REPLICA_STICKY_SECONDS = float(os.getenv("REPLICA_STICKY_SECONDS", "5"))
+# The next request after a write may reach another worker or host, so the
+# write time also travels with the client in a signed cookie. Signed with this
+# key (JWT_SECRET_KEY unless set); without either only the writing worker
+# pins the user's reads.
+REPLICA_STICKY_SECRET = os.getenv("REPLICA_STICKY_SECRET") or os.getenv("JWT_SECRET_KEY") or None
+
+REPLICA_BIND_PREFIX = "replica_"
+REPLICA_STICKY_COOKIE = "last_write"
+
+_recent_writers = TTLCache(100000, REPLICA_STICKY_SECONDS)
+
+
+def replica_binds() -> List[str]:
+
+    return [f"{REPLICA_BIND_PREFIX}{index}" for index in range(len(DATABASE_REPLICA_URLS))]
+
+
+def mark_written(user_id: str) -> None:
+
+    # Called by the repositories on every write. This worker remembers the
+    # writer itself; remember_write() hands the client a cookie that pins
+    # its next reads on whichever worker serves them.
+    if DATABASE_REPLICA_URLS and user_id:
+        _recent_writers.put(user_id, True)
+        if has_request_context():
+            g.written_user_id = user_id
+
+
+def remember_write(response):
+
+    # after_request hook: the cookie carries "<write time>.<signature>", the
+    # signature covering the user id, so it only pins that user's reads.
+    user_id = g.pop("written_user_id", None)
+    if user_id and REPLICA_STICKY_SECRET:
+        written_at = f"{time.time():.3f}"
+        response.set_cookie(REPLICA_STICKY_COOKIE, f"{written_at}.{_sign(user_id, written_at)}",
+                            max_age=math.ceil(REPLICA_STICKY_SECONDS), httponly=True, samesite="Lax")
+    return response
+
+
+def read_session(user_id: str):
+
+    # Session for a read-only repository call on behalf of user_id: a replica
+    # unless none is configured or the user wrote recently. Reads never
+    # share the primary session, so replica rows can't end up in its
+    # identity map and be written back. One replica is picked per request and
+    # reused, so all of a request's reads see the same snapshot.
+    if not DATABASE_REPLICA_URLS or not has_app_context() or _wrote_recently(user_id):
+        return db.session
+
+    session = g.get("replica_session")
+    if session is None:
+        bind = random.choice(replica_binds())
+        session = Session(bind=db.engines[bind], autoflush=False)
+        g.replica_session = session
+    return session
+
+
+def on_replica(session) -> bool:
+
+    return session is not db.session
+
+
+def close_replica_session(exception=None) -> None:
+
+    session = g.pop("replica_session", None)
+    if session is not None:
+        session.close()
+
+
+def _wrote_recently(user_id: str) -> bool:
+
+    if _recent_writers.get(user_id):
+        return True
+    if not has_request_context():
+        return False
+    return _cookie_write_time(user_id, request.cookies.get(REPLICA_STICKY_COOKIE)) is not None
+
+
+def _cookie_write_time(user_id: str, value: Optional[str]) -> Optional[float]:
+
+    # The write time from a valid cookie of this user still inside the sticky
+    # window, else None.
+    if not value or not REPLICA_STICKY_SECRET:
+        return None
+
+    written_at, _, signature = value.rpartition(".")
+    if not hmac.compare_digest(signature.encode("utf-8"), _sign(user_id, written_at).encode("utf-8")):
+        return None
+    try:
+        written = float(written_at)
+    except ValueError:
+        return None
+    return written if time.time() - written < REPLICA_STICKY_SECONDS else None
+
+
+def _sign(user_id: str, written_at: str) -> str:
+
+    message = f"{user_id}.{written_at}".encode("utf-8")
+    return hmac.new(REPLICA_STICKY_SECRET.encode("utf-8"), message, hashlib.sha256).hexdigest()
@@ -1,84 +1,213 @@
 import os
 import logging
+import threading
+import time
+from typing import Any, Dict
+from database import routing, sharding
 from database.models import db
-from sqlalchemy import text, inspect
+from sqlalchemy import exc, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
 
 logger = logging.getLogger(__name__)
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-if not DATABASE_URL:
-    raise ValueError("DATABASE_URL environment variable is not set!")
-
-def migrate_add_user_id_column(app) -> bool:
-    
-    with app.app_context():
+# Connection pool per worker process. Size it to at least the number of
+# request threads (GUNICORN_THREADS) so requests don't queue for a connection;
+# DB_POOL_SIZE=0 turns pooling off (NullPool), e.g. when PgBouncer pools.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Connections older than this many seconds are replaced, and each checkout is
+# pinged first, so a Postgres restart costs a reconnect instead of a failed
+# request.
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes", "on")
+# Connections each worker opens at start (0 = open them on demand).
+DB_POOL_WARMUP = int(os.getenv("DB_POOL_WARMUP", "0"))
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "10"))
+# PgBouncer in transaction pooling mode hands each transaction to whichever
+# server connection is free, so drivers must not keep prepared statements.
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "false").lower() in ("1", "true", "yes", "on")
+
+# asyncio drivers, used by the ASGI app (database/async_database.py).
+ASYNC_DRIVERS = frozenset(["asyncpg", "aiosqlite", "psycopg_async"])
+
+# Per driver: connect arguments that turn off server-side prepared statements.
+# psycopg2 never prepares statements, so it needs nothing.
+_PGBOUNCER_CONNECT_ARGS = {
+    "psycopg": {"prepare_threshold": None},
+    "asyncpg": {"statement_cache_size": 0, "prepared_statement_cache_size": 0},
+}
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long checkouts wait for a connection.
+
+    The wait includes opening a new connection when the pool is below its
+    limit, and time spent blocked on a full pool otherwise.
+    """
+
+    def __init__(self, *args, **kwargs):
+
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def _do_get(self):
+
+        started = time.perf_counter()
         try:
-            inspector = inspect(db.engine)
-
-            if "items" not in inspector.get_table_names():
-                logger.info("Items table doesn't exist yet, will be created by create_all()")
-                return True
-                
-            columns = [col["name"] for col in inspector.get_columns("items")]
-            if "user_id" in columns:
-                logger.info("user_id column already exists in table.")
-                return True
-                        
-            logger.info("Adding user_id column to items table...")
-
-            if "user_id" not in columns:
-                with db.engine.connect() as conn:
-                    
-                    result = conn.execute(text("SELECT COUNT(*) FROM items"))
-                    item_count = result.scalar()
-
-                    if item_count > 0:
-                        logger.warning(f"Warning: Found {item_count} existing items without user_id.")
-                        logger.info("Deleting existing items (they don't have user_id and can't be assigned).")
-
-                    conn.execute(text("ALTER TABLE items ADD COLUMN user_id VARCHAR(36)"))
-
-                    try:
-                        conn.execute(text("""
-                            ALTER TABLE items 
-                            ADD CONSTRAINT items_user_id_fkey
-                            FOREIGN KEY (user_id) REFERENCES users(id)
-                            ON DELETE CASCADE
-                            """))
-                        logger.info("Foreign key constraing added successfully.")
-                    except Exception as fk_error:
-                        logger.warning(f"Could not add foreign key constraint: {fk_error}")
-
-                    logger.info("user_id column added successfully!")
-                    return True
+            return super()._do_get()
+        except exc.TimeoutError:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            with self._stats_lock:
+                self.checkouts += 1
+                self.wait_seconds_total += waited
+                self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+    def stats(self) -> Dict[str, Any]:
+
+        with self._stats_lock:
+            return {
+                "pool_size": self.size(),
+                "max_overflow": self._max_overflow,
+                "checked_in": self.checkedin(),
+                "checked_out": self.checkedout(),
+                "overflow": max(self.overflow(), 0),
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_seconds_total": round(self.wait_seconds_total, 6),
+                "wait_seconds_max": round(self.wait_seconds_max, 6),
+            }
+
+
+class InstrumentedAsyncQueuePool(InstrumentedQueuePool, AsyncAdaptedQueuePool):
+    """InstrumentedQueuePool for asyncio engines; same counters."""
+
+
+def engine_options(database_url: str) -> Dict[str, Any]:
+
+    url = make_url(database_url)
+    backend, _, driver = url.drivername.partition("+")
+
+    if backend == "sqlite" and url.database in (None, "", ":memory:"):
+        # An in-memory database lives in a single connection; leave its pool alone.
+        return {}
+
+    options: Dict[str, Any] = {"pool_pre_ping": DB_POOL_PRE_PING}
+    if DB_POOL_SIZE > 0:
+        options.update(poolclass=(InstrumentedAsyncQueuePool if driver in ASYNC_DRIVERS
+                                  else InstrumentedQueuePool),
+                       pool_size=DB_POOL_SIZE,
+                       max_overflow=DB_MAX_OVERFLOW,
+                       pool_timeout=DB_POOL_TIMEOUT,
+                       pool_recycle=DB_POOL_RECYCLE)
+    else:
+        options["poolclass"] = NullPool
+
+    if backend == "postgresql":
+        connect_args: Dict[str, Any] = {}
+        # asyncpg names its connect timeout differently from libpq.
+        connect_args["timeout" if driver == "asyncpg" else "connect_timeout"] = DB_CONNECT_TIMEOUT
+        if DB_PGBOUNCER:
+            connect_args.update(_PGBOUNCER_CONNECT_ARGS.get(driver, {}))
+        options["connect_args"] = connect_args
+
+    return options
 
-        except Exception as e:
-            logger.error(f"Error in migration: {str(e)}")
-            return False
 
 def init_db(app) -> None:
 
+    # Checked here rather than at import, so importing the app (tests, tools)
+    # has no side effects and only building one needs the setting.
+    if not DATABASE_URL:
+        raise ValueError("DATABASE_URL environment variable is not set!")
+
     # Configure Flask app to use the database
     app.config["SQLALCHEMY_DATABASE_URI"] = DATABASE_URL
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-    
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(DATABASE_URL)
+    # Read replicas are extra binds; no model maps to them, so only
+    # routing.read_session() ever queries them.
+    # Shards are binds too; sharding.ShardedSession picks one per user.
+    binds = {**dict(zip(routing.replica_binds(), routing.DATABASE_REPLICA_URLS)),
+             **dict(zip(sharding.shard_names(), sharding.DATABASE_SHARD_URLS))}
+    app.config["SQLALCHEMY_BINDS"] = {bind: {"url": url, **engine_options(url)}
+                                      for bind, url in binds.items()}
+
+    # Schema changes are applied separately: python -m database.migrations upgrade
     db.init_app(app)
-    
+    app.after_request(routing.remember_write)
+    app.teardown_appcontext(routing.close_replica_session)
+    logger.info("Database initialized successfully with SQLAlchemy!")
+
+def dispose_engines(app, close: bool = True) -> None:
+
+    # In a freshly forked worker pass close=False: pooled connections copied
+    # from the parent are dropped without closing sockets the parent still
+    # uses, and this process opens its own on first use.
     with app.app_context():
-        db.create_all()
-        logger.info("Database tables created.")
-        
-        # Run migration to add user_id column if needed
-        if migrate_add_user_id_column(app):    
-            logger.info("Database initialized successfully with SQLAlchemy!")
-        else:
-            logger.error("Database migration failed!")
+        for engine in db.engines.values():
+            engine.dispose(close=close)
+
+
+def warm_pool(app, connections: int = DB_POOL_WARMUP) -> int:
+
+    # Opens up to `connections` connections at once and returns them to the
+    # pool, so a new worker's first requests don't pay for connecting.
+    # Failures are logged, not raised: a worker can still start and connect
+    # later if the database is briefly unavailable.
+    with app.app_context():
+        engine = db.engine
+        if not isinstance(engine.pool, QueuePool):
+            return 0
+
+        opened = []
+        try:
+            for _ in range(min(connections, engine.pool.size())):
+                connection = engine.connect()
+                opened.append(connection)
+                connection.execute(text("SELECT 1"))
+        except Exception as e:
+            logger.error(f"Pool warmup stopped after {len(opened)} connection(s): {str(e)}")
+        finally:
+            for connection in opened:
+                connection.close()
+
+    return len(opened)
+
+
+def pool_status() -> Dict[str, Any]:
+
+    # Requires an app context. Bind key None is the default database.
+    status = {}
+    for key, engine in db.engines.items():
+        pool = engine.pool
+        name = key or "default"
+        status[name] = pool_stats(pool)
+    return status
+
+
+def pool_stats(pool) -> Dict[str, Any]:
+
+    if isinstance(pool, InstrumentedQueuePool):
+        return pool.stats()
+    return {"pool_class": type(pool).__name__}
+
 
 def get_db_session():
 
     return db.session
-    
+
 def check_database_connection() -> bool:
 
     try:
@@ -86,4 +215,4 @@ def check_database_connection() -> bool:
         return True
     except Exception as e:
         logger.error(f"Database connection failed: {str(e)}")
-        return False
\ No newline at end of file
+        return False
@@ -0,0 +1,241 @@
+import bisect
+import hashlib
+import logging
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from inspect import signature
+from typing import Callable, Iterator, List, Optional, Sequence
+
+from flask_sqlalchemy.session import Session
+from sqlalchemy import exc, inspect, select
+from sqlalchemy.sql.util import find_tables
+
+from services.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Comma-separated database URLs holding item data, named shard_0, shard_1, ...
+# in this order. Users and the shard directory stay in DATABASE_URL (which
+# may also appear here). Without any, nothing is sharded. Only ever append:
+# a shard's name is its position.
+DATABASE_SHARD_URLS = [url.strip() for url in os.getenv("DATABASE_SHARD_URLS", "").split(",")
+                       if url.strip()]
+SHARD_VIRTUAL_NODES = int(os.getenv("SHARD_VIRTUAL_NODES", "64"))
+# How long a worker trusts a cached user -> shard lookup for reads. The
+# rebalancer waits this long before deleting a moved user's old copy.
+SHARD_MAP_CACHE_SECONDS = float(os.getenv("SHARD_MAP_CACHE_SECONDS", "5"))
+
+SHARD_BIND_PREFIX = "shard_"
+# Tables whose rows belong to one user and live on that user's shard.
+SHARDED_TABLES = frozenset(["items", "item_status_counts", "user_change_versions", "item_tombstones"])
+
+_current_shard: ContextVar[Optional[str]] = ContextVar("current_shard", default=None)
+_shard_cache = TTLCache(100000, SHARD_MAP_CACHE_SECONDS)
+
+
+def shard_names(count: Optional[int] = None) -> List[str]:
+
+    count = len(DATABASE_SHARD_URLS) if count is None else count
+    return [f"{SHARD_BIND_PREFIX}{index}" for index in range(count)]
+
+
+def enabled() -> bool:
+
+    return bool(DATABASE_SHARD_URLS)
+
+
+class HashRing:
+    """Consistent hashing of user ids onto shard names.
+
+    Each shard owns SHARD_VIRTUAL_NODES points on a 64-bit ring, and a user
+    belongs to the first point at or after the hash of their id. Adding a
+    shard only takes over the users that now land on its points, about
+    1/N of them, leaving everyone else in place.
+    """
+
+    def __init__(self, shards: Sequence[str], virtual_nodes: int = SHARD_VIRTUAL_NODES):
+
+        if not shards:
+            raise ValueError("A hash ring needs at least one shard.")
+
+        self.shards = list(shards)
+        points = sorted((_hash(f"{shard}#{index}"), shard)
+                        for shard in shards for index in range(virtual_nodes))
+        self._keys = [key for key, _ in points]
+        self._shards = [shard for _, shard in points]
+
+    def shard_for(self, user_id: str) -> str:
+
+        index = bisect.bisect_left(self._keys, _hash(user_id))
+        return self._shards[index % len(self._shards)]
+
+
+def _hash(value: str) -> int:
+
+    # Stable across processes and Python versions, unlike hash().
+    return int.from_bytes(hashlib.md5(value.encode("utf-8")).digest()[:8], "big")
+
+
+_ring: Optional[HashRing] = None
+
+
+def ring() -> HashRing:
+
+    global _ring
+    names = shard_names()
+    if _ring is None or _ring.shards != names:
+        _ring = HashRing(names)
+    return _ring
+
+
+def resolve_shard(conn, user_id: str, lock: bool = False) -> str:
+
+    # The directory (user_shards, on the primary) only lists users placed
+    # somewhere other than the ring says, i.e. users being or having been
+    # moved; everyone else follows the ring. lock=True takes a share lock on
+    # the directory row for the rest of conn's transaction, which is what
+    # makes the rebalancer's cutover wait for in-flight writes.
+    from database.models import UserShard
+
+    directory = UserShard.__table__
+    statement = select(directory.c.shard).where(directory.c.user_id == user_id)
+    if lock:
+        statement = statement.with_for_update(read=True)
+
+    shard = conn.execute(statement).scalar()
+    return shard or ring().shard_for(user_id)
+
+
+def shard_for(user_id: str) -> str:
+
+    # Read path: cached for SHARD_MAP_CACHE_SECONDS.
+    from database.models import db
+
+    shard = _shard_cache.get(user_id)
+    if shard is None:
+        with db.engine.connect() as conn:
+            shard = resolve_shard(conn, user_id)
+        _shard_cache.put(user_id, shard)
+    return shard
+
+
+@contextmanager
+def user_scope(user_id: Optional[str], write: bool = False) -> Iterator[None]:
+
+    # Routes db.session statements on sharded tables to user_id's shard for
+    # the duration of the block. Writes resolve the shard without the cache
+    # and hold the directory share lock until the block (including its
+    # commit) is done. A no-op when sharding is off.
+    if not enabled() or user_id is None:
+        yield
+        return
+
+    if not write:
+        with shard_scope(shard_for(user_id)):
+            yield
+        return
+
+    from database.models import db
+
+    with db.engine.connect() as conn:
+        shard = resolve_shard(conn, user_id, lock=True)
+        if conn.dialect.name == "sqlite":
+            # No row locks to hold; ending the read keeps it from blocking
+            # the write's commit when a shard shares the primary's file.
+            conn.rollback()
+        _shard_cache.put(user_id, shard)
+        with shard_scope(shard):
+            yield
+        conn.commit()
+
+
+def by_user(write: bool = False) -> Callable:
+
+    # Decorator for repository functions with a user_id argument: runs the
+    # whole call, commit included, inside user_scope().
+    def decorate(fn: Callable) -> Callable:
+
+        parameters = signature(fn)
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not enabled():
+                return fn(*args, **kwargs)
+            user_id = parameters.bind_partial(*args, **kwargs).arguments.get("user_id")
+            with user_scope(user_id, write=write):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+def each_shard() -> Iterator[Optional[str]]:
+
+    # For maintenance over every user: yields once per shard with that shard
+    # in scope, or once (None) when sharding is off.
+    if not enabled():
+        yield None
+        return
+
+    for shard in shard_names():
+        with shard_scope(shard):
+            yield shard
+
+
+@contextmanager
+def shard_scope(shard: str) -> Iterator[None]:
+
+    token = _current_shard.set(shard)
+    try:
+        yield
+    finally:
+        _current_shard.reset(token)
+
+
+def current_shard() -> Optional[str]:
+
+    return _current_shard.get()
+
+
+def forget(user_id: str) -> None:
+
+    _shard_cache.invalidate(user_id)
+
+
+class ShardedSession(Session):
+    """Flask-SQLAlchemy session that sends sharded tables to the scoped shard.
+
+    Inside user_scope()/shard_scope() every statement goes to that shard,
+    except ORM operations on models kept on the primary (such as User).
+    Outside a scope, statements on sharded tables are refused rather than
+    silently run against the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+
+        if bind is not None or not enabled():
+            return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+        tables = _tables_of(mapper, clause)
+        shard = _current_shard.get()
+
+        if shard is not None and (mapper is None or tables & SHARDED_TABLES):
+            return self._db.engines[shard]
+        if tables & SHARDED_TABLES:
+            raise exc.UnboundExecutionError(
+                f"Tables {sorted(tables & SHARDED_TABLES)} are sharded by user; "
+                "run this inside sharding.user_scope().")
+
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _tables_of(mapper, clause) -> frozenset:
+
+    if mapper is not None:
+        return frozenset([inspect(mapper).local_table.name])
+    if clause is None:
+        return frozenset()
+    return frozenset(table.name for table in find_tables(clause, include_crud=True))
@@ -0,0 +1,143 @@
+import os
+import signal
+import time
+
+# Production server settings for: gunicorn -c gunicorn.conf.py wsgi:application
+#
+# SIGTERM drains: the master stops accepting connections and each worker
+# finishes its in-flight requests (open event streams are ended so they do
+# not hold the worker) within GUNICORN_GRACEFUL_TIMEOUT. SIGHUP starts fresh
+# workers and retires the old ones the same way; with GUNICORN_PRELOAD on
+# they reuse the master's loaded code, so deploy new code with SIGUSR2 (or a
+# restart) instead.
+#
+# The worker class is chosen for event streams: an open stream waits in its
+# worker for minutes. Under "gevent" that wait is a parked greenlet, so one
+# worker holds thousands of streams; under "gthread" it would hold one of the
+# worker's GUNICORN_THREADS, so the app refuses streams there and the page
+# polls instead (see EVENTS_STREAMS in services/events.py). The Docker image
+# runs gevent; gthread remains the default for a bare
+# "gunicorn -c gunicorn.conf.py" where gevent may not be installed.
+
+
+def _cpu_count() -> int:
+
+    # CPUs this process may actually run on (cgroup/cpuset aware on Linux).
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def _env_int(name: str, default: int) -> int:
+
+    # An empty value (e.g. "WEB_CONCURRENCY=" in .env) means the default.
+    return int(os.getenv(name) or default)
+
+
+def _env_bool(name: str, default: bool) -> bool:
+
+    return (os.getenv(name) or str(default)).lower() in ("1", "true", "yes", "on")
+
+
+bind = os.getenv("GUNICORN_BIND") or "0.0.0.0:5000"
+worker_class = os.getenv("GUNICORN_WORKER_CLASS") or "gthread"
+workers = _env_int("WEB_CONCURRENCY", _cpu_count())
+threads = _env_int("GUNICORN_THREADS", 4)
+# gevent workers only: concurrent connections (mostly idle event streams) per worker.
+worker_connections = _env_int("GUNICORN_WORKER_CONNECTIONS", 1000)
+timeout = _env_int("GUNICORN_TIMEOUT", 30)
+graceful_timeout = _env_int("GUNICORN_GRACEFUL_TIMEOUT", 30)
+keepalive = _env_int("GUNICORN_KEEPALIVE", 5)
+max_requests = _env_int("GUNICORN_MAX_REQUESTS", 0)
+max_requests_jitter = _env_int("GUNICORN_MAX_REQUESTS_JITTER", 0)
+# gevent patches the standard library when each worker starts, after the fork;
+# a preloaded app would already hold unpatched locks and threads from the
+# master, which block the whole worker. Preload is therefore off under gevent.
+preload_app = _env_bool("GUNICORN_PRELOAD", worker_class != "gevent")
+accesslog = os.getenv("GUNICORN_ACCESS_LOG", "-")
+errorlog = "-"
+
+
+def _check_worker_class() -> None:
+
+    # Fail at startup rather than serve with a worker that cannot do what the
+    # settings promise.
+    if worker_class == "gevent":
+        missing = []
+        for module in ("gevent", "psycogreen"):
+            try:
+                __import__(module)
+            except ImportError:
+                missing.append(module)
+        if missing:
+            raise RuntimeError(f"GUNICORN_WORKER_CLASS=gevent needs {' and '.join(missing)} "
+                               f"(pip install -r requirements.txt).")
+        if preload_app:
+            raise RuntimeError("GUNICORN_PRELOAD cannot be used with the gevent worker: the preloaded app "
+                               "would keep the master's unpatched locks.")
+    elif (os.getenv("EVENTS_STREAMS") or "").lower() in ("on", "true", "1", "yes"):
+        raise RuntimeError(f"EVENTS_STREAMS=on needs GUNICORN_WORKER_CLASS=gevent; under {worker_class} every "
+                           f"open event stream holds a request thread. Unset it to let the page poll instead.")
+
+
+_check_worker_class()
+
+
+def on_starting(server):
+
+    from services import metrics
+
+    # Per-worker metric snapshots from a previous run would be added to this one's.
+    metrics.clear_snapshots()
+
+
+def post_fork(server, worker):
+
+    worker.boot_started = time.perf_counter()
+
+    if worker_class == "gevent":
+        # Let psycopg2 yield to other greenlets while waiting on the database.
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+
+
+def post_worker_init(worker):
+
+    from database import setup_database
+    from services import events
+
+    # The app may have been created in the master (preload); never share its
+    # pooled connections across processes.
+    setup_database.dispose_engines(worker.wsgi, close=False)
+    if setup_database.DB_POOL_WARMUP:
+        warmed = setup_database.warm_pool(worker.wsgi)
+        worker.log.info(f"Opened {warmed} database connection(s) during warmup.")
+
+    previous = signal.getsignal(signal.SIGTERM)
+
+    def drain(signum, frame):
+        events.shutdown()
+        if callable(previous):
+            previous(signum, frame)
+
+    signal.signal(signal.SIGTERM, drain)
+
+    worker.log.info(f"Event streams {'served' if events.streams_supported() else 'off; clients poll'} "
+                    f"under the {worker_class} worker.")
+
+    # Fork to ready-to-serve; without preload this includes create_app(),
+    # whose own phase breakdown is logged just before.
+    worker.log.info(f"Worker ready in {(time.perf_counter() - worker.boot_started) * 1000:.1f} ms")
+
+
+def worker_exit(server, worker):
+
+    from database import setup_database
+    from services import metrics
+
+    # Keep this worker's counters in the totals after it is gone.
+    metrics.write_snapshot()
+
+    if worker.wsgi is not None:
+        setup_database.dispose_engines(worker.wsgi)
@@ -0,0 +1,478 @@
+from database.async_database import adb
+from database.models import Item, ItemStatusCount, ItemTombstone, UserChangeVersion
+from datetime import datetime, timezone
+from sqlalchemy import bindparam, delete, insert, select, update
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+import logging
+
+# The statements themselves are shared with the sync repository; only the
+# execution differs. Keep the two in step.
+from repositories.todo_repository import (ITEM_FIELDS, FilterClause, _add_delta, _apply_keyset,
+                                          _change_version_values, _change_versions_upsert,
+                                          _group_updates, _items_select, _keyset_key,
+                                          _ownership_filter, _project_row, _status_count_values,
+                                          _status_counts_upsert, _tombstone_rows)
+
+logger = logging.getLogger(__name__)
+
+_COPY_COLUMNS = ["id", "title", "description", "status", "timestamp", "user_id", "version",
+                 "updated_at", "change_version"]
+
+
+async def get_items_page(user_id: str,
+                         filters: Optional[Sequence[FilterClause]] = None,
+                         sort_by: str = "id",
+                         sort_order: str = "asc",
+                         limit: int = 100,
+                         after: Optional[Tuple[Any, str]] = None,
+                         fields: Optional[Sequence[str]] = None,
+                         search: Optional[Sequence[str]] = None) -> Tuple[List[Dict[str, Any]], Optional[Tuple[Any, str]]]:
+
+    try:
+        fields = list(fields or ITEM_FIELDS)
+        statement, rank = _items_select(user_id, filters, sort_by, fields, search, _dialect())
+        statement = _apply_keyset(statement, sort_by, sort_order, after, rank)
+        rows = (await adb.session.execute(statement.limit(limit + 1))).mappings().all()
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        next_key = _keyset_key(rows[-1], sort_by) if has_more else None
+
+        return [_project_row(row, fields) for row in rows], next_key
+    except Exception as e:
+        logger.error(f"Error retrieving items page for user {user_id}: {e}")
+        return [], None
+
+
+async def iter_items(user_id: str,
+                     filters: Optional[Sequence[FilterClause]] = None,
+                     sort_by: str = "id",
+                     sort_order: str = "asc",
+                     fields: Optional[Sequence[str]] = None,
+                     chunk_size: int = 500,
+                     search: Optional[Sequence[str]] = None) -> AsyncIterator[Dict[str, Any]]:
+
+    # Server-side cursor streamed chunk by chunk; errors are re-raised so a
+    # truncated stream never looks complete.
+    fields = list(fields or ITEM_FIELDS)
+    statement, rank = _items_select(user_id, filters, sort_by, fields, search, _dialect())
+    statement = _apply_keyset(statement, sort_by, sort_order, None, rank)
+
+    try:
+        result = await adb.session.stream(statement.execution_options(yield_per=chunk_size))
+        async for row in result.mappings():
+            yield _project_row(row, fields)
+    except Exception as e:
+        logger.error(f"Error streaming items for user {user_id}: {e}")
+        raise
+
+
+async def get_item_by_id(item_id: str,
+                         user_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+
+    try:
+        item = await adb.session.get(Item, item_id)
+
+        if item and user_id and item.user_id != user_id:
+            return None
+
+        return item.to_dict() if item else None
+    except Exception as e:
+        logger.error(f"Error retrieving item by id: {item_id} for user {user_id}: {e}")
+        return None
+
+
+async def create_item(item_id: str,
+                      title: str,
+                      description: str,
+                      status: str,
+                      timestamp,
+                      user_id: str) -> Optional[Dict[str, Any]]:
+
+    session = adb.session
+    try:
+        change_versions = await _bump_change_versions([user_id])
+        row = {
+            "id": item_id,
+            "title": title,
+            "description": description,
+            "status": status,
+            "timestamp": timestamp,
+            "user_id": user_id,
+            "version": 1,
+            "updated_at": datetime.now(timezone.utc),
+            "change_version": change_versions[user_id]
+        }
+        await session.execute(insert(Item.__table__).values(**row))
+        await _adjust_status_counts({(user_id, status): 1})
+        await session.commit()
+        logger.info(f"Created new item {item_id} for user {user_id}")
+        return Item.row_to_dict(row)
+    except Exception as e:
+        await session.rollback()
+        logger.error(f"Error creating item {item_id} for user {user_id}: {e}")
+        return None
+
+
+async def delete_item(item_id: str,
+                      user_id: Optional[str] = None,
+                      expected_version: Optional[int] = None) -> Optional[Dict[str, Any]]:
+
+    session = adb.session
+    try:
+        owner_id = user_id or await _item_owner(item_id)
+        if owner_id is None:
+            return None
+
+        change_version = (await _bump_change_versions([owner_id]))[owner_id]
+
+        items_table = Item.__table__
+        statement = (delete(items_table)
+                     .where(*_ownership_filter(item_id, owner_id, expected_version))
+                     .returning(*items_table.c))
+
+        row = (await session.execute(statement)).mappings().first()
+        if row is None:
+            await session.rollback()
+            return None
+
+        await _adjust_status_counts({(owner_id, row["status"]): -1})
+        await session.execute(insert(ItemTombstone.__table__),
+                              _tombstone_rows(owner_id, [item_id], change_version))
+        await session.commit()
+
+        logger.info(f"Deleted item {item_id} for user {user_id}")
+        return Item.row_to_dict(row)
+    except Exception as e:
+        await session.rollback()
+        logger.error(f"Error deleting item {item_id} for user {user_id}: {e}")
+        return None
+
+
+async def update_item(item_id: str,
+                      title: Optional[str] = None,
+                      description: Optional[str] = None,
+                      status: Optional[str] = None,
+                      user_id: Optional[str] = None,
+                      expected_version: Optional[int] = None) -> Optional[Dict[str, Any]]:
+
+    session = adb.session
+    try:
+        updates = [("title", title),
+                   ("description", description),
+                   ("status", status)]
+        changes = {field: value for field, value in updates if value is not None}
+
+        if not changes:
+            item = await get_item_by_id(item_id, user_id)
+            if item and expected_version is not None and item["version"] != expected_version:
+                return None
+            return item
+
+        owner_id = user_id or await _item_owner(item_id)
+        if owner_id is None:
+            return None
+
+        change_version = (await _bump_change_versions([owner_id]))[owner_id]
+
+        items_table = Item.__table__
+        criteria = _ownership_filter(item_id, owner_id, expected_version)
+
+        old_status = None
+        if "status" in changes:
+            old_status = (await session.execute(
+                select(items_table.c.status).where(*criteria).with_for_update())).scalar()
+            if old_status is None:
+                await session.rollback()
+                return None
+
+        statement = (update(items_table)
+                     .where(*criteria)
+                     .values(**changes,
+                             version=items_table.c.version + 1,
+                             updated_at=datetime.now(timezone.utc),
+                             change_version=change_version)
+                     .returning(*items_table.c))
+
+        row = (await session.execute(statement)).mappings().first()
+        if row is None:
+            await session.rollback()
+            return None
+
+        if old_status is not None and old_status != row["status"]:
+            await _adjust_status_counts({(owner_id, old_status): -1,
+                                         (owner_id, row["status"]): 1})
+        await session.commit()
+
+        logger.info(f"Updated item {item_id} for user {user_id}")
+        return Item.row_to_dict(row)
+    except Exception as e:
+        await session.rollback()
+        logger.error(f"Error updating item {item_id} for user {user_id}: {e}")
+        return None
+
+
+async def get_items_by_ids(item_ids: List[str],
+                           user_id: str) -> Dict[str, Dict[str, Any]]:
+
+    if not item_ids:
+        return {}
+
+    try:
+        items = (await adb.session.execute(
+            select(Item).where(Item.user_id == user_id, Item.id.in_(item_ids)))).scalars().all()
+        return {item.id: item.to_dict() for item in items}
+    except Exception as e:
+        logger.error(f"Error retrieving items {item_ids} for user {user_id}: {e}")
+        return {}
+
+
+async def apply_batch(user_id: str,
+                      creates: List[Dict[str, Any]],
+                      updates: List[Dict[str, Any]],
+                      deletes: List[str]) -> Optional[Dict[str, Any]]:
+
+    session = adb.session
+    items_table = Item.__table__
+
+    try:
+        deltas: Dict[Tuple[str, str], int] = {}
+        change_version = (await _bump_change_versions([user_id]))[user_id]
+        now = datetime.now(timezone.utc)
+
+        creates = [{**row, "version": 1, "updated_at": now, "change_version": change_version}
+                   for row in creates]
+        if creates:
+            await session.execute(insert(items_table), creates)
+            for row in creates:
+                _add_delta(deltas, user_id, row["status"], 1)
+
+        status_changes = {change["id"]: change["status"] for change in updates if "status" in change}
+        if status_changes:
+            old_statuses = (await session.execute(
+                select(items_table.c.id, items_table.c.status)
+                .where(items_table.c.user_id == user_id,
+                       items_table.c.id.in_(list(status_changes)))
+                .with_for_update())).all()
+            for item_id, old_status in old_statuses:
+                _add_delta(deltas, user_id, old_status, -1)
+                _add_delta(deltas, user_id, status_changes[item_id], 1)
+
+        updated: Dict[str, Dict[str, Any]] = {}
+        for fields, params in _group_updates(updates).items():
+            statement = (update(items_table)
+                         .where(items_table.c.id == bindparam("b_id"),
+                                items_table.c.user_id == user_id)
+                         .values({**{field: bindparam(f"b_{field}") for field in fields},
+                                  "version": items_table.c.version + 1,
+                                  "updated_at": now,
+                                  "change_version": change_version})
+                         .returning(*items_table.c))
+            # Drivers cannot return rows from an executemany UPDATE, so each
+            # row is its own UPDATE ... RETURNING inside the one transaction.
+            for row_params in params:
+                row = (await session.execute(statement, row_params)).mappings().first()
+                if row is not None:
+                    updated[row["id"]] = Item.row_to_dict(row)
+
+        deleted = []
+        if deletes:
+            deleted = (await session.execute(delete(items_table)
+                                             .where(items_table.c.user_id == user_id,
+                                                    items_table.c.id.in_(deletes))
+                                             .returning(items_table.c.id, items_table.c.status))).all()
+            for _, status in deleted:
+                _add_delta(deltas, user_id, status, -1)
+            if deleted:
+                await session.execute(insert(ItemTombstone.__table__),
+                                      _tombstone_rows(user_id, [item_id for item_id, _ in deleted],
+                                                      change_version))
+
+        await _adjust_status_counts(deltas)
+        await session.commit()
+        logger.info(f"Applied batch for user {user_id}: {len(creates)} created, "
+                    f"{len(updated)} updated, {len(deleted)} deleted")
+        return {"created": [Item.row_to_dict(row) for row in creates],
+                "updated": updated,
+                "deleted": [item_id for item_id, _ in deleted]}
+    except Exception as e:
+        await session.rollback()
+        logger.error(f"Error applying batch for user {user_id}: {e}")
+        return None
+
+
+async def insert_items(rows: List[Dict[str, Any]]) -> bool:
+
+    # Bulk load: COPY through asyncpg on Postgres, a multi-row executemany
+    # INSERT elsewhere. Commits once per call.
+    if not rows:
+        return True
+
+    session = adb.session
+    try:
+        change_versions = await _bump_change_versions({row["user_id"] for row in rows})
+        now = datetime.now(timezone.utc)
+        rows = [{**row, "version": 1, "updated_at": now, "change_version": change_versions[row["user_id"]]}
+                for row in rows]
+
+        if _driver() == "asyncpg":
+            await _copy_items(rows)
+        else:
+            await session.execute(insert(Item.__table__), rows)
+
+        deltas: Dict[Tuple[str, str], int] = {}
+        for row in rows:
+            _add_delta(deltas, row["user_id"], row["status"], 1)
+        await _adjust_status_counts(deltas)
+
+        await session.commit()
+        return True
+    except Exception as e:
+        await session.rollback()
+        logger.error(f"Error bulk inserting {len(rows)} items: {e}")
+        return False
+
+
+async def get_status_counts(user_id: str) -> Dict[str, int]:
+
+    try:
+        counts_table = ItemStatusCount.__table__
+        rows = (await adb.session.execute(
+            select(counts_table.c.status, counts_table.c.count)
+            .where(counts_table.c.user_id == user_id))).all()
+        return {status: count for status, count in rows}
+    except Exception as e:
+        logger.error(f"Error retrieving status counts for user {user_id}: {e}")
+        return {}
+
+
+async def get_change_version(user_id: str) -> Optional[Tuple[int, Optional[datetime]]]:
+
+    try:
+        versions_table = UserChangeVersion.__table__
+        row = (await adb.session.execute(
+            select(versions_table.c.version, versions_table.c.changed_at)
+            .where(versions_table.c.user_id == user_id))).first()
+        return (row.version, row.changed_at) if row else (0, None)
+    except Exception as e:
+        logger.error(f"Error retrieving change version for user {user_id}: {e}")
+        return None
+
+
+async def get_changes_since(user_id: str, since: Optional[int] = None) -> Optional[Dict[str, Any]]:
+
+    # Same ordering guarantee as the sync version: the user's version is read
+    # before the items.
+    try:
+        session = adb.session
+        versions_table = UserChangeVersion.__table__
+        items_table = Item.__table__
+        tombstones_table = ItemTombstone.__table__
+
+        versions = (await session.execute(
+            select(versions_table.c.version, versions_table.c.min_sync_version)
+            .where(versions_table.c.user_id == user_id))).first()
+        version, min_sync_version = versions if versions else (0, 0)
+
+        changed = select(*(items_table.c[name] for name in ITEM_FIELDS)).where(
+            items_table.c.user_id == user_id)
+        if since is not None:
+            changed = changed.where(items_table.c.change_version > since)
+        changed = changed.order_by(items_table.c.change_version, items_table.c.id)
+        items = [_project_row(row, ITEM_FIELDS)
+                 for row in (await session.execute(changed)).mappings()]
+
+        deleted = []
+        if since is not None:
+            deleted = (await session.execute(
+                select(tombstones_table.c.item_id)
+                .where(tombstones_table.c.user_id == user_id,
+                       tombstones_table.c.change_version > since)
+                .order_by(tombstones_table.c.change_version, tombstones_table.c.item_id))).scalars().all()
+
+        return {"version": version,
+                "min_sync_version": min_sync_version,
+                "items": items,
+                "deleted": list(deleted)}
+    except Exception as e:
+        logger.error(f"Error retrieving changes since {since} for user {user_id}: {e}")
+        return None
+
+
+async def _bump_change_versions(user_ids) -> Dict[str, int]:
+
+    # See todo_repository._bump_change_versions.
+    values = _change_version_values(user_ids)
+    if not values:
+        return {}
+
+    session = adb.session
+    dialect = _dialect()
+    versions_table = UserChangeVersion.__table__
+
+    if dialect in ("postgresql", "sqlite"):
+        result = await session.execute(_change_versions_upsert(values, dialect))
+        return {user_id: version for user_id, version in result}
+
+    for value in values:
+        updated = await session.execute(
+            update(versions_table)
+            .where(versions_table.c.user_id == value["user_id"])
+            .values(version=versions_table.c.version + 1, changed_at=value["changed_at"]))
+        if updated.rowcount == 0:
+            await session.execute(insert(versions_table).values(**value))
+
+    rows = await session.execute(
+        select(versions_table.c.user_id, versions_table.c.version)
+        .where(versions_table.c.user_id.in_([value["user_id"] for value in values])))
+    return {user_id: version for user_id, version in rows}
+
+
+async def _adjust_status_counts(deltas: Dict[Tuple[str, str], int]) -> None:
+
+    values = _status_count_values(deltas)
+    if not values:
+        return
+
+    session = adb.session
+    dialect = _dialect()
+    counts_table = ItemStatusCount.__table__
+
+    if dialect in ("postgresql", "sqlite"):
+        await session.execute(_status_counts_upsert(values, dialect))
+        return
+
+    for value in values:
+        updated = await session.execute(
+            update(counts_table)
+            .where(counts_table.c.user_id == value["user_id"],
+                   counts_table.c.status == value["status"])
+            .values(count=counts_table.c.count + value["count"]))
+        if updated.rowcount == 0:
+            await session.execute(insert(counts_table).values(**value))
+
+
+async def _item_owner(item_id: str) -> Optional[str]:
+
+    items_table = Item.__table__
+    return (await adb.session.execute(
+        select(items_table.c.user_id).where(items_table.c.id == item_id))).scalar()
+
+
+async def _copy_items(rows: List[Dict[str, Any]]) -> None:
+
+    # Runs on the session's own connection, inside its transaction.
+    connection = await (await adb.session.connection()).get_raw_connection()
+    await connection.driver_connection.copy_records_to_table(
+        "items", columns=_COPY_COLUMNS,
+        records=[tuple(row[column] for column in _COPY_COLUMNS) for row in rows])
+
+
+def _dialect() -> str:
+
+    return adb.engine.dialect.name
+
+
+def _driver() -> str:
+
+    return adb.engine.dialect.driver
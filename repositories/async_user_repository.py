@@ -0,0 +1,91 @@
+from database.async_database import adb
+from database.models import User
+from sqlalchemy import select
+from typing import Optional, Dict, Any
+import logging
+
+from repositories.user_repository import _run_invalidation_hooks
+
+logger = logging.getLogger(__name__)
+
+
+async def get_user_by_id(user_id: str) -> Optional[Dict[str, Any]]:
+
+    try:
+        user = await adb.session.get(User, user_id)
+        return user.to_dict() if user else None
+    except Exception as e:
+        logger.error(f"Error retrieving user by id {user_id}: {e}")
+        return None
+
+
+async def get_user_with_password(email: str) -> Optional[Dict[str, Any]]:
+
+    try:
+        user = (await adb.session.execute(select(User).filter_by(email=email))).scalars().first()
+        if not user:
+            return None
+
+        return {
+            "id": user.id,
+            "email": user.email,
+            "password_hash": user.password_hash,
+            "created_at": user.created_at
+        }
+    except Exception as e:
+        logger.error(f"Error retrieving user with password for email: {email}: {e}")
+        return None
+
+
+async def create_user(user_id: str, email: str, password_hash: str, created_at) -> Optional[Dict[str, Any]]:
+
+    session = adb.session
+    try:
+        user = User(
+            id=user_id,
+            email=email,
+            password_hash=password_hash,
+            created_at=created_at
+        )
+        session.add(user)
+        await session.commit()
+        logger.info(f"Created new user with id {user_id}")
+        return user.to_dict()
+    except Exception as e:
+        await session.rollback()
+        logger.error(f"Error creating user {user_id}: {e}")
+        return None
+
+
+async def update_user(user_id: str, updates: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+
+    session = adb.session
+    try:
+        user = await session.get(User, user_id)
+        if not user:
+            return None
+
+        allowed_fields = {"email", "password_hash"}
+        for field, value in updates.items():
+            if field in allowed_fields and hasattr(user, field):
+                setattr(user, field, value)
+
+        await session.commit()
+        _run_invalidation_hooks(user_id)
+        logger.info(f"Updated user {user_id} with fields: {list(updates.keys())}")
+        return user.to_dict()
+
+    except Exception as e:
+        await session.rollback()
+        logger.error(f"Error updating user {user_id}: {e}")
+        return None
+
+
+async def email_exists(email: str) -> bool:
+
+    try:
+        found = (await adb.session.execute(select(User.id).filter_by(email=email).limit(1))).first()
+        return found is not None
+    except Exception as e:
+        logger.error(f"Error cheching email existence for {email}: {e}")
+        return False
@@ -1,52 +1,111 @@
-from database.models import db, Item
-from typing import Dict, Any, List, Optional
+from database import routing, sharding
+from database.models import db, Item, ItemStatusCount, ItemTombstone, UserChangeVersion
+from datetime import datetime, timezone
+from sqlalchemy import (and_, bindparam, column, delete, func, insert, literal_column, select, table, text,
+                        tuple_, update)
+from typing import Dict, Any, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+import csv
+import io
 import logging
+import operator
 
 logger = logging.getLogger(__name__)
 
 ALLOWED_SORT_COLUMNS = ["id", "title", "status", "timestamp"]
+ITEM_FIELDS = ["id", "title", "description", "status", "timestamp", "user_id", "version", "updated_at"]
+# Must match database.migrations.SEARCH_CONFIG, which built items.search_vector.
+SEARCH_CONFIG = "english"
+# Columns that can be filtered on and the operators each accepts. eq/ne take
+# a list of values for status. Every combination compiles to a predicate
+# the (user_id, ...) composite indexes can serve.
+FILTER_OPERATORS = {
+    "status": ("eq", "ne"),
+    "title": ("eq", "prefix"),
+    "timestamp": ("gt", "gte", "lt", "lte"),
+    "updated_at": ("gt", "gte", "lt", "lte"),
+}
 
+_COMPARISONS = {"gt": operator.gt, "gte": operator.ge, "lt": operator.lt, "lte": operator.le}
 
-def get_all_items(user_id: Optional[str] = None, 
-                  sort_by: str = "id", 
-                  sort_order: str = "asc") -> List[Dict[str, Any]]:
-    
-    try: 
-        item = Item.query
-        
-        if user_id:
-            item = item.filter_by(user_id=user_id)
-        
-        item = _apply_sorting(item, sort_by, sort_order)
-        return [item.to_dict() for item in item.all()]
-    except Exception as e:
-        logger.error(f"Error retrieving all items for {user_id}: {e}")
-        return []
+
+class FilterClause(NamedTuple):
+    field: str
+    op: str
+    value: Any
 
 
-def get_items_by_status(status: str,
-                        user_id: Optional[str] = None,
-                        sort_by: str = "id",
-                        sort_order: str = "asc") -> List[Dict[str, Any]]:
+@sharding.by_user()
+def get_items_page(user_id: str,
+                   filters: Optional[Sequence[FilterClause]] = None,
+                   sort_by: str = "id",
+                   sort_order: str = "asc",
+                   limit: int = 100,
+                   after: Optional[Tuple[Any, str]] = None,
+                   fields: Optional[Sequence[str]] = None,
+                   search: Optional[Sequence[str]] = None) -> Tuple[List[Dict[str, Any]], Optional[Tuple[Any, str]]]:
 
+    # Keyset pagination: rows are ordered by (sort column, id) and the next page
+    # starts strictly after the last (value, id) pair, so the database can seek
+    # into the index instead of counting past OFFSET rows.
+    #
+    # Only the requested columns (plus the sort key) are selected, as plain
+    # rows rather than ORM objects, so large columns such as description are
+    # never read unless asked for.
+    #
+    # `search` terms restrict the rows to full-text matches (all terms, as
+    # prefixes); sort_by="rank" then orders by relevance, best first.
     try:
-        item = Item.query.filter_by(status=status)
+        fields = list(fields or ITEM_FIELDS)
+        statement, rank = _items_select(user_id, filters, sort_by, fields, search)
+        statement = _apply_keyset(statement, sort_by, sort_order, after, rank)
+        rows = _read_session(user_id).execute(statement.limit(limit + 1)).mappings().all()
 
-        if user_id:
-            item = item.filter_by(user_id=user_id)
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        next_key = _keyset_key(rows[-1], sort_by) if has_more else None
 
-        item = _apply_sorting(item, sort_by, sort_order)
-        return [item.to_dict() for item in item.all()]
+        return [_project_row(row, fields) for row in rows], next_key
     except Exception as e:
-        logger.error(f"Error retrieving items by status: {status} for user {user_id}: {e}")
-        return []
+        logger.error(f"Error retrieving items page for user {user_id}: {e}")
+        return [], None
+
+
+def iter_items(user_id: str,
+               filters: Optional[Sequence[FilterClause]] = None,
+               sort_by: str = "id",
+               sort_order: str = "asc",
+               fields: Optional[Sequence[str]] = None,
+               chunk_size: int = 500,
+               search: Optional[Sequence[str]] = None) -> Iterator[Dict[str, Any]]:
+
+    # Streams every matching row with a server-side cursor (yield_per), holding
+    # at most one chunk in memory. Errors are re-raised after logging: a
+    # silently truncated stream would look like a complete export.
+    fields = list(fields or ITEM_FIELDS)
+    statement, rank = _items_select(user_id, filters, sort_by, fields, search)
+    statement = _apply_keyset(statement, sort_by, sort_order, None, rank)
+
+    try:
+        # Only the execute needs the scope: the open result keeps its connection.
+        with sharding.user_scope(user_id):
+            result = _read_session(user_id).execute(statement.execution_options(yield_per=chunk_size))
+        for row in result.mappings():
+            yield _project_row(row, fields)
+    except Exception as e:
+        logger.error(f"Error streaming items for user {user_id}: {e}")
+        raise
 
 
+@sharding.by_user()
 def get_item_by_id(item_id: str,
                     user_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
 
     try:
-        item = Item.query.get(item_id)
+        session = _read_session(user_id)
+        item = session.get(Item, item_id)
+        if item is None and routing.on_replica(session):
+            # May have been created moments ago and not replicated yet.
+            item = db.session.get(Item, item_id)
 
         if item and user_id and item.user_id != user_id:
             return None
@@ -69,6 +128,7 @@ def get_all_ids(user_id: Optional[str] = None) -> List[Dict[str, str]]:
         logger.error(f"Error retrieving all item IDs for user {user_id}: {e}")
         return []
 
+@sharding.by_user(write=True)
 def create_item(item_id: str,
                 title: str, 
                 description: str, 
@@ -76,78 +136,755 @@ def create_item(item_id: str,
                 timestamp, 
                 user_id: str) -> Optional[Dict[str, Any]]:
     
+    # Plain INSERT and a dict built from the values we already have, so there
+    # is no refresh SELECT after commit.
     try:
-        item = Item(
-            id=item_id,
-            title=title,
-            description=description,
-            status=status,
-            timestamp=timestamp,
-            user_id=user_id
-        )
-        db.session.add(item)
+        change_versions = _bump_change_versions([user_id])
+        row = {
+            "id": item_id,
+            "title": title,
+            "description": description,
+            "status": status,
+            "timestamp": timestamp,
+            "user_id": user_id,
+            "version": 1,
+            "updated_at": datetime.now(timezone.utc),
+            "change_version": change_versions[user_id]
+        }
+        db.session.execute(insert(Item.__table__).values(**row))
+        _adjust_status_counts({(user_id, status): 1})
         db.session.commit()
         logger.info(f"Created new item {item_id} for user {user_id}")
-        return item.to_dict()
+        return Item.row_to_dict(row)
     except Exception as e:
         db.session.rollback()
         logger.error(f"Error creating item {item_id} for user {user_id}: {e}")
         return None
 
 
+@sharding.by_user(write=True)
 def delete_item(item_id: str, 
-                user_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+                user_id: Optional[str] = None,
+                expected_version: Optional[int] = None) -> Optional[Dict[str, Any]]:
     try:
-        item = Item.query.get(item_id)
+        owner_id = user_id or _item_owner(item_id)
+        if owner_id is None:
+            return None
+
+        # The change version is taken first so the tombstone carries it; a
+        # miss rolls the bump back with everything else.
+        change_version = _bump_change_versions([owner_id])[owner_id]
+
+        items_table = Item.__table__
+        statement = (delete(items_table)
+                     .where(*_ownership_filter(item_id, owner_id, expected_version))
+                     .returning(*items_table.c))
 
-        if not item or (user_id and item.user_id != user_id):
+        row = db.session.execute(statement).mappings().first()
+        if row is None:
+            db.session.rollback()
             return None
-        
-        item_dict = item.to_dict()
-        db.session.delete(item)
+
+        _adjust_status_counts({(owner_id, row["status"]): -1})
+        _write_tombstones(owner_id, [item_id], change_version)
         db.session.commit()
+
         logger.info(f"Deleted item {item_id} for user {user_id}")
-        return item_dict
+        return Item.row_to_dict(row)
     except Exception as e:
+        db.session.rollback()
         logger.error(f"Error deleting item {item_id} for user {user_id}: {e}")
         return None
 
+@sharding.by_user(write=True)
 def update_item(item_id: str, 
                 title: Optional[str] = None, 
                 description: Optional[str] = None, 
                 status: Optional[str] = None, 
-                user_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+                user_id: Optional[str] = None,
+                expected_version: Optional[int] = None) -> Optional[Dict[str, Any]]:
     try:
-        item = Item.query.get(item_id)
-
-        if not item or (user_id and item.user_id != user_id):
-            return None
-                
         updates = [("title", title),
                 ("description", description),
                 ("status", status)]
-        
-        for field, value in updates:
-            if value is not None:
-                logger.info("Try to update item.....")
-                setattr(item, field, value)
+        changes = {field: value for field, value in updates if value is not None}
+
+        if not changes:
+            item = get_item_by_id(item_id, user_id)
+            if item and expected_version is not None and item["version"] != expected_version:
+                return None
+            return item
+
+        # One ownership-scoped UPDATE ... RETURNING instead of load, mutate, commit, refresh.
+        # A status change first locks the row to read the old status for the counters.
+        owner_id = user_id or _item_owner(item_id)
+        if owner_id is None:
+            return None
+
+        change_version = _bump_change_versions([owner_id])[owner_id]
+
+        items_table = Item.__table__
+        criteria = _ownership_filter(item_id, owner_id, expected_version)
 
+        old_status = None
+        if "status" in changes:
+            old_status = db.session.execute(
+                select(items_table.c.status).where(*criteria).with_for_update()).scalar()
+            if old_status is None:
+                db.session.rollback()
+                return None
+
+        statement = (update(items_table)
+                     .where(*criteria)
+                     .values(**changes,
+                             version=items_table.c.version + 1,
+                             updated_at=datetime.now(timezone.utc),
+                             change_version=change_version)
+                     .returning(*items_table.c))
+
+        row = db.session.execute(statement).mappings().first()
+        if row is None:
+            db.session.rollback()
+            return None
+
+        if old_status is not None and old_status != row["status"]:
+            _adjust_status_counts({(owner_id, old_status): -1,
+                                   (owner_id, row["status"]): 1})
         db.session.commit()
+
         logger.info(f"Updated item {item_id} for user {user_id}")
-        return item.to_dict()
+        return Item.row_to_dict(row)
     except Exception as e:
         db.session.rollback()
         logger.error(f"Error updating item {item_id} for user {user_id}: {e}")
         return None
 
 
-def _apply_sorting(item, sort_by: str, sort_order: str):
+@sharding.by_user()
+def get_items_by_ids(item_ids: List[str],
+                     user_id: str) -> Dict[str, Dict[str, Any]]:
+
+    if not item_ids:
+        return {}
+
+    try:
+        items = Item.query.filter(Item.user_id == user_id, Item.id.in_(item_ids)).all()
+        return {item.id: item.to_dict() for item in items}
+    except Exception as e:
+        logger.error(f"Error retrieving items {item_ids} for user {user_id}: {e}")
+        return {}
+
+
+@sharding.by_user(write=True)
+def apply_batch(user_id: str,
+                creates: List[Dict[str, Any]],
+                updates: List[Dict[str, Any]],
+                deletes: List[str]) -> Optional[Dict[str, Any]]:
+
+    # Everything below shares one transaction: a multi-row INSERT, an
+    # UPDATE ... RETURNING per updated item, and a single DELETE ... IN ...
+    # RETURNING. Every UPDATE/DELETE is scoped to the user. Returns the rows
+    # as written: created and updated items, and the ids actually deleted.
+    items_table = Item.__table__
+
+    try:
+        deltas: Dict[Tuple[str, str], int] = {}
+        change_version = _bump_change_versions([user_id])[user_id]
+        now = datetime.now(timezone.utc)
+
+        creates = [{**row, "version": 1, "updated_at": now, "change_version": change_version}
+                   for row in creates]
+        if creates:
+            db.session.execute(insert(items_table), creates)
+            for row in creates:
+                _add_delta(deltas, user_id, row["status"], 1)
+
+        status_changes = {change["id"]: change["status"] for change in updates if "status" in change}
+        if status_changes:
+            old_statuses = db.session.execute(
+                select(items_table.c.id, items_table.c.status)
+                .where(items_table.c.user_id == user_id,
+                       items_table.c.id.in_(list(status_changes)))
+                .with_for_update()).all()
+            for item_id, old_status in old_statuses:
+                _add_delta(deltas, user_id, old_status, -1)
+                _add_delta(deltas, user_id, status_changes[item_id], 1)
+
+        updated: Dict[str, Dict[str, Any]] = {}
+        for fields, params in _group_updates(updates).items():
+            statement = (update(items_table)
+                         .where(items_table.c.id == bindparam("b_id"),
+                                items_table.c.user_id == user_id)
+                         .values({**{field: bindparam(f"b_{field}") for field in fields},
+                                  "version": items_table.c.version + 1,
+                                  "updated_at": now,
+                                  "change_version": change_version})
+                         .returning(*items_table.c))
+            # Drivers cannot return rows from an executemany UPDATE, so each
+            # row is its own UPDATE ... RETURNING inside the one transaction.
+            for row_params in params:
+                row = db.session.execute(statement, row_params).mappings().first()
+                if row is not None:
+                    updated[row["id"]] = Item.row_to_dict(row)
+
+        deleted = []
+        if deletes:
+            deleted = db.session.execute(delete(items_table)
+                                         .where(items_table.c.user_id == user_id,
+                                                items_table.c.id.in_(deletes))
+                                         .returning(items_table.c.id, items_table.c.status)).all()
+            for _, status in deleted:
+                _add_delta(deltas, user_id, status, -1)
+            _write_tombstones(user_id, [item_id for item_id, _ in deleted], change_version)
+
+        _adjust_status_counts(deltas)
+        db.session.commit()
+        logger.info(f"Applied batch for user {user_id}: {len(creates)} created, "
+                    f"{len(updated)} updated, {len(deleted)} deleted")
+        return {"created": [Item.row_to_dict(row) for row in creates],
+                "updated": updated,
+                "deleted": [item_id for item_id, _ in deleted]}
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error applying batch for user {user_id}: {e}")
+        return None
+
+
+def insert_items(rows: List[Dict[str, Any]]) -> bool:
+
+    # Bulk load: COPY on Postgres, a multi-row executemany INSERT elsewhere.
+    # Commits once per call.
+    if not rows:
+        return True
+
+    user_ids = {row["user_id"] for row in rows}
+    if sharding.enabled() and len(user_ids) > 1:
+        # Users may live on different shards; load each user's rows on its own.
+        return all(insert_items([row for row in rows if row["user_id"] == user_id])
+                   for user_id in sorted(user_ids))
+
+    with sharding.user_scope(next(iter(user_ids)), write=True):
+        return _insert_items(rows)
+
+
+def _insert_items(rows: List[Dict[str, Any]]) -> bool:
+
+    try:
+        change_versions = _bump_change_versions({row["user_id"] for row in rows})
+        now = datetime.now(timezone.utc)
+        rows = [{**row, "version": 1, "updated_at": now, "change_version": change_versions[row["user_id"]]}
+                for row in rows]
+
+        if db.session.get_bind().dialect.name == "postgresql":
+            _copy_items(rows)
+        else:
+            db.session.execute(insert(Item.__table__), rows)
+
+        deltas: Dict[Tuple[str, str], int] = {}
+        for row in rows:
+            _add_delta(deltas, row["user_id"], row["status"], 1)
+        _adjust_status_counts(deltas)
+
+        db.session.commit()
+        return True
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error bulk inserting {len(rows)} items: {e}")
+        return False
+
+
+@sharding.by_user()
+def get_status_counts(user_id: str) -> Dict[str, int]:
+
+    try:
+        counts_table = ItemStatusCount.__table__
+        rows = _read_session(user_id).execute(
+            select(counts_table.c.status, counts_table.c.count)
+            .where(counts_table.c.user_id == user_id)).all()
+        return {status: count for status, count in rows}
+    except Exception as e:
+        logger.error(f"Error retrieving status counts for user {user_id}: {e}")
+        return {}
+
+
+@sharding.by_user(write=True)
+def rebuild_status_counts(user_id: Optional[str] = None) -> bool:
+
+    # Repair path: recompute counters from items with a GROUP BY, for one user
+    # or everyone, replacing whatever is stored.
+    try:
+        counts_table = ItemStatusCount.__table__
+        items_table = Item.__table__
+
+        clear = delete(counts_table)
+        grouped = select(items_table.c.user_id, items_table.c.status, func.count())
+        if user_id:
+            clear = clear.where(counts_table.c.user_id == user_id)
+            grouped = grouped.where(items_table.c.user_id == user_id)
+        grouped = grouped.group_by(items_table.c.user_id, items_table.c.status)
+
+        # For everyone, each shard rebuilds the counters of the users it holds.
+        for _ in ([None] if user_id else sharding.each_shard()):
+            db.session.execute(clear)
+            db.session.execute(insert(counts_table).from_select(["user_id", "status", "count"], grouped))
+            db.session.commit()
+        logger.info(f"Rebuilt item status counts for {user_id or 'all users'}")
+        return True
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error rebuilding status counts for {user_id or 'all users'}: {e}")
+        return False
+
+
+def rebuild_search_index() -> bool:
+
+    # SQLite only: items_fts points at items by rowid, and VACUUM may renumber
+    # rowids of a table without an INTEGER PRIMARY KEY. On Postgres a trigger
+    # keeps search_vector current, so there is nothing to rebuild.
+    try:
+        for _ in sharding.each_shard():
+            if db.session.get_bind().dialect.name == "sqlite":
+                db.session.execute(text("INSERT INTO items_fts (items_fts) VALUES ('rebuild')"))
+                db.session.commit()
+        logger.info("Rebuilt the item search index")
+        return True
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error rebuilding the item search index: {e}")
+        return False
+
+
+@sharding.by_user()
+def get_change_version(user_id: str) -> Optional[Tuple[int, Optional[datetime]]]:
+
+    try:
+        versions_table = UserChangeVersion.__table__
+        row = _read_session(user_id).execute(
+            select(versions_table.c.version, versions_table.c.changed_at)
+            .where(versions_table.c.user_id == user_id)).first()
+        return (row.version, row.changed_at) if row else (0, None)
+    except Exception as e:
+        logger.error(f"Error retrieving change version for user {user_id}: {e}")
+        return None
+
+
+@sharding.by_user()
+def get_changes_since(user_id: str, since: Optional[int] = None) -> Optional[Dict[str, Any]]:
+
+    # The user's version is read before the items: anything committed after
+    # that read may show up here and again in the next delta, which clients
+    # apply idempotently, but nothing at or below it can be missed.
+    # since=None returns every item as a full snapshot.
+    try:
+        versions_table = UserChangeVersion.__table__
+        items_table = Item.__table__
+        tombstones_table = ItemTombstone.__table__
+
+        session = _read_session(user_id)
+        versions_query = select(versions_table.c.version, versions_table.c.min_sync_version).where(
+            versions_table.c.user_id == user_id)
+        versions = session.execute(versions_query).first()
+        if since is not None and routing.on_replica(session) and (versions is None or versions[0] < since):
+            # The token came from a newer copy than this replica (e.g. another
+            # device's primary read); serve it from the primary rather than
+            # reporting it as expired.
+            session = db.session
+            versions = session.execute(versions_query).first()
+        version, min_sync_version = versions if versions else (0, 0)
+
+        changed = select(*(items_table.c[name] for name in ITEM_FIELDS)).where(
+            items_table.c.user_id == user_id)
+        if since is not None:
+            changed = changed.where(items_table.c.change_version > since)
+        changed = changed.order_by(items_table.c.change_version, items_table.c.id)
+        items = [_project_row(row, ITEM_FIELDS)
+                 for row in session.execute(changed).mappings()]
+
+        deleted = []
+        if since is not None:
+            deleted = session.execute(
+                select(tombstones_table.c.item_id)
+                .where(tombstones_table.c.user_id == user_id,
+                       tombstones_table.c.change_version > since)
+                .order_by(tombstones_table.c.change_version, tombstones_table.c.item_id)).scalars().all()
+
+        return {"version": version,
+                "min_sync_version": min_sync_version,
+                "items": items,
+                "deleted": list(deleted)}
+    except Exception as e:
+        logger.error(f"Error retrieving changes since {since} for user {user_id}: {e}")
+        return None
+
+
+def prune_tombstones(deleted_before: datetime) -> Optional[int]:
+
+    # Sync tokens older than a pruned tombstone can no longer be answered
+    # with a delta, so each user's min_sync_version is raised to the newest
+    # version removed; clients holding older tokens get a full resync.
+    try:
+        tombstones_table = ItemTombstone.__table__
+        versions_table = UserChangeVersion.__table__
+        expired = tombstones_table.c.deleted_at < deleted_before
+        removed = 0
+
+        for _ in sharding.each_shard():
+            pruned = db.session.execute(
+                select(tombstones_table.c.user_id, func.max(tombstones_table.c.change_version))
+                .where(expired)
+                .group_by(tombstones_table.c.user_id)).all()
+
+            if pruned:
+                db.session.execute(
+                    update(versions_table)
+                    .where(versions_table.c.user_id == bindparam("b_user_id"),
+                           versions_table.c.min_sync_version < bindparam("b_version"))
+                    .values(min_sync_version=bindparam("b_version")),
+                    [{"b_user_id": user_id, "b_version": version} for user_id, version in pruned])
+
+            removed += db.session.execute(delete(tombstones_table).where(expired)).rowcount
+            db.session.commit()
+        logger.info(f"Pruned {removed} item tombstones deleted before {deleted_before.isoformat()}")
+        return removed
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error pruning item tombstones: {e}")
+        return None
+
+
+def _read_session(user_id: str):
+
+    # Replicas mirror the unsharded primary; sharded item data is always read
+    # from the user's shard (db.session inside sharding.user_scope()).
+    return db.session if sharding.enabled() else routing.read_session(user_id)
+
+
+def _bump_change_versions(user_ids) -> Dict[str, int]:
+
+    # Same transaction as the item write, so a version never advertises a
+    # change that rolled back. The upsert also locks each user's version row
+    # until commit, so one user's writes commit in version order, which is
+    # what lets a delta sync token be a plain version number.
+    values = _change_version_values(user_ids)
+    if not values:
+        return {}
+
+    # Every item write passes through here: pin these users' reads to the
+    # primary until replicas have caught up.
+    for value in values:
+        routing.mark_written(value["user_id"])
+
+    versions_table = UserChangeVersion.__table__
+    dialect = db.session.get_bind().dialect.name
+
+    if dialect in ("postgresql", "sqlite"):
+        statement = _change_versions_upsert(values, dialect)
+        return {user_id: version for user_id, version in db.session.execute(statement)}
+
+    for value in values:
+        updated = db.session.execute(
+            update(versions_table)
+            .where(versions_table.c.user_id == value["user_id"])
+            .values(version=versions_table.c.version + 1, changed_at=value["changed_at"]))
+        if updated.rowcount == 0:
+            db.session.execute(insert(versions_table).values(**value))
+
+    rows = db.session.execute(
+        select(versions_table.c.user_id, versions_table.c.version)
+        .where(versions_table.c.user_id.in_([value["user_id"] for value in values])))
+    return {user_id: version for user_id, version in rows}
+
+
+def _change_version_values(user_ids) -> List[Dict[str, Any]]:
+
+    # Sorted, so concurrent multi-user writes lock version rows in one order.
+    changed_at = datetime.now(timezone.utc)
+    return [{"user_id": user_id, "version": 1, "changed_at": changed_at}
+            for user_id in sorted(set(user_ids))]
+
+
+def _change_versions_upsert(values: List[Dict[str, Any]], dialect: str):
+
+    # INSERT ... ON CONFLICT that bumps each user's version and returns it;
+    # Postgres and SQLite only.
+    versions_table = UserChangeVersion.__table__
+    statement = _upsert_insert(dialect)(versions_table).values(values)
+    statement = statement.on_conflict_do_update(
+        index_elements=["user_id"],
+        set_={"version": versions_table.c.version + 1,
+              "changed_at": statement.excluded.changed_at})
+    return statement.returning(versions_table.c.user_id, versions_table.c.version)
+
+
+def _upsert_insert(dialect: str):
+
+    # Only the dialect in use is imported, on the first write.
+    if dialect == "postgresql":
+        from sqlalchemy.dialects import postgresql
+        return postgresql.insert
+
+    from sqlalchemy.dialects import sqlite
+    return sqlite.insert
+
+
+def _write_tombstones(user_id: str, item_ids: List[str], change_version: int) -> None:
+
+    if not item_ids:
+        return
+
+    db.session.execute(insert(ItemTombstone.__table__),
+                       _tombstone_rows(user_id, item_ids, change_version))
+
+
+def _tombstone_rows(user_id: str, item_ids: List[str], change_version: int) -> List[Dict[str, Any]]:
+
+    deleted_at = datetime.now(timezone.utc)
+    return [{"item_id": item_id, "user_id": user_id,
+             "change_version": change_version, "deleted_at": deleted_at}
+            for item_id in item_ids]
+
+
+def _item_owner(item_id: str) -> Optional[str]:
+
+    items_table = Item.__table__
+    return db.session.execute(
+        select(items_table.c.user_id).where(items_table.c.id == item_id)).scalar()
+
+
+def _add_delta(deltas: Dict[Tuple[str, str], int], user_id: str, status: str, amount: int) -> None:
+
+    deltas[(user_id, status)] = deltas.get((user_id, status), 0) + amount
+
+
+def _adjust_status_counts(deltas: Dict[Tuple[str, str], int]) -> None:
+
+    # Runs inside the caller's transaction so counters commit (or roll back)
+    # together with the item change.
+    values = _status_count_values(deltas)
+    if not values:
+        return
+
+    counts_table = ItemStatusCount.__table__
+    dialect = db.session.get_bind().dialect.name
+
+    if dialect in ("postgresql", "sqlite"):
+        db.session.execute(_status_counts_upsert(values, dialect))
+        return
+
+    for value in values:
+        updated = db.session.execute(
+            update(counts_table)
+            .where(counts_table.c.user_id == value["user_id"],
+                   counts_table.c.status == value["status"])
+            .values(count=counts_table.c.count + value["count"]))
+        if updated.rowcount == 0:
+            db.session.execute(insert(counts_table).values(**value))
+
+
+def _status_count_values(deltas: Dict[Tuple[str, str], int]) -> List[Dict[str, Any]]:
+
+    return [{"user_id": user_id, "status": status, "count": amount}
+            for (user_id, status), amount in deltas.items() if amount]
+
+
+def _status_counts_upsert(values: List[Dict[str, Any]], dialect: str):
+
+    counts_table = ItemStatusCount.__table__
+    statement = _upsert_insert(dialect)(counts_table).values(values)
+    return statement.on_conflict_do_update(
+        index_elements=["user_id", "status"],
+        set_={"count": counts_table.c.count + statement.excluded.count})
+
+
+def _copy_items(rows: List[Dict[str, Any]]) -> None:
+
+    columns = ["id", "title", "description", "status", "timestamp", "user_id", "version",
+               "updated_at", "change_version"]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, quoting=csv.QUOTE_ALL)
+
+    for row in rows:
+        writer.writerow([row[column].isoformat() if isinstance(row[column], datetime) else row[column]
+                         for column in columns])
+    buffer.seek(0)
+
+    # Runs on the session's own connection, inside its transaction.
+    cursor = db.session.connection().connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY items ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    finally:
+        cursor.close()
+
+
+def _ownership_filter(item_id: str,
+                      user_id: Optional[str],
+                      expected_version: Optional[int]) -> List[Any]:
+
+    items_table = Item.__table__
+    criteria = [items_table.c.id == item_id]
+
+    if user_id:
+        criteria.append(items_table.c.user_id == user_id)
+
+    if expected_version is not None:
+        criteria.append(items_table.c.version == expected_version)
+
+    return criteria
+
+
+def _group_updates(updates: List[Dict[str, Any]]) -> Dict[Tuple[str, ...], List[Dict[str, Any]]]:
+
+    groups: Dict[Tuple[str, ...], List[Dict[str, Any]]] = {}
+
+    for change in updates:
+        fields = tuple(sorted(field for field in change if field != "id"))
+        if not fields:
+            continue
+
+        params = {f"b_{field}": change[field] for field in fields}
+        params["b_id"] = change["id"]
+        groups.setdefault(fields, []).append(params)
+
+    return groups
+
+
+def _items_select(user_id: str,
+                  filters: Optional[Sequence[FilterClause]],
+                  sort_by: str,
+                  fields: Sequence[str],
+                  search: Optional[Sequence[str]] = None,
+                  dialect: Optional[str] = None):
+
+    # `dialect` defaults to the one behind db.session; the async repository
+    # passes its own.
+    dialect = dialect or db.session.get_bind().dialect.name
 
     if sort_by not in ALLOWED_SORT_COLUMNS:
         sort_by = "id"
-    
+
+    items_table = Item.__table__
+    selected = list(dict.fromkeys([*fields, sort_by, "id"]))
+
+    statement = select(*(items_table.c[name] for name in selected)).where(
+        items_table.c.user_id == user_id)
+
+    for clause in filters or ():
+        statement = statement.where(_filter_predicate(clause, dialect))
+
+    rank = None
+    if search:
+        statement, rank = _apply_search(statement, search, dialect)
+        statement = statement.add_columns(rank.label("rank"))
+
+    return statement, rank
+
+
+def _filter_predicate(clause: FilterClause, dialect: str):
+
+    if clause.op not in FILTER_OPERATORS.get(clause.field, ()):
+        raise ValueError(f"Unsupported filter: {clause.field} {clause.op}")
+
+    column_ = Item.__table__.c[clause.field]
+
+    if clause.op in ("eq", "ne") and isinstance(clause.value, (list, tuple)):
+        return column_.in_(clause.value) if clause.op == "eq" else column_.not_in(clause.value)
+    if clause.op == "eq":
+        return column_ == clause.value
+    if clause.op == "ne":
+        return column_ != clause.value
+    if clause.op == "prefix":
+        return _prefix_predicate(column_, clause.value, dialect)
+    return _COMPARISONS[clause.op](column_, clause.value)
+
+
+def _prefix_predicate(column_, prefix: str, dialect: str):
+
+    # Case-sensitive prefix match. Postgres turns a LIKE 'prefix%' into an
+    # index range over the text_pattern_ops index from migration 0010; SQLite
+    # only does that for case-insensitive LIKE, so it gets the range directly
+    # (exact under its default BINARY collation).
+    if dialect == "postgresql":
+        escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        return column_.like(f"{escaped}%", escape="\\")
+
+    upper = _prefix_upper_bound(prefix)
+    if upper is None:
+        return column_ >= prefix
+    return and_(column_ >= prefix, column_ < upper)
+
+
+def _prefix_upper_bound(prefix: str) -> Optional[str]:
+
+    # Smallest string greater than every string starting with prefix.
+    while prefix and ord(prefix[-1]) == 0x10FFFF:
+        prefix = prefix[:-1]
+    if not prefix:
+        return None
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def _apply_search(statement, terms: Sequence[str], dialect: str):
+
+    # Terms are plain words (validated by the service), matched as prefixes
+    # and all required. Returns the filtered statement and a relevance
+    # expression where higher is better.
+    if dialect == "postgresql":
+        vector = literal_column("items.search_vector")
+        query = func.to_tsquery(literal_column(f"'{SEARCH_CONFIG}'::regconfig"),
+                                " & ".join(f"{term}:*" for term in terms))
+        return statement.where(vector.op("@@")(query)), func.ts_rank_cd(vector, query)
+
+    # SQLite: the FTS5 shadow table created by migration 0008, joined on rowid.
+    # bm25() is lower for better matches; title hits weigh more than description.
+    items_fts = table("items_fts", column("rowid"), column("items_fts"))
+    statement = (statement
+                 .join_from(Item.__table__, items_fts,
+                            items_fts.c.rowid == literal_column("items.rowid"))
+                 .where(items_fts.c.items_fts.match(" ".join(f'"{term}"*' for term in terms))))
+    return statement, -func.bm25(literal_column("items_fts"), literal_column("10.0"),
+                                 literal_column("5.0"))
+
+
+def _apply_keyset(item, sort_by: str, sort_order: str, after: Optional[Tuple[Any, str]], rank=None):
+
+    if sort_by == "rank" and rank is not None:
+        # Relevance is always best first; ties fall back to id.
+        if after is not None:
+            item = item.where(tuple_(rank, Item.id) < tuple_(*after))
+        return item.order_by(rank.desc(), Item.id.desc())
+
+    if sort_by not in ALLOWED_SORT_COLUMNS:
+        sort_by = "id"
+
+    descending = sort_order.lower() == "desc"
     sort_column = getattr(Item, sort_by)
-    
-    if sort_order.lower() == "desc":
-        return item.order_by(sort_column.desc())
-    return item.order_by(sort_column.asc())
+
+    if sort_by == "id":
+        if after is not None:
+            item = item.where(Item.id < after[1] if descending else Item.id > after[1])
+        return item.order_by(Item.id.desc() if descending else Item.id.asc())
+
+    if after is not None:
+        key = tuple_(sort_column, Item.id)
+        item = item.where(key < tuple_(*after) if descending else key > tuple_(*after))
+
+    if descending:
+        return item.order_by(sort_column.desc(), Item.id.desc())
+    return item.order_by(sort_column.asc(), Item.id.asc())
+
+
+def _keyset_key(row, sort_by: str) -> Tuple[Any, str]:
+
+    if sort_by not in ALLOWED_SORT_COLUMNS and not (sort_by == "rank" and "rank" in row):
+        sort_by = "id"
+
+    return row[sort_by], row["id"]
+
+
+def _project_row(row, fields: Sequence[str]) -> Dict[str, Any]:
+
+    projected = {}
+    for name in fields:
+        value = row[name]
+        projected[name] = value.isoformat() if isinstance(value, datetime) else value
+    return projected
@@ -1,16 +1,33 @@
-from database.models import db, User
-from typing import Optional, Dict, List, Any
+from database import routing, sharding
+from database.models import db, User, Item, ItemStatusCount, ItemTombstone, UserChangeVersion
+from typing import Optional, Dict, List, Any, Callable
 import logging
 
 logger = logging.getLogger(__name__)
 
 ALLOWED_SORT_COLUMNS = ["id", "email", "created_at"]
 
+# Callbacks run with the user id after a user row changes or disappears,
+# so caches holding that user can drop it right away.
+_invalidation_hooks: List[Callable[[str], None]] = []
+
+
+def register_invalidation_hook(hook: Callable[[str], None]) -> None:
+
+    if hook not in _invalidation_hooks:
+        _invalidation_hooks.append(hook)
+
 
 def get_user_by_id(user_id: str) -> Optional[Dict[str, Any]]:
 
+    # Served by a replica when configured: this is the lookup behind every
+    # authenticated request. Login and registration checks stay on the primary.
     try:
-        user = User.query.get(user_id)
+        session = routing.read_session(user_id)
+        user = session.get(User, user_id)
+        if user is None and routing.on_replica(session):
+            # A user who just registered may not have reached the replica yet.
+            user = db.session.get(User, user_id)
         return user.to_dict() if user else None
     except Exception as e:
         logger.error(f"Error retrieving user by id {user_id}: {e}")
@@ -66,6 +83,7 @@ def create_user(user_id: str, email: str, password_hash: str, created_at) -> Opt
         )
         db.session.add(user)
         db.session.commit()
+        routing.mark_written(user_id)
         logger.info(f"Created new user with id {user_id}")
         return user.to_dict()
     except Exception as e:
@@ -87,6 +105,8 @@ def update_user(user_id: str, updates: Dict[str, Any]) -> Optional[Dict[str, Any
                 setattr(user, field, value)
         
         db.session.commit()
+        routing.mark_written(user_id)
+        _run_invalidation_hooks(user_id)
         logger.info(f"Updated user {user_id} with fields: {list(updates.keys())}")
         return user.to_dict()
 
@@ -104,8 +124,21 @@ def delete_user(user_id: str) -> bool:
             logger.warning(f"Delete failed: User with ID: {user_id} not found.")
             return False
         
+        if sharding.enabled():
+            # Item data lives on the user's shard, out of reach of the
+            # primary's ON DELETE CASCADE, so it is removed first.
+            with sharding.user_scope(user_id, write=True):
+                for model in (Item, ItemTombstone, ItemStatusCount, UserChangeVersion):
+                    db.session.execute(db.delete(model).where(model.user_id == user_id))
+                db.session.commit()
+
         db.session.delete(user)
         db.session.commit()
+        # Only once the user row (and its user_shards entry) is gone, so a
+        # concurrent lookup cannot cache the old placement again.
+        sharding.forget(user_id)
+        routing.mark_written(user_id)
+        _run_invalidation_hooks(user_id)
         logger.info(f"Deleted user {user_id}")
         return True
         
@@ -121,3 +154,12 @@ def email_exists(email: str) -> bool:
     except Exception as e:
         logger.error(f"Error cheching email existence for {email}: {e}")
         return False
+
+
+def _run_invalidation_hooks(user_id: str) -> None:
+
+    for hook in _invalidation_hooks:
+        try:
+            hook(user_id)
+        except Exception as e:
+            logger.error(f"Invalidation hook failed for user {user_id}: {e}")
@@ -0,0 +1,309 @@
+from typing import Optional, Tuple, Dict, Any, AsyncIterator, Iterable, List
+import logging
+
+from starlette.concurrency import run_in_threadpool
+
+from repositories import async_todo_repository as repo
+from services.todo_service import (IMPORT_BATCH_SIZE, MAX_IMPORT_BATCH_SIZE, STREAM_CHUNK_SIZE, VALID_STATUSES,
+                                   SYNC_EXPIRED_ERROR, VERSION_CONFLICT_ERROR, _batch_lookup_ids, _change_versions,
+                                   _changes_result, _finish_batch, _new_import_report, _next_import_batch,
+                                   _notify_change, _page, _parse_bounded_int, _parse_cursor, _parse_fields,
+                                   _parse_limit, _parse_listing, _parse_since, _plan_batch, _prepare_new_item,
+                                   _prepare_update, _remember_change, _report_import_error, _sort_batch)
+
+# The async app's todo_service. Parsing, validation and batch planning are
+# todo_service's own helpers; only the repository calls are awaited.
+
+logger = logging.getLogger(__name__)
+
+
+async def get_todos(status: Optional[str] = None,
+                    user_id: Optional[str] = None,
+                    sort_by: Optional[str] = None,
+                    sort_order: str = "asc",
+                    limit: Optional[Any] = None,
+                    cursor: Optional[str] = None,
+                    fields: Optional[str] = None,
+                    q: Optional[str] = None,
+                    filters: Optional[str] = None) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    try:
+        listing, error = _parse_listing(status, user_id, sort_by, sort_order, q, filters)
+        if error:
+            return None, error
+
+        page_size, error = _parse_limit(limit)
+        if error:
+            return None, error
+
+        projection, error = _parse_fields(fields)
+        if error:
+            return None, error
+
+        after, error = _parse_cursor(cursor, listing)
+        if error:
+            return None, error
+
+        items, next_key = await repo.get_items_page(user_id, listing.filters, listing.sort_by,
+                                                    listing.sort_order, page_size, after, projection,
+                                                    listing.search)
+
+        return _page(listing, items, next_key), None
+
+    except Exception as e:
+        logger.error(f"Error in get_todos: {str(e)}")
+        return None, f"Error to retrieve items: {str(e)}"
+
+
+def stream_todos(status: Optional[str] = None,
+                 user_id: Optional[str] = None,
+                 sort_by: Optional[str] = None,
+                 sort_order: str = "asc",
+                 fields: Optional[str] = None,
+                 q: Optional[str] = None,
+                 filters: Optional[str] = None) -> Tuple[Optional[AsyncIterator[Dict[str, Any]]], Optional[str]]:
+
+    # Not a coroutine: validation runs now, the returned async iterator only
+    # queries once the response starts reading it.
+    try:
+        listing, error = _parse_listing(status, user_id, sort_by, sort_order, q, filters)
+        if error:
+            return None, error
+
+        projection, error = _parse_fields(fields)
+        if error:
+            return None, error
+
+        return repo.iter_items(user_id, listing.filters, listing.sort_by, listing.sort_order, projection,
+                               STREAM_CHUNK_SIZE, listing.search), None
+
+    except Exception as e:
+        logger.error(f"Error in stream_todos: {str(e)}")
+        return None, f"Error to retrieve items: {str(e)}"
+
+
+async def get_stats(user_id: Optional[str] = None) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+
+    try:
+        if not user_id:
+            return None, "User ID is required."
+
+        counts = await repo.get_status_counts(user_id)
+        by_status = {status: max(counts.get(status, 0), 0) for status in sorted(VALID_STATUSES)}
+
+        return {"counts": by_status, "total": sum(by_status.values())}, None
+
+    except Exception as e:
+        logger.error(f"Error in get_stats: {str(e)}")
+        return None, f"Error to retrieve stats: {str(e)}"
+
+
+async def get_change_version(user_id: Optional[str] = None) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+
+    try:
+        if not user_id:
+            return None, "User ID is required."
+
+        change = _change_versions.get(user_id)
+        if change is None:
+            current = await repo.get_change_version(user_id)
+            if current is None:
+                return None, "Failed to read change version."
+
+            change = _remember_change(user_id, current)
+
+        return change, None
+
+    except Exception as e:
+        logger.error(f"Error in get_change_version: {str(e)}")
+        return None, f"Error to retrieve change version: {str(e)}"
+
+
+async def get_changes(user_id: Optional[str] = None,
+                      since: Optional[str] = None) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+
+    try:
+        if not user_id:
+            return None, "User ID is required."
+
+        since_version, error = _parse_since(since)
+        if error:
+            return None, error
+
+        return _changes_result(await repo.get_changes_since(user_id, since_version), since_version)
+
+    except Exception as e:
+        logger.error(f"Error in get_changes: {str(e)}")
+        return None, f"Error to retrieve changes: {str(e)}"
+
+
+async def get_todo(item_id: str,
+                   user_id: Optional[str] = None) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+
+    try:
+        if not item_id or not item_id.strip():
+            return None, "Item ID is required."
+
+        item_id = item_id.strip()
+        item = await repo.get_item_by_id(item_id, user_id)
+
+        return (item, None) if item else (None, "Item not found")
+
+    except Exception as e:
+        logger.error(f"Error in get_todo {str(e)}")
+        return None, f"Error to get the item: {str(e)}"
+
+
+async def create_todo(title: str,
+                      description: Optional[str],
+                      status: Optional[str],
+                      user_id: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+
+    try:
+        row, error = _prepare_new_item(title, description, status, user_id)
+        if error:
+            return None, error
+
+        created_item = await repo.create_item(
+            item_id=row["id"],
+            title=row["title"],
+            description=row["description"],
+            status=row["status"],
+            timestamp=row["timestamp"],
+            user_id=user_id
+        )
+
+        if created_item:
+            _notify_change(user_id, "item.created", [row["id"]])
+        logger.info(f"Created todo item {row['id']} for user {user_id}")
+        return created_item, None
+
+    except Exception as e:
+        logger.error(f"Error in create_todo: {str(e)}")
+        return None, f"Failed to create item: {str(e)}"
+
+
+async def delete_todo(item_id: str,
+                      user_id: Optional[str] = None,
+                      expected_version: Optional[int] = None) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+
+    try:
+        if not item_id or not item_id.strip():
+            return None, "Item ID is required."
+
+        item = await repo.delete_item(item_id, user_id, expected_version)
+        if item:
+            _notify_change(user_id, "item.deleted", [item_id])
+        return ((item, None) if item
+                else (None, await _missing_item_error(item_id, user_id, expected_version)))
+
+    except Exception as e:
+        logger.error(f"Error in delete_todo: {str(e)}")
+        return None, f"Failed to delete item: {str(e)}"
+
+
+async def update_todo(item_id: str,
+                      title: Optional[str] = None,
+                      description: Optional[str] = None,
+                      status: Optional[str] = None,
+                      user_id: Optional[str] = None,
+                      expected_version: Optional[int] = None) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+
+    try:
+        if not item_id or not item_id.strip():
+            return None, "Item ID is required."
+
+        changes, error = _prepare_update(title, description, status)
+        if error:
+            return None, error
+
+        updated_item = await repo.update_item(item_id, changes.get("title"), changes.get("description"),
+                                              changes.get("status"), user_id, expected_version)
+        if updated_item:
+            _notify_change(user_id, "item.updated", [item_id])
+        return ((updated_item, None) if updated_item
+                else (None, await _missing_item_error(item_id, user_id, expected_version)))
+
+    except Exception as e:
+        logger.error(f"Error in update_todo: {str(e)}")
+        return None, f"Failed to update item: {str(e)}"
+
+
+async def apply_batch(operations: Any,
+                      user_id: str) -> Tuple[Optional[List[Dict[str, Any]]], Optional[str]]:
+
+    try:
+        results, planned, error = _plan_batch(operations, user_id)
+        if error:
+            return None, error
+
+        existing = await repo.get_items_by_ids(_batch_lookup_ids(planned), user_id)
+        batch = _sort_batch(planned, existing, results)
+
+        if batch.pending:
+            written = await repo.apply_batch(user_id, batch.creates, batch.updates, batch.deletes)
+            if written is not None:
+                _notify_change(user_id, "items.changed")
+            _finish_batch(batch, existing, written, results)
+
+        return results, None
+
+    except Exception as e:
+        logger.error(f"Error in apply_batch: {str(e)}")
+        return None, f"Failed to apply batch: {str(e)}"
+
+
+async def import_todos(records: Iterable[Tuple[int, Optional[Dict[str, Any]], Optional[str]]],
+                       user_id: str,
+                       batch_size: Optional[Any] = None) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+
+    # `records` is a blocking parser over the spooled upload, so each batch is
+    # read and validated on a worker thread; the insert is awaited here.
+    try:
+        if not user_id:
+            return None, "User ID is required."
+
+        batch_size, error = _parse_bounded_int(batch_size, "Batch size",
+                                               IMPORT_BATCH_SIZE, MAX_IMPORT_BATCH_SIZE)
+        if error:
+            return None, error
+
+        report = _new_import_report()
+        records = iter(records)
+
+        while True:
+            batch, exhausted = await run_in_threadpool(_next_import_batch, records, report, user_id, batch_size)
+            if batch:
+                await _flush_import_batch(batch, report)
+            if exhausted:
+                break
+
+        if report["imported"]:
+            _notify_change(user_id, "items.changed")
+
+        logger.info(f"Imported {report['imported']} items for user {user_id}, "
+                    f"{report['failed']} rows failed")
+        return report, None
+
+    except Exception as e:
+        logger.error(f"Error in import_todos: {str(e)}")
+        return None, f"Failed to import items: {str(e)}"
+
+
+async def _flush_import_batch(batch: List[Tuple[int, Dict[str, Any]]],
+                              report: Dict[str, Any]) -> None:
+
+    if await repo.insert_items([row for _, row in batch]):
+        report["imported"] += len(batch)
+        return
+
+    for number, _ in batch:
+        _report_import_error(report, number, "Batch insert failed.")
+
+
+async def _missing_item_error(item_id: str,
+                              user_id: Optional[str],
+                              expected_version: Optional[int]) -> str:
+
+    if expected_version is not None and await repo.get_item_by_id(item_id, user_id):
+        return VERSION_CONFLICT_ERROR
+    return "Item not found."
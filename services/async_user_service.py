@@ -0,0 +1,138 @@
+from datetime import datetime, timezone, timedelta
+from typing import Optional, Tuple, Dict, Any
+import re
+import logging
+import uuid
+
+from repositories import async_user_repository as repo
+from services import password_hasher
+from services.user_service import (BUSY_ERROR, EMAIL_PATTERN, JWT_ALGORITHM, JWT_EXPIRATION_HOURS,
+                                   JWT_SECRET, MIN_PASSWORD_LENGTH, _is_valid_password)
+
+# The async app's user_service: same rules and messages, with bcrypt awaited
+# on the hasher's pool instead of blocking the event loop.
+
+logger = logging.getLogger(__name__)
+
+
+async def register_user(email: str,
+                        password: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+
+    try:
+        normalized_email, error = await _check_email_validation(email)
+        if error:
+            return None, error
+
+        if not password:
+            return None, "Password is required."
+
+        if not _is_valid_password(password):
+            return None, f"Password must be at least {MIN_PASSWORD_LENGTH} characters long."
+
+        email = normalized_email
+        user_id = str(uuid.uuid4())
+        password = await password_hasher.hash_password_async(password)
+        created_at = datetime.now(timezone.utc)
+
+        created_user = await repo.create_user(
+            user_id=user_id,
+            email=email,
+            password_hash=password,
+            created_at=created_at
+        )
+        logger.info(f"New user registered: {email}")
+        return created_user, None
+
+    except password_hasher.HasherBusyError:
+        return None, BUSY_ERROR
+    except Exception as e:
+        logger.error(f"Error in register_user for email '{email}': {str(e)}")
+        return None, f"Failed to register user: {str(e)}"
+
+
+async def authenticate_user(email: str,
+                            password: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    try:
+        if not email or not password:
+            return None, "Email and password are required."
+
+        email = email.strip().lower()
+        user = await repo.get_user_with_password(email)
+
+        if not user:
+            logger.warning(f"Authentication failed. no user: {email}")
+            return None, "Invalid email or password."
+
+        if not await password_hasher.verify_password_async(password, user["password_hash"]):
+            return None, "Invalid email or password."
+
+        await _rehash_if_needed(user["id"], password, user["password_hash"])
+
+        token_payload = {
+            "user_id": user["id"],
+            "exp": datetime.now(timezone.utc) + timedelta(hours=JWT_EXPIRATION_HOURS)
+        }
+
+        import jwt
+
+        token = jwt.encode(token_payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
+        logger.info(f"User authenticated successfully: {email}")
+
+        return {
+            "user info": {
+                "id": user["id"],
+                "email": user["email"]
+            },
+            "token": token
+        }, None
+
+    except password_hasher.HasherBusyError:
+        return None, BUSY_ERROR
+    except Exception as e:
+        logger.error(f"Error in authenticate_user for email: '{email}': {str(e)}")
+        return None, f"Failed to authenticate user: {str(e)}"
+
+
+async def get_user(user_id: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+
+    try:
+        if not user_id:
+            return None, "User ID is required."
+
+        user = await repo.get_user_by_id(user_id)
+
+        return (user, None) if user else (None, "User not found")
+
+    except Exception as e:
+        logger.error(f"Error in get_user for user_id '{user_id}': {str(e)}")
+        return None, f"Failed to get user: {str(e)}"
+
+
+async def _check_email_validation(email: str) -> Tuple[Optional[str], Optional[str]]:
+
+    if not email or not email.strip():
+        return None, "Email is required."
+
+    normalized_email = email.strip().lower()
+
+    if not bool(re.match(EMAIL_PATTERN, normalized_email)):
+        return None, "Invalid email format."
+
+    if await repo.email_exists(normalized_email):
+        return None, "Email already registered."
+
+    return normalized_email, None
+
+
+async def _rehash_if_needed(user_id: str, password: str, password_hash: str) -> None:
+
+    if not password_hasher.needs_rehash(password_hash):
+        return
+
+    try:
+        await repo.update_user(user_id, {"password_hash": await password_hasher.hash_password_async(password)})
+        logger.info(f"Rehashed password for user {user_id} with the configured cost.")
+    except password_hasher.HasherBusyError:
+        logger.warning(f"Skipped password rehash for user {user_id}: hasher busy.")
+    except Exception as e:
+        logger.error(f"Error rehashing password for user {user_id}: {str(e)}")
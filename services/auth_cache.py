@@ -0,0 +1,83 @@
+from typing import Any, Dict, Optional
+import hashlib
+import logging
+import os
+import time
+
+from repositories import user_repository
+from services import events, metrics
+from services.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+AUTH_CACHE_TTL_SECONDS = float(os.getenv("AUTH_CACHE_TTL_SECONDS", "60"))
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", "10000"))
+USER_CHANGED_EVENT = "auth.user_changed"
+
+
+_token_cache = TTLCache(AUTH_CACHE_MAX_ENTRIES, AUTH_CACHE_TTL_SECONDS)
+_user_cache = TTLCache(AUTH_CACHE_MAX_ENTRIES, AUTH_CACHE_TTL_SECONDS)
+
+metrics.register_cache("auth_token", _token_cache)
+metrics.register_cache("auth_user", _user_cache)
+
+
+def get_token_payload(token: str) -> Optional[Dict[str, Any]]:
+
+    return _token_cache.get(_token_digest(token))
+
+
+def put_token_payload(token: str, payload: Dict[str, Any]) -> None:
+
+    # Never serve a decoded token past its own "exp" claim.
+    ttl = None
+    if "exp" in payload:
+        ttl = float(payload["exp"]) - time.time()
+
+    _token_cache.put(_token_digest(token), payload, ttl)
+
+
+def get_user(user_id: str) -> Optional[Dict[str, Any]]:
+
+    return _user_cache.get(user_id)
+
+
+def put_user(user_id: str, user: Dict[str, Any]) -> None:
+
+    _user_cache.put(user_id, user)
+
+
+def invalidate_user(user_id: str) -> None:
+
+    # Other workers hold their own caches; the events backend tells them to
+    # drop the user too. With EVENTS_BACKEND=local, or when a message is
+    # lost, their entries still expire after AUTH_CACHE_TTL_SECONDS.
+    _drop_user(user_id)
+    events.publish(user_id, {"type": USER_CHANGED_EVENT}, local=False)
+
+
+def _drop_user(user_id: str) -> None:
+
+    _user_cache.invalidate(user_id)
+    _token_cache.invalidate_where(lambda payload: payload.get("user_id") == user_id)
+    logger.info(f"Invalidated cached auth entries for user {user_id}")
+
+
+def clear() -> None:
+
+    _token_cache.clear()
+    _user_cache.clear()
+
+
+def stats() -> Dict[str, Dict[str, int]]:
+
+    return {"token": _token_cache.stats(), "user": _user_cache.stats()}
+
+
+def _token_digest(token: str) -> str:
+
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+user_repository.register_invalidation_hook(invalidate_user)
+events.register_handler(USER_CHANGED_EVENT, _drop_user)
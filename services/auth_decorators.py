@@ -1,21 +1,27 @@
 from functools import wraps
-from flask import request, jsonify
-import jwt
+from flask import g, request, jsonify
 import logging
 import os
 
-from services import user_service
+from services import auth_cache, user_service
 
 logger = logging.getLogger(__name__)
 
 JWT_SECRET = os.getenv("JWT_SECRET_KEY")
 JWT_ALGORITHM = "HS256"
-JWT_EXPIRATION_HOURS = 24
+JWT_EXPIRATION_HOURS = user_service.JWT_EXPIRATION_HOURS
+# Comma-separated emails of users allowed on the /admin endpoints.
+ADMIN_EMAILS = frozenset(email.strip().lower() for email in (os.getenv("ADMIN_EMAILS") or "").split(",")
+                         if email.strip())
 
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
 
+        # Imported on the first authenticated request, not at startup; after
+        # that it is a sys.modules lookup.
+        import jwt
+
         auth_header = request.headers.get("Authorization")
         if not auth_header:
             logger.error("Error with authorization header!")
@@ -29,14 +35,22 @@ def token_required(f):
         token = parts[1]
         
         try:
-            data = jwt.decode(token, JWT_SECRET, algorithms=JWT_ALGORITHM)
+            data = auth_cache.get_token_payload(token)
+            if data is None:
+                data = jwt.decode(token, JWT_SECRET, algorithms=JWT_ALGORITHM)
+                auth_cache.put_token_payload(token, data)
 
             current_user_id = data["user_id"]
-            user_result, error = user_service.get_user(current_user_id)
+            user_result = auth_cache.get_user(current_user_id)
+
+            if user_result is None:
+                user_result, error = user_service.get_user(current_user_id)
+
+                if error or not user_result:
+                    logger.error("Invalid token: user not found.")
+                    return jsonify({"message": "Invalid token: user not found!"}), 401
 
-            if error or not user_result:
-                logger.error("Invalid token: user not found.")
-                return jsonify({"message": "Invalid token: user not found!"}), 401
+                auth_cache.put_user(current_user_id, user_result)
                         
         except jwt.ExpiredSignatureError:
             logger.error(f"Token has expired: {jwt.ExpiredSignatureError}")
@@ -48,6 +62,22 @@ def token_required(f):
             logger.error(f"Token validation error: {str(e)}")
             return jsonify({"message": "Token validation failed!"}), 401
         
+        # Kept for code outside the view, e.g. request profiles record whose they are.
+        g.current_user_id = current_user_id
         return f(user_result, *args, **kwargs)
     
+    return decorated
+
+
+def admin_required(f):
+    # Goes below @token_required, which passes in the current user.
+    @wraps(f)
+    def decorated(current_user, *args, **kwargs):
+
+        if (current_user.get("email") or "").lower() not in ADMIN_EMAILS:
+            logger.error(f"User {current_user.get('id')} is not an admin.")
+            return jsonify({"message": "Admin access required!"}), 403
+
+        return f(current_user, *args, **kwargs)
+
     return decorated
\ No newline at end of file
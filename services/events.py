@@ -0,0 +1,425 @@
+from collections import deque
+import asyncio
+from typing import Any, Callable, Deque, Dict, Optional, Set
+import glob
+import json
+import logging
+import os
+import socket
+import threading
+import uuid
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+# "local" (this process only), "unix:///path/to/dir" (every process on the
+# host that uses the same directory) or "redis://host:port/db".
+EVENTS_BACKEND = os.getenv("EVENTS_BACKEND", "local")
+EVENTS_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", "100"))
+EVENTS_MAX_CONNECTIONS = int(os.getenv("EVENTS_MAX_CONNECTIONS", "10000"))
+# An idle stream sends a comment this often so proxies keep it open, and is
+# closed after EVENTS_STREAM_SECONDS so the client reconnects and
+# re-authenticates.
+EVENTS_HEARTBEAT_SECONDS = float(os.getenv("EVENTS_HEARTBEAT_SECONDS", "15"))
+EVENTS_STREAM_SECONDS = float(os.getenv("EVENTS_STREAM_SECONDS", "300"))
+EVENTS_RETRY_MS = int(os.getenv("EVENTS_RETRY_MS", "3000"))
+# Whether this server accepts event streams. "auto" allows them only where an
+# idle stream does not pin an OS thread: the ASGI app and gevent workers. On
+# a threaded worker each stream would hold one of its few request threads for
+# EVENTS_STREAM_SECONDS, so clients are told to poll instead. "on" / "off"
+# override the check.
+EVENTS_STREAMS = (os.getenv("EVENTS_STREAMS") or "auto").lower()
+
+RESYNC_EVENT = {"type": "resync"}
+STREAMS_UNAVAILABLE_ERROR = "Event streams are not served here; poll /user/items/changes instead."
+_MAX_DATAGRAM_BYTES = 64 * 1024
+# event type -> handler(user_id). Events of a handled type are instructions to
+# the worker processes rather than news for the user's streams: every process
+# runs the handler instead of delivering them to subscribers.
+_handlers: Dict[str, Callable[[str], None]] = {}
+
+
+def streams_supported(asynchronous: bool = False) -> bool:
+
+    # asynchronous: asked by the ASGI app, where a stream is a pending task.
+    if EVENTS_STREAMS in ("off", "false", "0", "no"):
+        return False
+    if EVENTS_STREAMS in ("on", "true", "1", "yes") or asynchronous:
+        return True
+
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched("threading")
+
+
+class TooManySubscribersError(Exception):
+    """Raised when the process already holds EVENTS_MAX_CONNECTIONS streams."""
+
+
+class Subscription:
+    """Bounded inbox for one event stream.
+
+    Waiting is done on a Condition, so under a gevent worker an idle stream
+    is a parked greenlet rather than a blocked OS thread. If the reader falls
+    behind, the backlog is replaced by a single resync event: clients catch
+    up through delta sync anyway.
+    """
+
+    def __init__(self, broker: "EventBroker", user_id: str, max_size: int):
+
+        self.user_id = user_id
+        self._broker = broker
+        self._max_size = max_size
+        self._events: Deque[Dict[str, Any]] = deque()
+        self._condition = threading.Condition()
+        # (loop, asyncio.Event) of a reader waiting in get_async().
+        self._waiter = None
+        self.closed = False
+
+    def put(self, event: Dict[str, Any]) -> None:
+
+        with self._condition:
+            if len(self._events) >= self._max_size:
+                self._events.clear()
+                event = RESYNC_EVENT
+            self._events.append(event)
+            self._condition.notify()
+            self._wake_async_reader()
+
+    def get(self, timeout: float) -> Optional[Dict[str, Any]]:
+
+        with self._condition:
+            if not self._events and not self.closed:
+                self._condition.wait(timeout)
+            return self._events.popleft() if self._events else None
+
+    async def get_async(self, timeout: float) -> Optional[Dict[str, Any]]:
+
+        # get() for the ASGI app: the wait is a pending asyncio.Event rather
+        # than a blocked thread. put() and close() may run on other threads
+        # (the backend listener), so they wake the loop thread-safely.
+        ready = asyncio.Event()
+        with self._condition:
+            if self._events or self.closed:
+                return self._events.popleft() if self._events else None
+            self._waiter = (asyncio.get_running_loop(), ready)
+
+        try:
+            await asyncio.wait_for(ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+        with self._condition:
+            self._waiter = None
+            return self._events.popleft() if self._events else None
+
+    def close(self) -> None:
+
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+            self._wake_async_reader()
+        self._broker.unsubscribe(self)
+
+    def _wake_async_reader(self) -> None:
+
+        # Caller holds self._condition.
+        if self._waiter is not None:
+            loop, ready = self._waiter
+            try:
+                loop.call_soon_threadsafe(ready.set)
+            except RuntimeError:
+                # The loop has already been closed; nobody is waiting any more.
+                pass
+
+
+class EventBroker:
+    """Fans item change events out to this process's subscribers.
+
+    Published events are delivered locally and handed to the backend, which
+    carries them to the other worker processes; events arriving from the
+    backend are only delivered locally.
+    """
+
+    def __init__(self, backend: "EventBackend", max_connections: int, queue_size: int):
+
+        self.max_connections = max_connections
+        self.queue_size = queue_size
+        self._backend = backend
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        self._count = 0
+        self._lock = threading.Lock()
+        self._backend.start(self.deliver)
+
+    def subscribe(self, user_id: str) -> Subscription:
+
+        subscription = Subscription(self, user_id, self.queue_size)
+
+        with self._lock:
+            if self._count >= self.max_connections:
+                raise TooManySubscribersError("Too many open event streams.")
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+            self._count += 1
+
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if not subscribers or subscription not in subscribers:
+                return
+
+            subscribers.discard(subscription)
+            self._count -= 1
+            if not subscribers:
+                del self._subscribers[subscription.user_id]
+
+    def publish(self, user_id: str, event: Dict[str, Any], local: bool = True) -> None:
+
+        # local=False only forwards the event, for a publisher that has
+        # already acted on it in this process.
+        if local:
+            self.deliver(user_id, event)
+        try:
+            self._backend.publish(user_id, event)
+        except Exception as e:
+            logger.error(f"Error forwarding event for user {user_id}: {e}")
+
+    def deliver(self, user_id: str, event: Dict[str, Any]) -> None:
+
+        handler = _handlers.get(event.get("type"))
+        if handler is not None:
+            try:
+                handler(user_id)
+            except Exception as e:
+                logger.error(f"Handler for {event['type']} failed for user {user_id}: {e}")
+            return
+
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+
+        for subscription in subscribers:
+            subscription.put(event)
+
+    def stats(self) -> Dict[str, int]:
+
+        with self._lock:
+            return {"subscribers": self._count, "users": len(self._subscribers)}
+
+    def close_all(self) -> None:
+
+        # Ends every open stream, e.g. when the worker is draining; clients
+        # reconnect to another worker after their retry delay.
+        with self._lock:
+            subscriptions = [subscription for subscribers in self._subscribers.values()
+                             for subscription in subscribers]
+
+        for subscription in subscriptions:
+            subscription.close()
+
+    def shutdown(self) -> None:
+
+        self._backend.stop()
+
+
+class EventBackend:
+    """Carries events between processes. The base class keeps them local."""
+
+    def start(self, deliver: Callable[[str, Dict[str, Any]], None]) -> None:
+        pass
+
+    def publish(self, user_id: str, event: Dict[str, Any]) -> None:
+        pass
+
+    def stop(self) -> None:
+        pass
+
+
+class UnixSocketBackend(EventBackend):
+    """Datagram fan-out between processes sharing a directory on one host.
+
+    Each process binds its own socket in the directory and publishes by
+    sending one datagram to every other socket there. Sockets left behind by
+    dead processes are removed when a send is refused. Delivery is best
+    effort: a full peer buffer drops the datagram instead of blocking the
+    request that published it.
+    """
+
+    def __init__(self, directory: str):
+
+        self.directory = directory
+        self._path = None
+        self._socket = None
+        self._deliver = None
+        self._thread = None
+
+    def start(self, deliver: Callable[[str, Dict[str, Any]], None]) -> None:
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._deliver = deliver
+        self._path = os.path.join(self.directory, f"{os.getpid()}-{uuid.uuid4().hex[:8]}.sock")
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.bind(self._path)
+        self._thread = threading.Thread(target=self._listen, name="events-listener", daemon=True)
+        self._thread.start()
+
+    def publish(self, user_id: str, event: Dict[str, Any]) -> None:
+
+        message = json.dumps({"user_id": user_id, "event": event}).encode("utf-8")
+        if len(message) > _MAX_DATAGRAM_BYTES:
+            message = json.dumps({"user_id": user_id, "event": RESYNC_EVENT}).encode("utf-8")
+
+        sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sender.setblocking(False)
+        try:
+            for peer in glob.glob(os.path.join(self.directory, "*.sock")):
+                if peer == self._path:
+                    continue
+                try:
+                    sender.sendto(message, peer)
+                except (ConnectionRefusedError, FileNotFoundError):
+                    _remove_stale_socket(peer)
+                except BlockingIOError:
+                    logger.warning(f"Event dropped, peer {peer} is not keeping up.")
+        finally:
+            sender.close()
+
+    def stop(self) -> None:
+
+        listener, self._socket = self._socket, None
+        if listener is not None:
+            try:
+                # Wakes the listener thread out of recv() before closing.
+                listener.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            listener.close()
+        if self._path:
+            _remove_stale_socket(self._path)
+
+    def _listen(self) -> None:
+
+        listener = self._socket
+        while self._socket is listener:
+            try:
+                message = json.loads(listener.recv(_MAX_DATAGRAM_BYTES))
+                self._deliver(message["user_id"], message["event"])
+            except OSError:
+                return
+            except (ValueError, KeyError, TypeError) as e:
+                logger.warning(f"Ignoring malformed event datagram: {e}")
+
+
+class RedisBackend(EventBackend):
+    """Redis pub/sub fan-out for workers spread over several hosts."""
+
+    CHANNEL = "todo:item-events"
+
+    def __init__(self, url: str):
+
+        if redis is None:
+            raise RuntimeError("The redis package is required for a redis:// EVENTS_BACKEND.")
+
+        self._client = redis.Redis.from_url(url)
+        self._origin = uuid.uuid4().hex
+        self._pubsub = None
+        self._thread = None
+
+    def start(self, deliver: Callable[[str, Dict[str, Any]], None]) -> None:
+
+        origin = self._origin
+
+        def handle(message):
+            try:
+                payload = json.loads(message["data"])
+                if payload["origin"] != origin:
+                    deliver(payload["user_id"], payload["event"])
+            except (ValueError, KeyError, TypeError) as e:
+                logger.warning(f"Ignoring malformed event message: {e}")
+
+        self._pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.subscribe(**{self.CHANNEL: handle})
+        self._thread = self._pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+
+    def publish(self, user_id: str, event: Dict[str, Any]) -> None:
+
+        self._client.publish(self.CHANNEL, json.dumps(
+            {"origin": self._origin, "user_id": user_id, "event": event}))
+
+    def stop(self) -> None:
+
+        if self._thread is not None:
+            self._thread.stop()
+        if self._pubsub is not None:
+            self._pubsub.close()
+
+
+def create_backend(spec: str) -> EventBackend:
+
+    if spec.startswith("unix://"):
+        return UnixSocketBackend(spec[len("unix://"):])
+    if spec.startswith(("redis://", "rediss://")):
+        return RedisBackend(spec)
+    if spec != "local":
+        raise ValueError(f"Unknown EVENTS_BACKEND: {spec}")
+    return EventBackend()
+
+
+_broker: Optional[EventBroker] = None
+_broker_pid: Optional[int] = None
+_broker_lock = threading.Lock()
+
+
+def get_broker() -> EventBroker:
+
+    # Created on first use and again after a fork, so each worker process
+    # gets its own subscribers, socket and listener thread.
+    global _broker, _broker_pid
+
+    with _broker_lock:
+        if _broker is None or _broker_pid != os.getpid():
+            _broker = EventBroker(create_backend(EVENTS_BACKEND),
+                                  EVENTS_MAX_CONNECTIONS, EVENTS_QUEUE_SIZE)
+            _broker_pid = os.getpid()
+        return _broker
+
+
+def shutdown() -> None:
+
+    # Ends this process's open streams and stops its backend listener.
+    if _broker is not None and _broker_pid == os.getpid():
+        _broker.close_all()
+        _broker.shutdown()
+
+
+def subscribe(user_id: str) -> Subscription:
+
+    return get_broker().subscribe(user_id)
+
+
+def publish(user_id: str, event: Dict[str, Any], local: bool = True) -> None:
+
+    try:
+        get_broker().publish(user_id, event, local)
+    except Exception as e:
+        logger.error(f"Error publishing event for user {user_id}: {e}")
+
+
+def register_handler(event_type: str, handler: Callable[[str], None]) -> None:
+
+    _handlers[event_type] = handler
+
+
+def _remove_stale_socket(path: str) -> None:
+
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
@@ -0,0 +1,359 @@
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+import glob
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+METRICS_ENABLED = (os.getenv("METRICS_ENABLED") or "true").lower() in ("1", "true", "yes", "on")
+# With several worker processes, point this at a directory shared by them
+# (e.g. a tmpfs): each worker writes its totals there and /metrics adds them
+# up. Unset, /metrics reports the process that answers the scrape.
+METRICS_DIR = os.getenv("METRICS_DIR") or None
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "5"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+UNMATCHED_ROUTE = "<unmatched>"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class RequestStats:
+    """What one request has done so far; only ever touched by its own thread or task."""
+
+    __slots__ = ("method", "started", "queries", "query_seconds", "finished")
+
+    def __init__(self, method: str):
+
+        self.method = method
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.finished = False
+
+
+class Registry:
+    """Per-process totals.
+
+    Requests accumulate their own numbers without locking (query events add
+    to the request's RequestStats) and fold them in here once, at the end,
+    under a lock held for a few dict updates. Histogram buckets are stored
+    per bucket and only made cumulative when rendered.
+    """
+
+    def __init__(self):
+
+        self._lock = threading.Lock()
+        self._requests: Dict[Tuple[str, str, str], int] = {}
+        self._latency: Dict[Tuple[str, str], List[float]] = {}
+        self._queries: Dict[str, List[float]] = {}
+        self._in_flight = 0
+
+    def started(self) -> None:
+
+        with self._lock:
+            self._in_flight += 1
+
+    def finished(self, route: str, stats: RequestStats, status: int) -> None:
+
+        elapsed = time.perf_counter() - stats.started
+        latency_bucket = bisect_left(LATENCY_BUCKETS, elapsed)
+        query_bucket = bisect_left(QUERY_COUNT_BUCKETS, stats.queries)
+        request_key = (route, stats.method, str(status))
+        latency_key = (route, stats.method)
+
+        with self._lock:
+            self._in_flight -= 1
+            self._requests[request_key] = self._requests.get(request_key, 0) + 1
+
+            # [count per bucket (last one is +Inf)..., sum]
+            latency = self._latency.get(latency_key)
+            if latency is None:
+                latency = self._latency[latency_key] = [0] * (len(LATENCY_BUCKETS) + 1) + [0.0]
+            latency[latency_bucket] += 1
+            latency[-1] += elapsed
+
+            # [count per bucket..., queries, query seconds]
+            queries = self._queries.get(route)
+            if queries is None:
+                queries = self._queries[route] = [0] * (len(QUERY_COUNT_BUCKETS) + 1) + [0, 0.0]
+            queries[query_bucket] += 1
+            queries[-2] += stats.queries
+            queries[-1] += stats.query_seconds
+
+    def snapshot(self) -> Dict[str, Any]:
+
+        with self._lock:
+            return {"pid": os.getpid(),
+                    "in_flight": self._in_flight,
+                    "requests": [[*key, count] for key, count in self._requests.items()],
+                    "latency": [[*key, list(values)] for key, values in self._latency.items()],
+                    "queries": [[route, list(values)] for route, values in self._queries.items()],
+                    "caches": [[name, cache.stats()] for name, cache in sorted(_caches.items())]}
+
+
+_registry = Registry()
+_current: ContextVar[Optional[RequestStats]] = ContextVar("request_metrics", default=None)
+_flusher_pid: Optional[int] = None
+_flusher_lock = threading.Lock()
+# In-process caches whose stats() are exported, by name; see register_cache().
+_caches: Dict[str, Any] = {}
+
+
+def start_request(method: str) -> None:
+
+    # Call when a request arrives, then finish_request() with its route and
+    # status from the same thread or task.
+    if not METRICS_ENABLED:
+        return
+
+    if METRICS_DIR and _flusher_pid != os.getpid():
+        _start_flusher()
+
+    _current.set(RequestStats(method))
+    _registry.started()
+
+
+def finish_request(route: Optional[str], status: int) -> None:
+
+    # Idempotent: a response sent from a child task (an ASGI stream) clears
+    # only that task's copy of the context, not the request's.
+    stats = _current.get()
+    if stats is None or stats.finished:
+        return
+
+    stats.finished = True
+    _current.set(None)
+    _registry.finished(route or UNMATCHED_ROUTE, stats, status)
+
+
+def register_cache(name: str, cache: Any) -> None:
+
+    # `cache` is anything with a stats() returning hits, misses, evictions and
+    # size (services.cache.TTLCache). Its numbers are read at each scrape or
+    # snapshot, so the cache itself keeps counting without calling in here.
+    _caches[name] = cache
+
+
+def record_query(seconds: float) -> None:
+
+    stats = _current.get()
+    if stats is not None and not stats.finished:
+        stats.queries += 1
+        stats.query_seconds += seconds
+
+
+def install_query_hooks() -> None:
+
+    # Engine-class listeners, so every engine counts: the primary, replicas,
+    # shards and the async app's (whose sync_engine fires the same events).
+    # Queries outside a request (CLI commands, workers' warmup) are ignored.
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    if not METRICS_ENABLED or event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        return
+
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def render() -> bytes:
+
+    # Prometheus text exposition format, totals of every worker when
+    # METRICS_DIR is set.
+    if METRICS_DIR:
+        write_snapshot()
+        snapshots = _read_snapshots()
+    else:
+        snapshots = [_registry.snapshot()]
+
+    return _render(_merge(snapshots)).encode("utf-8")
+
+
+def write_snapshot() -> None:
+
+    # Written to a temporary name and renamed, so readers never see half a file.
+    if not METRICS_DIR:
+        return
+
+    path = os.path.join(METRICS_DIR, f"worker-{os.getpid()}.json")
+    try:
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(_registry.snapshot(), f)
+        os.replace(f"{path}.tmp", path)
+    except OSError as e:
+        logger.error(f"Could not write metrics snapshot {path}: {e}")
+
+
+def clear_snapshots() -> None:
+
+    # Called once by the gunicorn master at startup: totals restart with it.
+    if METRICS_DIR:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        for path in glob.glob(os.path.join(METRICS_DIR, "worker-*.json*")):
+            os.remove(path)
+
+
+def reset() -> None:
+
+    global _registry
+    _registry = Registry()
+    _current.set(None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+
+    stats = _current.get()
+    if stats is not None and not stats.finished:
+        conn.info["metrics_query_started"] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+
+    started = conn.info.pop("metrics_query_started", None)
+    if started is not None:
+        record_query(time.perf_counter() - started)
+
+
+def _start_flusher() -> None:
+
+    # One flushing thread per process, started on the first request after a
+    # fork (threads do not survive one).
+    global _flusher_pid
+    with _flusher_lock:
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+
+    def flush():
+        while True:
+            time.sleep(METRICS_FLUSH_SECONDS)
+            write_snapshot()
+
+    threading.Thread(target=flush, name="metrics-flush", daemon=True).start()
+
+
+def _read_snapshots() -> List[Dict[str, Any]]:
+
+    snapshots = []
+    for path in glob.glob(os.path.join(METRICS_DIR, "worker-*.json")):
+        try:
+            with open(path) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Skipping unreadable metrics snapshot {path}: {e}")
+            continue
+
+        # Counters of exited workers still count; their in-flight requests don't.
+        if not _process_alive(snapshot["pid"]):
+            snapshot["in_flight"] = 0
+            for _, stats in snapshot.get("caches", []):
+                stats["size"] = 0
+        snapshots.append(snapshot)
+    return snapshots
+
+
+def _process_alive(pid: int) -> bool:
+
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+
+def _merge(snapshots: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+
+    merged = {"in_flight": 0, "requests": {}, "latency": {}, "queries": {}, "caches": {}}
+    for snapshot in snapshots:
+        merged["in_flight"] += snapshot["in_flight"]
+        for name, stats in snapshot.get("caches", []):
+            totals = merged["caches"].setdefault(name, {})
+            for key, value in stats.items():
+                totals[key] = totals.get(key, 0) + value
+        for *key, count in snapshot["requests"]:
+            key = tuple(key)
+            merged["requests"][key] = merged["requests"].get(key, 0) + count
+        for kind, key_length in (("latency", 2), ("queries", 1)):
+            for entry in snapshot[kind]:
+                key, values = tuple(entry[:key_length]), entry[key_length]
+                totals = merged[kind].setdefault(key, [0] * len(values))
+                merged[kind][key] = [total + value for total, value in zip(totals, values)]
+    return merged
+
+
+def _render(merged: Dict[str, Any]) -> str:
+
+    lines = []
+
+    def family(name, kind, help_text):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    family("http_requests_total", "counter", "Requests handled, by route template, method and status.")
+    for (route, method, status), count in sorted(merged["requests"].items()):
+        lines.append(f"http_requests_total{_labels(route=route, method=method, status=status)} {count}")
+
+    family("http_request_duration_seconds", "histogram", "Time to build each response, by route and method.")
+    for (route, method), values in sorted(merged["latency"].items()):
+        _histogram(lines, "http_request_duration_seconds", {"route": route, "method": method},
+                   LATENCY_BUCKETS, values[:-1], values[-1])
+
+    family("http_requests_in_flight", "gauge", "Requests being handled right now.")
+    lines.append(f"http_requests_in_flight {merged['in_flight']}")
+
+    family("db_queries_per_request", "histogram", "Database queries issued by each request, by route.")
+    for (route,), values in sorted(merged["queries"].items()):
+        _histogram(lines, "db_queries_per_request", {"route": route},
+                   QUERY_COUNT_BUCKETS, values[:-2], values[-2])
+
+    family("db_query_duration_seconds_total", "counter", "Time spent in database queries, by route.")
+    for (route,), values in sorted(merged["queries"].items()):
+        lines.append(f"db_query_duration_seconds_total{_labels(route=route)} {_number(values[-1])}")
+
+    for name, kind, stat, help_text in (
+            ("cache_hits_total", "counter", "hits", "Lookups answered from an in-process cache, by cache."),
+            ("cache_misses_total", "counter", "misses", "Lookups an in-process cache could not answer, by cache."),
+            ("cache_evictions_total", "counter", "evictions", "Entries dropped to stay under the size limit."),
+            ("cache_entries", "gauge", "size", "Entries held in an in-process cache right now.")):
+        family(name, kind, help_text)
+        for cache, stats in sorted(merged["caches"].items()):
+            lines.append(f"{name}{_labels(cache=cache)} {stats.get(stat, 0)}")
+
+    return "\n".join(lines) + "\n"
+
+
+def _histogram(lines: List[str], name: str, labels: Dict[str, str], bounds: Sequence[float],
+               counts: Sequence[int], total: float) -> None:
+
+    cumulative = 0
+    for bound, count in zip([*bounds, "+Inf"], counts):
+        cumulative += count
+        lines.append(f"{name}_bucket{_labels(**labels, le=_number(bound))} {cumulative}")
+    lines.append(f"{name}_sum{_labels(**labels)} {_number(total)}")
+    lines.append(f"{name}_count{_labels(**labels)} {cumulative}")
+
+
+def _labels(**labels: str) -> str:
+
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _escape(value: Any) -> str:
+
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value: Any) -> str:
+
+    if isinstance(value, str):
+        return value
+    return repr(float(value)) if isinstance(value, float) else str(value)
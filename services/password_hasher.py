@@ -0,0 +1,169 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+import asyncio
+from typing import Optional
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+BCRYPT_MAX_WORKERS = int(os.getenv("BCRYPT_MAX_WORKERS", str(os.cpu_count() or 2)))
+BCRYPT_MAX_QUEUE = int(os.getenv("BCRYPT_MAX_QUEUE", "64"))
+BCRYPT_RETRY_AFTER_SECONDS = int(os.getenv("BCRYPT_RETRY_AFTER_SECONDS", "1"))
+
+
+class HasherBusyError(Exception):
+    """Raised when every bcrypt worker and queue slot is taken."""
+
+
+class PasswordHasher:
+    """Runs bcrypt on a dedicated thread pool with a bounded backlog.
+
+    bcrypt releases the GIL while hashing, so the pool gives real parallelism
+    and request threads only block on their own hash. Work beyond
+    max_workers + max_queue is rejected instead of piling up.
+    """
+
+    def __init__(self, rounds: int, max_workers: int, max_queue: int):
+
+        self.rounds = rounds
+        self._executor = _executor_class()(max_workers=max_workers,
+                                           thread_name_prefix="bcrypt")
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+
+    def hash(self, password: str) -> str:
+
+        # bcrypt is imported on first use so that processes which never hash
+        # (workers before their first login, CLI commands) skip loading it.
+        import bcrypt
+
+        salt = bcrypt.gensalt(rounds=self.rounds)
+        hashed = self._run(bcrypt.hashpw, password.encode("utf-8"), salt)
+        return hashed.decode("utf-8")
+
+    def verify(self, password: str, password_hash: str) -> bool:
+
+        import bcrypt
+
+        return self._run(bcrypt.checkpw, password.encode("utf-8"), password_hash.encode("utf-8"))
+
+    async def hash_async(self, password: str) -> str:
+
+        # Same pool and backlog limit as hash(), awaited instead of blocking,
+        # so an event loop keeps serving other requests meanwhile.
+        import bcrypt
+
+        salt = bcrypt.gensalt(rounds=self.rounds)
+        hashed = await asyncio.wrap_future(self._submit(bcrypt.hashpw, password.encode("utf-8"), salt))
+        return hashed.decode("utf-8")
+
+    async def verify_async(self, password: str, password_hash: str) -> bool:
+
+        import bcrypt
+
+        return await asyncio.wrap_future(
+            self._submit(bcrypt.checkpw, password.encode("utf-8"), password_hash.encode("utf-8")))
+
+    def needs_rehash(self, password_hash: str) -> bool:
+
+        return _hash_rounds(password_hash) != self.rounds
+
+    def shutdown(self) -> None:
+
+        self._executor.shutdown(wait=True)
+
+    def _run(self, fn, *args):
+
+        return self._submit(fn, *args).result()
+
+    def _submit(self, fn, *args) -> Future:
+
+        if not self._slots.acquire(blocking=False):
+            logger.warning("bcrypt pool saturated, rejecting request.")
+            raise HasherBusyError("Password hashing capacity exhausted.")
+
+        try:
+            future = self._executor.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+
+def _executor_class():
+
+    # Under a gevent worker threading is patched, so a ThreadPoolExecutor's
+    # "threads" are greenlets and a hash would stall every request in the
+    # worker. gevent's executor runs on real threads and its futures wait
+    # cooperatively.
+    try:
+        from gevent import monkey
+    except ImportError:
+        return ThreadPoolExecutor
+    if not monkey.is_module_patched("threading"):
+        return ThreadPoolExecutor
+    from gevent.threadpool import ThreadPoolExecutor as GeventThreadPoolExecutor
+    return GeventThreadPoolExecutor
+
+
+_hasher: Optional[PasswordHasher] = None
+_hasher_lock = threading.Lock()
+
+
+def get_hasher() -> PasswordHasher:
+
+    global _hasher
+    if _hasher is None:
+        with _hasher_lock:
+            if _hasher is None:
+                _hasher = PasswordHasher(BCRYPT_ROUNDS, BCRYPT_MAX_WORKERS, BCRYPT_MAX_QUEUE)
+    return _hasher
+
+
+def _reset_after_fork() -> None:
+
+    # Executor threads do not survive fork; a child must build its own pool
+    # rather than queue work for threads that only exist in the parent.
+    global _hasher, _hasher_lock
+    _hasher = None
+    _hasher_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def hash_password(password: str) -> str:
+
+    return get_hasher().hash(password)
+
+
+def verify_password(password: str, password_hash: str) -> bool:
+
+    return get_hasher().verify(password, password_hash)
+
+
+async def hash_password_async(password: str) -> str:
+
+    return await get_hasher().hash_async(password)
+
+
+async def verify_password_async(password: str, password_hash: str) -> bool:
+
+    return await get_hasher().verify_async(password, password_hash)
+
+
+def needs_rehash(password_hash: str) -> bool:
+
+    return get_hasher().needs_rehash(password_hash)
+
+
+def _hash_rounds(password_hash: str) -> Optional[int]:
+
+    # Modular crypt format: $2b$<cost>$<salt+digest>
+    try:
+        return int(password_hash.split("$")[2])
+    except (IndexError, ValueError):
+        return None
@@ -0,0 +1,143 @@
+from typing import Any, Dict, List, Optional
+import cProfile
+import glob
+import hashlib
+import hmac
+import json
+import logging
+import os
+import random
+import re
+import tempfile
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Profiling is off unless one of these is set; the app then registers no hooks.
+# A request is profiled when it carries a valid X-Profile-Token (made with
+# PROFILE_SECRET, see make_token) or is picked at PROFILE_SAMPLE_RATE.
+PROFILE_SECRET = os.getenv("PROFILE_SECRET") or None
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE") or "0")
+# Comma-separated route templates that sampling is limited to (e.g. /user/items); empty means all.
+PROFILE_ROUTES = frozenset(route.strip() for route in (os.getenv("PROFILE_ROUTES") or "").split(",")
+                           if route.strip())
+# Sampled requests faster than this are not kept; requested ones always are.
+PROFILE_MIN_MS = float(os.getenv("PROFILE_MIN_MS") or "0")
+PROFILE_DIR = os.getenv("PROFILE_DIR") or os.path.join(tempfile.gettempdir(), "todo-profiles")
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES") or "200")
+
+PROFILE_HEADER = "X-Profile-Token"
+_PROFILE_ID = re.compile(r"^\d+-[0-9a-f]{8}$")
+
+
+def enabled() -> bool:
+
+    return bool(PROFILE_SECRET) or PROFILE_SAMPLE_RATE > 0
+
+
+def make_token(ttl_seconds: int) -> str:
+
+    # "<expiry>.<signature>": anyone holding it may profile requests until
+    # it expires, so hand out short-lived ones.
+    if not PROFILE_SECRET:
+        raise ValueError("PROFILE_SECRET is not set.")
+
+    expires = str(int(time.time()) + ttl_seconds)
+    return f"{expires}.{_sign(expires)}"
+
+
+def token_valid(token: Optional[str]) -> bool:
+
+    if not PROFILE_SECRET or not token:
+        return False
+
+    expires, _, signature = token.strip().partition(".")
+    if not expires.isdigit() or not hmac.compare_digest(signature, _sign(expires)):
+        return False
+    return int(expires) >= time.time()
+
+
+def trigger_for(route: Optional[str], token: Optional[str]) -> Optional[str]:
+
+    # Why this request should be profiled ("token" or "sample"), or None.
+    if token and token_valid(token):
+        return "token"
+
+    if (PROFILE_SAMPLE_RATE > 0 and (not PROFILE_ROUTES or route in PROFILE_ROUTES)
+            and random.random() < PROFILE_SAMPLE_RATE):
+        return "sample"
+    return None
+
+
+def start() -> Optional[cProfile.Profile]:
+
+    # cProfile only follows the calling thread, so concurrent requests in
+    # other threads are not mixed in.
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError as e:
+        # Another profiler is already active in this thread.
+        logger.warning(f"Could not start request profiler: {e}")
+        return None
+    return profiler
+
+
+def save(profiler: cProfile.Profile, metadata: Dict[str, Any]) -> Optional[str]:
+
+    # Writes <id>.prof (pstats format: snakeviz, flameprof, gprof2dot) and
+    # <id>.json with the request details, then drops the oldest beyond
+    # PROFILE_MAX_FILES. Returns the profile id.
+    profile_id = f"{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}"
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        profiler.dump_stats(os.path.join(PROFILE_DIR, f"{profile_id}.prof"))
+        with open(os.path.join(PROFILE_DIR, f"{profile_id}.json"), "w") as f:
+            json.dump({"id": profile_id, **metadata}, f)
+    except OSError as e:
+        logger.error(f"Could not save request profile {profile_id}: {e}")
+        return None
+
+    _prune()
+    logger.info(f"Saved request profile {profile_id} for {metadata.get('method')} {metadata.get('route')}")
+    return profile_id
+
+
+def list_profiles() -> List[Dict[str, Any]]:
+
+    # Newest first.
+    profiles = []
+    for path in sorted(glob.glob(os.path.join(PROFILE_DIR, "*.json")), reverse=True):
+        try:
+            with open(path) as f:
+                profiles.append(json.load(f))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Skipping unreadable profile metadata {path}: {e}")
+    return profiles
+
+
+def profile_path(profile_id: str) -> Optional[str]:
+
+    # Ids are checked against their format, so no path can be smuggled in.
+    if not _PROFILE_ID.match(profile_id or ""):
+        return None
+
+    path = os.path.join(PROFILE_DIR, f"{profile_id}.prof")
+    return path if os.path.exists(path) else None
+
+
+def _prune() -> None:
+
+    stale = sorted(glob.glob(os.path.join(PROFILE_DIR, "*.json")), reverse=True)[PROFILE_MAX_FILES:]
+    for path in stale:
+        for stale_file in (path, path[:-len(".json")] + ".prof"):
+            try:
+                os.remove(stale_file)
+            except OSError:
+                pass
+
+
+def _sign(value: str) -> str:
+
+    return hmac.new(PROFILE_SECRET.encode("utf-8"), value.encode("utf-8"), hashlib.sha256).hexdigest()
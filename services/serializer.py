@@ -0,0 +1,250 @@
+from datetime import date, datetime
+from typing import IO, Any, AsyncIterable, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+from flask import Response
+import csv
+import io
+import json
+import logging
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+EXPORT_MIMETYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv"
+}
+
+# Streamed bodies are flushed in blocks of about this size rather than one
+# write per row.
+STREAM_BUFFER_BYTES = 64 * 1024
+
+
+def dumps(payload: Any) -> bytes:
+
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS)
+
+    return json.dumps(payload, separators=(",", ":"), ensure_ascii=False,
+                      default=_default).encode("utf-8")
+
+
+def json_response(payload: Any) -> Response:
+
+    return Response(dumps(payload), mimetype="application/json")
+
+
+def stream_json_list(key: str, rows: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+
+    # Same envelope as _success_response with a list under `key`, written incrementally.
+    def chunks():
+        yield b'{"success":true,' + dumps(key) + b':['
+        separator = b""
+        for row in rows:
+            yield separator + dumps(row)
+            separator = b","
+        yield b'],"next_cursor":null}'
+
+    return _buffered(chunks())
+
+
+def stream_ndjson(rows: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+
+    return _buffered(dumps(row) + b"\n" for row in rows)
+
+
+def stream_csv(rows: Iterable[Dict[str, Any]],
+               fields: Optional[Sequence[str]] = None) -> Iterator[bytes]:
+
+    def chunks():
+        encoder = _CsvEncoder(fields)
+        for row in rows:
+            yield encoder.row(row)
+        tail = encoder.end()
+        if tail:
+            yield tail
+
+    return _buffered(chunks())
+
+
+async def astream_json_list(key: str, rows: AsyncIterable[Dict[str, Any]]) -> AsyncIterator[bytes]:
+
+    # Async counterparts of the stream_* functions, for the ASGI app: same
+    # bytes, rows read from an async iterator.
+    async def chunks():
+        yield b'{"success":true,' + dumps(key) + b':['
+        separator = b""
+        async for row in rows:
+            yield separator + dumps(row)
+            separator = b","
+        yield b'],"next_cursor":null}'
+
+    async for block in _abuffered(chunks()):
+        yield block
+
+
+async def astream_ndjson(rows: AsyncIterable[Dict[str, Any]]) -> AsyncIterator[bytes]:
+
+    async def chunks():
+        async for row in rows:
+            yield dumps(row) + b"\n"
+
+    async for block in _abuffered(chunks()):
+        yield block
+
+
+async def astream_csv(rows: AsyncIterable[Dict[str, Any]],
+                      fields: Optional[Sequence[str]] = None) -> AsyncIterator[bytes]:
+
+    async def chunks():
+        encoder = _CsvEncoder(fields)
+        async for row in rows:
+            yield encoder.row(row)
+        tail = encoder.end()
+        if tail:
+            yield tail
+
+    async for block in _abuffered(chunks()):
+        yield block
+
+
+class _CsvEncoder:
+    """CSV rows as bytes; the header comes from the first row unless fields are given."""
+
+    def __init__(self, fields: Optional[Sequence[str]] = None):
+
+        self._fields = fields
+        self._buffer = io.StringIO()
+        self._writer = None
+
+    def row(self, row: Dict[str, Any]) -> bytes:
+
+        if self._writer is None:
+            self._writer = csv.DictWriter(self._buffer, fieldnames=list(self._fields or row.keys()),
+                                          extrasaction="ignore")
+            self._writer.writeheader()
+        self._writer.writerow(row)
+        return self._flush()
+
+    def end(self) -> bytes:
+
+        # A header-only file when there were no rows but the columns are known.
+        if self._writer is None and self._fields:
+            csv.writer(self._buffer).writerow(self._fields)
+        return self._flush()
+
+    def _flush(self) -> bytes:
+
+        data = self._buffer.getvalue().encode("utf-8")
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return data
+
+
+def sse_message(data: Any = None,
+                event: Optional[str] = None,
+                retry_ms: Optional[int] = None) -> bytes:
+
+    # One Server-Sent Events frame. Never buffered: each frame is flushed as
+    # soon as it is yielded.
+    lines = []
+    if retry_ms is not None:
+        lines.append(b"retry: %d" % retry_ms)
+    if event:
+        lines.append(b"event: " + event.encode("utf-8"))
+    if data is not None:
+        lines.append(b"data: " + dumps(data))
+    return b"\n".join(lines) + b"\n\n"
+
+
+def sse_comment(text: str) -> bytes:
+
+    return b": " + text.encode("utf-8") + b"\n\n"
+
+
+def parse_ndjson(stream: IO[bytes]) -> Iterator[Tuple[int, Optional[Any], Optional[str]]]:
+
+    # Yields (line number, record, error) one line at a time.
+    for number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield number, loads(line), None
+        except ValueError:
+            yield number, None, "Invalid JSON."
+
+
+def parse_csv(stream: IO[bytes]) -> Iterator[Tuple[int, Optional[Any], Optional[str]]]:
+
+    # Yields (row number, record, error) for each data row after the header.
+    # Empty cells are treated as missing values.
+    reader = csv.DictReader(io.TextIOWrapper(stream, encoding="utf-8", newline=""))
+    number = 0
+
+    while True:
+        number += 1
+        try:
+            record = next(reader)
+        except StopIteration:
+            return
+        except (csv.Error, UnicodeDecodeError) as e:
+            yield number, None, f"Unreadable CSV: {e}"
+            return
+
+        if None in record:
+            yield number, None, "Row has more columns than the header."
+            continue
+
+        yield number, {field: (value if value != "" else None) for field, value in record.items()}, None
+
+
+def loads(data: Any) -> Any:
+
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _buffered(chunks: Iterable[bytes]) -> Iterator[bytes]:
+
+    pending = []
+    size = 0
+
+    for chunk in chunks:
+        pending.append(chunk)
+        size += len(chunk)
+        if size >= STREAM_BUFFER_BYTES:
+            yield b"".join(pending)
+            pending = []
+            size = 0
+
+    if pending:
+        yield b"".join(pending)
+
+
+async def _abuffered(chunks: AsyncIterable[bytes]) -> AsyncIterator[bytes]:
+
+    pending: List[bytes] = []
+    size = 0
+
+    async for chunk in chunks:
+        pending.append(chunk)
+        size += len(chunk)
+        if size >= STREAM_BUFFER_BYTES:
+            yield b"".join(pending)
+            pending = []
+            size = 0
+
+    if pending:
+        yield b"".join(pending)
+
+
+def _default(value: Any) -> Any:
+
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
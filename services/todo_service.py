@@ -1,34 +1,202 @@
-from datetime import datetime, timezone
-from typing import Optional, Tuple, Dict, Any, List
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Tuple, Dict, Any, Iterable, Iterator, List, NamedTuple
+import base64
+import binascii
+import json
+import os
+import re
 import uuid
 import logging
 
 from repositories import todo_repository as repo
+from services import events, validator_service
+from services.cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
 VALID_STATUSES = frozenset(["ToDo", "InProgress", "Done"])
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+MAX_BATCH_OPERATIONS = 500
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", "500"))
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+MAX_IMPORT_BATCH_SIZE = 5000
+MAX_IMPORT_ERRORS = 1000
+# Change versions are read on every conditional GET. A TTL above zero lets a
+# worker reuse the value briefly (writes made through this process always
+# invalidate it); zero means one primary-key lookup per request.
+CHANGE_VERSION_CACHE_TTL_SECONDS = float(os.getenv("CHANGE_VERSION_CACHE_TTL_SECONDS", "0"))
+# Columns produced by the export that are assigned by the server on import.
+IMPORT_IGNORED_FIELDS = frozenset(["id", "timestamp", "user_id", "version", "updated_at"])
+VERSION_CONFLICT_ERROR = "Item was modified by another request."
+SYNC_EXPIRED_ERROR = "Sync token is no longer valid; fetch a full snapshot."
+# Tombstones older than this are pruned by `flask prune-tombstones`.
+TOMBSTONE_RETENTION_DAYS = int(os.getenv("TOMBSTONE_RETENTION_DAYS", "30"))
+BATCH_OPERATIONS = ("create", "update", "delete", "get")
+MAX_SEARCH_TERMS = 16
+MAX_SEARCH_TERM_LENGTH = 64
+# Letters and digits only: anything else separates terms, so no search
+# syntax from the client ever reaches the database.
+_SEARCH_TERM = re.compile(r"[^\W_]+")
+# filter=<clause>;<clause>... where a clause is <field><op><value>, e.g.
+# status=ToDo|InProgress;timestamp>=2026-01-05;title^=Buy
+MAX_FILTER_CLAUSES = 10
+MAX_TITLE_LENGTH = 200
+_FILTER_CLAUSE = re.compile(r"^\s*([a-z_]+)\s*(\^=|!=|>=|<=|=|>|<)\s*(.*?)\s*$")
+_FILTER_OPERATORS = {"=": "eq", "!=": "ne", ">": "gt", ">=": "gte", "<": "lt", "<=": "lte",
+                     "^=": "prefix"}
+
+_change_versions = TTLCache(10000, CHANGE_VERSION_CACHE_TTL_SECONDS)
+
 
 def get_todos(status: Optional[str]= None,
                 user_id: Optional[str]= None, 
-                sort_by: str= "id",
-                sort_order: str= "asc") -> Tuple[Optional[List[Dict[str, Any]]], Optional[str]]:
+                sort_by: Optional[str]= None,
+                sort_order: str= "asc",
+                limit: Optional[Any]= None,
+                cursor: Optional[str]= None,
+                fields: Optional[str]= None,
+                q: Optional[str]= None,
+                filters: Optional[str]= None) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
     try:
-        if status and not _is_valid_status(status):
-            return None, "Invalid status."
+        listing, error = _parse_listing(status, user_id, sort_by, sort_order, q, filters)
+        if error:
+            return None, error
+
+        page_size, error = _parse_limit(limit)
+        if error:
+            return None, error
+
+        projection, error = _parse_fields(fields)
+        if error:
+            return None, error
 
-        if status:
-            items = repo.get_items_by_status(status, user_id, sort_by, sort_order)
-        else: 
-            items = repo.get_all_items(user_id, sort_by, sort_order)
+        after, error = _parse_cursor(cursor, listing)
+        if error:
+            return None, error
 
-        return items, None
+        items, next_key = repo.get_items_page(user_id, listing.filters, listing.sort_by, listing.sort_order,
+                                              page_size, after, projection, listing.search)
+
+        return _page(listing, items, next_key), None
 
     except Exception as e:
         logger.error(f"Error in get_todos: {str(e)}")
         return None, f"Error to retrieve items: {str(e)}"
 
 
+def stream_todos(status: Optional[str] = None,
+                 user_id: Optional[str] = None,
+                 sort_by: Optional[str] = None,
+                 sort_order: str = "asc",
+                 fields: Optional[str] = None,
+                 q: Optional[str] = None,
+                 filters: Optional[str] = None) -> Tuple[Optional[Iterator[Dict[str, Any]]], Optional[str]]:
+
+    # Validation happens here, before the first byte is sent; the returned
+    # iterator only reads rows as the response is written.
+    try:
+        listing, error = _parse_listing(status, user_id, sort_by, sort_order, q, filters)
+        if error:
+            return None, error
+
+        projection, error = _parse_fields(fields)
+        if error:
+            return None, error
+
+        return repo.iter_items(user_id, listing.filters, listing.sort_by, listing.sort_order, projection,
+                               STREAM_CHUNK_SIZE, listing.search), None
+
+    except Exception as e:
+        logger.error(f"Error in stream_todos: {str(e)}")
+        return None, f"Error to retrieve items: {str(e)}"
+
+
+def get_stats(user_id: Optional[str] = None) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+
+    try:
+        if not user_id:
+            return None, "User ID is required."
+
+        counts = repo.get_status_counts(user_id)
+        by_status = {status: max(counts.get(status, 0), 0) for status in sorted(VALID_STATUSES)}
+
+        return {"counts": by_status, "total": sum(by_status.values())}, None
+
+    except Exception as e:
+        logger.error(f"Error in get_stats: {str(e)}")
+        return None, f"Error to retrieve stats: {str(e)}"
+
+
+def rebuild_stats(user_id: Optional[str] = None) -> Optional[str]:
+
+    if not repo.rebuild_status_counts(user_id):
+        return "Failed to rebuild item status counters."
+    return None
+
+
+def rebuild_search_index() -> Optional[str]:
+
+    if not repo.rebuild_search_index():
+        return "Failed to rebuild the item search index."
+    return None
+
+
+def get_change_version(user_id: Optional[str] = None) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+
+    try:
+        if not user_id:
+            return None, "User ID is required."
+
+        change = _change_versions.get(user_id)
+        if change is None:
+            current = repo.get_change_version(user_id)
+            if current is None:
+                return None, "Failed to read change version."
+
+            change = _remember_change(user_id, current)
+
+        return change, None
+
+    except Exception as e:
+        logger.error(f"Error in get_change_version: {str(e)}")
+        return None, f"Error to retrieve change version: {str(e)}"
+
+
+def get_changes(user_id: Optional[str] = None,
+                since: Optional[str] = None) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+
+    # Sync tokens are the user's change version, not a timestamp, so clock
+    # skew and commit order cannot drop a change. No token means a full
+    # snapshot; a token older than the retained tombstones means the client
+    # must start over from one.
+    try:
+        if not user_id:
+            return None, "User ID is required."
+
+        since_version, error = _parse_since(since)
+        if error:
+            return None, error
+
+        return _changes_result(repo.get_changes_since(user_id, since_version), since_version)
+
+    except Exception as e:
+        logger.error(f"Error in get_changes: {str(e)}")
+        return None, f"Error to retrieve changes: {str(e)}"
+
+
+def prune_tombstones(days: Optional[int] = None) -> Tuple[Optional[int], Optional[str]]:
+
+    days = TOMBSTONE_RETENTION_DAYS if days is None else days
+    if days < 0:
+        return None, "Days must not be negative."
+
+    removed = repo.prune_tombstones(datetime.now(timezone.utc) - timedelta(days=days))
+    if removed is None:
+        return None, "Failed to prune item tombstones."
+    return removed, None
+
+
 def get_todo(item_id: str,
             user_id: Optional[str] = None) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
 
@@ -51,31 +219,22 @@ def create_todo(title: str,
                 user_id: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
 
     try:
-        if not title or not title.strip():
-            return None, "Title is required."
-
-        if not user_id:
-            return None, "User ID is required."
-
-        if status is not None and not _is_valid_status(status):
-            return None, "Invalid status."
-
-        todo_id = str(uuid.uuid4())
-        title = title.strip()
-        description=description.strip() if description else ""
-        status=status or "ToDo"
-        timestamp = datetime.now(timezone.utc)
+        row, error = _prepare_new_item(title, description, status, user_id)
+        if error:
+            return None, error
 
         created_item = repo.create_item(
-            item_id=todo_id,
-            title=title,
-            description=description,
-            status=status,
-            timestamp=timestamp,
+            item_id=row["id"],
+            title=row["title"],
+            description=row["description"],
+            status=row["status"],
+            timestamp=row["timestamp"],
             user_id=user_id
         )
         
-        logger.info(f"Created todo item {todo_id} for user {user_id}")
+        if created_item:
+            _notify_change(user_id, "item.created", [row["id"]])
+        logger.info(f"Created todo item {row['id']} for user {user_id}")
         return created_item, None
 
     except Exception as e:
@@ -84,14 +243,17 @@ def create_todo(title: str,
 
 
 def delete_todo(item_id: str,
-                user_id: Optional[str] = None) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+                user_id: Optional[str] = None,
+                expected_version: Optional[int] = None) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
 
     try:
         if not item_id or not item_id.strip():
             return None, "Item ID is required."
 
-        item = repo.delete_item(item_id, user_id)
-        return (item, None) if item else (None, "Item not found.")
+        item = repo.delete_item(item_id, user_id, expected_version)
+        if item:
+            _notify_change(user_id, "item.deleted", [item_id])
+        return (item, None) if item else (None, _missing_item_error(item_id, user_id, expected_version))
     
     except Exception as e:
         logger.error(f"Error in delete_todo: {str(e)}")
@@ -102,32 +264,655 @@ def update_todo(item_id: str,
                 title: Optional[str] = None, 
                 description: Optional[str] = None,
                 status: Optional[str] = None, 
-                user_id: Optional[str] = None) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+                user_id: Optional[str] = None,
+                expected_version: Optional[int] = None) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
 
     try:
 
         if not item_id or not item_id.strip():
             return None, "Item ID is required."
 
-        if not _is_valid_status(status) and status != None:
-            return None, "Invalid status."
-
-        if title is not None:
-            title = title.strip()
-            if not title: return None, "Title cannot be empty."
-            if len(title) > 200: return None, "Title is too long."
+        changes, error = _prepare_update(title, description, status)
+        if error:
+            return None, error
 
-        if description is not None:
-            description = description.strip()
-
-        updated_item = repo.update_item(item_id, title, description, status, user_id)
-        return (updated_item, None) if updated_item else (None, "Item not found.")
+        updated_item = repo.update_item(item_id, changes.get("title"), changes.get("description"),
+                                        changes.get("status"), user_id, expected_version)
+        if updated_item:
+            _notify_change(user_id, "item.updated", [item_id])
+        return ((updated_item, None) if updated_item
+                else (None, _missing_item_error(item_id, user_id, expected_version)))
     
     except Exception as e:
         logger.error(f"Error in update_todo: {str(e)}")
         return None, f"Failed to update item: {str(e)}"
 
 
+def apply_batch(operations: Any,
+                user_id: str) -> Tuple[Optional[List[Dict[str, Any]]], Optional[str]]:
+
+    try:
+        results, planned, error = _plan_batch(operations, user_id)
+        if error:
+            return None, error
+
+        existing = repo.get_items_by_ids(_batch_lookup_ids(planned), user_id)
+        batch = _sort_batch(planned, existing, results)
+
+        if batch.pending:
+            written = repo.apply_batch(user_id, batch.creates, batch.updates, batch.deletes)
+            if written is not None:
+                _notify_change(user_id, "items.changed")
+            _finish_batch(batch, existing, written, results)
+
+        return results, None
+
+    except Exception as e:
+        logger.error(f"Error in apply_batch: {str(e)}")
+        return None, f"Failed to apply batch: {str(e)}"
+
+
+def import_todos(records: Iterable[Tuple[int, Optional[Dict[str, Any]], Optional[str]]],
+                 user_id: str,
+                 batch_size: Optional[Any] = None) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+
+    # `records` yields (row number, record, parse error) as the upload is read.
+    # Only one batch of rows is held at a time; the error report is capped.
+    try:
+        if not user_id:
+            return None, "User ID is required."
+
+        batch_size, error = _parse_bounded_int(batch_size, "Batch size",
+                                               IMPORT_BATCH_SIZE, MAX_IMPORT_BATCH_SIZE)
+        if error:
+            return None, error
+
+        report = _new_import_report()
+        records = iter(records)
+
+        while True:
+            batch, exhausted = _next_import_batch(records, report, user_id, batch_size)
+            if batch:
+                _flush_import_batch(batch, report, user_id)
+            if exhausted:
+                break
+
+        if report["imported"]:
+            _notify_change(user_id, "items.changed")
+
+        logger.info(f"Imported {report['imported']} items for user {user_id}, "
+                    f"{report['failed']} rows failed")
+        return report, None
+
+    except Exception as e:
+        logger.error(f"Error in import_todos: {str(e)}")
+        return None, f"Failed to import items: {str(e)}"
+
+
+def _notify_change(user_id: str,
+                   event_type: str,
+                   item_ids: Optional[List[str]] = None) -> None:
+
+    # Called after the repository committed. Subscribers get a hint, not the
+    # items: they fetch the actual changes through get_changes().
+    _change_versions.invalidate(user_id)
+
+    event = {"type": event_type}
+    if item_ids:
+        event["ids"] = item_ids
+    events.publish(user_id, event)
+
+
+def _new_import_report() -> Dict[str, Any]:
+
+    return {"imported": 0, "failed": 0, "errors": [], "errors_truncated": False}
+
+
+def _next_import_batch(records: Iterator[Tuple[int, Optional[Dict[str, Any]], Optional[str]]],
+                       report: Dict[str, Any],
+                       user_id: str,
+                       batch_size: int) -> Tuple[List[Tuple[int, Dict[str, Any]]], bool]:
+
+    # Reads and validates records until batch_size rows are ready or the
+    # input ends; rejected rows go straight into the report. Returns the
+    # batch and whether the input is exhausted.
+    batch = []
+
+    for number, record, error in records:
+        row = None
+        if not error:
+            row, error = _prepare_import_record(record, user_id)
+
+        if error:
+            _report_import_error(report, number, error)
+            continue
+
+        batch.append((number, row))
+        if len(batch) >= batch_size:
+            return batch, False
+
+    return batch, True
+
+
+def _prepare_import_record(record: Any,
+                           user_id: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+
+    if not isinstance(record, dict):
+        return None, "Row must be an object."
+
+    data = {field: value for field, value in record.items() if field not in IMPORT_IGNORED_FIELDS}
+
+    error = validator_service.validate_todo_item_data(data)
+    if error:
+        return None, error
+
+    return _prepare_new_item(data.get("title"), data.get("description"), data.get("status"), user_id)
+
+
+def _flush_import_batch(batch: List[Tuple[int, Dict[str, Any]]],
+                        report: Dict[str, Any],
+                        user_id: str) -> None:
+
+    if repo.insert_items([row for _, row in batch]):
+        report["imported"] += len(batch)
+        return
+
+    for number, _ in batch:
+        _report_import_error(report, number, "Batch insert failed.")
+
+
+def _report_import_error(report: Dict[str, Any], number: int, error: str) -> None:
+
+    report["failed"] += 1
+    if len(report["errors"]) < MAX_IMPORT_ERRORS:
+        report["errors"].append({"row": number, "error": error})
+    else:
+        report["errors_truncated"] = True
+
+
+class _Batch(NamedTuple):
+    creates: List[Dict[str, Any]]
+    updates: List[Dict[str, Any]]
+    deletes: List[str]
+    pending: List[Tuple[int, Dict[str, Any]]]
+
+
+def _plan_batch(operations: Any,
+                user_id: str) -> Tuple[Optional[List[Optional[Dict[str, Any]]]], List[Tuple[int, Dict[str, Any]]], Optional[str]]:
+
+    # Validates every operation up front. Returns the results list with the
+    # rejected operations already filled in, and (index, plan) for the rest.
+    if not user_id:
+        return None, [], "User ID is required."
+
+    if not isinstance(operations, list) or not operations:
+        return None, [], "Operations must be a non-empty list."
+
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        return None, [], f"A batch may contain at most {MAX_BATCH_OPERATIONS} operations."
+
+    results: List[Optional[Dict[str, Any]]] = [None] * len(operations)
+    planned = []
+    seen_ids = set()
+
+    for index, operation in enumerate(operations):
+        plan, error = _plan_batch_operation(operation, user_id)
+
+        if not error and plan["id"] in seen_ids:
+            error = "Item is referenced more than once in the batch."
+
+        if error:
+            op = operation.get("op") if isinstance(operation, dict) else None
+            results[index] = _batch_result(index, op, error=error)
+            continue
+
+        seen_ids.add(plan["id"])
+        planned.append((index, plan))
+
+    return results, planned, None
+
+
+def _batch_lookup_ids(planned: List[Tuple[int, Dict[str, Any]]]) -> List[str]:
+
+    return [plan["id"] for _, plan in planned if plan["op"] != "create"]
+
+
+def _sort_batch(planned: List[Tuple[int, Dict[str, Any]]],
+                existing: Dict[str, Dict[str, Any]],
+                results: List[Optional[Dict[str, Any]]]) -> _Batch:
+
+    # Answers gets and operations on missing items from `existing`; the rest
+    # become the writes of one repository transaction.
+    batch = _Batch([], [], [], [])
+
+    for index, plan in planned:
+        op, item_id = plan["op"], plan["id"]
+
+        if op != "create" and item_id not in existing:
+            results[index] = _batch_result(index, op, error="Item not found.")
+        elif op == "get":
+            results[index] = _batch_result(index, op, item=existing[item_id])
+        elif op == "create":
+            batch.creates.append(plan["row"])
+            batch.pending.append((index, plan))
+        elif op == "update":
+            batch.updates.append({"id": item_id, **plan["changes"]})
+            batch.pending.append((index, plan))
+        else:
+            batch.deletes.append(item_id)
+            batch.pending.append((index, plan))
+
+    return batch
+
+
+def _finish_batch(batch: _Batch,
+                  existing: Dict[str, Dict[str, Any]],
+                  written: Optional[Dict[str, Any]],
+                  results: List[Optional[Dict[str, Any]]]) -> None:
+
+    # Results come from the rows the statements returned. An item deleted
+    # since the lookup matched no row and is reported as missing.
+    if written is None:
+        for index, plan in batch.pending:
+            results[index] = _batch_result(index, plan["op"],
+                                           error="Batch failed, no changes were applied.")
+        return
+
+    created_items = iter(written["created"])
+    deleted_ids = set(written["deleted"])
+
+    for index, plan in batch.pending:
+        op, item_id = plan["op"], plan["id"]
+
+        if op == "create":
+            results[index] = _batch_result(index, op, item=next(created_items))
+        elif op == "update" and item_id in written["updated"]:
+            results[index] = _batch_result(index, op, item=written["updated"][item_id])
+        elif op == "delete" and item_id in deleted_ids:
+            results[index] = _batch_result(index, op, item=existing[item_id])
+        else:
+            results[index] = _batch_result(index, op, error="Item not found.")
+
+
+def _plan_batch_operation(operation: Any,
+                          user_id: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+
+    if not isinstance(operation, dict):
+        return None, "Operation must be an object."
+
+    op = operation.get("op")
+    if op not in BATCH_OPERATIONS:
+        return None, f"Operation must be one of: {', '.join(BATCH_OPERATIONS)}"
+
+    data = operation.get("data") or {}
+
+    if op == "create":
+        error = validator_service.validate_todo_item_data(data)
+        if error:
+            return None, error
+
+        row, error = _prepare_new_item(data.get("title"), data.get("description"),
+                                       data.get("status"), user_id)
+        return ({"op": op, "id": row["id"], "row": row}, None) if not error else (None, error)
+
+    item_id = operation.get("id")
+    if not isinstance(item_id, str) or not item_id.strip():
+        return None, "Item ID is required."
+
+    plan = {"op": op, "id": item_id.strip()}
+
+    if op == "update":
+        error = validator_service.validate_todo_item_data(data, is_update=True)
+        if error:
+            return None, error
+
+        changes, error = _prepare_update(data.get("title"), data.get("description"),
+                                         data.get("status"))
+        if error:
+            return None, error
+        if not changes:
+            return None, "No data provided."
+
+        plan["changes"] = changes
+
+    return plan, None
+
+
+def _batch_result(index: int,
+                  op: Optional[str],
+                  item: Optional[Dict[str, Any]] = None,
+                  error: Optional[str] = None) -> Dict[str, Any]:
+
+    if error:
+        return {"index": index, "op": op, "success": False, "error": error}
+    return {"index": index, "op": op, "success": True, "item": item}
+
+
+def _prepare_new_item(title: str,
+                      description: Optional[str],
+                      status: Optional[str],
+                      user_id: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+
+    if not isinstance(title, str) or not title.strip():
+        return None, "Title is required."
+
+    title = title.strip()
+    if len(title) > MAX_TITLE_LENGTH:
+        return None, "Title is too long."
+
+    if description is not None and not isinstance(description, str):
+        return None, "Description must be a string."
+
+    if not user_id:
+        return None, "User ID is required."
+
+    if status is not None and not _is_valid_status(status):
+        return None, "Invalid status."
+
+    return {
+        "id": str(uuid.uuid4()),
+        "title": title,
+        "description": description.strip() if description else "",
+        "status": status or "ToDo",
+        "timestamp": datetime.now(timezone.utc),
+        "user_id": user_id
+    }, None
+
+
+def _prepare_update(title: Optional[str],
+                    description: Optional[str],
+                    status: Optional[str]) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+
+    if status is not None and not _is_valid_status(status):
+        return None, "Invalid status."
+
+    changes: Dict[str, Any] = {}
+
+    if title is not None:
+        if not isinstance(title, str):
+            return None, "Title must be a string."
+        title = title.strip()
+        if not title: return None, "Title cannot be empty."
+        if len(title) > MAX_TITLE_LENGTH: return None, "Title is too long."
+        changes["title"] = title
+
+    if description is not None:
+        if not isinstance(description, str):
+            return None, "Description must be a string."
+        changes["description"] = description.strip()
+
+    if status is not None:
+        changes["status"] = status
+
+    return changes, None
+
+
+def _missing_item_error(item_id: str,
+                        user_id: Optional[str],
+                        expected_version: Optional[int]) -> str:
+
+    # A version-guarded statement matches no row both when the item is gone
+    # and when it changed; only the failure path pays to tell them apart.
+    if expected_version is not None and repo.get_item_by_id(item_id, user_id):
+        return VERSION_CONFLICT_ERROR
+    return "Item not found."
+
+
 def _is_valid_status(status: str) -> bool:
 
-    return status in VALID_STATUSES
+    return isinstance(status, str) and status in VALID_STATUSES
+
+
+class _Listing(NamedTuple):
+    filters: Optional[List[Any]]
+    search: Optional[List[str]]
+    sort_by: str
+    sort_order: str
+
+
+def _parse_listing(status: Optional[str],
+                   user_id: Optional[str],
+                   sort_by: Optional[str],
+                   sort_order: Optional[str],
+                   q: Optional[str],
+                   filters: Optional[str]) -> Tuple[Optional[_Listing], Optional[str]]:
+
+    # Validation shared by pages and streams.
+    if status and not _is_valid_status(status):
+        return None, "Invalid status."
+
+    if not user_id:
+        return None, "User ID is required."
+
+    clauses, error = _parse_filters(filters, status)
+    if error:
+        return None, error
+
+    search, error = _parse_search(q)
+    if error:
+        return None, error
+
+    sort_order = "desc" if sort_order and sort_order.lower() == "desc" else "asc"
+    return _Listing(clauses, search, _resolve_sort(sort_by, search), sort_order), None
+
+
+def _parse_cursor(cursor: Optional[str],
+                  listing: _Listing) -> Tuple[Optional[Tuple[Any, str]], Optional[str]]:
+
+    if not cursor:
+        return None, None
+    return _decode_cursor(cursor, listing.sort_by, listing.sort_order)
+
+
+def _page(listing: _Listing,
+          items: List[Dict[str, Any]],
+          next_key: Optional[Tuple[Any, str]]) -> Dict[str, Any]:
+
+    next_cursor = _encode_cursor(listing.sort_by, listing.sort_order, next_key) if next_key else None
+    return {"items": items, "next_cursor": next_cursor}
+
+
+def _remember_change(user_id: str, current: Tuple[int, Optional[datetime]]) -> Dict[str, Any]:
+
+    version, changed_at = current
+    if changed_at is not None and changed_at.tzinfo is None:
+        changed_at = changed_at.replace(tzinfo=timezone.utc)
+
+    change = {"version": version, "changed_at": changed_at}
+    _change_versions.put(user_id, change)
+    return change
+
+
+def _parse_since(since: Optional[str]) -> Tuple[Optional[int], Optional[str]]:
+
+    if not since:
+        return None, None
+
+    try:
+        since_version = int(since)
+    except ValueError:
+        return None, "Invalid sync token."
+    if since_version < 0:
+        return None, "Invalid sync token."
+
+    return since_version, None
+
+
+def _changes_result(changes: Optional[Dict[str, Any]],
+                    since_version: Optional[int]) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+
+    if changes is None:
+        return None, "Failed to read changes."
+
+    if since_version is not None and not (
+            changes["min_sync_version"] <= since_version <= changes["version"]):
+        return None, SYNC_EXPIRED_ERROR
+
+    return {"items": changes["items"],
+            "deleted": changes["deleted"],
+            "full": since_version is None,
+            "next_since": str(changes["version"])}, None
+
+
+def _parse_limit(limit: Optional[Any]) -> Tuple[Optional[int], Optional[str]]:
+
+    return _parse_bounded_int(limit, "Limit", DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
+
+
+def _parse_bounded_int(value: Optional[Any],
+                       name: str,
+                       default: int,
+                       maximum: int) -> Tuple[Optional[int], Optional[str]]:
+
+    if value is None or value == "":
+        return default, None
+
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return None, f"{name} must be an integer."
+
+    if value < 1:
+        return None, f"{name} must be at least 1."
+
+    return min(value, maximum), None
+
+
+def _parse_filters(expression: Optional[str],
+                   status: Optional[str] = None) -> Tuple[Optional[List[Any]], Optional[str]]:
+
+    # Parsed and validated once here; the repository compiles the clauses
+    # into WHERE predicates of the same list query. The legacy status=
+    # parameter is just one more clause.
+    clauses = [repo.FilterClause("status", "eq", [status])] if status else []
+
+    if not expression or not expression.strip():
+        return clauses or None, None
+
+    parts = [part for part in expression.split(";") if part.strip()]
+    if len(parts) > MAX_FILTER_CLAUSES:
+        return None, f"Filter may contain at most {MAX_FILTER_CLAUSES} clauses."
+
+    for part in parts:
+        match = _FILTER_CLAUSE.match(part)
+        if not match:
+            return None, f"Invalid filter clause: {part.strip()}"
+
+        field, symbol, raw_value = match.groups()
+        op = _FILTER_OPERATORS[symbol]
+
+        if op not in repo.FILTER_OPERATORS.get(field, ()):
+            allowed = ", ".join(sorted(repo.FILTER_OPERATORS))
+            return None, (f"Unsupported filter: {field} {symbol}. "
+                          f"Filterable fields are: {allowed}")
+
+        value, error = _parse_filter_value(field, raw_value)
+        if error:
+            return None, error
+
+        clauses.append(repo.FilterClause(field, op, value))
+
+    return clauses, None
+
+
+def _parse_filter_value(field: str, raw_value: str) -> Tuple[Any, Optional[str]]:
+
+    if not raw_value:
+        return None, f"Filter on {field} needs a value."
+
+    if field == "status":
+        statuses = list(dict.fromkeys(value.strip() for value in raw_value.split("|")))
+        invalid = [value for value in statuses if not _is_valid_status(value)]
+        if invalid:
+            return None, f"Invalid status in filter: {', '.join(invalid)}"
+        return statuses, None
+
+    if field in ("timestamp", "updated_at"):
+        try:
+            value = datetime.fromisoformat(raw_value)
+        except ValueError:
+            return None, f"Invalid {field} in filter: {raw_value}"
+        # Stored values are naive UTC.
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value, None
+
+    if len(raw_value) > MAX_TITLE_LENGTH:
+        return None, f"Filter value for {field} is too long."
+    return raw_value, None
+
+
+def _parse_search(q: Optional[str]) -> Tuple[Optional[List[str]], Optional[str]]:
+
+    if q is None or not q.strip():
+        return None, None
+
+    terms = list(dict.fromkeys(term.lower() for term in _SEARCH_TERM.findall(q)))
+    if not terms:
+        return None, "Search query must contain letters or digits."
+
+    if len(terms) > MAX_SEARCH_TERMS:
+        return None, f"Search query may contain at most {MAX_SEARCH_TERMS} terms."
+
+    return [term[:MAX_SEARCH_TERM_LENGTH] for term in terms], None
+
+
+def _resolve_sort(sort_by: Optional[str], search: Optional[List[str]]) -> str:
+
+    # Searches are ranked by relevance unless another order is asked for.
+    if sort_by is None:
+        return "rank" if search else "id"
+
+    if sort_by == "rank" and search:
+        return "rank"
+
+    return sort_by if sort_by in repo.ALLOWED_SORT_COLUMNS else "id"
+
+
+def _parse_fields(fields: Optional[str]) -> Tuple[Optional[List[str]], Optional[str]]:
+
+    # None selects every column; "id" is always returned so clients can address items.
+    if not fields:
+        return None, None
+
+    requested = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = sorted(set(requested) - set(repo.ITEM_FIELDS))
+
+    if unknown:
+        return None, (f"Unknown field(s): {', '.join(unknown)}. "
+                      f"Allowed fields are: {', '.join(repo.ITEM_FIELDS)}")
+
+    return list(dict.fromkeys(["id", *requested])), None
+
+
+def _encode_cursor(sort_by: str, sort_order: str, key: Tuple[Any, str]) -> str:
+
+    value, item_id = key
+    if isinstance(value, datetime):
+        value = value.isoformat()
+
+    payload = json.dumps({"s": sort_by, "o": sort_order, "v": value, "id": item_id},
+                         separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: str,
+                   sort_by: str,
+                   sort_order: str) -> Tuple[Optional[Tuple[Any, str]], Optional[str]]:
+
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        value, item_id = payload["v"], payload["id"]
+
+        if payload["s"] != sort_by or payload["o"] != sort_order:
+            return None, "Cursor does not match the requested sort."
+
+        if sort_by == "timestamp":
+            value = datetime.fromisoformat(value)
+        elif sort_by == "rank":
+            value = float(value)
+
+        return (value, item_id), None
+    except (binascii.Error, UnicodeError, ValueError, KeyError, TypeError):
+        return None, "Invalid cursor."
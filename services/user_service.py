@@ -1,13 +1,12 @@
 from datetime import datetime, timezone, timedelta
 from typing import Optional, Tuple, Dict, Any
-import jwt
-import bcrypt
 import re
 import logging
 import uuid
 import os 
 
 from repositories import user_repository as repo
+from services import password_hasher
 
 logger = logging.getLogger(__name__)
  
@@ -16,7 +15,10 @@ MIN_PASSWORD_LENGTH = 2
 
 JWT_SECRET = os.getenv("JWT_SECRET_KEY")
 JWT_ALGORITHM = "HS256"
-JWT_EXPIRATION_HOURS = 24
+# Lifetime of issued tokens; fractional values work (load tests use seconds-long ones).
+JWT_EXPIRATION_HOURS = float(os.getenv("JWT_EXPIRATION_HOURS") or "24")
+
+BUSY_ERROR = "Server is busy, please retry shortly."
 
 def register_user(email: str,
                   password: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
@@ -46,6 +48,8 @@ def register_user(email: str,
         logger.info(f"New user registered: {email}")
         return created_user, None
     
+    except password_hasher.HasherBusyError:
+        return None, BUSY_ERROR
     except Exception as e:
         logger.error(f"Error in register_user for email '{email}': {str(e)}")
         return None, f"Failed to register user: {str(e)}"
@@ -67,11 +71,15 @@ def authenticate_user(email: str,
         if not _verify_password(password, user["password_hash"]):
             return None, "Invalid email or password."
 
+        _rehash_if_needed(user["id"], password, user["password_hash"])
+
         token_payload = {
             "user_id": user["id"],
             "exp": datetime.now(timezone.utc) + timedelta(hours= JWT_EXPIRATION_HOURS)
         }
         
+        import jwt  # loaded on the first login rather than at startup
+
         token = jwt.encode(token_payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
         logger.info(f"User authenticated successfully: {email}")
 
@@ -83,6 +91,8 @@ def authenticate_user(email: str,
             "token": token
         }, None
         
+    except password_hasher.HasherBusyError:
+        return None, BUSY_ERROR
     except Exception as e:
         logger.error(f"Error in authenticate_user for email: '{email}': {str(e)}")
         return None, f"Failed to authenticate user: {str(e)}"
@@ -126,9 +136,25 @@ def _is_valid_password(password: str) -> bool:
 
 def _hash_password(password: str) -> str:
     
-    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+    return password_hasher.hash_password(password)
 
 
 def _verify_password(password: str, password_hash: str) -> bool:
     
-    return bcrypt.checkpw(password.encode("utf-8"), password_hash.encode("utf-8"))
+    return password_hasher.verify_password(password, password_hash)
+
+
+def _rehash_if_needed(user_id: str, password: str, password_hash: str) -> None:
+
+    # Upgrade hashes made with an older cost factor while we hold the plaintext.
+    # A failure here must never fail the login itself.
+    if not password_hasher.needs_rehash(password_hash):
+        return
+
+    try:
+        repo.update_user(user_id, {"password_hash": _hash_password(password)})
+        logger.info(f"Rehashed password for user {user_id} with the configured cost.")
+    except password_hasher.HasherBusyError:
+        logger.warning(f"Skipped password rehash for user {user_id}: hasher busy.")
+    except Exception as e:
+        logger.error(f"Error rehashing password for user {user_id}: {str(e)}")
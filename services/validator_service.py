@@ -45,7 +45,7 @@ def validate_todo_item_data(data: Dict[str, Any], is_update: bool = False) -> Op
     
     if "status" in data and data["status"] is not None:
         valid_statuses = {"ToDo", "InProgress", "Done"}
-        if data["status"] not in valid_statuses:
+        if not isinstance(data["status"], str) or data["status"] not in valid_statuses:
             return f"Status must be one of: {', '.join(valid_statuses)}"
     
     return None
\ No newline at end of file
@@ -0,0 +1,58 @@
+import pytest
+from contextlib import ExitStack
+from unittest.mock import patch
+from sqlalchemy import create_engine
+from database import migrations, setup_database
+
+
+@pytest.fixture
+def migrated_url(tmp_path):
+    """Creates a migrated SQLite file under tmp_path and returns its URL."""
+
+    def make(name):
+        url = f"sqlite:///{tmp_path / name}"
+        engine = create_engine(url)
+        migrations.upgrade(engine)
+        engine.dispose()
+        return url
+
+    return make
+
+
+@pytest.fixture
+def database_url(migrated_url):
+    """Primary database of the app under test."""
+    return migrated_url("app.db")
+
+
+@pytest.fixture
+def app_patches():
+    """Patches held while apps are built and used; modules override this to configure them."""
+    return []
+
+
+@pytest.fixture
+def make_app(database_url, app_patches):
+    """Builds Flask apps on database_url with app_patches applied, and disposes them afterwards."""
+    import todo_app
+
+    apps = []
+
+    def make():
+        app = todo_app.create_app()
+        apps.append(app)
+        return app
+
+    with ExitStack() as stack:
+        stack.enter_context(patch.object(setup_database, "DATABASE_URL", database_url))
+        for setting in app_patches:
+            stack.enter_context(setting)
+        yield make
+        for app in apps:
+            setup_database.dispose_engines(app)
+
+
+@pytest.fixture
+def app(make_app):
+    """Flask app on a migrated SQLite file."""
+    return make_app()
@@ -0,0 +1,201 @@
+import json
+import re
+import pytest
+from unittest.mock import patch
+from starlette.testclient import TestClient
+from database import setup_database
+from services import async_user_service, auth_cache, auth_decorators, password_hasher, user_service
+
+VOLATILE_FIELDS = {"id", "timestamp", "updated_at", "created_at", "token", "next_cursor"}
+_UUID = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}")
+
+
+class _Client:
+    """Same calls against the Flask test client or Starlette's TestClient."""
+
+    def __init__(self, client, flask):
+        self.client = client
+        self.flask = flask
+
+    def call(self, method, url, json_body=None, data=None, headers=None):
+        headers = dict(headers or {})
+        if self.flask:
+            response = self.client.open(url, method=method, json=json_body, data=data, headers=headers)
+            return response.status_code, response.data, response.headers
+        response = self.client.request(method, url, json=json_body, content=data, headers=headers)
+        return response.status_code, response.content, response.headers
+
+
+def _normalize(value):
+    # Ids, tokens and times differ between any two runs; their presence does not.
+    if isinstance(value, dict):
+        return {key: (f"<{key}>" if key in VOLATILE_FIELDS and item is not None else _normalize(item))
+                for key, item in value.items()}
+    if isinstance(value, list):
+        return sorted((_normalize(item) for item in value), key=lambda item: json.dumps(item, sort_keys=True))
+    if isinstance(value, str):
+        return _UUID.sub("<uuid>", value)
+    return value
+
+
+def _body(data):
+    try:
+        return _normalize(json.loads(data))
+    except ValueError:
+        lines = data.decode("utf-8").splitlines()
+        return sorted(_UUID.sub("<uuid>", re.sub(r"\d{4}-\d\d-\d\dT[\d:.+]+", "<time>", line)) for line in lines)
+
+
+def _run_scenario(client):
+    """Drives one app through the API and returns what a client would observe."""
+    seen = []
+
+    def call(label, method, url, json_body=None, data=None, headers=None):
+        status, body, response_headers = client.call(method, url, json_body, data, headers)
+        # The tag's digest covers the URL, which carries ids; compare its version.
+        etag = response_headers.get("ETag")
+        seen.append((label, status, _body(body) if body else None,
+                     etag.split("-")[0] if etag else None, "Last-Modified" in response_headers))
+        try:
+            return status, json.loads(body), response_headers
+        except ValueError:
+            return status, body, response_headers
+
+    call("register", "POST", "/register", {"email": "User@Example.com", "password": "secret"})
+    call("register duplicate", "POST", "/register", {"email": "user@example.com", "password": "secret"})
+    call("register bad email", "POST", "/register", {"email": "nope", "password": "secret"})
+    call("register not json", "POST", "/register", data=b"email=x", headers={"Content-Type": "text/plain"})
+    call("login wrong password", "POST", "/login", {"email": "user@example.com", "password": "wrong"})
+    _, login, _ = call("login", "POST", "/login", {"email": "user@example.com", "password": "secret"})
+    auth = {"Authorization": f"Bearer {login['user']['token']}"}
+    user_id = login["user"]["user info"]["id"]
+
+    call("no header", "GET", "/user/items")
+    call("bad header", "GET", "/user/items", headers={"Authorization": "Token abc"})
+    call("bad token", "GET", "/user/items", headers={"Authorization": "Bearer abc"})
+    call("get user", "GET", f"/user/{user_id}", headers=auth)
+
+    ids = {}
+    for title, status in (("Alpha", "ToDo"), ("Bravo", "Done"), ("Charlie", "InProgress")):
+        _, created, _ = call(f"create {title}", "POST", "/user/items",
+                             {"title": title, "description": f"{title} task", "status": status}, headers=auth)
+        ids[title] = created["item"]["id"]
+    call("create invalid", "POST", "/user/items", {"description": "no title"}, headers=auth)
+
+    _, page, _ = call("page 1", "GET", "/user/items?sort_by=title&limit=2", headers=auth)
+    call("page 2", "GET", f"/user/items?sort_by=title&limit=2&cursor={page['next_cursor']}", headers=auth)
+    call("filter", "GET", "/user/items?filter=status=Done&fields=title,status", headers=auth)
+    call("search", "GET", "/user/items?q=charlie", headers=auth)
+    call("bad limit", "GET", "/user/items?limit=abc", headers=auth)
+    call("stream", "GET", "/user/items?stream=1&sort_by=title", headers=auth)
+    call("stats", "GET", "/user/items/stats", headers=auth)
+
+    _, _, headers = call("get item", "GET", f"/user/items/{ids['Alpha']}", headers=auth)
+    call("get item unchanged", "GET", f"/user/items/{ids['Alpha']}",
+         headers={**auth, "If-None-Match": headers["ETag"]})
+    call("get missing item", "GET", "/user/items/missing", headers=auth)
+
+    _, changes, _ = call("full sync", "GET", "/user/items/changes", headers=auth)
+    call("update stale version", "PUT", f"/user/items/{ids['Alpha']}", {"status": "Done"},
+         headers={**auth, "If-Match": "7"})
+    call("update", "PUT", f"/user/items/{ids['Alpha']}", {"status": "Done"}, headers={**auth, "If-Match": '"1"'})
+    call("delete", "DELETE", f"/user/items/{ids['Bravo']}", headers=auth)
+    call("delete again", "DELETE", f"/user/items/{ids['Bravo']}", headers=auth)
+    call("delta sync", "GET", f"/user/items/changes?since={changes['next_since']}", headers=auth)
+    call("expired sync", "GET", "/user/items/changes?since=999", headers=auth)
+
+    call("batch", "POST", "/user/items/batch", {"operations": [
+        {"op": "create", "data": {"title": "Delta", "status": "ToDo"}},
+        {"op": "update", "id": ids["Charlie"], "data": {"title": "Charlie 2"}},
+        {"op": "delete", "id": ids["Alpha"]},
+        {"op": "get", "id": ids["Bravo"]},
+    ]}, headers=auth)
+    call("import", "POST", "/user/items/import",
+         data=b'{"title": "Echo", "status": "Done"}\nnot json\n{"status": "ToDo"}\n',
+         headers={**auth, "Content-Type": "application/x-ndjson"})
+    call("import csv", "POST", "/user/items/import",
+         data=b"title,status\nFoxtrot,ToDo\n,Done\n", headers={**auth, "Content-Type": "text/csv"})
+    call("export ndjson", "GET", "/user/items/export?fields=title,status", headers=auth)
+    call("export csv", "GET", "/user/items/export?format=csv&fields=title,status", headers=auth)
+    call("export bad format", "GET", "/user/items/export?format=xml", headers=auth)
+    call("stats after", "GET", "/user/items/stats", headers=auth)
+    return seen
+
+
+@pytest.fixture
+def app_patches():
+    """Low bcrypt cost and a fixed JWT secret for both apps."""
+    import asgi_app
+
+    secret = "parity-secret"
+    auth_cache.clear()
+    yield [patch.object(password_hasher, "_hasher", password_hasher.PasswordHasher(4, 2, 8)),
+           patch.object(user_service, "JWT_SECRET", secret),
+           patch.object(async_user_service, "JWT_SECRET", secret),
+           patch.object(auth_decorators, "JWT_SECRET", secret),
+           patch.object(asgi_app, "JWT_SECRET", secret)]
+    auth_cache.clear()
+
+
+class TestAsgiParity:
+    """Tests that the ASGI app answers exactly like the Flask app."""
+
+    def test_same_responses_as_flask(self, app, migrated_url):
+        """Should return the same statuses, bodies and cache headers for every call."""
+        import asgi_app
+
+        expected = _run_scenario(_Client(app.test_client(), flask=True))
+
+        with patch.object(setup_database, "DATABASE_URL", migrated_url("asgi.db")):
+            with TestClient(asgi_app.create_app()) as client:
+                actual = _run_scenario(_Client(client, flask=False))
+
+        for expected_call, actual_call in zip(expected, actual):
+            assert actual_call == expected_call
+        assert len(actual) == len(expected)
+
+    def test_refuses_shards(self, database_url):
+        """Should not start when item data is sharded."""
+        import asgi_app
+        from database import sharding
+
+        with patch.object(setup_database, "DATABASE_URL", database_url), \
+             patch.object(sharding, "DATABASE_SHARD_URLS", ["sqlite:///shard.db"]):
+            with pytest.raises(ValueError):
+                asgi_app.create_app()
+
+
+class TestItemValidators:
+    """Tests that an item's ETag is the validator its writes accept."""
+
+    @pytest.mark.parametrize("flask", [True, False])
+    def test_put_with_etag_from_get(self, make_app, flask):
+        """Should accept the ETag of a GET in If-Match, then refuse it once the item changed."""
+        import asgi_app
+
+        def scenario(client):
+            client.call("POST", "/register", {"email": "user@example.com", "password": "secret"})
+            _, body, _ = client.call("POST", "/login", {"email": "user@example.com", "password": "secret"})
+            auth = {"Authorization": f"Bearer {json.loads(body)['user']['token']}"}
+            _, body, _ = client.call("POST", "/user/items", {"title": "Alpha"}, headers=auth)
+            url = f"/user/items/{json.loads(body)['item']['id']}"
+
+            _, _, headers = client.call("GET", url, headers=auth)
+            etag = headers["ETag"]
+            status, _, headers = client.call("PUT", url, {"status": "Done"}, headers={**auth, "If-Match": etag})
+            assert status == 200
+            new_etag = headers["ETag"]
+
+            assert new_etag != etag
+            assert client.call("PUT", url, {"status": "ToDo"}, headers={**auth, "If-Match": etag})[0] == 412
+            assert client.call("DELETE", url, headers={**auth, "If-Match": etag})[0] == 412
+            assert client.call("GET", url, headers={**auth, "If-None-Match": new_etag})[0] == 304
+            client.call("POST", "/user/items", {"title": "Bravo"}, headers=auth)
+            assert client.call("DELETE", url, headers={**auth, "If-Match": new_etag})[0] == 200
+
+        # make_app holds the database and settings patches for either app.
+        if flask:
+            scenario(_Client(make_app().test_client(), flask=True))
+        else:
+            with TestClient(asgi_app.create_app()) as client:
+                scenario(_Client(client, flask=False))
@@ -0,0 +1,103 @@
+import time
+import pytest
+from unittest.mock import patch
+from repositories import user_repository
+from services import auth_cache, cache, events
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    auth_cache.clear()
+    yield
+    auth_cache.clear()
+
+
+class TestTTLCache:
+    """Tests for the bounded TTL cache."""
+
+    def test_hit_and_miss_counters(self):
+        """Should count hits and misses separately."""
+        ttl_cache = cache.TTLCache(max_entries=10, ttl_seconds=60)
+        ttl_cache.put("a", 1)
+
+        assert ttl_cache.get("a") == 1
+        assert ttl_cache.get("b") is None
+        assert ttl_cache.stats()["hits"] == 1
+        assert ttl_cache.stats()["misses"] == 1
+
+    def test_entries_expire_after_ttl(self):
+        """Should drop entries once their TTL has passed."""
+        ttl_cache = cache.TTLCache(max_entries=10, ttl_seconds=60)
+
+        with patch("services.cache.time.monotonic", return_value=100.0):
+            ttl_cache.put("a", 1)
+        with patch("services.cache.time.monotonic", return_value=161.0):
+            assert ttl_cache.get("a") is None
+
+    def test_evicts_least_recently_used(self):
+        """Should evict the least recently used entry when full."""
+        ttl_cache = cache.TTLCache(max_entries=2, ttl_seconds=60)
+        ttl_cache.put("a", 1)
+        ttl_cache.put("b", 2)
+        ttl_cache.get("a")
+        ttl_cache.put("c", 3)
+
+        assert ttl_cache.get("b") is None
+        assert ttl_cache.get("a") == 1
+        assert ttl_cache.stats()["evictions"] == 1
+
+
+class TestAuthCache:
+    """Tests for the token and user caches used by token_required."""
+
+    def test_token_payload_is_cached_by_digest(self):
+        """Should return the decoded payload for the same token."""
+        payload = {"user_id": "user_1", "exp": time.time() + 3600}
+        auth_cache.put_token_payload("token-1", payload)
+
+        assert auth_cache.get_token_payload("token-1") == payload
+        assert auth_cache.get_token_payload("token-2") is None
+
+    def test_expired_token_is_not_cached(self):
+        """Should never cache a token beyond its exp claim."""
+        auth_cache.put_token_payload("token-1", {"user_id": "user_1", "exp": time.time() - 1})
+
+        assert auth_cache.get_token_payload("token-1") is None
+
+    def test_repository_hook_invalidates_user(self):
+        """Should drop the user and their tokens when the repository reports a change."""
+        auth_cache.put_user("user_1", {"id": "user_1"})
+        auth_cache.put_token_payload("token-1", {"user_id": "user_1", "exp": time.time() + 3600})
+
+        user_repository._run_invalidation_hooks("user_1")
+
+        assert auth_cache.get_user("user_1") is None
+        assert auth_cache.get_token_payload("token-1") is None
+
+    def test_invalidation_is_sent_to_other_workers(self):
+        """Should forward a user change through the events backend after dropping it here."""
+        with patch.object(events, "publish") as publish:
+            auth_cache.invalidate_user("user_1")
+
+        publish.assert_called_once_with("user_1", {"type": auth_cache.USER_CHANGED_EVENT}, local=False)
+
+    def test_invalidation_from_another_worker_drops_entries(self, tmp_path):
+        """Should drop a user's cached entries when another worker reports a change, without streaming it."""
+        auth_cache.put_user("user_1", {"id": "user_1"})
+        auth_cache.put_token_payload("token-1", {"user_id": "user_1", "exp": time.time() + 3600})
+        other_worker = events.EventBroker(events.UnixSocketBackend(str(tmp_path)), 10, 10)
+        this_worker = events.EventBroker(events.UnixSocketBackend(str(tmp_path)), 10, 10)
+        try:
+            subscription = this_worker.subscribe("user_1")
+
+            other_worker.publish("user_1", {"type": auth_cache.USER_CHANGED_EVENT}, local=False)
+
+            deadline = time.monotonic() + 5
+            while auth_cache.get_user("user_1") is not None and time.monotonic() < deadline:
+                time.sleep(0.01)
+            assert auth_cache.get_user("user_1") is None
+            assert auth_cache.get_token_payload("token-1") is None
+            assert subscription.get(0) is None
+        finally:
+            other_worker.shutdown()
+            this_worker.shutdown()
@@ -0,0 +1,146 @@
+import pytest
+from unittest.mock import patch
+from benchmarks import harness, load
+from database import setup_database
+from services import auth_cache, metrics, password_hasher
+
+
+def _report(**scenarios):
+    return {"meta": {}, "scenarios": scenarios}
+
+
+def _result(p50=1.0, p95=2.0, p99=3.0, throughput=100.0, queries=2.0, errors=0):
+    return {"throughput_rps": throughput, "errors": errors, "queries_per_request": queries,
+            "latency_ms": {"p50": p50, "p95": p95, "p99": p99}}
+
+
+class TestHarness:
+    """Tests for seeding and summarising benchmark runs."""
+
+    @pytest.mark.parametrize("distribution", ["uniform", "zipf"])
+    def test_item_counts_add_up(self, distribution):
+        """Should hand out every item, heaviest users first."""
+        counts = harness.item_counts(7, 1000, distribution)
+
+        assert sum(counts) == 1000
+        assert counts == sorted(counts, reverse=True)
+        if distribution == "zipf":
+            assert counts[0] > 3 * counts[-1]
+
+    def test_percentile_is_nearest_rank(self):
+        """Should pick the nearest-rank value."""
+        values = list(range(1, 101))
+
+        assert harness.percentile(values, 0.50) == 50
+        assert harness.percentile(values, 0.99) == 99
+        assert harness.percentile([7], 0.95) == 7
+
+    def test_compare_flags_regressions(self):
+        """Should flag slower percentiles, lower throughput, more queries and new errors beyond the threshold."""
+        baseline = _report(same=_result(), slower=_result(), n_plus_one=_result(), failing=_result())
+        current = _report(same=_result(p95=2.1, throughput=95.0),
+                          slower=_result(p99=4.0, throughput=80.0),
+                          n_plus_one=_result(queries=12.0),
+                          failing=_result(errors=3),
+                          new=_result())
+
+        regressions = harness.compare(baseline, current, 0.10)
+
+        assert [regression.split(":")[0] for regression in regressions] == \
+            ["slower", "slower", "n_plus_one", "failing"]
+
+
+class TestBenchmarkRun:
+    """Tests for a full (tiny) run through the Flask test client."""
+
+    def test_every_scenario_succeeds(self, tmp_path):
+        """Should run every scenario without errors and count its queries."""
+        import todo_app
+
+        with patch.object(setup_database, "DATABASE_URL", f"sqlite:///{tmp_path / 'bench.db'}"), \
+             patch.object(password_hasher, "_hasher", password_hasher.PasswordHasher(4, 1, 4)), \
+             patch("services.user_service.JWT_SECRET", "secret"), \
+             patch("services.auth_decorators.JWT_SECRET", "secret"):
+            auth_cache.clear()
+            metrics.reset()
+            app = todo_app.create_app()
+            try:
+                users = harness.seed(app, 3, 60, "zipf", 1)
+                results = harness.run(harness.ClientDriver(app), users, requests=4, concurrency=2,
+                                      warmup=1, seed_value=1)
+                with pytest.raises(ValueError):
+                    harness.seed(app, 1, 1, "uniform", 1)
+            finally:
+                setup_database.dispose_engines(app)
+                auth_cache.clear()
+
+        assert list(results) == [scenario.name for scenario in harness.SCENARIOS]
+        assert {name: result["errors"] for name, result in results.items() if result["errors"]} == {}
+        assert all(result["requests"] == 4 for result in results.values())
+        assert results["list_items"]["queries_per_request"] >= 1
+        assert results["index"]["queries_per_request"] == 0
+
+
+class TestLoad:
+    """Tests for the mixed-workload load generator."""
+
+    def test_personas_follow_the_mix(self):
+        """Should assign personas in proportion at every stage of the ramp."""
+        personas = load.assign_personas(20, {"reader": 70, "writer": 25, "login": 5})
+
+        assert personas[:4].count("reader") == 3
+        assert [personas.count(name) for name in ("reader", "writer", "login")] == [14, 5, 1]
+
+    def test_mix_is_validated(self):
+        """Should reject unknown personas and an all-zero mix."""
+        assert load.parse_mix("reader=1,login=1") == {"reader": 1.0, "login": 1.0}
+        with pytest.raises(ValueError):
+            load.parse_mix("lurker=5")
+        with pytest.raises(ValueError):
+            load.parse_mix("reader=0")
+
+    @pytest.mark.parametrize("last, reason", [
+        ({"throughput_rps": 105.0}, "throughput"),
+        ({"throughput_rps": 300.0, "error_rate": 0.05}, "error rate"),
+        ({"throughput_rps": 300.0, "p95": 900.0}, "p95"),
+    ])
+    def test_saturation_is_found(self, last, reason):
+        """Should report the first stage that adds too little throughput or breaks a limit."""
+        def stage(concurrency, throughput_rps, error_rate=0.0, p95=10.0):
+            return {"concurrency": concurrency, "throughput_rps": throughput_rps,
+                    "error_rate": error_rate, "latency_ms": {"p95": p95}}
+
+        stages = [stage(1, 50.0), stage(2, 100.0), stage(4, **last)]
+
+        assert load.find_saturation(stages[:2], 500.0, 0.01, 0.10) is None
+        saturation = load.find_saturation(stages, 500.0, 0.01, 0.10)
+        assert saturation["concurrency"] == 4
+        assert saturation["reason"].startswith(reason)
+
+    def test_ramp_reuses_and_refreshes_tokens(self, tmp_path):
+        """Should run every persona, log in again once tokens expire and record a timeline."""
+        import todo_app
+
+        with patch.object(setup_database, "DATABASE_URL", f"sqlite:///{tmp_path / 'load.db'}"), \
+             patch.object(password_hasher, "_hasher", password_hasher.PasswordHasher(4, 1, 4)), \
+             patch("services.user_service.JWT_SECRET", "secret"), \
+             patch("services.user_service.JWT_EXPIRATION_HOURS", 1 / 3600), \
+             patch("services.auth_decorators.JWT_SECRET", "secret"):
+            auth_cache.clear()
+            app = todo_app.create_app()
+            try:
+                users = harness.seed(app, 3, 30, "uniform", 1)
+                report = load.ramp(harness.ClientDriver(app), users, stages=[1, 4], stage_seconds=1.5,
+                                   mix={"reader": 2, "writer": 1, "login": 1}, think_seconds=0.01,
+                                   seed_value=1, latency_slo_ms=10_000, max_error_rate=0.01, min_gain=0.0,
+                                   stop_at_saturation=False)
+            finally:
+                setup_database.dispose_engines(app)
+                auth_cache.clear()
+
+        assert [stage["concurrency"] for stage in report["stages"]] == [1, 4]
+        assert {"poll", "list", "create", "login"} <= set(report["stages"][1]["operations"])
+        assert sum(stage["errors"] for stage in report["stages"]) == 0
+        assert report["tokens"]["expired"] > 0
+        assert report["timeline"][0]["concurrency"] == 1
+        assert report["timeline"][-1]["concurrency"] == 4
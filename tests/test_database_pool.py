@@ -0,0 +1,77 @@
+import pytest
+from unittest.mock import patch
+from sqlalchemy import create_engine, exc, text
+from sqlalchemy.pool import NullPool
+from database import setup_database
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'pool.db'}",
+                           poolclass=setup_database.InstrumentedQueuePool,
+                           pool_size=1, max_overflow=0, pool_timeout=0.05)
+    yield engine
+    engine.dispose()
+
+
+class TestEngineOptions:
+    """Tests for env-driven engine configuration."""
+
+    def test_postgres_pool_options(self):
+        """Should size the instrumented pool and set a connect timeout."""
+        options = setup_database.engine_options("postgresql://user:pw@db/todo")
+
+        assert options["poolclass"] is setup_database.InstrumentedQueuePool
+        assert options["pool_size"] == setup_database.DB_POOL_SIZE
+        assert options["pool_pre_ping"] == setup_database.DB_POOL_PRE_PING
+        assert options["connect_args"] == {"connect_timeout": setup_database.DB_CONNECT_TIMEOUT}
+
+    @pytest.mark.parametrize("url,expected", [
+        ("postgresql+psycopg://user:pw@db/todo", {"prepare_threshold": None}),
+        ("postgresql+asyncpg://user:pw@db/todo",
+         {"statement_cache_size": 0, "prepared_statement_cache_size": 0}),
+    ])
+    def test_pgbouncer_mode_disables_prepared_statements(self, url, expected):
+        """Should turn off server-side prepared statements for the driver in use."""
+        with patch.object(setup_database, "DB_PGBOUNCER", True):
+            connect_args = setup_database.engine_options(url)["connect_args"]
+
+        assert expected.items() <= connect_args.items()
+
+    def test_zero_pool_size_disables_pooling(self):
+        """Should fall back to NullPool when DB_POOL_SIZE is 0."""
+        with patch.object(setup_database, "DB_POOL_SIZE", 0):
+            options = setup_database.engine_options("postgresql://user:pw@db/todo")
+
+        assert options["poolclass"] is NullPool
+        assert "pool_size" not in options
+
+    def test_in_memory_sqlite_keeps_defaults(self):
+        """Should leave the single-connection in-memory pool untouched."""
+        assert setup_database.engine_options("sqlite://") == {}
+
+
+class TestInstrumentedQueuePool:
+    """Tests for connection pool metrics."""
+
+    def test_counts_checkouts_and_timeouts(self, engine):
+        """Should record every checkout and each wait that ran out of time."""
+        with engine.connect() as held:
+            held.execute(text("SELECT 1"))
+            with pytest.raises(exc.TimeoutError):
+                engine.connect()
+
+        stats = engine.pool.stats()
+        assert stats["checkouts"] == 2
+        assert stats["timeouts"] == 1
+        assert stats["wait_seconds_max"] >= 0.05
+        assert stats["checked_out"] == 0
+
+    def test_dispose_keeps_instrumentation(self, engine):
+        """Should give a recreated pool (e.g. after fork) fresh counters."""
+        engine.connect().close()
+
+        engine.dispose(close=False)
+
+        assert isinstance(engine.pool, setup_database.InstrumentedQueuePool)
+        assert engine.pool.stats()["checkouts"] == 0
@@ -0,0 +1,167 @@
+import socket
+import pytest
+from unittest.mock import patch
+from database import setup_database
+from services import auth_cache, events, password_hasher, serializer, todo_service
+
+
+@pytest.fixture
+def broker():
+    broker = events.EventBroker(events.EventBackend(), max_connections=2, queue_size=3)
+    yield broker
+    broker.shutdown()
+
+
+class TestEventBroker:
+    """Tests for the in-process event fan-out."""
+
+    def test_events_reach_only_that_users_subscribers(self, broker):
+        """Should deliver an event to every subscriber of the user and nobody else."""
+        first = broker.subscribe("user_1")
+        second = broker.subscribe("user_1")
+
+        broker.publish("user_1", {"type": "item.created", "ids": ["item_1"]})
+
+        assert first.get(0) == {"type": "item.created", "ids": ["item_1"]}
+        assert second.get(0) == {"type": "item.created", "ids": ["item_1"]}
+        assert broker.stats() == {"subscribers": 2, "users": 1}
+
+    def test_slow_subscriber_gets_resync(self, broker):
+        """Should replace a full backlog with a single resync event."""
+        subscription = broker.subscribe("user_1")
+
+        for index in range(4):
+            broker.publish("user_1", {"type": "item.updated", "ids": [str(index)]})
+
+        assert subscription.get(0) == events.RESYNC_EVENT
+        assert subscription.get(0) is None
+
+    def test_connection_limit(self, broker):
+        """Should refuse subscribers beyond max_connections until one closes."""
+        first = broker.subscribe("user_1")
+        broker.subscribe("user_2")
+
+        with pytest.raises(events.TooManySubscribersError):
+            broker.subscribe("user_3")
+
+        first.close()
+        assert broker.subscribe("user_3").user_id == "user_3"
+
+    def test_mutation_publishes_event(self):
+        """Should publish a change event after a successful update."""
+        with patch("services.todo_service.repo") as mock_repo, \
+             patch("services.todo_service.events") as mock_events:
+            mock_repo.update_item.return_value = {"id": "item_1"}
+
+            todo_service.update_todo("item_1", "Updated", None, None, "user_1")
+
+            mock_events.publish.assert_called_once_with(
+                "user_1", {"type": "item.updated", "ids": ["item_1"]})
+
+    def test_failed_mutation_publishes_nothing(self):
+        """Should stay quiet when the repository changed nothing."""
+        with patch("services.todo_service.repo") as mock_repo, \
+             patch("services.todo_service.events") as mock_events:
+            mock_repo.delete_item.return_value = None
+            mock_repo.get_item_by_id.return_value = None
+
+            todo_service.delete_todo("item_1", "user_1")
+
+            mock_events.publish.assert_not_called()
+
+    def test_close_all_ends_open_streams(self, broker):
+        """Should end every open stream so a draining worker can exit."""
+        subscription = broker.subscribe("user_1")
+
+        broker.close_all()
+
+        assert subscription.closed
+        assert subscription.get(5) is None
+        assert broker.stats() == {"subscribers": 0, "users": 0}
+
+
+class TestUnixSocketBackend:
+    """Tests for the cross-process datagram backend."""
+
+    def test_event_crosses_to_other_broker(self, tmp_path):
+        """Should deliver an event published by one process to the others."""
+        publisher = events.EventBroker(events.UnixSocketBackend(str(tmp_path)), 10, 10)
+        receiver = events.EventBroker(events.UnixSocketBackend(str(tmp_path)), 10, 10)
+        try:
+            subscription = receiver.subscribe("user_1")
+
+            publisher.publish("user_1", {"type": "item.deleted", "ids": ["item_1"]})
+
+            assert subscription.get(5) == {"type": "item.deleted", "ids": ["item_1"]}
+        finally:
+            publisher.shutdown()
+            receiver.shutdown()
+
+    def test_stale_socket_is_removed(self, tmp_path):
+        """Should drop sockets left behind by processes that exited."""
+        # Bound and closed with no thread still in recv(), as an exited
+        # process leaves it; sends to it are refused.
+        stale_path = tmp_path / "1-deadbeef.sock"
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        stale.bind(str(stale_path))
+        stale.close()
+
+        publisher = events.EventBroker(events.UnixSocketBackend(str(tmp_path)), 10, 10)
+        try:
+            publisher.publish("user_1", {"type": "items.changed"})
+
+            assert not stale_path.exists()
+        finally:
+            publisher.shutdown()
+
+
+class TestSseFormat:
+    """Tests for Server-Sent Events framing."""
+
+    def test_message_frame(self):
+        """Should frame an event name and JSON data, terminated by a blank line."""
+        frame = serializer.sse_message({"type": "resync"}, event="resync")
+
+        assert frame == b'event: resync\ndata: {"type":"resync"}\n\n'
+
+
+class TestStreamSupport:
+    """Tests for refusing event streams on workers that would hold a thread per stream."""
+
+    @pytest.mark.parametrize("setting, asynchronous, expected", [
+        ("auto", False, False),
+        ("auto", True, True),
+        ("on", False, True),
+        ("off", True, False),
+    ])
+    def test_streams_supported(self, setting, asynchronous, expected):
+        """Should allow streams on the ASGI app and when forced, not on a threaded worker."""
+        with patch.object(events, "EVENTS_STREAMS", setting):
+            assert events.streams_supported(asynchronous) is expected
+
+    def test_threaded_worker_tells_clients_to_poll(self, database_url):
+        """Should advertise no streams in /health and refuse /user/items/events without holding it open."""
+        import todo_app
+
+        with patch.object(setup_database, "DATABASE_URL", database_url), \
+             patch.object(password_hasher, "_hasher", password_hasher.PasswordHasher(4, 1, 4)), \
+             patch("services.user_service.JWT_SECRET", "secret"), \
+             patch("services.auth_decorators.JWT_SECRET", "secret"), \
+             patch.object(events, "EVENTS_STREAMS", "auto"):
+            auth_cache.clear()
+            app = todo_app.create_app()
+            try:
+                client = app.test_client()
+                client.post("/register", json={"email": "user@example.com", "password": "secret"})
+                token = client.post("/login", json={"email": "user@example.com",
+                                                     "password": "secret"}).get_json()["user"]["token"]
+
+                health = client.get("/health").get_json()
+                response = client.get("/user/items/events", headers={"Authorization": f"Bearer {token}"})
+            finally:
+                setup_database.dispose_engines(app)
+                auth_cache.clear()
+
+        assert health["event_streams"] is False
+        assert response.status_code == 501
+        assert response.get_json()["error"] == events.STREAMS_UNAVAILABLE_ERROR
@@ -0,0 +1,198 @@
+import json
+import re
+import time
+import pytest
+from unittest.mock import patch
+from database import setup_database
+from services import auth_cache, metrics, password_hasher
+from services.cache import TTLCache
+
+
+def _sample(text, name, **labels):
+    # Value of one sample in the exposition text, or None.
+    wanted = ",".join(f'{key}="{value}"' for key, value in labels.items())
+    pattern = "^" + re.escape(name + (f"{{{wanted}}}" if labels else "")) + r" (\S+)$"
+    match = re.search(pattern, text, re.MULTILINE)
+    return float(match.group(1)) if match else None
+
+
+@pytest.fixture(autouse=True)
+def registry():
+    """A fresh registry for every test."""
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+@pytest.fixture
+def app_patches():
+    """Low bcrypt cost and a fixed JWT secret."""
+    return [patch.object(password_hasher, "_hasher", password_hasher.PasswordHasher(4, 1, 4)),
+            patch("services.user_service.JWT_SECRET", "secret"),
+            patch("services.auth_decorators.JWT_SECRET", "secret")]
+
+
+@pytest.fixture
+def client(app):
+    """Flask test client with a registered user, and that user's auth header."""
+    client = app.test_client()
+    client.post("/register", json={"email": "user@example.com", "password": "secret"})
+    token = client.post("/login", json={"email": "user@example.com",
+                                         "password": "secret"}).get_json()["user"]["token"]
+    metrics.reset()
+    return client, {"Authorization": f"Bearer {token}"}
+
+
+class TestRegistry:
+    """Tests for collecting and rendering request metrics."""
+
+    def test_histograms_are_cumulative(self):
+        """Should render cumulative buckets with a matching count and sum."""
+        for queries in (0, 2, 7):
+            metrics.start_request("GET")
+            for _ in range(queries):
+                metrics.record_query(0.001)
+            metrics.finish_request("/items", 200)
+
+        text = metrics.render().decode()
+
+        assert _sample(text, "http_requests_total", route="/items", method="GET", status="200") == 3
+        assert _sample(text, "db_queries_per_request_bucket", route="/items", le="0") == 1
+        assert _sample(text, "db_queries_per_request_bucket", route="/items", le="5") == 2
+        assert _sample(text, "db_queries_per_request_bucket", route="/items", le="+Inf") == 3
+        assert _sample(text, "db_queries_per_request_sum", route="/items") == 9
+        assert _sample(text, "db_query_duration_seconds_total", route="/items") == pytest.approx(0.009)
+        assert _sample(text, "http_request_duration_seconds_count", route="/items", method="GET") == 3
+        assert _sample(text, "http_requests_in_flight") == 0
+
+    def test_finish_is_idempotent(self):
+        """Should count a request once however often it is finished."""
+        metrics.start_request("GET")
+        metrics.finish_request("/items", 200)
+        metrics.finish_request("/items", 500)
+
+        text = metrics.render().decode()
+
+        assert _sample(text, "http_requests_total", route="/items", method="GET", status="200") == 1
+        assert _sample(text, "http_requests_total", route="/items", method="GET", status="500") is None
+
+    def test_labels_are_escaped(self):
+        """Should escape quotes and backslashes in label values."""
+        metrics.start_request("GET")
+        metrics.finish_request('/a"b\\c', 200)
+
+        assert 'route="/a\\"b\\\\c"' in metrics.render().decode()
+
+    def test_workers_are_added_up(self, tmp_path):
+        """Should sum every worker's snapshot and ignore in-flight requests of exited ones."""
+        with patch.object(metrics, "METRICS_DIR", str(tmp_path)):
+            metrics.start_request("GET")
+            metrics.finish_request("/items", 200)
+            metrics.start_request("GET")
+            metrics.write_snapshot()
+            # An exited worker that had counted two requests and had one in flight.
+            snapshot = metrics._registry.snapshot()
+            snapshot.update(pid=2 ** 22 + 1, in_flight=1,
+                            requests=[["/items", "GET", "200", 2]])
+            with open(tmp_path / "worker-dead.json", "w") as f:
+                json.dump(snapshot, f)
+
+            text = metrics.render().decode()
+
+        assert _sample(text, "http_requests_total", route="/items", method="GET", status="200") == 3
+        assert _sample(text, "http_requests_in_flight") == 1
+
+    def test_cache_stats_are_exported_and_added_up(self, tmp_path):
+        """Should export registered caches' counters summed over workers, with no entries for exited ones."""
+        cache = TTLCache(10, 60)
+        cache.put("key", "value")
+        cache.get("key")
+        cache.get("other")
+
+        with patch.object(metrics, "_caches", {"things": cache}), \
+             patch.object(metrics, "METRICS_DIR", str(tmp_path)):
+            metrics.write_snapshot()
+            snapshot = metrics._registry.snapshot()
+            snapshot.update(pid=2 ** 22 + 1, caches=[["things", {"hits": 4, "misses": 1, "evictions": 2,
+                                                                 "size": 9}]])
+            with open(tmp_path / "worker-dead.json", "w") as f:
+                json.dump(snapshot, f)
+
+            text = metrics.render().decode()
+
+        assert "# TYPE cache_hits_total counter" in text
+        assert _sample(text, "cache_hits_total", cache="things") == 5
+        assert _sample(text, "cache_misses_total", cache="things") == 2
+        assert _sample(text, "cache_evictions_total", cache="things") == 2
+        assert _sample(text, "cache_entries", cache="things") == 1
+
+    def test_collection_overhead(self):
+        """Should cost a few microseconds per request, queries included."""
+        rounds = 20000
+        started = time.perf_counter()
+        for _ in range(rounds):
+            metrics.start_request("GET")
+            metrics.record_query(0.0001)
+            metrics.finish_request("/items", 200)
+        per_request = (time.perf_counter() - started) / rounds
+
+        # Generous bound so a busy CI machine does not fail it.
+        assert per_request < 50e-6
+
+
+class TestFlaskMetrics:
+    """Tests for the /metrics endpoint of the Flask app."""
+
+    def test_requests_are_attributed_to_routes(self, client):
+        """Should count requests and their queries under the route template."""
+        client, auth = client
+        item = client.post("/user/items", json={"title": "Title"}, headers=auth).get_json()["item"]
+        client.get(f"/user/items/{item['id']}", headers=auth)
+        client.get("/user/items/missing", headers=auth)
+        client.get("/nowhere")
+
+        response = client.get("/metrics")
+        text = response.get_data(as_text=True)
+
+        assert response.headers["Content-Type"] == metrics.CONTENT_TYPE
+        assert _sample(text, "http_requests_total", route="/user/items", method="POST", status="201") == 1
+        assert _sample(text, "http_requests_total", route="/user/items/<item_id>", method="GET", status="200") == 1
+        assert _sample(text, "http_requests_total", route="/user/items/<item_id>", method="GET", status="404") == 1
+        assert _sample(text, "http_requests_total", route="<unmatched>", method="GET", status="404") == 1
+        assert _sample(text, "db_queries_per_request_sum", route="/user/items") >= 2
+        assert _sample(text, "db_query_duration_seconds_total", route="/user/items") > 0
+        # The scrape itself is in flight while rendering.
+        assert _sample(text, "http_requests_in_flight") == 1
+
+    def test_auth_cache_hits_are_exported(self, client):
+        """Should count the auth cache's hits and misses as authenticated requests come in."""
+        client, auth = client
+        auth_cache.clear()
+        for _ in range(3):
+            client.get("/user/items/stats", headers=auth)
+
+        text = client.get("/metrics").get_data(as_text=True)
+
+        assert _sample(text, "cache_misses_total", cache="auth_token") == 1
+        assert _sample(text, "cache_hits_total", cache="auth_token") == 2
+        assert _sample(text, "cache_entries", cache="auth_user") == 1
+
+
+class TestAsgiMetrics:
+    """Tests for the /metrics endpoint of the ASGI app."""
+
+    def test_requests_are_attributed_to_routes(self, database_url):
+        """Should count requests and the async engine's queries under the route template."""
+        import asgi_app
+        from starlette.testclient import TestClient
+
+        with patch.object(setup_database, "DATABASE_URL", database_url), \
+             patch.object(password_hasher, "_hasher", password_hasher.PasswordHasher(4, 1, 4)):
+            with TestClient(asgi_app.create_app()) as client:
+                client.post("/register", json={"email": "user@example.com", "password": "secret"})
+                client.get("/user/items/abc")
+                text = client.get("/metrics").text
+
+        assert _sample(text, "http_requests_total", route="/register", method="POST", status="201") == 1
+        assert _sample(text, "http_requests_total", route="/user/items/{item_id}", method="GET", status="401") == 1
+        assert _sample(text, "db_queries_per_request_sum", route="/register") >= 2
@@ -0,0 +1,178 @@
+import pytest
+from unittest.mock import MagicMock
+from sqlalchemy import create_engine, inspect, text
+from database import migrations
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'migrations.db'}")
+    yield engine
+    engine.dispose()
+
+
+class TestMigrationRunner:
+    """Tests for the versioned schema migration runner."""
+
+    def test_upgrade_fresh_database(self, engine):
+        """Should create the schema and record every migration."""
+        applied = migrations.upgrade(engine)
+
+        assert applied == [migration.version for migration in migrations.MIGRATIONS]
+        assert {"users", "items", "schema_migrations"} <= set(inspect(engine).get_table_names())
+
+    def test_upgrade_is_idempotent(self, engine):
+        """Should apply nothing on a second run."""
+        migrations.upgrade(engine)
+
+        assert migrations.upgrade(engine) == []
+        assert migrations.pending_migrations(engine) == []
+
+    def test_access_indexes_exist(self, engine):
+        """Should create the composite indexes used by item list queries."""
+        migrations.upgrade(engine)
+
+        indexes = {index["name"]: index["column_names"]
+                   for index in inspect(engine).get_indexes("items")}
+        assert indexes["ix_items_user_status_timestamp"] == ["user_id", "status", "timestamp", "id"]
+
+    def test_delta_sync_schema(self, engine):
+        """Should add updated_at and change_version to items and create tombstones."""
+        migrations.upgrade(engine)
+
+        inspector = inspect(engine)
+        columns = [col["name"] for col in inspector.get_columns("items")]
+        assert {"updated_at", "change_version"} <= set(columns)
+        assert "item_tombstones" in inspector.get_table_names()
+
+    def test_search_index_follows_item_writes(self, engine):
+        """Should keep the SQLite FTS table in step with inserts, updates and deletes."""
+        migrations.upgrade(engine)
+
+        with engine.begin() as conn:
+            conn.execute(text("INSERT INTO users (id, email, password_hash, created_at) "
+                              "VALUES ('u1', 'a@b.co', 'x', CURRENT_TIMESTAMP)"))
+            conn.execute(text("INSERT INTO items (id, title, description, status, timestamp, user_id, "
+                              "updated_at) VALUES ('i1', 'Buy milk', '', 'ToDo', CURRENT_TIMESTAMP, "
+                              "'u1', CURRENT_TIMESTAMP)"))
+            conn.execute(text("UPDATE items SET title = 'Buy bread' WHERE id = 'i1'"))
+
+            def matches(term):
+                return conn.execute(text("SELECT COUNT(*) FROM items_fts WHERE items_fts MATCH :term"),
+                                    {"term": term}).scalar()
+
+            assert matches("milk") == 0
+            assert matches("bread") == 1
+
+            conn.execute(text("DELETE FROM items WHERE id = 'i1'"))
+            assert matches("bread") == 0
+
+    def test_command_line(self, tmp_path, monkeypatch, capsys):
+        """Should report pending migrations, apply them, then report them applied."""
+        monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'cli.db'}")
+
+        assert migrations.main(["status"]) == 0
+        before = capsys.readouterr().out
+        assert migrations.main(["upgrade"]) == 0
+        assert migrations.main(["status"]) == 0
+        after = capsys.readouterr().out
+
+        assert before.count("pending") == after.count("applied") == len(migrations.MIGRATIONS)
+
+    def test_command_line_needs_database_url(self, monkeypatch):
+        """Should fail without DATABASE_URL."""
+        monkeypatch.delenv("DATABASE_URL", raising=False)
+
+        assert migrations.main(["upgrade"]) == 1
+
+    def test_legacy_items_table_gets_user_id(self, engine):
+        """Should add user_id to an items table created before users existed."""
+        with engine.begin() as conn:
+            conn.execute(text("CREATE TABLE items (id VARCHAR(36) PRIMARY KEY, title VARCHAR(200) NOT NULL, "
+                              "description TEXT, status VARCHAR(20) NOT NULL, timestamp DATETIME NOT NULL)"))
+
+        migrations.upgrade(engine)
+
+        columns = [col["name"] for col in inspect(engine).get_columns("items")]
+        assert "user_id" in columns
+
+
+class _PostgresConnection:
+    """Records statements and answers index validity checks and item id batches from a script."""
+
+    class dialect:
+        name = "postgresql"
+
+    def __init__(self, validity, id_batches=()):
+        self.validity = list(validity)
+        self.id_batches = list(id_batches)
+        self.statements = []
+        self.parameters = []
+
+    def execute(self, statement, parameters=None):
+        sql = str(statement)
+        if "indisvalid" in sql:
+            return MagicMock(scalar=MagicMock(return_value=self.validity.pop(0)))
+        if sql.startswith("SELECT id FROM items"):
+            batch = self.id_batches.pop(0) if self.id_batches else []
+            return MagicMock(scalars=MagicMock(return_value=MagicMock(all=MagicMock(return_value=batch))))
+        self.statements.append(" ".join(sql.split()))
+        self.parameters.append(parameters)
+        return MagicMock(rowcount=0)
+
+
+class TestConcurrentIndexes:
+    """Tests for building Postgres indexes CONCURRENTLY."""
+
+    def test_invalid_leftover_is_rebuilt(self):
+        """Should drop an INVALID index from a failed build and create it again."""
+        conn = _PostgresConnection([False, True])
+
+        migrations.create_index(conn, "ix_items_user_status", "items", ("user_id", "status"))
+
+        assert conn.statements == [
+            "DROP INDEX CONCURRENTLY IF EXISTS ix_items_user_status",
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_items_user_status ON items (user_id, status)"]
+
+    def test_missing_index_is_built(self):
+        """Should build a missing index without dropping anything."""
+        conn = _PostgresConnection([None, True])
+
+        migrations.create_index(conn, "ix_items_search_vector", "items", ("search_vector",), using="GIN")
+
+        assert conn.statements == [
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_items_search_vector ON items USING GIN (search_vector)"]
+
+    def test_index_still_invalid_fails_the_migration(self):
+        """Should raise, so the migration is not recorded, when the index is unusable after the build."""
+        conn = _PostgresConnection([True, False])
+
+        with pytest.raises(RuntimeError):
+            migrations.create_index(conn, "ix_items_user_status", "items", ("user_id", "status"))
+
+
+class TestPostgresSearchMigration:
+    """Tests for adding the Postgres search vector without rewriting items."""
+
+    def test_column_is_plain_and_filled_by_a_trigger(self):
+        """Should add a nullable tsvector column and a trigger instead of a generated column."""
+        conn = _PostgresConnection([])
+
+        migrations._items_search(conn)
+
+        assert conn.statements[0] == "ALTER TABLE items ADD COLUMN IF NOT EXISTS search_vector tsvector"
+        assert not any("GENERATED" in sql for sql in conn.statements)
+        assert conn.statements[-1] == ("CREATE TRIGGER items_search_vector_update BEFORE INSERT OR UPDATE OF "
+                                       "title, description ON items FOR EACH ROW EXECUTE FUNCTION "
+                                       "items_search_vector_update()")
+
+    def test_backfill_runs_in_batches_before_the_index(self):
+        """Should fill existing rows one primary key range at a time, then build the GIN index."""
+        conn = _PostgresConnection([None, True], id_batches=[["a", "b"], ["c"]])
+
+        migrations._items_search_index(conn)
+
+        assert [sql.split(" SET ")[0] for sql in conn.statements] == [
+            "UPDATE items", "UPDATE items",
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_items_search_vector ON items USING GIN (search_vector)"]
+        assert conn.parameters[:2] == [{"first_id": "a", "last_id": "b"}, {"first_id": "c", "last_id": "c"}]
@@ -0,0 +1,85 @@
+import threading
+import pytest
+from unittest.mock import patch
+from services import password_hasher, user_service
+
+
+class TestPasswordHasher:
+    """Tests for the bounded bcrypt executor."""
+
+    def test_hash_and_verify(self):
+        """Should verify a password against its own hash."""
+        hasher = password_hasher.PasswordHasher(rounds=4, max_workers=1, max_queue=1)
+        hashed = hasher.hash("password123")
+
+        assert hasher.verify("password123", hashed)
+        assert not hasher.verify("wrong", hashed)
+
+    def test_rejects_work_over_capacity(self):
+        """Should fail fast once workers and queue slots are all taken."""
+        hasher = password_hasher.PasswordHasher(rounds=4, max_workers=1, max_queue=0)
+        release = threading.Event()
+        started = threading.Event()
+
+        def slow_job():
+            started.set()
+            release.wait(5)
+
+        worker = threading.Thread(target=hasher._run, args=(slow_job,))
+        worker.start()
+        started.wait(5)
+        try:
+            with pytest.raises(password_hasher.HasherBusyError):
+                hasher.hash("password123")
+        finally:
+            release.set()
+            worker.join()
+
+        assert hasher.hash("password123")
+
+    @pytest.mark.parametrize("rounds,expected", [
+        (4, False),
+        (5, True),
+    ])
+    def test_needs_rehash_on_cost_change(self, rounds, expected):
+        """Should flag hashes made with a different cost factor."""
+        hashed = password_hasher.PasswordHasher(rounds=4, max_workers=1, max_queue=1).hash("pw")
+        hasher = password_hasher.PasswordHasher(rounds=rounds, max_workers=1, max_queue=1)
+
+        assert hasher.needs_rehash(hashed) == expected
+
+    def test_child_process_builds_its_own_pool(self):
+        """Should drop the parent's executor after a fork."""
+        with patch.object(password_hasher, "_hasher", object()):
+            password_hasher._reset_after_fork()
+
+            assert password_hasher._hasher is None
+
+
+class TestRehashOnLogin:
+    """Tests for transparent rehashing after a successful login."""
+
+    def test_outdated_hash_is_upgraded(self):
+        """Should store a new hash when the configured cost changed."""
+        old_hash = password_hasher.PasswordHasher(rounds=4, max_workers=1, max_queue=1).hash("pw")
+        hasher = password_hasher.PasswordHasher(rounds=5, max_workers=1, max_queue=1)
+
+        with patch("services.user_service.repo") as mock_repo, \
+             patch("services.password_hasher._hasher", hasher):
+            user_service._rehash_if_needed("user_1", "pw", old_hash)
+
+            mock_repo.update_user.assert_called_once()
+            new_hash = mock_repo.update_user.call_args[0][1]["password_hash"]
+            assert not hasher.needs_rehash(new_hash)
+
+    def test_busy_hasher_reports_busy_error(self):
+        """Should surface a busy hasher as the retryable error."""
+        with patch("services.user_service.repo") as mock_repo, \
+             patch("services.user_service._hash_password",
+                   side_effect=password_hasher.HasherBusyError()):
+            mock_repo.email_exists.return_value = False
+
+            user, error = user_service.register_user("test@example.com", "password123")
+
+            assert user is None
+            assert error == user_service.BUSY_ERROR
@@ -0,0 +1,136 @@
+import pstats
+import time
+import pytest
+from contextlib import ExitStack
+from unittest.mock import patch
+from services import auth_cache, auth_decorators, password_hasher, profiling
+
+
+def _login(client, email):
+    client.post("/register", json={"email": email, "password": "secret"})
+    user = client.post("/login", json={"email": email, "password": "secret"}).get_json()["user"]
+    return {"Authorization": f"Bearer {user['token']}"}, user["user info"]["id"]
+
+
+@pytest.fixture
+def app_patches():
+    """Low bcrypt cost, a fixed JWT secret and one admin."""
+    auth_cache.clear()
+    yield [patch.object(password_hasher, "_hasher", password_hasher.PasswordHasher(4, 1, 4)),
+           patch("services.user_service.JWT_SECRET", "secret"),
+           patch.object(auth_decorators, "JWT_SECRET", "secret"),
+           patch.object(auth_decorators, "ADMIN_EMAILS", frozenset({"admin@example.com"}))]
+    auth_cache.clear()
+
+
+@pytest.fixture
+def make_client(make_app, tmp_path):
+    """Builds a Flask test client under the given profiling settings."""
+    with ExitStack() as stack:
+
+        def make(**settings):
+            settings.setdefault("PROFILE_DIR", str(tmp_path / "profiles"))
+            for name, value in settings.items():
+                stack.enter_context(patch.object(profiling, name, value))
+            return make_app().test_client()
+
+        yield make
+
+
+class TestProfileTokens:
+    """Tests for the signed X-Profile-Token header."""
+
+    def test_token_round_trip(self):
+        """Should accept its own tokens and reject tampered, expired or unsigned ones."""
+        with patch.object(profiling, "PROFILE_SECRET", "profile-secret"):
+            token = profiling.make_token(60)
+            expires, signature = token.split(".")
+
+            assert profiling.token_valid(token)
+            assert not profiling.token_valid(f"{int(expires) + 60}.{signature}")
+            assert not profiling.token_valid(f"{expires}.{'0' * len(signature)}")
+            assert not profiling.token_valid(profiling.make_token(-1))
+            assert not profiling.token_valid("garbage")
+
+        with patch.object(profiling, "PROFILE_SECRET", None):
+            assert not profiling.token_valid(token)
+            with pytest.raises(ValueError):
+                profiling.make_token(60)
+
+    def test_sampling_is_limited_to_routes(self):
+        """Should only sample the configured route templates."""
+        with patch.object(profiling, "PROFILE_SAMPLE_RATE", 1.0), \
+             patch.object(profiling, "PROFILE_ROUTES", frozenset({"/user/items"})):
+            assert profiling.trigger_for("/user/items", None) == "sample"
+            assert profiling.trigger_for("/health", None) is None
+
+
+class TestFlaskProfiling:
+    """Tests for profiling requests of the Flask app."""
+
+    def test_disabled_installs_no_hooks(self, make_client):
+        """Should leave requests untouched when profiling is off."""
+        client = make_client(PROFILE_SECRET=None, PROFILE_SAMPLE_RATE=0)
+        hooks = [hook.__name__ for hook in client.application.before_request_funcs[None]]
+
+        assert "start_profile" not in hooks
+        client.get("/health", headers={profiling.PROFILE_HEADER: "1.abc"})
+        assert profiling.list_profiles() == []
+
+    def test_token_profiles_request(self, make_client):
+        """Should save a pstats capture with the route and user of a request carrying a token."""
+        client = make_client(PROFILE_SECRET="profile-secret", PROFILE_SAMPLE_RATE=0)
+        auth, user_id = _login(client, "user@example.com")
+        client.post("/user/items", json={"title": "Title"}, headers=auth)
+        client.get("/user/items", headers=auth)
+
+        assert profiling.list_profiles() == []
+
+        response = client.get("/user/items?limit=5",
+                              headers={**auth, profiling.PROFILE_HEADER: profiling.make_token(60)})
+        profiles = profiling.list_profiles()
+
+        assert response.status_code == 200
+        assert len(profiles) == 1
+        assert profiles[0]["route"] == "/user/items"
+        assert profiles[0]["path"] == "/user/items?limit=5"
+        assert profiles[0]["user_id"] == user_id
+        assert profiles[0]["status"] == 200
+        assert profiles[0]["trigger"] == "token"
+        stats = pstats.Stats(profiling.profile_path(profiles[0]["id"]))
+        assert any(name == "get_todos" for _, _, name in stats.stats)
+
+    def test_slow_samples_are_kept(self, make_client):
+        """Should drop sampled requests faster than PROFILE_MIN_MS and keep at most PROFILE_MAX_FILES."""
+        client = make_client(PROFILE_SAMPLE_RATE=1.0, PROFILE_MIN_MS=60_000)
+        client.get("/health")
+        assert profiling.list_profiles() == []
+
+        with patch.object(profiling, "PROFILE_MIN_MS", 0), patch.object(profiling, "PROFILE_MAX_FILES", 2):
+            for _ in range(3):
+                client.get("/health")
+                time.sleep(0.002)
+            profiles = profiling.list_profiles()
+
+        assert len(profiles) == 2
+        assert {profile["trigger"] for profile in profiles} == {"sample"}
+
+    def test_admins_list_and_download(self, make_client):
+        """Should let admins list and download captures, and nobody else."""
+        client = make_client(PROFILE_SECRET="profile-secret", PROFILE_SAMPLE_RATE=0)
+        admin, _ = _login(client, "admin@example.com")
+        user, _ = _login(client, "user@example.com")
+        client.get("/health", headers={profiling.PROFILE_HEADER: profiling.make_token(60)})
+
+        listing = client.get("/admin/profiles", headers=admin)
+        profile_id = listing.get_json()["profiles"][0]["id"]
+        download = client.get(f"/admin/profiles/{profile_id}", headers=admin)
+
+        assert listing.status_code == 200
+        assert download.status_code == 200
+        assert download.headers["Content-Disposition"] == f"attachment; filename={profile_id}.prof"
+        assert download.data == open(profiling.profile_path(profile_id), "rb").read()
+        assert client.get("/admin/profiles", headers=user).status_code == 403
+        assert client.get(f"/admin/profiles/{profile_id}", headers=user).status_code == 403
+        assert client.get("/admin/profiles").status_code == 401
+        assert client.get("/admin/profiles/..%2Fapp", headers=admin).status_code == 404
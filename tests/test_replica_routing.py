@@ -0,0 +1,136 @@
+import pytest
+from datetime import datetime, timezone
+from unittest.mock import patch
+from sqlalchemy import create_engine, text
+from database import routing, setup_database
+from repositories import todo_repository, user_repository
+
+
+def _insert_user(url, user_id, email):
+    engine = create_engine(url)
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO users (id, email, password_hash, created_at) "
+                          "VALUES (:id, :email, 'hash', :now)"),
+                     {"id": user_id, "email": email, "now": datetime.now(timezone.utc)})
+    engine.dispose()
+
+
+@pytest.fixture
+def database_url(migrated_url):
+    """Primary database, a separate SQLite file from the replica."""
+    primary = migrated_url("primary.db")
+    _insert_user(primary, "user_1", "user@example.com")
+    return primary
+
+
+@pytest.fixture
+def app_patches(migrated_url):
+    """One replica with the same user as the primary, and a cookie secret."""
+    replica = migrated_url("replica.db")
+    _insert_user(replica, "user_1", "user@example.com")
+    routing._recent_writers.clear()
+    return [patch.object(routing, "DATABASE_REPLICA_URLS", [replica]),
+            patch.object(routing, "REPLICA_STICKY_SECRET", "secret")]
+
+
+def _create_item(item_id, title):
+    return todo_repository.create_item(item_id, title, None, "ToDo",
+                                       datetime.now(timezone.utc), "user_1")
+
+
+class TestReplicaRouting:
+    """Tests for sending reads to replicas and writes to the primary."""
+
+    def test_reads_go_to_replica(self, app):
+        """Should serve a user's reads from the replica until they write."""
+        # A row only the replica has, so the answer shows where it came from.
+        engine = create_engine(routing.DATABASE_REPLICA_URLS[0])
+        with engine.begin() as conn:
+            conn.execute(text(
+                "INSERT INTO items (id, title, status, timestamp, user_id, version, change_version) "
+                "VALUES ('replicated', 'From replica', 'ToDo', '2026-01-01', 'user_1', 1, 0)"))
+        engine.dispose()
+
+        with app.app_context():
+            items, _ = todo_repository.get_items_page("user_1")
+
+            assert [item["id"] for item in items] == ["replicated"]
+
+    def test_writes_go_to_primary_and_stick(self, app):
+        """Should write to the primary and read the user's own writes back from it."""
+        with app.app_context():
+            assert _create_item("item_1", "Written")
+
+            items, _ = todo_repository.get_items_page("user_1")
+
+            assert [item["id"] for item in items] == ["item_1"]
+            assert todo_repository.get_change_version("user_1")[0] == 1
+
+    def test_stickiness_expires(self, app):
+        """Should go back to the replica once the sticky window has passed."""
+        with app.app_context():
+            _create_item("item_1", "Written")
+            routing._recent_writers.invalidate("user_1")
+
+            items, _ = todo_repository.get_items_page("user_1")
+
+            assert items == []
+
+    def test_write_cookie_pins_reads_on_other_workers(self, app):
+        """Should keep a writer's reads on the primary when another worker gets its signed cookie."""
+        with app.test_request_context("/user/items", method="POST"):
+            _create_item("item_1", "Written")
+            response = routing.remember_write(app.make_response("created"))
+        cookie = response.headers["Set-Cookie"].split(";")[0]
+        # The next request lands on a worker that did not see the write.
+        routing._recent_writers.clear()
+
+        def item_ids(headers=None):
+            with app.test_request_context("/user/items", headers=headers):
+                items, _ = todo_repository.get_items_page("user_1")
+                return [item["id"] for item in items]
+
+        assert cookie.startswith(f"{routing.REPLICA_STICKY_COOKIE}=")
+        assert item_ids({"Cookie": cookie}) == ["item_1"]
+        assert item_ids() == []
+        assert item_ids({"Cookie": cookie.replace(".", "9.", 1)}) == []
+        with patch.object(routing, "REPLICA_STICKY_SECONDS", 0):
+            assert item_ids({"Cookie": cookie}) == []
+
+    def test_write_cookie_only_pins_its_user(self, app):
+        """Should ignore another user's cookie."""
+        with app.test_request_context("/user/items", method="POST"):
+            _create_item("item_1", "Written")
+            response = routing.remember_write(app.make_response("created"))
+        routing._recent_writers.clear()
+
+        with app.test_request_context("/", headers={"Cookie": response.headers["Set-Cookie"].split(";")[0]}):
+            assert routing.on_replica(routing.read_session("user_2"))
+            assert not routing.on_replica(routing.read_session("user_1"))
+
+    def test_replica_miss_falls_back_to_primary(self, app):
+        """Should find a just-created row on the primary when the replica lacks it."""
+        with app.app_context():
+            _create_item("item_1", "Written")
+            routing._recent_writers.invalidate("user_1")
+            _insert_user(setup_database.DATABASE_URL, "user_2", "new@example.com")
+
+            assert todo_repository.get_item_by_id("item_1", "user_1")["title"] == "Written"
+            assert user_repository.get_user_by_id("user_2")["email"] == "new@example.com"
+
+    def test_newer_sync_token_is_served_by_primary(self, app):
+        """Should not report a token from a newer copy than the replica as expired."""
+        with app.app_context():
+            _create_item("item_1", "Written")
+            _create_item("item_2", "Written too")
+            routing._recent_writers.invalidate("user_1")
+
+            changes = todo_repository.get_changes_since("user_1", since=1)
+
+            assert changes["version"] == 2
+            assert [item["id"] for item in changes["items"]] == ["item_2"]
+
+    def test_without_replicas_everything_uses_primary(self):
+        """Should keep the single primary session when no replica is configured."""
+        with patch.object(routing, "DATABASE_REPLICA_URLS", []):
+            assert not routing.on_replica(routing.read_session("user_1"))
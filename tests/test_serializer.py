@@ -0,0 +1,70 @@
+import io
+import json
+from datetime import datetime
+from unittest.mock import patch
+from services import serializer
+
+
+class TestSerializer:
+    """Tests for JSON response serialization."""
+
+    def test_stdlib_fallback_encodes_datetimes(self):
+        """Should encode datetimes as ISO strings without the optional encoder."""
+        with patch("services.serializer.orjson", None):
+            body = serializer.dumps({"timestamp": datetime(2026, 1, 5, 12, 0, 0), "title": "Milk"})
+
+        assert json.loads(body) == {"timestamp": "2026-01-05T12:00:00", "title": "Milk"}
+
+    def test_fast_and_fallback_encoders_agree(self):
+        """Should produce the same document with either encoder."""
+        payload = {"success": True, "items": [{"id": "item_1", "title": "Çay"}], "next_cursor": None}
+
+        with patch("services.serializer.orjson", None):
+            fallback = serializer.dumps(payload)
+
+        assert json.loads(serializer.dumps(payload)) == json.loads(fallback)
+
+    def test_streamed_list_matches_envelope(self):
+        """Should stream the same envelope as a regular list response."""
+        rows = iter([{"id": "item_1"}, {"id": "item_2"}])
+
+        body = b"".join(serializer.stream_json_list("items", rows))
+
+        assert json.loads(body) == {"success": True, "items": [{"id": "item_1"}, {"id": "item_2"}],
+                                    "next_cursor": None}
+
+    def test_streamed_csv_quotes_multiline_values(self):
+        """Should write a header and keep multi-line values in one record."""
+        rows = iter([{"id": "item_1", "description": "line one\nline two"}])
+
+        body = b"".join(serializer.stream_csv(rows)).decode("utf-8")
+
+        assert body.splitlines()[0] == "id,description"
+        assert '"line one\nline two"' in body
+
+    def test_stream_is_flushed_in_blocks(self):
+        """Should group small rows into buffered chunks."""
+        rows = ({"id": f"item_{index}"} for index in range(1000))
+
+        chunks = list(serializer.stream_ndjson(rows))
+
+        assert len(chunks) == 1
+        assert chunks[0].count(b"\n") == 1000
+
+    def test_parse_ndjson_reports_bad_lines(self):
+        """Should yield a parse error for a bad line and keep going."""
+        stream = io.BytesIO(b'{"title": "a"}\nnot json\n\n{"title": "b"}\n')
+
+        parsed = list(serializer.parse_ndjson(stream))
+
+        assert parsed == [(1, {"title": "a"}, None), (2, None, "Invalid JSON."),
+                          (4, {"title": "b"}, None)]
+
+    def test_parse_csv_treats_empty_cells_as_missing(self):
+        """Should map empty cells to None and flag rows with extra columns."""
+        stream = io.BytesIO(b"title,status\nMilk,\nBread,Done,extra\n")
+
+        parsed = list(serializer.parse_csv(stream))
+
+        assert parsed[0] == (1, {"title": "Milk", "status": None}, None)
+        assert parsed[1] == (2, None, "Row has more columns than the header.")
@@ -0,0 +1,178 @@
+import pytest
+from datetime import datetime, timezone
+from unittest.mock import patch
+from sqlalchemy import create_engine, exc, select, text
+from database import rebalance, sharding
+from database.models import db, Item
+from repositories import todo_repository, user_repository
+
+
+def _user_on(shard):
+    # First generated id the two-shard ring places on `shard`.
+    ring = sharding.HashRing(sharding.shard_names(2))
+    return next(f"user_{index}" for index in range(1000) if ring.shard_for(f"user_{index}") == shard)
+
+
+def _count_items(url, user_id):
+    engine = create_engine(url)
+    with engine.connect() as conn:
+        count = conn.execute(text("SELECT COUNT(*) FROM items WHERE user_id = :user_id"),
+                             {"user_id": user_id}).scalar()
+    engine.dispose()
+    return count
+
+
+@pytest.fixture
+def database_url(migrated_url):
+    """Primary database, separate from the shards."""
+    return migrated_url("primary.db")
+
+
+@pytest.fixture
+def app_patches(migrated_url):
+    """Two shards, as separate SQLite files, with the shard map read uncached."""
+    shards = [migrated_url(f"shard_{index}.db") for index in range(2)]
+    sharding._shard_cache.clear()
+    return [patch.object(sharding, "DATABASE_SHARD_URLS", shards),
+            patch.object(sharding, "SHARD_MAP_CACHE_SECONDS", 0),
+            patch.object(rebalance, "REBALANCE_GRACE_SECONDS", 0)]
+
+
+@pytest.fixture
+def app(app):
+    """App with one user on each shard."""
+    with app.app_context():
+        for shard in ("shard_0", "shard_1"):
+            user_id = _user_on(shard)
+            user_repository.create_user(user_id, f"{user_id}@example.com", "hash",
+                                        datetime.now(timezone.utc))
+    return app
+
+
+def _create_item(item_id, user_id):
+    return todo_repository.create_item(item_id, "Title", None, "ToDo",
+                                       datetime.now(timezone.utc), user_id)
+
+
+class TestHashRing:
+    """Tests for consistent hashing of users onto shards."""
+
+    def test_assignment_is_stable(self):
+        """Should place a user on the same shard every time."""
+        ring = sharding.HashRing(["shard_0", "shard_1", "shard_2"])
+
+        assert ring.shard_for("user_1") == sharding.HashRing(["shard_0", "shard_1", "shard_2"]).shard_for("user_1")
+
+    def test_adding_a_shard_moves_few_users(self):
+        """Should only move users to the new shard, about 1/N of them."""
+        before = sharding.HashRing(sharding.shard_names(3))
+        after = sharding.HashRing(sharding.shard_names(4))
+        user_ids = [f"user_{index}" for index in range(4000)]
+
+        moved = [user_id for user_id in user_ids if before.shard_for(user_id) != after.shard_for(user_id)]
+
+        assert all(after.shard_for(user_id) == "shard_3" for user_id in moved)
+        assert 0.15 < len(moved) / len(user_ids) < 0.35
+
+
+class TestShardRouting:
+    """Tests for sending each user's item data to their shard."""
+
+    def test_items_live_on_the_users_shard(self, app):
+        """Should write and read a user's items on the shard the ring picks."""
+        user_id = _user_on("shard_1")
+        with app.app_context():
+            assert _create_item("item_1", user_id)
+
+            items, _ = todo_repository.get_items_page(user_id)
+
+            assert [item["id"] for item in items] == ["item_1"]
+            assert todo_repository.get_change_version(user_id)[0] == 1
+            assert todo_repository.get_status_counts(user_id)["ToDo"] == 1
+
+        assert _count_items(sharding.DATABASE_SHARD_URLS[1], user_id) == 1
+        assert _count_items(sharding.DATABASE_SHARD_URLS[0], user_id) == 0
+
+    def test_bulk_insert_splits_by_shard(self, app):
+        """Should load each user's rows on that user's shard."""
+        users = [_user_on("shard_0"), _user_on("shard_1")]
+        now = datetime.now(timezone.utc)
+        rows = [{"id": f"item_{index}", "title": "Title", "description": None, "status": "ToDo",
+                 "timestamp": now, "user_id": users[index % 2]} for index in range(4)]
+        with app.app_context():
+            assert todo_repository.insert_items(rows)
+
+        for index, user_id in enumerate(users):
+            assert _count_items(sharding.DATABASE_SHARD_URLS[index], user_id) == 2
+
+    def test_unscoped_sharded_query_is_refused(self, app):
+        """Should raise instead of querying a sharded table on the primary."""
+        with app.app_context():
+            with pytest.raises(exc.UnboundExecutionError):
+                db.session.execute(select(Item))
+
+    def test_deleting_a_user_removes_their_items(self, app):
+        """Should delete the user's item data from their shard."""
+        user_id = _user_on("shard_0")
+        with app.app_context():
+            _create_item("item_1", user_id)
+
+            assert user_repository.delete_user(user_id)
+
+        assert _count_items(sharding.DATABASE_SHARD_URLS[0], user_id) == 0
+
+    def test_deleted_user_is_forgotten_after_commit(self, app):
+        """Should drop the cached shard of a deleted user once the delete has committed."""
+        user_id = _user_on("shard_0")
+        with app.app_context():
+            _create_item("item_1", user_id)
+            still_there = []
+            forget = sharding.forget
+
+            def record(forgotten_id):
+                still_there.append(user_repository.get_user_by_id(forgotten_id) is not None)
+                forget(forgotten_id)
+
+            with patch.object(sharding, "forget", side_effect=record):
+                assert user_repository.delete_user(user_id)
+
+        assert still_there == [False]
+        assert sharding._shard_cache.get(user_id) is None
+
+
+class TestRebalance:
+    """Tests for moving users between shards."""
+
+    def test_moved_user_keeps_items_and_version(self, app):
+        """Should serve a moved user's items, version and sync state from the new shard."""
+        user_id = _user_on("shard_0")
+        with app.app_context():
+            _create_item("item_1", user_id)
+            _create_item("item_2", user_id)
+            todo_repository.delete_item("item_2", user_id)
+            primary, shards = db.engine, {name: db.engines[name] for name in sharding.shard_names()}
+
+            assert rebalance.move_user(primary, shards, user_id, "shard_1")
+            sharding.forget(user_id)
+
+            items, _ = todo_repository.get_items_page(user_id)
+            changes = todo_repository.get_changes_since(user_id, since=1)
+
+            assert [item["id"] for item in items] == ["item_1"]
+            assert todo_repository.get_change_version(user_id)[0] == 3
+            assert changes["deleted"] == ["item_2"]
+            assert _create_item("item_3", user_id)
+
+        assert _count_items(sharding.DATABASE_SHARD_URLS[0], user_id) == 0
+        assert _count_items(sharding.DATABASE_SHARD_URLS[1], user_id) == 2
+
+    def test_pinned_users_are_moved_to_their_ring_shard(self, app):
+        """Should keep users put when shards are added, until rebalance moves them."""
+        with app.app_context():
+            primary, shards = db.engine, {name: db.engines[name] for name in sharding.shard_names()}
+            moving = [user_id for user_id in (_user_on("shard_0"), _user_on("shard_1"))
+                      if sharding.HashRing(["shard_0"]).shard_for(user_id) != sharding.ring().shard_for(user_id)]
+
+            assert rebalance.pin_changed(primary, from_count=1) == len(moving)
+            assert rebalance.rebalance(primary, shards) == len(moving)
+            assert rebalance.status(primary, shards)[0]["pinned"] == 0
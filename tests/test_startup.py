@@ -0,0 +1,44 @@
+import os
+import subprocess
+import sys
+import pytest
+from unittest.mock import patch
+from database import setup_database
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class TestStartup:
+    """Tests for side-effect-free imports and lazy app startup."""
+
+    def test_import_needs_no_database_and_skips_heavy_modules(self):
+        """Should import the app without DATABASE_URL and without bcrypt, jwt or migrations."""
+        env = {key: value for key, value in os.environ.items() if key != "DATABASE_URL"}
+        script = ("import sys, todo_app; "
+                  "print(','.join(m for m in ('bcrypt', 'jwt', 'database.migrations') "
+                  "if m in sys.modules))")
+
+        result = subprocess.run([sys.executable, "-c", script], cwd=REPO_ROOT, env=env,
+                                capture_output=True, text=True, timeout=60)
+
+        assert result.returncode == 0, result.stderr
+        assert result.stdout.strip() == ""
+
+    def test_create_app_does_not_connect(self, tmp_path):
+        """Should build the app without opening a connection, and record its timings."""
+        import todo_app
+
+        # SQLite cannot open a file in a missing directory, so any connection attempt would fail.
+        unreachable = f"sqlite:///{tmp_path / 'missing' / 'app.db'}"
+        with patch.object(setup_database, "DATABASE_URL", unreachable):
+            app = todo_app.create_app()
+
+        assert set(app.extensions["startup_timings"]) == {"imports", "app", "database", "routes"}
+
+    def test_create_app_requires_database_url(self):
+        """Should refuse to build an app when DATABASE_URL is missing."""
+        import todo_app
+
+        with patch.object(setup_database, "DATABASE_URL", None):
+            with pytest.raises(ValueError):
+                todo_app.create_app()
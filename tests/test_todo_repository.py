@@ -0,0 +1,232 @@
+import pytest
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import text
+from database.models import db
+from repositories import todo_repository, user_repository
+from services import todo_service
+
+
+def _new_row(item_id, user_id, title="Title", status="ToDo", description=None):
+    return {"id": item_id, "title": title, "description": description, "status": status,
+            "timestamp": datetime.now(timezone.utc), "user_id": user_id}
+
+
+@pytest.fixture
+def app(app):
+    """App on a migrated SQLite file, inside an app context, with one user."""
+    with app.app_context():
+        user_repository.create_user("user_1", "user_1@example.com", "hash", datetime.now(timezone.utc))
+        yield app
+
+
+class TestApplyBatch:
+    """Tests for the batch write transaction against a real database."""
+
+    def test_updates_return_the_written_rows(self, app):
+        """Should return each updated row as stored, with its new version and update time."""
+        todo_repository.insert_items([_new_row("item_1", "user_1", title="Old")])
+        before = todo_repository.get_item_by_id("item_1", "user_1")
+
+        written = todo_repository.apply_batch("user_1", [], [{"id": "item_1", "title": "New"}], [])
+
+        assert written["updated"]["item_1"] == todo_repository.get_item_by_id("item_1", "user_1")
+        assert written["updated"]["item_1"]["title"] == "New"
+        assert written["updated"]["item_1"]["version"] == 2
+        assert written["updated"]["item_1"]["updated_at"] > before["updated_at"]
+
+    def test_writes_that_match_no_row_are_left_out(self, app):
+        """Should leave updates and deletes of missing or foreign items out of the result."""
+        user_repository.create_user("user_2", "user_2@example.com", "hash", datetime.now(timezone.utc))
+        todo_repository.insert_items([_new_row("theirs", "user_2")])
+
+        written = todo_repository.apply_batch("user_1", [_new_row("item_1", "user_1")],
+                                              [{"id": "theirs", "title": "Mine now"},
+                                               {"id": "missing", "status": "Done"}],
+                                              ["theirs", "missing"])
+
+        assert [item["id"] for item in written["created"]] == ["item_1"]
+        assert written["updated"] == {}
+        assert written["deleted"] == []
+        assert todo_repository.get_item_by_id("theirs", "user_2")["title"] == "Title"
+
+
+def _all_pages(**listing):
+    ids, cursor = [], None
+    while True:
+        page, error = todo_service.get_todos(user_id="user_1", limit=4, cursor=cursor, **listing)
+        assert error is None
+        ids.extend(item["id"] for item in page["items"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return ids
+
+
+class TestKeysetPagination:
+    """Tests that cursor pages cover every row exactly once, in order."""
+
+    @pytest.mark.parametrize("sort_by", ["id", "title", "status", "timestamp"])
+    @pytest.mark.parametrize("sort_order", ["asc", "desc"])
+    def test_pages_have_no_duplicates_or_gaps(self, app, sort_by, sort_order):
+        """Should return the same rows as one full ordered scan, including ties on the sort column."""
+        start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+        # Few distinct titles, statuses and timestamps, so pages split ties.
+        rows = [{**_new_row(f"item_{index:02d}", "user_1", title=f"Title {index % 3}",
+                            status=("ToDo", "InProgress", "Done")[index % 3]),
+                 "timestamp": start + timedelta(minutes=index // 4)}
+                for index in range(23)]
+        todo_repository.insert_items(rows)
+
+        ids = _all_pages(sort_by=sort_by, sort_order=sort_order)
+
+        expected = sorted(rows, key=lambda row: (row[sort_by], row["id"]), reverse=sort_order == "desc")
+        assert ids == [row["id"] for row in expected]
+
+    def test_rows_written_between_pages_are_not_repeated(self, app):
+        """Should neither repeat nor skip rows that were on a page already when others are inserted."""
+        todo_repository.insert_items([_new_row(f"item_{index:02d}", "user_1") for index in range(0, 20, 2)])
+        first, _ = todo_service.get_todos(user_id="user_1", limit=4)
+        todo_repository.insert_items([_new_row("item_01", "user_1"), _new_row("item_99", "user_1")])
+
+        ids = [item["id"] for item in first["items"]]
+        cursor = first["next_cursor"]
+        while cursor:
+            page, _ = todo_service.get_todos(user_id="user_1", limit=4, cursor=cursor)
+            ids.extend(item["id"] for item in page["items"])
+            cursor = page["next_cursor"]
+
+        assert ids == [f"item_{index:02d}" for index in range(0, 20, 2)] + ["item_99"]
+
+
+class TestVersionedMutations:
+    """Tests for single-statement, version-guarded updates and deletes."""
+
+    def test_update_bumps_version_and_returns_the_row(self, app):
+        """Should return the row as stored, with the next version, from the UPDATE itself."""
+        todo_repository.insert_items([_new_row("item_1", "user_1", title="Old")])
+
+        item = todo_repository.update_item("item_1", title="New", user_id="user_1", expected_version=1)
+
+        assert item == todo_repository.get_item_by_id("item_1", "user_1")
+        assert (item["title"], item["version"]) == ("New", 2)
+
+    def test_stale_version_changes_nothing(self, app):
+        """Should match no row for a stale version and leave the item as it was."""
+        todo_repository.insert_items([_new_row("item_1", "user_1", title="Old")])
+        todo_repository.update_item("item_1", status="Done", user_id="user_1")
+
+        assert todo_repository.update_item("item_1", title="Lost", user_id="user_1", expected_version=1) is None
+        assert todo_repository.delete_item("item_1", "user_1", expected_version=1) is None
+
+        item = todo_repository.get_item_by_id("item_1", "user_1")
+        assert (item["title"], item["status"], item["version"]) == ("Old", "Done", 2)
+        assert todo_repository.get_change_version("user_1")[0] == 2
+
+    def test_delete_with_current_version_returns_the_row(self, app):
+        """Should delete with the current version and return the deleted row."""
+        todo_repository.insert_items([_new_row("item_1", "user_1")])
+
+        item = todo_repository.delete_item("item_1", "user_1", expected_version=1)
+
+        assert item["id"] == "item_1"
+        assert todo_repository.get_item_by_id("item_1", "user_1") is None
+
+    def test_other_users_items_are_not_touched(self, app):
+        """Should scope the statements to the owner."""
+        user_repository.create_user("user_2", "user_2@example.com", "hash", datetime.now(timezone.utc))
+        todo_repository.insert_items([_new_row("theirs", "user_2")])
+
+        assert todo_repository.update_item("theirs", title="Mine", user_id="user_1") is None
+        assert todo_repository.delete_item("theirs", "user_1") is None
+        assert todo_repository.get_item_by_id("theirs", "user_2")["title"] == "Title"
+
+
+def _count_by_status(user_id):
+    rows = db.session.execute(text("SELECT status, COUNT(*) FROM items WHERE user_id = :user_id "
+                                   "GROUP BY status"), {"user_id": user_id}).all()
+    return {status: count for status, count in rows}
+
+
+class TestStatusCounters:
+    """Tests that the status counters match the items table."""
+
+    def test_counters_match_count_after_writes(self, app):
+        """Should keep the counters equal to COUNT(*) per status through every kind of write."""
+        todo_repository.insert_items([_new_row(f"item_{index}", "user_1") for index in range(6)])
+        todo_repository.apply_batch("user_1",
+                                    [_new_row("item_6", "user_1", status="Done")],
+                                    [{"id": "item_0", "status": "Done"},
+                                     {"id": "item_1", "status": "InProgress", "title": "Started"},
+                                     {"id": "item_2", "title": "Renamed"},
+                                     {"id": "missing", "status": "Done"}],
+                                    ["item_3", "missing"])
+        todo_repository.update_item("item_4", status="Done", user_id="user_1")
+        todo_repository.delete_item("item_5", "user_1")
+
+        counts = {status: count for status, count in todo_repository.get_status_counts("user_1").items() if count}
+
+        assert counts == _count_by_status("user_1") == {"ToDo": 1, "InProgress": 1, "Done": 3}
+
+    def test_failed_batch_leaves_counters_alone(self, app):
+        """Should roll the counters back with the rest of a failed batch."""
+        todo_repository.insert_items([_new_row("item_0", "user_1")])
+
+        written = todo_repository.apply_batch("user_1", [_new_row("item_0", "user_1")],
+                                              [{"id": "item_0", "status": "Done"}], [])
+
+        assert written is None
+        assert todo_repository.get_status_counts("user_1") == _count_by_status("user_1") == {"ToDo": 1}
+
+
+class TestChanges:
+    """Tests for delta sync against the tombstones actually written."""
+
+    def test_deletes_show_up_as_tombstones(self, app):
+        """Should list single and batched deletes since a token, and only the survivors as items."""
+        todo_repository.insert_items([_new_row(f"item_{index}", "user_1") for index in range(4)])
+        since = todo_repository.get_change_version("user_1")[0]
+
+        todo_repository.delete_item("item_0", "user_1")
+        todo_repository.apply_batch("user_1", [], [{"id": "item_1", "title": "Edited"}], ["item_2"])
+        changes = todo_repository.get_changes_since("user_1", since)
+
+        assert changes["deleted"] == ["item_0", "item_2"]
+        assert [item["id"] for item in changes["items"]] == ["item_1"]
+        assert changes["version"] == since + 2
+
+    def test_full_snapshot_has_no_tombstones(self, app):
+        """Should return the current items and no deletes without a token."""
+        todo_repository.insert_items([_new_row(f"item_{index}", "user_1") for index in range(3)])
+        todo_repository.delete_item("item_0", "user_1")
+
+        changes = todo_repository.get_changes_since("user_1")
+
+        assert changes["deleted"] == []
+        assert [item["id"] for item in changes["items"]] == ["item_1", "item_2"]
+
+
+class TestSearchRanking:
+    """Tests for full-text search on SQLite's FTS5 index."""
+
+    def test_title_hits_rank_above_description_hits(self, app):
+        """Should order matches by bm25 with titles weighted over descriptions, and page by rank."""
+        todo_repository.insert_items([
+            _new_row("title", "user_1", title="Milk", description="from the corner shop"),
+            _new_row("both", "user_1", title="Milk run", description="milk, milk and more milk"),
+            _new_row("unrelated", "user_1", title="Laundry", description="whites only"),
+            # Equal scores, so the rank cursor has to break ties by id across pages.
+            *(_new_row(f"description_{index}", "user_1", title="Groceries", description="buy milk and bread")
+              for index in range(5)),
+        ])
+
+        ranked = _all_pages(q="milk")
+
+        assert ranked == ["both", "title"] + [f"description_{index}" for index in reversed(range(5))]
+
+    def test_every_term_must_match(self, app):
+        """Should only return items containing all terms, as prefixes."""
+        todo_repository.insert_items([
+            _new_row("both", "user_1", title="Buy milk", description="at the market"),
+            _new_row("one", "user_1", title="Buy bread"),
+        ])
+
+        assert _all_pages(q="mil buy") == ["both"]
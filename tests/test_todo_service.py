@@ -1,5 +1,7 @@
 import pytest
+from datetime import datetime, timezone
 from unittest.mock import patch, MagicMock
+from repositories.todo_repository import FilterClause
 from services import todo_service
 
 
@@ -145,6 +147,20 @@ class TestTodoUpdate:
             assert error == "Item not found."
 
 
+    def test_update_with_stale_version(self):
+        """Should report a conflict when the item exists at another version."""
+        with patch("services.todo_service.repo") as mock_repo:
+            mock_repo.update_item.return_value = None
+            mock_repo.get_item_by_id.return_value = {"id": "item_1", "version": 3}
+            
+            item, error = todo_service.update_todo("item_1", "Updated", None, None, "user_1",
+                                                   expected_version=2)
+            
+            assert item is None
+            assert error == todo_service.VERSION_CONFLICT_ERROR
+            assert mock_repo.update_item.call_args[0][5] == 2
+
+
 class TestTodoDeletion:
     """Tests for todo deletion functionality."""
     
@@ -168,6 +184,17 @@ class TestTodoDeletion:
             assert item is None
             assert error == "Item not found."
     
+    def test_delete_with_stale_version(self):
+        """Should report a conflict instead of deleting a changed item."""
+        with patch("services.todo_service.repo") as mock_repo:
+            mock_repo.delete_item.return_value = None
+            mock_repo.get_item_by_id.return_value = {"id": "item_1", "version": 3}
+            
+            item, error = todo_service.delete_todo("item_1", "user_1", expected_version=2)
+            
+            assert item is None
+            assert error == todo_service.VERSION_CONFLICT_ERROR
+    
     def test_delete_without_id(self):
         """Should reject deletion without item ID."""
         item, error = todo_service.delete_todo(None, "user_1")
@@ -176,6 +203,468 @@ class TestTodoDeletion:
         assert error == "Item ID is required."
 
 
+class TestTodoPagination:
+    """Tests for cursor-based pagination of todo lists."""
+    
+    def test_first_page_without_cursor(self):
+        """Should request the default page size and return no cursor on the last page."""
+        with patch("services.todo_service.repo") as mock_repo:
+            mock_repo.ALLOWED_SORT_COLUMNS = ["id", "title", "status", "timestamp"]
+            mock_repo.get_items_page.return_value = ([{"id": "item_1"}], None)
+            
+            page, error = todo_service.get_todos(user_id="user_1")
+            
+            assert error is None
+            assert page == {"items": [{"id": "item_1"}], "next_cursor": None}
+            mock_repo.get_items_page.assert_called_once_with(
+                "user_1", None, "id", "asc", todo_service.DEFAULT_PAGE_SIZE, None, None, None)
+    
+    def test_next_cursor_round_trip(self):
+        """Should hand back a cursor that decodes to the last row's sort key."""
+        last_seen = datetime(2026, 1, 5, 12, 0, 0)
+        with patch("services.todo_service.repo") as mock_repo:
+            mock_repo.ALLOWED_SORT_COLUMNS = ["id", "title", "status", "timestamp"]
+            mock_repo.get_items_page.return_value = ([{"id": "item_1"}], (last_seen, "item_1"))
+            
+            page, _ = todo_service.get_todos(user_id="user_1", sort_by="timestamp",
+                                             sort_order="desc", limit="1")
+            todo_service.get_todos(user_id="user_1", sort_by="timestamp",
+                                   sort_order="desc", limit="1", cursor=page["next_cursor"])
+            
+            assert mock_repo.get_items_page.call_args[0][5] == (last_seen, "item_1")
+    
+    def test_cursor_for_other_sort_is_rejected(self):
+        """Should reject a cursor issued for a different sort column."""
+        cursor = todo_service._encode_cursor("title", "asc", ("Milk", "item_1"))
+        
+        page, error = todo_service.get_todos(user_id="user_1", sort_by="id", cursor=cursor)
+        
+        assert page is None
+        assert error == "Cursor does not match the requested sort."
+    
+    def test_garbage_cursor_is_rejected(self):
+        """Should reject a cursor that is not a valid token."""
+        page, error = todo_service.get_todos(user_id="user_1", cursor="not-a-cursor")
+        
+        assert page is None
+        assert error == "Invalid cursor."
+    
+    @pytest.mark.parametrize("limit,expected", [
+        (None, (todo_service.DEFAULT_PAGE_SIZE, None)),
+        ("10", (10, None)),
+        ("100000", (todo_service.MAX_PAGE_SIZE, None)),
+        ("0", (None, "Limit must be at least 1.")),
+        ("ten", (None, "Limit must be an integer.")),
+    ])
+    def test_limit_parsing(self, limit, expected):
+        """Should default, clamp and validate the page size."""
+        assert todo_service._parse_limit(limit) == expected
+
+
+class TestFieldProjection:
+    """Tests for the fields= projection of todo lists."""
+    
+    def test_projection_always_includes_id(self):
+        """Should pass the requested columns, with id first, to the repository."""
+        with patch("services.todo_service.repo") as mock_repo:
+            mock_repo.ALLOWED_SORT_COLUMNS = ["id", "title", "status", "timestamp"]
+            mock_repo.ITEM_FIELDS = ["id", "title", "description", "status", "timestamp"]
+            mock_repo.get_items_page.return_value = ([], None)
+            
+            todo_service.get_todos(user_id="user_1", fields="title, status")
+            
+            assert mock_repo.get_items_page.call_args[0][6] == ["id", "title", "status"]
+    
+    def test_unknown_field_is_rejected(self):
+        """Should reject fields that are not item columns."""
+        page, error = todo_service.get_todos(user_id="user_1", fields="title,password_hash")
+        
+        assert page is None
+        assert error.startswith("Unknown field(s): password_hash.")
+
+
+class TestTodoFilters:
+    """Tests for the filter= expression language."""
+    
+    def test_clauses_are_parsed_and_typed(self):
+        """Should turn every clause into a typed filter for the repository."""
+        clauses, error = todo_service._parse_filters(
+            "status=ToDo|InProgress; timestamp>=2026-01-05T00:00:00+02:00;title^=Buy")
+        
+        assert error is None
+        assert clauses == [
+            FilterClause("status", "eq", ["ToDo", "InProgress"]),
+            FilterClause("timestamp", "gte", datetime(2026, 1, 4, 22, 0, 0)),
+            FilterClause("title", "prefix", "Buy")
+        ]
+    
+    def test_status_parameter_joins_the_filter(self):
+        """Should keep the legacy status= parameter as one more clause."""
+        clauses, error = todo_service._parse_filters("updated_at<2026-02-01", "Done")
+        
+        assert error is None
+        assert clauses == [FilterClause("status", "eq", ["Done"]),
+                           FilterClause("updated_at", "lt", datetime(2026, 2, 1))]
+    
+    @pytest.mark.parametrize("expression,expected", [
+        ("status=ToDo|Later", "Invalid status in filter: Later"),
+        ("timestamp>=yesterday", "Invalid timestamp in filter: yesterday"),
+        ("title>Buy", "Unsupported filter: title >."),
+        ("user_id=user_2", "Unsupported filter: user_id =."),
+        ("status", "Invalid filter clause: status"),
+        ("title^=", "Filter on title needs a value."),
+    ])
+    def test_invalid_clauses_are_rejected(self, expression, expected):
+        """Should reject fields, operators and values outside the whitelist."""
+        clauses, error = todo_service._parse_filters(expression)
+        
+        assert clauses is None
+        assert error.startswith(expected)
+    
+    def test_filter_reaches_repository(self):
+        """Should pass the parsed clauses to the single list query."""
+        with patch("services.todo_service.repo") as mock_repo:
+            mock_repo.ALLOWED_SORT_COLUMNS = ["id", "title", "status", "timestamp"]
+            mock_repo.FILTER_OPERATORS = {"status": ("eq", "ne")}
+            mock_repo.FilterClause = FilterClause
+            mock_repo.get_items_page.return_value = ([], None)
+            
+            todo_service.get_todos(user_id="user_1", filters="status!=Done")
+            
+            assert mock_repo.get_items_page.call_args[0][1] == [FilterClause("status", "ne", ["Done"])]
+
+
+class TestTodoSearch:
+    """Tests for full-text search in todo lists."""
+    
+    def test_search_defaults_to_rank_order(self):
+        """Should pass normalized terms and rank by relevance when no sort is given."""
+        with patch("services.todo_service.repo") as mock_repo:
+            mock_repo.ALLOWED_SORT_COLUMNS = ["id", "title", "status", "timestamp"]
+            mock_repo.get_items_page.return_value = ([], None)
+            
+            todo_service.get_todos(user_id="user_1", q="Buy  MILK, buy!")
+            
+            args = mock_repo.get_items_page.call_args[0]
+            assert args[2] == "rank"
+            assert args[7] == ["buy", "milk"]
+    
+    def test_search_composes_with_explicit_sort(self):
+        """Should keep an explicit sort column and status filter."""
+        with patch("services.todo_service.repo") as mock_repo:
+            mock_repo.ALLOWED_SORT_COLUMNS = ["id", "title", "status", "timestamp"]
+            mock_repo.get_items_page.return_value = ([], None)
+            
+            mock_repo.FilterClause = FilterClause
+            mock_repo.get_items_page.return_value = ([], None)
+            
+            todo_service.get_todos(status="Done", user_id="user_1", sort_by="title", q="milk")
+            
+            args = mock_repo.get_items_page.call_args[0]
+            assert args[1:3] == ([FilterClause("status", "eq", ["Done"])], "title")
+            assert args[7] == ["milk"]
+    
+    def test_rank_cursor_round_trip(self):
+        """Should page through ranked results with a rank cursor."""
+        with patch("services.todo_service.repo") as mock_repo:
+            mock_repo.ALLOWED_SORT_COLUMNS = ["id", "title", "status", "timestamp"]
+            mock_repo.get_items_page.return_value = ([{"id": "item_1"}], (0.25, "item_1"))
+            
+            page, _ = todo_service.get_todos(user_id="user_1", q="milk", limit="1")
+            todo_service.get_todos(user_id="user_1", q="milk", limit="1", cursor=page["next_cursor"])
+            
+            assert mock_repo.get_items_page.call_args[0][5] == (0.25, "item_1")
+    
+    @pytest.mark.parametrize("q", ["%_*\"'", "-- ..."])
+    def test_query_without_terms_is_rejected(self, q):
+        """Should reject a query with nothing searchable in it."""
+        page, error = todo_service.get_todos(user_id="user_1", q=q)
+        
+        assert page is None
+        assert error == "Search query must contain letters or digits."
+
+
+class TestTodoBatch:
+    """Tests for batched item operations."""
+    
+    def test_mixed_operations_in_one_call(self):
+        """Should run all writes through a single repository batch."""
+        with patch("services.todo_service.repo") as mock_repo:
+            mock_repo.get_items_by_ids.return_value = {
+                "item_1": {"id": "item_1", "title": "Old", "status": "ToDo", "version": 1},
+                "item_2": {"id": "item_2", "title": "Gone", "status": "ToDo", "version": 1}
+            }
+            mock_repo.apply_batch.side_effect = lambda user_id, creates, updates, deletes: {
+                "created": [{"id": row["id"], "title": row["title"]} for row in creates],
+                "updated": {"item_1": {"id": "item_1", "title": "Old", "status": "Done", "version": 2}},
+                "deleted": ["item_2"]}
+            
+            results, error = todo_service.apply_batch([
+                {"op": "create", "data": {"title": "New"}},
+                {"op": "update", "id": "item_1", "data": {"status": "Done"}},
+                {"op": "delete", "id": "item_2"},
+                {"op": "get", "id": "item_3"}
+            ], "user_1")
+            
+            assert error is None
+            assert [result["success"] for result in results] == [True, True, True, False]
+            assert results[0]["item"]["title"] == "New"
+            assert results[1]["item"]["status"] == "Done"
+            assert results[1]["item"]["version"] == 2
+            assert results[3]["error"] == "Item not found."
+            mock_repo.get_items_by_ids.assert_called_once_with(["item_1", "item_2", "item_3"], "user_1")
+            _, creates, updates, deletes = mock_repo.apply_batch.call_args[0]
+            assert updates == [{"id": "item_1", "status": "Done"}]
+            assert deletes == ["item_2"]
+    
+    def test_writes_that_matched_no_row_fail(self):
+        """Should report updates and deletes of items gone since the lookup as missing."""
+        with patch("services.todo_service.repo") as mock_repo:
+            mock_repo.get_items_by_ids.return_value = {
+                "item_1": {"id": "item_1", "title": "Old", "status": "ToDo", "version": 1},
+                "item_2": {"id": "item_2", "title": "Gone", "status": "ToDo", "version": 1}
+            }
+            mock_repo.apply_batch.return_value = {"created": [], "updated": {}, "deleted": []}
+
+            results, error = todo_service.apply_batch([
+                {"op": "update", "id": "item_1", "data": {"status": "Done"}},
+                {"op": "delete", "id": "item_2"}
+            ], "user_1")
+
+            assert error is None
+            assert [result["success"] for result in results] == [False, False]
+            assert all(result["error"] == "Item not found." for result in results)
+
+    def test_invalid_operations_get_their_own_errors(self):
+        """Should report validation errors per operation without touching the database."""
+        with patch("services.todo_service.repo") as mock_repo:
+            mock_repo.get_items_by_ids.return_value = {}
+            
+            results, error = todo_service.apply_batch([
+                {"op": "create", "data": {"title": "  "}},
+                {"op": "rename", "id": "item_1"},
+                {"op": "update", "id": "item_1", "data": {}}
+            ], "user_1")
+            
+            assert error is None
+            assert all(not result["success"] for result in results)
+            mock_repo.apply_batch.assert_not_called()
+
+    def test_malformed_create_fails_only_its_operation(self):
+        """Should reject a create with a non-string description or an over-long title per operation."""
+        with patch("services.todo_service.repo") as mock_repo:
+            mock_repo.get_items_by_ids.return_value = {}
+            mock_repo.apply_batch.side_effect = lambda user_id, creates, updates, deletes: {
+                "created": [{"id": row["id"], "title": row["title"]} for row in creates],
+                "updated": {}, "deleted": []}
+
+            results, error = todo_service.apply_batch([
+                {"op": "create", "data": {"title": "x", "description": 5}},
+                {"op": "create", "data": {"title": "x" * (todo_service.MAX_TITLE_LENGTH + 1)}},
+                {"op": "create", "data": {"title": "New"}}
+            ], "user_1")
+
+            assert error is None
+            assert results[0] == {"index": 0, "op": "create", "success": False,
+                                  "error": "Description must be a string."}
+            assert results[1]["error"] == "Title is too long."
+            assert results[2]["success"]
+            _, creates, _, _ = mock_repo.apply_batch.call_args[0]
+            assert [row["title"] for row in creates] == ["New"]
+
+    def test_repository_failure_fails_all_writes(self):
+        """Should mark every write as failed when the transaction rolls back."""
+        with patch("services.todo_service.repo") as mock_repo:
+            mock_repo.get_items_by_ids.return_value = {}
+            mock_repo.apply_batch.return_value = None
+            
+            results, error = todo_service.apply_batch(
+                [{"op": "create", "data": {"title": "New"}}], "user_1")
+            
+            assert results[0]["error"] == "Batch failed, no changes were applied."
+    
+    def test_rejects_empty_batch(self):
+        """Should reject a batch without operations."""
+        results, error = todo_service.apply_batch([], "user_1")
+        
+        assert results is None
+        assert error == "Operations must be a non-empty list."
+
+
+class TestTodoStats:
+    """Tests for per-user status counters."""
+    
+    def test_stats_fill_missing_statuses(self):
+        """Should report every status, defaulting missing counters to zero."""
+        with patch("services.todo_service.repo") as mock_repo:
+            mock_repo.get_status_counts.return_value = {"ToDo": 2, "Done": 5}
+            
+            stats, error = todo_service.get_stats("user_1")
+            
+            assert error is None
+            assert stats == {"counts": {"Done": 5, "InProgress": 0, "ToDo": 2}, "total": 7}
+    
+    def test_rebuild_reports_failure(self):
+        """Should return an error when the repository rebuild fails."""
+        with patch("services.todo_service.repo") as mock_repo:
+            mock_repo.rebuild_status_counts.return_value = False
+            
+            assert todo_service.rebuild_stats() == "Failed to rebuild item status counters."
+
+
+class TestChangeVersion:
+    """Tests for per-user change versions behind conditional GETs."""
+    
+    def test_version_defaults_and_is_utc(self):
+        """Should report the stored version with a UTC timestamp."""
+        with patch("services.todo_service.repo") as mock_repo:
+            mock_repo.get_change_version.return_value = (4, datetime(2026, 1, 5, 12, 0, 0))
+            
+            change, error = todo_service.get_change_version("user_1")
+            
+            assert error is None
+            assert change["version"] == 4
+            assert change["changed_at"].tzinfo is timezone.utc
+    
+    def test_lookup_failure_is_an_error(self):
+        """Should report an error instead of guessing a version."""
+        with patch("services.todo_service.repo") as mock_repo:
+            mock_repo.get_change_version.return_value = None
+            
+            change, error = todo_service.get_change_version("user_1")
+            
+            assert change is None
+            assert error == "Failed to read change version."
+    
+    def test_mutation_drops_cached_version(self):
+        """Should forget a cached version after a write through this process."""
+        with patch("services.todo_service.repo") as mock_repo, \
+             patch.object(todo_service, "_change_versions") as mock_cache:
+            mock_repo.update_item.return_value = {"id": "item_1"}
+            
+            todo_service.update_todo("item_1", "Updated", None, None, "user_1")
+            
+            mock_cache.invalidate.assert_called_once_with("user_1")
+
+
+class TestDeltaSync:
+    """Tests for change feeds used by delta sync."""
+    
+    def test_no_token_returns_full_snapshot(self):
+        """Should return every item and the current version as the next token."""
+        with patch("services.todo_service.repo") as mock_repo:
+            mock_repo.get_changes_since.return_value = {
+                "version": 7, "min_sync_version": 0,
+                "items": [{"id": "item_1"}], "deleted": []
+            }
+            
+            changes, error = todo_service.get_changes("user_1")
+            
+            assert error is None
+            assert changes["full"] is True
+            assert changes["next_since"] == "7"
+            mock_repo.get_changes_since.assert_called_once_with("user_1", None)
+    
+    def test_token_returns_delta(self):
+        """Should pass the token through and report deleted ids."""
+        with patch("services.todo_service.repo") as mock_repo:
+            mock_repo.get_changes_since.return_value = {
+                "version": 9, "min_sync_version": 2,
+                "items": [{"id": "item_1"}], "deleted": ["item_2"]
+            }
+            
+            changes, error = todo_service.get_changes("user_1", "5")
+            
+            assert error is None
+            assert changes["full"] is False
+            assert changes["deleted"] == ["item_2"]
+            assert changes["next_since"] == "9"
+            mock_repo.get_changes_since.assert_called_once_with("user_1", 5)
+    
+    @pytest.mark.parametrize("since", ["1", "10"])
+    def test_token_outside_retained_range_expires(self, since):
+        """Should ask for a resync when tombstones were pruned or the token is unknown."""
+        with patch("services.todo_service.repo") as mock_repo:
+            mock_repo.get_changes_since.return_value = {
+                "version": 9, "min_sync_version": 2, "items": [], "deleted": []
+            }
+            
+            changes, error = todo_service.get_changes("user_1", since)
+            
+            assert changes is None
+            assert error == todo_service.SYNC_EXPIRED_ERROR
+    
+    @pytest.mark.parametrize("since", ["abc", "-1"])
+    def test_invalid_token(self, since):
+        """Should reject tokens that are not versions."""
+        with patch("services.todo_service.repo") as mock_repo:
+            changes, error = todo_service.get_changes("user_1", since)
+            
+            assert changes is None
+            assert error == "Invalid sync token."
+            mock_repo.get_changes_since.assert_not_called()
+
+
+class TestTodoImport:
+    """Tests for bulk item import."""
+    
+    def test_rows_are_inserted_in_batches(self):
+        """Should insert valid rows in batches and report invalid ones."""
+        records = [
+            (1, {"title": "a"}, None),
+            (2, {"title": ""}, None),
+            (3, None, "Invalid JSON."),
+            (4, {"title": "b", "id": "ignored"}, None),
+            (5, {"title": "c", "status": "Done"}, None)
+        ]
+        with patch("services.todo_service.repo") as mock_repo:
+            mock_repo.insert_items.return_value = True
+            
+            report, error = todo_service.import_todos(iter(records), "user_1", batch_size="2")
+            
+            assert error is None
+            assert report["imported"] == 3
+            assert [entry["row"] for entry in report["errors"]] == [2, 3]
+            assert [len(call[0][0]) for call in mock_repo.insert_items.call_args_list] == [2, 1]
+            assert mock_repo.insert_items.call_args_list[0][0][0][1]["id"] != "ignored"
+    
+    def test_failed_batch_reports_every_row(self):
+        """Should report each row of a batch that could not be inserted."""
+        with patch("services.todo_service.repo") as mock_repo:
+            mock_repo.insert_items.return_value = False
+            
+            report, _ = todo_service.import_todos(
+                iter([(1, {"title": "a"}, None), (2, {"title": "b"}, None)]), "user_1")
+            
+            assert report["imported"] == 0
+            assert report["failed"] == 2
+
+    def test_non_string_description_is_a_row_error(self):
+        """Should report a row whose description is not a string and import the rest."""
+        records = [(1, {"title": "a"}, None), (2, {"title": "x", "description": 5}, None),
+                   (3, {"title": "b"}, None)]
+        with patch("services.todo_service.repo") as mock_repo:
+            mock_repo.insert_items.return_value = True
+
+            report, error = todo_service.import_todos(iter(records), "user_1", batch_size="1")
+
+            assert error is None
+            assert report["imported"] == 2
+            assert report["errors"] == [{"row": 2, "error": "Description must be a string."}]
+
+    def test_over_long_title_is_a_row_error(self):
+        """Should reject an over-long title before it reaches the batch insert."""
+        records = [(1, {"title": "x" * (todo_service.MAX_TITLE_LENGTH + 1)}, None), (2, {"title": "b"}, None)]
+        with patch("services.todo_service.repo") as mock_repo:
+            mock_repo.insert_items.return_value = True
+
+            report, error = todo_service.import_todos(iter(records), "user_1")
+
+            assert error is None
+            assert report["errors"] == [{"row": 1, "error": "Title is too long."}]
+            assert [row["title"] for row in mock_repo.insert_items.call_args[0][0]] == ["b"]
+
+
 class TestStatusValidation:
     """Tests for status validation."""
     
@@ -1,70 +1,393 @@
-from flask import Flask, jsonify, request, send_from_directory
+import time
+_import_started = time.perf_counter()
+
+from flask import Blueprint, Flask, Response, current_app, g, request, send_file, send_from_directory, stream_with_context
 from flask_cors import CORS
+import click
+import hashlib
 import os
 import traceback
 import sys
 import logging
 
 from database import setup_database
-from services import todo_service, user_service, validator_service
-from services.auth_decorators import token_required
+from services import events, metrics, password_hasher, profiling, serializer, todo_service, user_service, validator_service
+from services.auth_decorators import admin_required, token_required
+
+# Time spent importing this module and everything it pulls in (Flask,
+# SQLAlchemy, the services); reported by create_app().
+_import_seconds = time.perf_counter() - _import_started
 
-application = Flask(__name__)
-CORS(application)
+logger = logging.getLogger(__name__)
 
-setup_database.init_db(application)
+# Startup longer than this is logged as a warning (0 disables the check).
+STARTUP_BUDGET_MS = float(os.getenv("STARTUP_BUDGET_MS", "0"))
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
-    handlers=[
-        logging.StreamHandler(sys.stdout) 
-]
-)
+# Routes and CLI commands live on a blueprint so that create_app() can build
+# as many independent apps as needed (one per worker, one per test).
+api = Blueprint("api", __name__, cli_group=None)
 
-logger = logging.getLogger(__name__)
+
+def create_app() -> Flask:
+
+    # Builds and configures an app without touching the database: the engine
+    # connects lazily on first use, so an app created before a fork (gunicorn
+    # --preload) hands workers an empty pool. See gunicorn.conf.py. Schema
+    # changes are never applied here; run python -m database.migrations upgrade
+    # as a release step instead.
+    timings = {"imports": _import_seconds}
+    started = time.perf_counter()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
+        handlers=[
+            logging.StreamHandler(sys.stdout)
+        ]
+    )
+
+    app = Flask(__name__)
+    CORS(app)
+    started = _record_phase(timings, "app", started)
+
+    setup_database.init_db(app)
+    started = _record_phase(timings, "database", started)
+
+    app.register_blueprint(api)
+    _instrument(app)
+    _install_profiling(app)
+    _record_phase(timings, "routes", started)
+
+    app.extensions["startup_timings"] = timings
+    _report_startup(timings)
+
+    return app
+
+
+def _instrument(app):
+
+    # Request metrics for /metrics. A request is timed from before_request to
+    # after_request, i.e. until its response is built; a streamed body is not
+    # included (nor are the queries it runs while streaming).
+    if not metrics.METRICS_ENABLED:
+        return
+
+    metrics.install_query_hooks()
+
+    @app.before_request
+    def start_request_metrics():
+        metrics.start_request(request.method)
+
+    @app.after_request
+    def finish_request_metrics(response):
+        metrics.finish_request(request.url_rule.rule if request.url_rule else None, response.status_code)
+        return response
+
+    @app.teardown_request
+    def fail_request_metrics(exception):
+        # Only still open when an exception escaped the view and after_request.
+        metrics.finish_request(request.url_rule.rule if request.url_rule else None, 500)
+
+
+def _install_profiling(app):
+
+    # Per-request cProfile captures, listed and downloaded at /admin/profiles.
+    # With neither PROFILE_SECRET nor PROFILE_SAMPLE_RATE set no hooks are
+    # registered, so requests pay nothing. Like the metrics, a capture ends
+    # when the response is built: SQL, ORM hydration, to_dict and JSON
+    # encoding are in it, a streamed body is not.
+    if not profiling.enabled():
+        return
+
+    @app.before_request
+    def start_profile():
+        route = request.url_rule.rule if request.url_rule else None
+        trigger = profiling.trigger_for(route, request.headers.get(profiling.PROFILE_HEADER))
+        if trigger:
+            profiler = profiling.start()
+            if profiler is not None:
+                g.profile = (profiler, trigger, time.perf_counter())
+
+    @app.after_request
+    def finish_profile(response):
+        _save_profile(response.status_code)
+        return response
+
+    @app.teardown_request
+    def fail_profile(exception):
+        # Only still running when an exception escaped the view and after_request.
+        _save_profile(500)
 
 
-@application.route("/")
+def _save_profile(status):
+
+    profile = g.pop("profile", None)
+    if profile is None:
+        return
+
+    profiler, trigger, started = profile
+    profiler.disable()
+    duration_ms = (time.perf_counter() - started) * 1000
+    if trigger == "sample" and duration_ms < profiling.PROFILE_MIN_MS:
+        return
+
+    profiling.save(profiler, {"route": request.url_rule.rule if request.url_rule else None,
+                              "method": request.method,
+                              "path": request.full_path.rstrip("?"),
+                              "user_id": g.get("current_user_id"),
+                              "status": status,
+                              "duration_ms": round(duration_ms, 3),
+                              "trigger": trigger,
+                              "created_at": time.time()})
+
+
+def _record_phase(timings, phase, started):
+
+    now = time.perf_counter()
+    timings[phase] = now - started
+    return now
+
+
+def _report_startup(timings):
+
+    total_ms = sum(timings.values()) * 1000
+    breakdown = ", ".join(f"{phase} {seconds * 1000:.1f}" for phase, seconds in timings.items())
+    message = f"Startup took {total_ms:.1f} ms ({breakdown})"
+
+    if STARTUP_BUDGET_MS and total_ms > STARTUP_BUDGET_MS:
+        logger.warning(f"{message}, over the {STARTUP_BUDGET_MS:.0f} ms budget.")
+    else:
+        logger.info(message)
+
+
+@api.route("/")
 def index():
     return send_from_directory(os.path.dirname(os.path.abspath(__file__)), "index.html")
 
 
-@application.route("/user/items", methods=["GET"])
+@api.route("/health", methods=["GET"])
+def health():
+
+    # Database reachability plus this worker's connection pool counters
+    # (checked out, overflow, checkout wait time, timeouts).
+    try:
+        healthy = setup_database.check_database_connection()
+        status = {"success": healthy,
+                  "database": "ok" if healthy else "unavailable",
+                  "pool": setup_database.pool_status(),
+                  "event_streams": events.streams_supported()}
+
+        return serializer.json_response(status), 200 if healthy else 503
+    except Exception as e:
+        return _handle_exception(e, "health")
+
+
+@api.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+
+    # Prometheus scrape target; see services/metrics.py for what is collected.
+    if not metrics.METRICS_ENABLED:
+        return _error_response("Metrics are disabled.", 404)
+
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
+@api.route("/admin/profiles", methods=["GET"])
+@token_required
+@admin_required
+def list_profiles(current_user):
+
+    # Newest first; download one from /admin/profiles/<id>.
+    try:
+        return _success_response({"profiles": profiling.list_profiles()})
+    except Exception as e:
+        return _handle_exception(e, "list_profiles")
+
+
+@api.route("/admin/profiles/<profile_id>", methods=["GET"])
+@token_required
+@admin_required
+def download_profile(current_user, profile_id):
+
+    # A pstats file: python -m pstats, snakeviz or flameprof open it.
+    path = profiling.profile_path(profile_id)
+    if path is None:
+        return _error_response("Profile not found.", 404)
+
+    return send_file(path, mimetype="application/octet-stream", as_attachment=True,
+                     download_name=f"{profile_id}.prof")
+
+
+@api.route("/user/items", methods=["GET"])
 @token_required
 def get_items(current_user):
 
     try:
         user_id = current_user["id"]
-        
-        items, error = todo_service.get_todos(
+
+        def build_response():
+
+            if request.args.get("stream", "").lower() in ("1", "true"):
+                return _stream_items(user_id)
+
+            page, error = todo_service.get_todos(
+                status=request.args.get("status"),
+                user_id=user_id,
+                sort_by=request.args.get("sort_by"),
+                sort_order=request.args.get("sort_order", "asc"),
+                limit=request.args.get("limit"),
+                cursor=request.args.get("cursor"),
+                fields=request.args.get("fields"),
+                q=request.args.get("q"),
+                filters=request.args.get("filter")
+            )
+
+            return _success_response(page) if not error else _error_response(error)
+
+        return _conditional_response(user_id, build_response)
+    except Exception as e:
+        return _handle_exception(e, "get_items")
+
+
+@api.route("/user/items/stats", methods=["GET"])
+@token_required
+def get_item_stats(current_user):
+
+    try:
+        user_id = current_user["id"]
+
+        stats, error = todo_service.get_stats(user_id)
+
+        return _success_response({"stats": stats}) if not error else _error_response(error)
+    except Exception as e:
+        return _handle_exception(e, "get_item_stats")
+
+
+@api.route("/user/items/changes", methods=["GET"])
+@token_required
+def get_item_changes(current_user):
+
+    try:
+        user_id = current_user["id"]
+
+        def build_response():
+
+            changes, error = todo_service.get_changes(user_id, request.args.get("since"))
+            if error == todo_service.SYNC_EXPIRED_ERROR:
+                return _error_response(error, 410)
+
+            return _success_response(changes) if not error else _error_response(error)
+
+        # Polling with an up-to-date token is answered with 304.
+        return _conditional_response(user_id, build_response)
+    except Exception as e:
+        return _handle_exception(e, "get_item_changes")
+
+
+@api.route("/user/items/events", methods=["GET"])
+@token_required
+def item_events(current_user):
+
+    # Server-Sent Events: the token is checked once per connection instead of
+    # once per poll. Events only say that something changed; the client then
+    # calls /user/items/changes with its sync token.
+    try:
+        if not events.streams_supported():
+            return _error_response(events.STREAMS_UNAVAILABLE_ERROR, 501)
+
+        try:
+            subscription = events.subscribe(current_user["id"])
+        except events.TooManySubscribersError as e:
+            response, status_code = _error_response(str(e), 503)
+            response.headers["Retry-After"] = str(int(events.EVENTS_RETRY_MS / 1000) or 1)
+            return response, status_code
+
+        response = Response(_event_stream(subscription), mimetype="text/event-stream")
+        response.headers["Cache-Control"] = "no-cache"
+        response.headers["X-Accel-Buffering"] = "no"
+        return response
+    except Exception as e:
+        return _handle_exception(e, "item_events")
+
+
+@api.route("/user/items/export", methods=["GET"])
+@token_required
+def export_items(current_user):
+
+    try:
+        user_id = current_user["id"]
+
+        export_format = request.args.get("format", "ndjson").lower()
+        if export_format not in serializer.EXPORT_MIMETYPES:
+            return _error_response(
+                f"Format must be one of: {', '.join(serializer.EXPORT_MIMETYPES)}")
+
+        rows, error = todo_service.stream_todos(
             status=request.args.get("status"),
             user_id=user_id,
-            sort_by=request.args.get("sort_by", "id"),
-            sort_order=request.args.get("sort_order", "asc")
+            sort_by=request.args.get("sort_by"),
+            sort_order=request.args.get("sort_order", "asc"),
+            fields=request.args.get("fields"),
+            q=request.args.get("q"),
+            filters=request.args.get("filter")
         )
-        
-        return _success_response({"items": items}) if not error else _error_response(error)
+        if error:
+            return _error_response(error)
+
+        body = (serializer.stream_csv(rows) if export_format == "csv"
+                else serializer.stream_ndjson(rows))
+
+        response = Response(stream_with_context(body),
+                            mimetype=serializer.EXPORT_MIMETYPES[export_format])
+        response.headers["Content-Disposition"] = f"attachment; filename=items.{export_format}"
+        return response
     except Exception as e:
-        return _handle_exception(e, "get_items")
+        return _handle_exception(e, "export_items")
 
 
-@application.route("/user/items/<item_id>", methods=["GET"])
+@api.route("/user/items/import", methods=["POST"])
+@token_required
+def import_items(current_user):
+
+    try:
+        user_id = current_user["id"]
+
+        default_format = "csv" if request.mimetype == "text/csv" else "ndjson"
+        import_format = request.args.get("format", default_format).lower()
+        if import_format not in serializer.EXPORT_MIMETYPES:
+            return _error_response(
+                f"Format must be one of: {', '.join(serializer.EXPORT_MIMETYPES)}")
+
+        # Read the body as a stream so large uploads are never fully buffered.
+        records = (serializer.parse_csv(request.stream) if import_format == "csv"
+                   else serializer.parse_ndjson(request.stream))
+
+        report, error = todo_service.import_todos(records, user_id,
+                                                  request.args.get("batch_size"))
+
+        return (_success_response(report) if not error
+                else _error_response(error))
+    except Exception as e:
+        return _handle_exception(e, "import_items")
+
+
+@api.route("/user/items/<item_id>", methods=["GET"])
 @token_required
 def get_item(current_user, item_id):
 
     try:
         user_id = current_user["id"]
-        
+
         item, error = todo_service.get_todo(item_id, user_id)
-        
-        return (_success_response({"item": item}) if not error 
-                else _error_response(error, 404))
+        if error:
+            return _error_response(error, 404)
+
+        return _item_response(item)
     except Exception as e:
         return _handle_exception(e, "get_item")
 
 
-@application.route("/user/items", methods=["POST"])
+@api.route("/user/items", methods=["POST"])
 @token_required
 def create_item(current_user):
 
@@ -93,14 +416,21 @@ def create_item(current_user):
         return _handle_exception(e, "create_item")
 
 
-@application.route("/user/items/<item_id>", methods=["DELETE"])
+@api.route("/user/items/<item_id>", methods=["DELETE"])
 @token_required
 def delete_item(current_user ,item_id):
 
     try:
         user_id = current_user["id"]
+
+        expected_version, error = _parse_if_match(request.headers.get("If-Match"))
+        if error:
+            return _error_response(error)
         
-        item, error = todo_service.delete_todo(item_id, user_id)
+        item, error = todo_service.delete_todo(item_id, user_id, expected_version)
+
+        if error == todo_service.VERSION_CONFLICT_ERROR:
+            return _error_response(error, 412)
         
         return (_success_response({"message": "Item deleted", "item": item}) if not error 
                 else _error_response(error, 404))
@@ -108,7 +438,7 @@ def delete_item(current_user ,item_id):
         return _handle_exception(e, "delete_item")
 
 
-@application.route("/user/items/<item_id>", methods=["PUT"])
+@api.route("/user/items/<item_id>", methods=["PUT"])
 @token_required
 def update_item(current_user, item_id):
     
@@ -123,22 +453,57 @@ def update_item(current_user, item_id):
         if validation_error:
             logger.error(f"Wrong validation: {validation_error}")
             return _error_response(validation_error)
+
+        expected_version, error = _parse_if_match(request.headers.get("If-Match"))
+        if error:
+            return _error_response(error)
         
         updated_item, error = todo_service.update_todo(
             item_id=item_id,
             title=data.get("title"),
             description=data.get("description"),
             status=data.get("status"),
-            user_id=user_id
+            user_id=user_id,
+            expected_version=expected_version
         )
+
+        if error == todo_service.VERSION_CONFLICT_ERROR:
+            return _error_response(error, 412)
         
-        return (_success_response({"message": "Item updated", "item": updated_item}) if not error 
-                else _error_response(error, 404))
+        if error:
+            return _error_response(error, 404)
+
+        response = current_app.make_response(_success_response({"message": "Item updated", "item": updated_item}))
+        response.set_etag(_item_etag(updated_item))
+        return response
     except Exception as e:
         return _handle_exception(e, "update_item")
 
 
-@application.route("/register", methods=["POST"])
+@api.route("/user/items/batch", methods=["POST"])
+@token_required
+def batch_items(current_user):
+
+    try:
+        user_id = current_user["id"]
+
+        data = request.get_json()
+        if not data:
+            return _error_response("No data provided.")
+
+        validation_error = validator_service.validate_fields(data, {"operations"})
+        if validation_error:
+            return _error_response(validation_error)
+
+        results, error = todo_service.apply_batch(data.get("operations"), user_id)
+
+        return (_success_response({"results": results}) if not error
+                else _error_response(error))
+    except Exception as e:
+        return _handle_exception(e, "batch_items")
+
+
+@api.route("/register", methods=["POST"])
 def register():
 
     try:
@@ -155,13 +520,16 @@ def register():
             password=data.get("password")
         )
         
+        if error == user_service.BUSY_ERROR:
+            return _busy_response(error)
+
         return (_success_response({"user": created_user}, 201) if not error 
                 else _error_response(error))
     except Exception as e:
         return _handle_exception(e, "register")
 
 
-@application.route("/login", methods=["POST"])
+@api.route("/login", methods=["POST"])
 def login():
 
     try:
@@ -178,13 +546,16 @@ def login():
             password=data.get("password")
         )
         
+        if error == user_service.BUSY_ERROR:
+            return _busy_response(error)
+
         return (_success_response({"user": user}) if not error 
                 else _error_response(error, 401))
     except Exception as e:
         return _handle_exception(e, "login")
 
 
-@application.route("/user/<user_id>", methods=["GET"])
+@api.route("/user/<user_id>", methods=["GET"])
 @token_required
 def get_user(current_user, user_id):
 
@@ -198,14 +569,193 @@ def get_user(current_user, user_id):
         return _handle_exception(e, "get_user")
     
 
+@api.cli.command("startup-report")
+def startup_report_command():
+    """Print how long building the app took, by phase."""
+
+    timings = current_app.extensions["startup_timings"]
+    for phase, seconds in timings.items():
+        click.echo(f"{phase:10} {seconds * 1000:8.1f} ms")
+    click.echo(f"{'total':10} {sum(timings.values()) * 1000:8.1f} ms")
+
+
+@api.cli.command("profile-token")
+@click.option("--minutes", type=int, default=15, show_default=True, help="How long the token stays valid.")
+def profile_token_command(minutes):
+    """Print an X-Profile-Token header value that profiles the requests sending it."""
+
+    try:
+        click.echo(profiling.make_token(minutes * 60))
+    except ValueError as e:
+        raise click.ClickException(str(e))
+
+
+@api.cli.command("rebuild-stats")
+@click.option("--user-id", default=None, help="Only rebuild counters for this user.")
+def rebuild_stats_command(user_id):
+    """Recompute per-user item status counters from the items table."""
+
+    error = todo_service.rebuild_stats(user_id)
+    if error:
+        raise click.ClickException(error)
+    click.echo("Item status counters rebuilt.")
+
+
+@api.cli.command("rebuild-search-index")
+def rebuild_search_index_command():
+    """Rebuild the SQLite full-text index over items (a no-op on Postgres)."""
+
+    error = todo_service.rebuild_search_index()
+    if error:
+        raise click.ClickException(error)
+    click.echo("Item search index rebuilt.")
+
+
+@api.cli.command("prune-tombstones")
+@click.option("--days", type=int, default=None,
+              help="Keep tombstones newer than this many days (default: TOMBSTONE_RETENTION_DAYS).")
+def prune_tombstones_command(days):
+    """Delete old item tombstones used by delta sync."""
+
+    removed, error = todo_service.prune_tombstones(days)
+    if error:
+        raise click.ClickException(error)
+    click.echo(f"Pruned {removed} item tombstone(s).")
+
+
+def _stream_items(user_id):
+
+    # Chunked response fed by a server-side cursor; memory stays flat however
+    # many items the user has. limit and cursor do not apply here.
+    rows, error = todo_service.stream_todos(
+        status=request.args.get("status"),
+        user_id=user_id,
+        sort_by=request.args.get("sort_by"),
+        sort_order=request.args.get("sort_order", "asc"),
+        fields=request.args.get("fields"),
+        q=request.args.get("q"),
+        filters=request.args.get("filter")
+    )
+    if error:
+        return _error_response(error)
+
+    return Response(stream_with_context(serializer.stream_json_list("items", rows)),
+                    mimetype="application/json")
+
+
+def _event_stream(subscription):
+
+    # Deliberately not wrapped in stream_with_context: the request context,
+    # and with it the database session, is released as soon as the view
+    # returns, so an idle stream holds no connection.
+    deadline = time.monotonic() + events.EVENTS_STREAM_SECONDS
+    try:
+        yield serializer.sse_message(retry_ms=events.EVENTS_RETRY_MS)
+
+        while not subscription.closed:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+
+            event = subscription.get(min(events.EVENTS_HEARTBEAT_SECONDS, remaining))
+            if event is None:
+                if subscription.closed:
+                    return
+                yield serializer.sse_comment("keep-alive")
+            else:
+                yield serializer.sse_message(event, event=event["type"])
+    finally:
+        subscription.close()
+
+
+def _conditional_response(user_id, build_response):
+
+    # The user's change version decides freshness: a matching If-None-Match is
+    # answered with 304 before any item query or serialization runs. The
+    # version is read before the body is built, so a concurrent write can only
+    # make the tag older than the body, never newer.
+    change, error = todo_service.get_change_version(user_id)
+    if error:
+        return build_response()
+
+    etag = _representation_etag(change["version"])
+
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = current_app.make_response(build_response())
+        if response.status_code != 200:
+            return response
+
+    response.set_etag(etag)
+    if change["changed_at"]:
+        response.last_modified = change["changed_at"]
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
+def _representation_etag(version):
+
+    # Different paths and query strings are different representations.
+    query = "&".join(f"{key}={value}" for key, value in sorted(request.args.items(multi=True)))
+    digest = hashlib.sha1(f"{request.path}?{query}".encode("utf-8")).hexdigest()[:16]
+    return f"v{version}-{digest}"
+
+
+def _item_response(item):
+
+    # A single item is validated by its own version, not the user's change
+    # version: the ETag a GET returns is what a PUT or DELETE sends back in
+    # If-Match, and writes to other items leave it valid.
+    etag = _item_etag(item)
+
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = current_app.make_response(_success_response({"item": item}))
+
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
+def _item_etag(item):
+
+    return str(item["version"])
+
+
+def _parse_if_match(header):
+
+    # If-Match carries the item's ETag, i.e. its "version" (quoted or bare);
+    # "*" matches any version.
+    if not header or header.strip() == "*":
+        return None, None
+
+    value = header.strip()
+    if value.startswith("W/"):
+        value = value[2:]
+
+    try:
+        return int(value.strip('"')), None
+    except ValueError:
+        return None, "Invalid If-Match header."
+
+
 def _success_response(data, status_code=200):
     
-    return jsonify({"success": True, **data}), status_code
+    return serializer.json_response({"success": True, **data}), status_code
 
 
 def _error_response(error_message, status_code=400):
 
-    return jsonify({"success": False, "error": error_message}), status_code
+    return serializer.json_response({"success": False, "error": error_message}), status_code
+
+
+def _busy_response(error_message):
+
+    response, status_code = _error_response(error_message, 503)
+    response.headers["Retry-After"] = str(password_hasher.BCRYPT_RETRY_AFTER_SECONDS)
+    return response, status_code
 
 
 def _handle_exception(exception, route_name):
@@ -216,4 +766,5 @@ def _handle_exception(exception, route_name):
 
 
 if __name__ == "__main__":
-    application.run(debug=True, host="0.0.0.0", port=5000)
+    # Development server only; production runs gunicorn -c gunicorn.conf.py wsgi:application
+    create_app().run(debug=True, host="0.0.0.0", port=5000)
@@ -0,0 +1,4 @@
+from todo_app import create_app
+
+# WSGI entry point for production servers: gunicorn -c gunicorn.conf.py wsgi:application
+application = create_app()